@@ -0,0 +1,531 @@
+'''
+Module containing an asyncio driver for the BK Precision 9141 command set.
+Lets one event loop drive many power supplies at once, without a thread per instrument.
+
+Example
+-------
+async def main():
+    async with AsyncBK9141('COM5') as supply_a, AsyncBK9141('COM6', channel=2) as supply_b:
+        await asyncio.gather(supply_a.set_voltage(12.0), supply_b.set_voltage(5.0))
+        print(await supply_a.measure_current())
+'''
+import asyncio
+import weakref
+
+import serial
+from instrument_limits import InstrumentLimits
+from link_profiles import DEFAULT_PROFILE, FLOW_CONTROL
+
+
+class ConfirmationError(Exception):
+    '''
+    Raised when the value read back from the instrument does not match the value that was set.
+    '''
+
+
+class AsyncSerialTransport():
+    '''
+    Class containing a non-blocking serial port, read and written from coroutines.
+    Readiness comes from the event loop where the platform supports it (POSIX file descriptors), and from short polling otherwise (Windows).
+    '''
+
+    POLL_INTERVAL = 0.002  # Seconds between readiness checks when the event loop cannot watch the port directly
+
+    def __init__(self, com_port, baudrate=9600, serial_factory=serial.Serial, xonxoff=False, rtscts=False):
+        '''
+        Store port parameters. The port itself is opened by open().
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        baudrate (int): Link speed
+        serial_factory (function object): Callable returning an open serial.Serial-like object
+        xonxoff (bool): Software flow control
+        rtscts (bool): Hardware flow control
+
+        Returns
+        -------
+        None
+
+        '''
+        self.com_port = com_port
+        self.baudrate = baudrate
+        self.serial_factory = serial_factory
+        self.flow_control = {'xonxoff': xonxoff, 'rtscts': rtscts}
+        self.ser = None
+        self.buffer = bytearray()  # Bytes received after the last returned terminator
+
+
+    def open(self):
+        '''
+        Open the serial port in non-blocking mode (timeout=0: read() returns whatever is already available).
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        self.ser = self.serial_factory(self.com_port, self.baudrate, timeout=0, **self.flow_control)
+        self.buffer.clear()
+
+
+    def close(self):
+        '''
+        Close the serial port.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        if self.ser is not None:
+            self.ser.close()
+        self.ser = None
+
+
+    def write(self, data):
+        '''
+        Queue bytes for transmission. Commands are a few bytes long, so this only copies into the driver's output buffer.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        data (bytes): Bytes to send
+
+        Returns
+        -------
+        None
+
+        '''
+        self.ser.write(data)
+
+
+    def discard_input(self):
+        '''
+        Drop unread bytes, such as a late reply to a previously timed-out query.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        self.ser.reset_input_buffer()
+        self.buffer.clear()
+
+
+    async def read_until(self, terminator=b'\n'):
+        '''
+        Wait for, and return, one terminated reply. Bytes following the terminator are kept for the next call.
+        Wrap in asyncio.wait_for() to bound the wait.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        terminator (bytes): End-of-reply marker
+
+        Returns
+        -------
+        bytes object, terminator included
+
+        '''
+        while True:
+            index = self.buffer.find(terminator)
+            if index >= 0:
+                reply = bytes(self.buffer[:index + len(terminator)])
+                del self.buffer[:index + len(terminator)]
+                return reply
+
+            chunk = self.ser.read(self.ser.in_waiting or 1)
+            if chunk:
+                self.buffer += chunk
+                continue
+
+            await self.__wait_readable()
+
+
+    async def __wait_readable(self):
+        '''
+        Suspend until the port may have new bytes.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        loop = asyncio.get_running_loop()
+        try:
+            file_descriptor = self.ser.fileno()
+        except (AttributeError, OSError, serial.SerialException):
+            file_descriptor = None
+
+        if file_descriptor is not None:
+            readable = loop.create_future()
+            try:
+                loop.add_reader(file_descriptor, lambda: readable.done() or readable.set_result(None))
+            except NotImplementedError:  # Ex.: ProactorEventLoop
+                pass
+            else:
+                try:
+                    await readable
+                finally:
+                    loop.remove_reader(file_descriptor)
+                return
+
+        await asyncio.sleep(self.POLL_INTERVAL)
+
+
+class AsyncBK9141():
+    '''
+    Class containing awaitable BK Precision 9141 commands.
+    Commands to the same port are serialized by a per-port lock, so several tasks (or several driver objects) can safely share one instrument.
+    Driver objects for the same port, in the same event loop, share one lock and one open transport: the port is opened once, and closed with the last of them.
+    A driver object given a channel selects it ahead of its own commands, whenever another channel was selected last, so driver objects for different channels can share a port.
+    Baud rate, flow control, and terminators come from the instrument's link profile (see link_profiles.py).
+    '''
+
+    # {event loop: {com_port: {'lock': asyncio.Lock, 'transport': AsyncSerialTransport, 'users': int, 'selected': channel selected last, None if unknown}}}
+    # Keyed by loop, as an asyncio.Lock belongs to the loop it was first used in. Entries go when their loop is garbage collected
+    shared_ports = weakref.WeakKeyDictionary()
+
+    def __init__(self, com_port, baudrate=None, timeout=3.0, transport=None, profiles=None, channel=None):
+        '''
+        Store driver parameters. Call open(), or use "async with", before sending commands.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        baudrate (int): Link speed. Defaults to the link profile's
+        timeout (float): Seconds to wait for a query reply before raising asyncio.TimeoutError
+        transport (AsyncSerialTransport): Optional pre-built transport. Ex.: one using a simulated serial factory. Unused if the port is already open through another driver object
+        profiles (LinkProfiles): Optional per-instrument link settings. None uses the BK Precision 9141 factory settings (DEFAULT_PROFILE)
+        channel (int): 1, 2, or 3. None sends commands to whichever channel is selected
+
+        Returns
+        -------
+        None
+
+        '''
+        settings = profiles.settings(com_port) if profiles is not None else {**FLOW_CONTROL[DEFAULT_PROFILE['flow_control']], **DEFAULT_PROFILE}
+        self.com_port = com_port
+        self.timeout = timeout
+        self.channel = channel
+        self.terminator = settings['terminator']
+        self.reply_terminator = settings['reply_terminator'].encode()
+        self.transport = transport or AsyncSerialTransport(com_port, baudrate or settings['baudrate'], xonxoff=settings['xonxoff'], rtscts=settings['rtscts'])
+        self.lock = None  # Set by open(), inside the event loop
+        self.shared = None  # Entry of shared_ports, while open
+
+
+    async def open(self):
+        '''
+        Open the serial port, or join the driver object that already has it open in this event loop.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        serial.serialutil.SerialException if the port cannot be opened
+
+        '''
+        if self.shared is not None:
+            return
+        ports = AsyncBK9141.shared_ports.setdefault(asyncio.get_running_loop(), {})
+        shared = ports.setdefault(self.com_port, {'lock': asyncio.Lock(), 'transport': self.transport, 'users': 0, 'selected': None})
+        async with shared['lock']:
+            if shared['users'] == 0:
+                try:
+                    shared['transport'].open()
+                except (serial.SerialException, OSError):
+                    ports.pop(self.com_port, None)  # Nothing opened: the next driver object starts afresh
+                    raise
+            shared['users'] += 1
+        self.lock, self.transport, self.shared = shared['lock'], shared['transport'], shared
+
+
+    async def close(self):
+        '''
+        Leave the serial port, closing it if no other driver object in this event loop still uses it.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        shared = self.shared
+        if shared is None:
+            return
+        self.shared = None
+        async with shared['lock']:
+            shared['users'] -= 1
+            if shared['users'] == 0:
+                shared['transport'].close()
+                ports = AsyncBK9141.shared_ports.get(asyncio.get_running_loop(), {})
+                if ports.get(self.com_port) is shared:
+                    del ports[self.com_port]
+
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+
+    async def __aexit__(self, exc_type, exc, trace):
+        await self.close()
+
+
+    async def write(self, command):
+        '''
+        Send a command that produces no reply. Ex.: "VOLT 12.0"
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        command (string): SCPI command, without terminator
+
+        Returns
+        -------
+        None
+
+        '''
+        async with self.lock:
+            self.transport.write(self.__encode(command))
+
+
+    async def query(self, command, timeout=None):
+        '''
+        Send a command and return its reply. Ex.: "VOLT?"
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        command (string): SCPI query, without terminator
+        timeout (float): Overrides the driver timeout for this query
+
+        Returns
+        -------
+        Reply string, stripped of whitespace and terminator
+
+        Raises
+        ------
+        asyncio.TimeoutError if no complete reply arrives in time
+
+        '''
+        async with self.lock:
+            self.transport.discard_input()
+            self.transport.write(self.__encode(command))
+            reply = await self.__read_reply(timeout or self.timeout)
+            return reply.decode().strip()
+
+
+    async def set_voltage(self, volts, verify=True):
+        '''
+        Set the output voltage, optionally confirming it with VOLT?.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        volts (float): Voltage setpoint
+        verify (bool): Read the setpoint back and compare
+
+        Returns
+        -------
+        Read-back value as a float if verify is True, otherwise None
+
+        Raises
+        ------
+        ConfirmationError if the read-back does not match, or is not a number
+
+        '''
+        return await self.__set('VOLT', volts, verify)
+
+
+    async def set_current(self, amps, verify=True):
+        '''
+        Set the output current limit, optionally confirming it with CURR?.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        amps (float): Current setpoint
+        verify (bool): Read the setpoint back and compare
+
+        Returns
+        -------
+        Read-back value as a float if verify is True, otherwise None
+
+        Raises
+        ------
+        ConfirmationError if the read-back does not match, or is not a number
+
+        '''
+        return await self.__set('CURR', amps, verify)
+
+
+    async def measure_voltage(self):
+        '''
+        Measure the actual output voltage.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        float
+
+        '''
+        return float(await self.query('MEAS:VOLT?'))
+
+
+    async def measure_current(self):
+        '''
+        Measure the actual output current.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        float
+
+        '''
+        return float(await self.query('MEAS:CURR?'))
+
+
+    async def measure_power(self):
+        '''
+        Measure the actual output power.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        float
+
+        '''
+        return float(await self.query('MEAS:POW?'))
+
+
+    async def identify(self):
+        '''
+        Return the *IDN? identification string. Ex.: "B&K Precision, 9141, <serial number>, <firmware>"
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        string
+
+        '''
+        return await self.query('*IDN?')
+
+
+    def __encode(self, *lines):
+        '''
+        Encode command lines with the link profile's terminator, preceded by the driver's channel selection if another channel was selected last.
+        Call with the lock held.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        lines (strings): SCPI commands, without terminators
+
+        Returns
+        -------
+        bytes object
+
+        '''
+        if self.channel is not None and self.shared['selected'] != self.channel:
+            lines = (f'INST:SEL CH{self.channel}',) + lines
+            self.shared['selected'] = self.channel
+        return ''.join(f'{line}{self.terminator}' for line in lines).encode()
+
+
+    async def __read_reply(self, timeout):
+        '''
+        Wait for one reply line. Call with the lock held.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        timeout (float): Seconds
+
+        Returns
+        -------
+        bytes object, terminator included
+
+        Raises
+        ------
+        asyncio.TimeoutError if no complete reply arrives in time
+
+        '''
+        try:
+            return await asyncio.wait_for(self.transport.read_until(self.reply_terminator), timeout)
+        except asyncio.TimeoutError:
+            # Whether the instrument saw the channel selection is unknown, so the next command selects again
+            self.shared['selected'] = None
+            raise
+
+
+    async def __set(self, thing_to_change, value, verify):
+        '''
+        Send a VOLT/CURR setpoint, then optionally read it back in the same locked transaction.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        thing_to_change (string): "VOLT" or "CURR"
+        value (float): Setpoint
+        verify (bool): Read the setpoint back and compare
+
+        Returns
+        -------
+        Read-back value as a float if verify is True, otherwise None
+
+        '''
+        async with self.lock:
+            self.transport.discard_input()
+            if not verify:
+                self.transport.write(self.__encode(f'{thing_to_change} {value}'))
+                return None
+
+            self.transport.write(self.__encode(f'{thing_to_change} {value}', f'{thing_to_change}?'))
+            reply = (await self.__read_reply(self.timeout)).decode().strip()
+
+        # Read-backs are rounded to the instrument's 1 mV / 1 mA resolution. Ex.: 1.0004 reads back as 1.000
+        if not InstrumentLimits.confirms(reply, value):
+            raise ConfirmationError(f'{self.com_port}: {thing_to_change} set to {value}, read back {reply}')
+        return float(reply)
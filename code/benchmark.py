@@ -0,0 +1,417 @@
+'''
+Module to benchmark the command path, fleet fan-out, link speed, port enumeration, and GUI status logging against simulated instruments (POSIX only).
+Results are written as JSON with percentiles, so builds can be compared.
+The replay benchmark also times the command path against a recorded trace (see session_trace.py), with no instrument or simulator timing in the way.
+
+Run with:
+    python benchmark.py [output .json] [iterations] [baseline .json to compare against]
+'''
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+from check_ports import CheckPorts
+from fleet_control import FleetControl
+from link_profiles import LinkProfiles
+from remote_control import RemoteControl
+from scpi_transaction import ScpiTransaction
+from serial_sessions import SerialSessions
+from session_trace import TraceRecorder, TraceReplayer
+from simulator import SimulatorBank
+
+
+class SilentDialogs():
+    '''
+    Class standing in for PopupDialogs when nobody is watching: every dialog is answered as acknowledged, without being shown.
+    '''
+
+    @staticmethod
+    def com_bad_communication(com_port):
+        return True
+
+
+    @staticmethod
+    def failed_confirmation(thing_to_change, value_found, value):
+        return True
+
+
+class Benchmark():
+    '''
+    Class containing the individual benchmarks. Each returns a dictionary of results ready for JSON.
+    '''
+
+    @staticmethod
+    def percentiles(samples):
+        '''
+        Summarize timing samples.
+
+        Parameters
+        ----------
+        samples (list): Seconds
+
+        Returns
+        -------
+        Dictionary of count, mean, p50, p90, p99, and max, in milliseconds
+
+        '''
+        samples = np.asarray(samples, dtype=float) * 1000
+        if samples.size == 0:
+            return {'count': 0}
+
+        p50, p90, p99 = np.percentile(samples, [50, 90, 99])
+        return {'count': int(samples.size), 'mean_ms': round(float(samples.mean()), 4), 'p50_ms': round(float(p50), 4),
+                'p90_ms': round(float(p90), 4), 'p99_ms': round(float(p99), 4), 'max_ms': round(float(samples.max()), 4)}
+
+
+    @staticmethod
+    def command_latency(com_port, sessions, iterations):
+        '''
+        Time complete "Go!" operations (set + verify + status output) through RemoteControl.remote_control.
+
+        Parameters
+        ----------
+        com_port (string): Simulated instrument device path
+        sessions (SerialSessions): Pool of open serial port sessions
+        iterations (int): Number of operations
+
+        Returns
+        -------
+        Dictionary of percentiles, plus the number of failed operations
+
+        '''
+        samples = []
+        failures = 0
+        for iteration in range(iterations):
+            value = f'{(iteration % 600) / 10:.1f}'  # Always a new setpoint, so nothing can be skipped
+            start_time = time.perf_counter()
+            if RemoteControl.remote_control(lambda *args, **fields: None, com_port, 'VOLT', value, sessions, SilentDialogs):
+                failures += 1
+            samples.append(time.perf_counter() - start_time)
+
+        return {**Benchmark.percentiles(samples), 'failures': failures}
+
+
+    @staticmethod
+    def replay(com_port, iterations):
+        '''
+        Record "Go!" operations against an instrument, then run the same operations against the recording: at the recorded timing, and as fast as possible.
+        The recorded timing should match the live run. As fast as possible is the cost of the driver path alone (RemoteControl, ScpiTransaction, SerialSessions, AdaptiveLink).
+
+        Parameters
+        ----------
+        com_port (string): Simulated instrument device path. Best given some latency, so the recorded timing is worth replaying
+        iterations (int): Number of operations
+
+        Returns
+        -------
+        Dictionary of {'live', 'recorded_timing', 'fast'} percentiles, plus the trace size and the writes that did not match the recording
+
+        '''
+        def operations(sessions):
+            samples = []
+            failures = 0
+            for iteration in range(iterations):
+                value = f'{(iteration % 600) / 10:.1f}'
+                start_time = time.perf_counter()
+                if RemoteControl.remote_control(lambda *args, **fields: None, com_port, 'VOLT', value, sessions, SilentDialogs):
+                    failures += 1
+                samples.append(time.perf_counter() - start_time)
+            sessions.close_all()
+            return {**Benchmark.percentiles(samples), 'failures': failures}
+
+        results = {}
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'benchmark.rctrace')
+            recorder = TraceRecorder(path, description='benchmark.py replay')
+            results['live'] = operations(SerialSessions(idle_timeout=300.0, serial_factory=recorder.serial_factory(), metrics=None))
+            recorder.close()
+            results['trace_bytes'] = os.path.getsize(path)
+
+            mismatches = 0
+            for name, speed in (('recorded_timing', 1.0), ('fast', 0.0)):
+                replayer = TraceReplayer(path, speed=speed, strict=False)
+                results[name] = operations(SerialSessions(idle_timeout=300.0, serial_factory=replayer.serial_factory, metrics=None))
+                mismatches += replayer.statistics()['mismatches']
+            results['mismatched_writes'] = mismatches
+
+        return results
+
+
+    @staticmethod
+    def throughput(com_port, sessions, duration):
+        '''
+        Count set + verify transactions completed back to back over a fixed time.
+
+        Parameters
+        ----------
+        com_port (string): Simulated instrument device path
+        sessions (SerialSessions): Pool of open serial port sessions
+        duration (float): Seconds to run for
+
+        Returns
+        -------
+        Dictionary of commands, seconds, and commands per second
+
+        '''
+        commands = 0
+        start_time = time.perf_counter()
+        while time.perf_counter() - start_time < duration:
+            RemoteControl.set_and_check(com_port, 'VOLT', f'{(commands % 600) / 10:.1f}', sessions)
+            commands += 1
+
+        seconds = time.perf_counter() - start_time
+        return {'commands': commands, 'seconds': round(seconds, 4), 'commands_per_second': round(commands / seconds, 2)}
+
+
+    @staticmethod
+    def link_speed(bank, duration, fast_rate=115200):
+        '''
+        Compare measurement polling + three-channel configuration at the factory 9600 baud against a negotiated faster rate.
+        Both instruments simulate wire time, so the difference is what the serial line itself costs.
+
+        Parameters
+        ----------
+        bank (SimulatorBank): Simulator to add the two instruments to. Its port listing must be installed, so link profiles find them
+        duration (float): Seconds to run each measurement for
+        fast_rate (int): Baud rate set on the fast instrument's simulated front panel
+
+        Returns
+        -------
+        Dictionary of {baud rate: {'polls_per_second', 'configurations_per_second'}}, plus the speed-ups and the negotiation time
+
+        '''
+        results = {}
+        profiles = LinkProfiles(path=None)
+        for baudrate in (9600, fast_rate):
+            com_port = bank.add(baudrate=baudrate)
+            sessions = SerialSessions(idle_timeout=300.0, profiles=profiles)
+            start_time = time.perf_counter()
+            negotiated = profiles.negotiate(com_port, sessions)
+            negotiation_time = time.perf_counter() - start_time
+
+            poll = ScpiTransaction()
+            for command in ('MEAS:VOLT?', 'MEAS:CURR?', 'MEAS:POW?'):
+                poll.query(command)
+            polls = 0
+            start_time = time.perf_counter()
+            while time.perf_counter() - start_time < duration:
+                poll.execute(com_port, sessions)
+                polls += 1
+            poll_seconds = time.perf_counter() - start_time
+
+            # Alternating setpoints, so the channel state never lets a configuration be skipped
+            configurations = 0
+            start_time = time.perf_counter()
+            while time.perf_counter() - start_time < duration:
+                volts = 12.0 + configurations % 2
+                ScpiTransaction.configure_channels(com_port, {1: (volts, 1.0), 2: (volts / 2, 0.5), 3: (3.3, 0.2)}, sessions)
+                configurations += 1
+            configuration_seconds = time.perf_counter() - start_time
+            sessions.close_all()
+
+            results[str(baudrate)] = {'negotiated_baudrate': negotiated['baudrate'], 'negotiation_seconds': round(negotiation_time, 4),
+                                      'polls_per_second': round(polls / poll_seconds, 2), 'configurations_per_second': round(configurations / configuration_seconds, 2)}
+
+        slow, fast = results['9600'], results[str(fast_rate)]
+        results['poll_speedup'] = round(fast['polls_per_second'] / slow['polls_per_second'], 2)
+        results['configuration_speedup'] = round(fast['configurations_per_second'] / slow['configurations_per_second'], 2)
+        return results
+
+
+    @staticmethod
+    def fleet_scaling(ports, sessions, iterations, sizes=(1, 2, 4, 8, 16)):
+        '''
+        Time one fleet-wide set + verify for growing fleet sizes. Ideal fan-out keeps the time flat as the fleet grows.
+
+        Parameters
+        ----------
+        ports (list): Simulated instrument device paths, at least max(sizes) of them
+        sessions (SerialSessions): Pool of open serial port sessions
+        iterations (int): Fleet operations per size
+        sizes (tuple): Fleet sizes to measure
+
+        Returns
+        -------
+        Dictionary of {fleet size: percentiles + failed port count}
+
+        '''
+        results = {}
+        for size in sizes:
+            samples = []
+            failures = 0
+            for iteration in range(iterations):
+                start_time = time.perf_counter()
+                outcomes = FleetControl.apply(ports[:size], 'VOLT', f'{(iteration % 600) / 10:.1f}', sessions)
+                samples.append(time.perf_counter() - start_time)
+                failures += sum(not outcome['passed'] for outcome in outcomes)
+            results[str(size)] = {**Benchmark.percentiles(samples), 'failures': failures}
+        return results
+
+
+    @staticmethod
+    def port_enumeration(iterations):
+        '''
+        Time CheckPorts.check_ports, including the formatting of every port's details.
+
+        Parameters
+        ----------
+        iterations (int): Number of enumerations
+
+        Returns
+        -------
+        Dictionary of percentiles, plus the number of status lines produced per enumeration
+
+        '''
+        samples = []
+        lines = []
+        for _ in range(iterations):
+            lines.clear()
+            start_time = time.perf_counter()
+            CheckPorts.check_ports(lambda *args, **fields: lines.append(args))
+            samples.append(time.perf_counter() - start_time)
+
+        return {**Benchmark.percentiles(samples), 'lines': len(lines)}
+
+
+    @staticmethod
+    def status_logging(lines):
+        '''
+        Time ApplicationUi.update_status_callback for many status lines, then the flush into the status box and the repaint that follow. Runs the GUI offscreen.
+
+        Parameters
+        ----------
+        lines (int): Number of status lines
+
+        Returns
+        -------
+        Dictionary of per-line percentiles, total seconds, and flush + repaint seconds. Or the reason it was skipped
+
+        '''
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        try:
+            from PyQt5 import QtWidgets
+            from run import ApplicationUi
+        except ImportError as error:
+            return {'skipped': str(error)}
+
+        application = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+        view = ApplicationUi()
+        view.show()
+        application.processEvents()
+
+        samples = []
+        start_time = time.perf_counter()
+        for line in range(lines):
+            text = '<p style="font-size:11px; color:#DADADA;">' + f'Step {line}: VOLT 12.000 at {line * 0.1:.3f} s, timing error +0.02 ms' + '</p>'
+            line_start = time.perf_counter()
+            view.update_status_callback(text)
+            samples.append(time.perf_counter() - line_start)
+        appended = time.perf_counter()
+        view.flush_status()
+        application.processEvents()
+        finished = time.perf_counter()
+
+        view.close()
+        return {**Benchmark.percentiles(samples), 'total_seconds': round(finished - start_time, 4), 'repaint_seconds': round(finished - appended, 4)}
+
+
+    @staticmethod
+    def run_all(iterations=200, fleet_size=16, fleet_latency=0.005):
+        '''
+        Run every benchmark against freshly started simulated instruments.
+
+        Parameters
+        ----------
+        iterations (int): Base iteration count. Individual benchmarks scale from it
+        fleet_size (int): Largest fleet measured
+        fleet_latency (float): Simulated reply latency of the fleet instruments, in seconds, so fan-out has device time to overlap
+
+        Returns
+        -------
+        Dictionary with run details and results, ready for JSON
+
+        '''
+        results = {}
+        with SimulatorBank() as bank:
+            bank.install_port_listing()
+            single = bank.add()
+            fleet = [bank.add(latency=fleet_latency) for _ in range(fleet_size)]
+            sessions = SerialSessions(idle_timeout=300.0)
+
+            try:
+                results['command_latency'] = Benchmark.command_latency(single, sessions, iterations)
+                results['throughput'] = Benchmark.throughput(single, sessions, duration=2.0)
+                sizes = tuple(size for size in (1, 2, 4, 8, 16, 32, 64) if size <= fleet_size)
+                results['fleet_scaling'] = Benchmark.fleet_scaling(fleet, sessions, max(iterations // 10, 5), sizes)
+                results['port_enumeration'] = Benchmark.port_enumeration(max(iterations // 10, 5))
+                results['link_speed'] = Benchmark.link_speed(bank, duration=1.0)
+                results['replay'] = Benchmark.replay(fleet[0], max(iterations // 4, 10))
+            finally:
+                sessions.close_all()
+
+        results['status_logging'] = Benchmark.status_logging(iterations * 25)
+
+        return {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'settings': {'iterations': iterations, 'fleet_size': fleet_size, 'fleet_latency': fleet_latency},
+            'results': results,
+        }
+
+
+    @staticmethod
+    def compare(report, baseline, tolerance=0.2):
+        '''
+        Find results that got slower than a baseline report by more than tolerance.
+        Compares every p50/p99 value, and commands per second.
+
+        Parameters
+        ----------
+        report (dictionary): As returned by run_all
+        baseline (dictionary): An earlier run_all report
+        tolerance (float): Allowed slowdown. 0.2 = 20 %
+
+        Returns
+        -------
+        List of regression descriptions. Empty if nothing regressed
+
+        '''
+        regressions = []
+
+        def walk(current, previous, path):
+            for key, value in current.items():
+                if key not in previous:
+                    continue
+                if isinstance(value, dict):
+                    walk(value, previous[key], f'{path}{key}.')
+                elif key in ('p50_ms', 'p99_ms') and previous[key] > 0 and value > previous[key] * (1 + tolerance):
+                    regressions.append(f'{path}{key}: {previous[key]} -> {value} ({value / previous[key] - 1:+.0%})')
+                elif key == 'commands_per_second' and value < previous[key] / (1 + tolerance):
+                    regressions.append(f'{path}{key}: {previous[key]} -> {value} ({value / previous[key] - 1:+.0%})')
+
+        walk(report['results'], baseline.get('results', {}), '')
+        return regressions
+
+
+if __name__ == '__main__':
+    output = sys.argv[1] if len(sys.argv) > 1 else 'benchmark.json'
+    report = Benchmark.run_all(int(sys.argv[2]) if len(sys.argv) > 2 else 200)
+
+    with open(output, 'w', encoding='utf-8') as output_file:
+        json.dump(report, output_file, indent=4)
+    print(json.dumps(report['results'], indent=4))
+    print(f'Written to {output}')
+
+    if len(sys.argv) > 3:
+        with open(sys.argv[3], 'r', encoding='utf-8') as baseline_file:
+            regressions = Benchmark.compare(report, json.load(baseline_file))
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,133 @@
+'''
+Module to check that the runtime files belong to the same build as the application .exe, without re-reading the .exe on every launch.
+'''
+import base64
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+
+# Verified result, remembered until the .exe or version.dat changes
+INTEGRITY_CACHE_FILE = 'integrity_cache.json'
+
+CHUNK_SIZE = 1024 * 1024  # Bytes hashed at a time, so memory use does not grow with the .exe size
+
+
+class BuildIntegrity():
+    '''
+    Class containing the build version check.
+    A version number is generated and encrypted into version.dat when this app is built, keyed by a hash of the .exe contents.
+    Only an app from the same build as version.dat can decrypt the version number, so mismatched runtime files are immediately apparent.
+    '''
+
+    @staticmethod
+    def file_key(path, chunk_size=CHUNK_SIZE):
+        '''
+        blake2s hash of a file's contents, read in chunks. Identical to hashing the whole file at once.
+
+        Parameters
+        ----------
+        path (string): File to hash
+        chunk_size (int): Bytes read at a time
+
+        Returns
+        -------
+        32-byte digest
+
+        '''
+        digest = hashlib.blake2s(digest_size=32)
+        with open(path, 'rb') as hashed_file:
+            for chunk in iter(lambda: hashed_file.read(chunk_size), b''):
+                digest.update(chunk)
+        return digest.digest()
+
+
+    @staticmethod
+    def fingerprint(path):
+        '''
+        Size, modification time, and inode of a file. Any rebuild or file replacement changes at least one of them.
+
+        Parameters
+        ----------
+        path (string): File to describe
+
+        Returns
+        -------
+        List of [size, mtime in ns, inode]
+
+        '''
+        status = os.stat(path)
+        return [status.st_size, status.st_mtime_ns, status.st_ino]
+
+
+    @staticmethod
+    def version(exe_path='RemoteControl.exe', version_path='version.dat', cache_path=INTEGRITY_CACHE_FILE):
+        '''
+        Decrypt the build version, or return the cached result if neither file changed since it was last verified.
+
+        Possible version values:
+        00000001: The application .exe file is not located. This would be because a standalone GUI was run via direct command (expected), or post-compile directory structure was lost
+        00000000: The application .exe file exists, but the encrypted version.dat file is missing, was not successfully decrypted, or there was an error reading it
+        YYYYMMDD: The application is running normally
+
+        Parameters
+        ----------
+        exe_path (string): Application .exe file
+        version_path (string): Encrypted version file written by scripts\\helpers\\make_version.py
+        cache_path (string): JSON cache file. None disables the cache
+
+        Returns
+        -------
+        (version string, details dictionary of {'cached': bool, 'seconds': float})
+
+        '''
+        start_time = time.perf_counter()
+
+        # If standalone GUI run via command
+        if not Path(exe_path).is_file():
+            return '00000001', {'cached': False, 'seconds': time.perf_counter() - start_time}
+
+        try:
+            fingerprint = {'exe': BuildIntegrity.fingerprint(exe_path), 'version': BuildIntegrity.fingerprint(version_path)}
+        except OSError:
+            # .exe exists, version.dat missing
+            return '00000000', {'cached': False, 'seconds': time.perf_counter() - start_time}
+
+        if cache_path:
+            try:
+                with open(cache_path, 'r', encoding='utf-8') as cache_file:
+                    cached = json.load(cache_file)
+                if cached.get('fingerprint') == fingerprint:
+                    return cached['version'], {'cached': True, 'seconds': time.perf_counter() - start_time}
+            except (OSError, ValueError, KeyError):
+                pass  # No usable cache, verify properly
+
+        # Decryption. See make_version.py in scripts\helpers for fuller explanation comments
+        # Only needed when the cache misses, so cryptography is imported here rather than at startup
+        try:
+            from cryptography.fernet import Fernet, InvalidToken
+        except ImportError:  # cryptography not installed: the version cannot be checked
+            return '00000000', {'cached': False, 'seconds': time.perf_counter() - start_time}
+
+        try:
+            with open(version_path, 'rb') as version_file:
+                version_encrypted = version_file.read()
+
+            key_64 = base64.urlsafe_b64encode(BuildIntegrity.file_key(exe_path))
+            version_decrypted = Fernet(key_64).decrypt(version_encrypted).decode()
+
+        # OSError: reading. InvalidToken: wrong key or tampered file. ValueError: bad key, or the version is not text
+        except (OSError, InvalidToken, ValueError):
+            # .exe exists, version.dat not successfully decrypted/error reading. Never cached, so a fixed install is noticed next launch
+            return '00000000', {'cached': False, 'seconds': time.perf_counter() - start_time}
+
+        if cache_path:
+            try:
+                with open(cache_path, 'w', encoding='utf-8') as cache_file:
+                    json.dump({'fingerprint': fingerprint, 'version': version_decrypted}, cache_file)
+            except OSError:
+                pass  # Read-only install folder: verify every launch instead
+
+        return version_decrypted, {'cached': False, 'seconds': time.perf_counter() - start_time}
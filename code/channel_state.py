@@ -0,0 +1,114 @@
+'''
+Module to remember what an instrument's output channels were last confirmed to be set to, so commands that would change nothing are not sent.
+
+One ChannelState belongs to one open connection (see serial_sessions.AdaptiveLink). Closing or reopening the port starts from an empty state,
+so anything that may have happened while the link was down (power cycle, front-panel changes, another application) is never assumed.
+'''
+
+
+class ChannelState():
+    '''
+    Class containing the selected output channel and the per-channel setpoints last confirmed on one connection.
+    Unknown is always a safe answer: a missing entry means "send the command".
+    Used under the serial session lock, like the port itself, so it needs no lock of its own.
+    '''
+
+    def __init__(self):
+        '''
+        Create an empty state: nothing is known.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        self.selected = None  # Channel selected by INST:SEL, None if unknown
+        self.setpoints = {}  # {(channel, "VOLT" or "CURR"): float}
+
+
+    def matches(self, channel, thing_to_change, value):
+        '''
+        Check whether a setpoint is already known to be in effect.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        channel (int): 1, 2, or 3. None if unknown
+        thing_to_change (string): "VOLT" or "CURR"
+        value (float or string): Setpoint
+
+        Returns
+        -------
+        True if sending the setpoint would change nothing
+
+        '''
+        if channel is None:
+            return False
+        try:
+            return self.setpoints.get((channel, thing_to_change)) == float(value)
+        except ValueError:
+            return False
+
+
+    def confirm(self, channel, thing_to_change, value):
+        '''
+        Record a setpoint as in effect. A value that is not a number forgets the setpoint instead.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        channel (int): 1, 2, or 3. None if unknown, which records nothing
+        thing_to_change (string): "VOLT" or "CURR"
+        value (float or string): Setpoint, or read-back reply
+
+        Returns
+        -------
+        None
+
+        '''
+        if channel is None:
+            return
+        try:
+            self.setpoints[(channel, thing_to_change)] = float(value)
+        except ValueError:
+            self.setpoints.pop((channel, thing_to_change), None)
+
+
+    def forget(self):
+        '''
+        Forget everything. Ex.: after an incomplete reply, when it is unknown which commands took effect.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        self.selected = None
+        self.setpoints.clear()
+
+
+    def snapshot(self):
+        '''
+        Copy of the known setpoints, for display.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        Dictionary of {channel: {"VOLT" and/or "CURR": float}}, plus {'selected': channel or None}
+
+        '''
+        snapshot = {'selected': self.selected}
+        for (channel, thing_to_change), value in list(self.setpoints.items()):
+            snapshot.setdefault(channel, {})[thing_to_change] = value
+        return snapshot
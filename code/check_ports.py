@@ -1,7 +1,10 @@
 '''
 Module to interface with computer COM ports.
 '''
-from serial.tools import list_ports
+
+
+# Status message template for one port. Filled in only if it reaches the screen
+PORT_TEMPLATE = '<br>{device}<br>\002\002\002\002\002Description: {description}<br>\002\002\002\002\002Hardware identification: {hwid}<br>\002\002\002\002\002Vendor ID: {vid}<br>\002\002\002\002\002Product ID: {pid}<br>\002\002\002\002\002Serial number: {serial_number}<br>\002\002\002\002\002Location: {location}<br>\002\002\002\002\002Manufacturer: {manufacturer}<br>\002\002\002\002\002Product: {product}<br>\002\002\002\002\002Interface: {interface}'
 
 
 class CheckPorts():
@@ -10,7 +13,7 @@ class CheckPorts():
     '''
 
     @staticmethod
-    def check_ports(update_status_callback):
+    def check_ports(update_status_callback, ports=None):
         '''
         Print a detailed list of all detected communication ports.
         Uses update_status_callback to update/refresh GUI.
@@ -18,6 +21,7 @@ class CheckPorts():
         Parameters
         ----------
         update_status_callback (function object): Defined in run.py, prints fed string to GUI status box + refreshes GUI
+        ports (list): Port descriptions to print, Ex.: from PortMonitor.ports(). Defaults to enumerating them now
 
         Returns
         -------
@@ -27,8 +31,11 @@ class CheckPorts():
         update_status_callback('<p style="font-size:12px; color:#DADADA; font-weight: bold;">' + f'<br>Port List<br>{"-"*110}' + '</p>')
 
         # Returns a list containing serial.tools.list_ports.ListPortInfo objects - see which are being referenced below
-        ports = list_ports.comports()
+        if ports is None:
+            from serial.tools import list_ports  # Imported on first use, as it is slow to load on some platforms
+            ports = list_ports.comports()
         for port in ports:
-            update_status_callback('<p style="font-size:11px; color:#DADADA;">' + f'<br>{port.device}<br>\002\002\002\002\002Description: {port.description}<br>\002\002\002\002\002Hardware identification: {port.hwid}<br>\002\002\002\002\002Vendor ID: {port.vid}<br>\002\002\002\002\002Product ID: {port.pid}<br>\002\002\002\002\002Serial number: {port.serial_number}<br>\002\002\002\002\002Location: {port.location}<br>\002\002\002\002\002Manufacturer: {port.manufacturer}<br>\002\002\002\002\002Product: {port.product}<br>\002\002\002\002\002Interface: {port.interface}' + '</p>')
-        update_status_callback('<p style="font-size:11px; color:#DADADA;">' + f'<br>{len(ports)} ports found' + '</p>')
+            update_status_callback(PORT_TEMPLATE, 'info', device=port.device, description=port.description, hwid=port.hwid, vid=port.vid, pid=port.pid, serial_number=port.serial_number,
+                                   location=port.location, manufacturer=port.manufacturer, product=port.product, interface=port.interface)
+        update_status_callback('<br>{count} ports found', 'info', count=len(ports))
         update_status_callback('<p style="font-size:12px; color:#DADADA; font-weight: bold;">' + f'<br>{"-"*110}<br><br>' + '</p>')
@@ -0,0 +1,465 @@
+'''
+Module containing the headless command line. Loads the serial layer only: no PyQt5, no NumPy.
+
+Usage:
+    python cli.py set --port COM5 --volt 12.0 [--curr 1.0] [--channel 2] [--verify]
+    python cli.py query --port COM5 [--channel 2] [VOLT? CURR? MEAS:VOLT? ...]
+    python cli.py stream --port COM5 [--interval 0.5] [--count 100 | --duration 60]
+    python cli.py negotiate --port COM5
+    python cli.py metrics --connect [host:port] [--format text | json | prometheus] [--reset]
+Any subcommand but negotiate takes --connect [host:port], to share the ports through a running instrument_server.py instead of opening them.
+Any subcommand but negotiate and metrics also takes --record PATH, to record every byte to and from the ports into a trace,
+or --replay PATH [--replay-speed X], to have a recorded trace answer instead of the instruments (see session_trace.py).
+metrics prints the server's latency histograms per port + command (see latency_metrics.py). Only a long-running server has any worth reading.
+--port takes the same port lists as the GUI fleet field. Ex.: "5", "COM5", "3-7, 12", "/dev/ttyUSB0"
+Every port uses its instrument's link profile from link_profiles.json (see link_profiles.py), unless --baud is given. negotiate fills the profile in.
+
+set and query print one JSON object. stream prints one JSON object per line, per sample.
+Exit codes are listed below, as EXIT_*. With several ports, the first failing port's code is returned.
+'''
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import serial
+from deadline_scheduler import DeadlineScheduler
+from fleet_control import FleetControl
+from instrument_limits import InstrumentLimits
+from instrument_server import RemoteSessions, server_address
+from latency_metrics import LatencyMetrics
+from link_profiles import LinkProfiles
+from session_trace import open_trace
+from scpi_transaction import ScpiTransaction
+from serial_sessions import SerialSessions
+
+
+EXIT_OK = 0
+EXIT_USAGE = 2  # Also argparse's own code for bad arguments
+EXIT_LIMITS = 3  # Setpoint outside instrument limits. Nothing was sent
+EXIT_COMMUNICATION = 4  # Port could not be opened, or the link failed
+EXIT_NO_REPLY = 5  # Instrument did not answer
+EXIT_VERIFY = 6  # Read-back differs from the setpoint
+
+DEFAULT_QUERIES = ('VOLT?', 'CURR?', 'MEAS:VOLT?', 'MEAS:CURR?', 'MEAS:POW?')
+
+
+class CommandLine():
+    '''
+    Class containing the command-line subcommands. Each returns (JSON-ready result, exit code).
+    '''
+
+    @staticmethod
+    def on_ports(ports, function):
+        '''
+        Run function(com_port) on every port at once, and collect the results in port order.
+
+        Parameters
+        ----------
+        ports (list): Port names
+        function (function object): Returns (result dictionary, exit code) for one port
+
+        Returns
+        -------
+        (list of result dictionaries, exit code of the first failing port or EXIT_OK)
+
+        '''
+        with ThreadPoolExecutor(max_workers=len(ports)) as executor:
+            outcomes = list(executor.map(function, ports))
+
+        exit_code = next((code for _, code in outcomes if code != EXIT_OK), EXIT_OK)
+        return [result for result, _ in outcomes], exit_code
+
+
+    @staticmethod
+    def set(ports, setpoints, channel, verify, sessions, settings):
+        '''
+        Send setpoints, confirmed with *OPC?, or with VOLT?/CURR? read-backs when verify is set.
+
+        Parameters
+        ----------
+        ports (list): Port names
+        setpoints (dictionary): {"VOLT" or "CURR": value string}
+        channel (int): Output channel to select first. None leaves the selection alone
+        verify (bool): Read every setpoint back and compare
+        sessions (SerialSessions): Pool of open serial port sessions
+        settings (dictionary): Serial settings. Ex.: {'timeout': 3.0}
+
+        Returns
+        -------
+        (result dictionary, exit code)
+
+        '''
+        for thing_to_change, value in setpoints.items():
+            limit_error = InstrumentLimits.check(thing_to_change, value)
+            if limit_error is not None:
+                return {'command': 'set', 'error': limit_error}, EXIT_LIMITS
+
+        def set_one(com_port):
+            transaction = ScpiTransaction()
+            if channel is not None:
+                transaction.select(channel)
+            for thing_to_change, value in setpoints.items():
+                transaction.set(thing_to_change, value)
+                if verify:
+                    transaction.query(f'{thing_to_change}?', thing_to_change)
+
+            result = {'port': com_port, 'channel': channel, 'passed': False, 'error': None}
+            start_time = time.perf_counter()
+            try:
+                replies = transaction.execute(com_port, sessions, **settings)
+            except (serial.serialutil.SerialException, OSError) as error:
+                result.update({'error': f'Could not communicate: {error}', 'latency': time.perf_counter() - start_time})
+                return result, EXIT_COMMUNICATION
+            result['latency'] = time.perf_counter() - start_time
+
+            if any(reply == '' for reply in replies.values()):
+                result['error'] = 'No reply'
+                return result, EXIT_NO_REPLY
+
+            for thing_to_change, value in setpoints.items():
+                result[thing_to_change] = {'set': float(value)}
+                if verify:
+                    try:
+                        read_back = float(replies[thing_to_change])
+                    except ValueError:
+                        read_back = None
+                    result[thing_to_change].update({'read_back': read_back, 'passed': InstrumentLimits.confirms(read_back, value)})
+
+            if verify and not all(result[thing_to_change]['passed'] for thing_to_change in setpoints):
+                result['error'] = 'Confirmation failed'
+                return result, EXIT_VERIFY
+
+            result['passed'] = True
+            return result, EXIT_OK
+
+        results, exit_code = CommandLine.on_ports(ports, set_one)
+        return {'command': 'set', 'verified': verify, 'results': results}, exit_code
+
+
+    @staticmethod
+    def query(ports, queries, channel, sessions, settings):
+        '''
+        Send queries in one compound line, and return the replies.
+
+        Parameters
+        ----------
+        ports (list): Port names
+        queries (list): SCPI queries. Ex.: ['VOLT?', 'MEAS:CURR?']
+        channel (int): Output channel to select first. None leaves the selection alone
+        sessions (SerialSessions): Pool of open serial port sessions
+        settings (dictionary): Serial settings. Ex.: {'timeout': 3.0}
+
+        Returns
+        -------
+        (result dictionary, exit code)
+
+        '''
+        def query_one(com_port):
+            transaction = ScpiTransaction()
+            if channel is not None:
+                transaction.query_channel(channel, *queries)
+            else:
+                for command in queries:
+                    transaction.query(command)
+
+            result = {'port': com_port, 'channel': channel, 'replies': None, 'error': None}
+            start_time = time.perf_counter()
+            try:
+                replies = transaction.execute(com_port, sessions, **settings)
+            except (serial.serialutil.SerialException, OSError) as error:
+                result.update({'error': f'Could not communicate: {error}', 'latency': time.perf_counter() - start_time})
+                return result, EXIT_COMMUNICATION
+            result['latency'] = time.perf_counter() - start_time
+
+            result['replies'] = {label if not isinstance(label, tuple) else label[1]: reply for label, reply in replies.items()}
+            if any(reply == '' for reply in replies.values()):
+                result['error'] = 'No reply'
+                return result, EXIT_NO_REPLY
+            return result, EXIT_OK
+
+        results, exit_code = CommandLine.on_ports(ports, query_one)
+        return {'command': 'query', 'results': results}, exit_code
+
+
+    @staticmethod
+    def stream(com_port, channel, interval, count, duration, sessions, settings, output=sys.stdout):
+        '''
+        Measure voltage, current, and power at a fixed interval, printing one JSON line per sample.
+
+        Parameters
+        ----------
+        com_port (string): Name of the serial port
+        channel (int): Output channel. None leaves the selection alone
+        interval (float): Seconds between samples. 0 samples as fast as the instrument answers
+        count (int): Stop after this many samples. None for no limit
+        duration (float): Stop after this many seconds. None for no limit
+        sessions (SerialSessions): Pool of open serial port sessions
+        settings (dictionary): Serial settings. Ex.: {'timeout': 3.0}
+        output (file object): Where sample lines go
+
+        Returns
+        -------
+        (summary dictionary, exit code)
+
+        '''
+        transaction = ScpiTransaction()
+        if channel is not None:
+            transaction.query_channel(channel, 'MEAS:VOLT?', 'MEAS:CURR?', 'MEAS:POW?')
+        else:
+            for command in ('MEAS:VOLT?', 'MEAS:CURR?', 'MEAS:POW?'):
+                transaction.query(command, (None, command))
+
+        scheduler = DeadlineScheduler()
+        scheduler.start()
+        samples = 0
+        exit_code = EXIT_OK
+        try:
+            while (count is None or samples < count) and (duration is None or scheduler.elapsed() < duration):
+                scheduler.wait_until(samples * interval)
+                try:
+                    replies = transaction.execute(com_port, sessions, **settings)
+                except (serial.serialutil.SerialException, OSError) as error:
+                    print(json.dumps({'port': com_port, 'error': f'Could not communicate: {error}'}), file=output, flush=True)
+                    exit_code = EXIT_COMMUNICATION
+                    break
+
+                values = [replies[(channel, command)] for command in ('MEAS:VOLT?', 'MEAS:CURR?', 'MEAS:POW?')]
+                if '' in values:
+                    print(json.dumps({'port': com_port, 'error': 'No reply'}), file=output, flush=True)
+                    exit_code = EXIT_NO_REPLY
+                    break
+
+                try:
+                    voltage, current, power = (float(value) for value in values)
+                except ValueError:
+                    # Ex.: a garbled line, or an error message in place of a measurement
+                    print(json.dumps({'port': com_port, 'error': 'Unexpected reply', 'replies': values}), file=output, flush=True)
+                    exit_code = EXIT_COMMUNICATION
+                    break
+
+                print(json.dumps({'port': com_port, 'time': time.time(), 'voltage': voltage, 'current': current, 'power': power}), file=output, flush=True)
+                samples += 1
+
+        except KeyboardInterrupt:
+            pass
+
+        return {'command': 'stream', 'port': com_port, 'samples': samples, 'seconds': round(scheduler.elapsed(), 3)}, exit_code
+
+
+    @staticmethod
+    def negotiate(ports, profiles):
+        '''
+        Find the fastest baud rate each supply answers at, and store it in its link profile.
+
+        Parameters
+        ----------
+        ports (list): Port names
+        profiles (LinkProfiles): Link profile store
+
+        Returns
+        -------
+        (result dictionary, exit code)
+
+        '''
+        def negotiate_one(com_port):
+            result = {'port': com_port, 'baudrate': None, 'identity': None, 'error': None}
+            try:
+                negotiated = profiles.negotiate(com_port)
+            except (serial.serialutil.SerialException, OSError) as error:
+                result['error'] = f'Could not communicate: {error}'
+                return result, EXIT_COMMUNICATION
+
+            result.update({'baudrate': negotiated['baudrate'], 'identity': negotiated['identity'], 'attempts': negotiated['attempts']})
+            if negotiated['baudrate'] is None:
+                result['error'] = 'No reply at any baud rate'
+                return result, EXIT_NO_REPLY
+            return result, EXIT_OK
+
+        results, exit_code = CommandLine.on_ports(ports, negotiate_one)
+        return {'command': 'negotiate', 'results': results}, exit_code
+
+
+    @staticmethod
+    def metrics(connect, output_format='json', reset=False, output=sys.stdout):
+        '''
+        Print a running instrument server's latency histograms.
+
+        Parameters
+        ----------
+        connect (string): Server address, "host:port". None or empty for the default
+        output_format (string): "text", "json", or "prometheus"
+        reset (bool): Have the server forget every sample once they are printed
+        output (file object): Where to print. Defaults to sys.stdout
+
+        Returns
+        -------
+        Exit code
+
+        '''
+        try:
+            sessions = RemoteSessions(server_address(connect), client_name='cli')
+        except ValueError as error:
+            print(json.dumps({'command': 'metrics', 'error': str(error)}), file=output)
+            return EXIT_USAGE
+
+        try:
+            snapshot = sessions.latency_metrics()
+            if reset:
+                sessions.reset_latency_metrics()
+        except serial.serialutil.SerialException as error:
+            print(json.dumps({'command': 'metrics', 'error': str(error)}), file=output)
+            return EXIT_COMMUNICATION
+        finally:
+            sessions.close_all()
+
+        if output_format == 'text':
+            print(LatencyMetrics.text(snapshot), file=output)
+        elif output_format == 'prometheus':
+            print(LatencyMetrics.prometheus(snapshot), end='', file=output)
+        else:
+            print(json.dumps({'command': 'metrics', 'ports': snapshot}), file=output)
+        return EXIT_OK
+
+
+    @staticmethod
+    def parser():
+        '''
+        Build the argument parser.
+
+        Parameters
+        ----------
+        N/A
+
+        Returns
+        -------
+        argparse.ArgumentParser object
+
+        '''
+        parser = argparse.ArgumentParser(prog='cli.py', description='Headless control of BK Precision 9141 power supplies.')
+        subcommands = parser.add_subparsers(dest='command', required=True)
+
+        def common(subcommand):
+            subcommand.add_argument('--port', required=True, help='Port list. Ex.: "5", "COM5", "3-7, 12", "/dev/ttyUSB0"')
+            subcommand.add_argument('--channel', type=int, choices=(1, 2, 3), help='Output channel to select first')
+            subcommand.add_argument('--timeout', type=float, default=3.0, help='Longest wait for a reply, in seconds')
+            subcommand.add_argument('--baud', type=int, help='Baud rate. Overrides the link profile')
+            subcommand.add_argument('--connect', nargs='?', const='', metavar='HOST:PORT', help='Go through a running instrument_server.py. Default: 127.0.0.1:5025')
+            trace = subcommand.add_mutually_exclusive_group()
+            trace.add_argument('--record', metavar='PATH', help='Record every byte to and from the ports into a trace file')
+            trace.add_argument('--replay', metavar='PATH', help='Answer from a recorded trace file instead of the instruments')
+            subcommand.add_argument('--replay-speed', type=float, default=1.0, help='With --replay: 1.0 keeps the recorded timing, 0 answers straight away')
+
+        set_parser = subcommands.add_parser('set', help='Set voltage and/or current')
+        common(set_parser)
+        set_parser.add_argument('--volt', help='Voltage setpoint')
+        set_parser.add_argument('--curr', help='Current setpoint')
+        set_parser.add_argument('--verify', action='store_true', help='Read setpoints back and compare')
+
+        query_parser = subcommands.add_parser('query', help='Send SCPI queries')
+        common(query_parser)
+        query_parser.add_argument('queries', nargs='*', default=list(DEFAULT_QUERIES), help=f'Default: {" ".join(DEFAULT_QUERIES)}')
+
+        stream_parser = subcommands.add_parser('stream', help='Print measurements continuously, one JSON line each')
+        common(stream_parser)
+        stream_parser.add_argument('--interval', type=float, default=0.5, help='Seconds between samples. 0 for as fast as possible')
+        stream_parser.add_argument('--count', type=int, help='Stop after this many samples')
+        stream_parser.add_argument('--duration', type=float, help='Stop after this many seconds')
+
+        negotiate_parser = subcommands.add_parser('negotiate', help='Find and remember the fastest baud rate each supply answers at')
+        common(negotiate_parser)
+
+        metrics_parser = subcommands.add_parser('metrics', help="Print a running instrument server's latency histograms")
+        metrics_parser.add_argument('--connect', nargs='?', const='', metavar='HOST:PORT', help='Instrument server. Default: 127.0.0.1:5025')
+        metrics_parser.add_argument('--format', choices=('text', 'json', 'prometheus'), default='json', help='text: table. prometheus: text exposition format')
+        metrics_parser.add_argument('--reset', action='store_true', help='Forget every sample after printing')
+
+        return parser
+
+
+    @staticmethod
+    def main(argv=None):
+        '''
+        Run one subcommand, print its JSON result, and return its exit code.
+
+        Parameters
+        ----------
+        argv (list): Arguments, without the program name. Defaults to sys.argv[1:]
+
+        Returns
+        -------
+        Exit code
+
+        '''
+        arguments = CommandLine.parser().parse_args(argv)
+        profiles = LinkProfiles()
+        if arguments.command == 'metrics':
+            return CommandLine.metrics(arguments.connect, arguments.format, arguments.reset)
+
+        if (arguments.record or arguments.replay) and (arguments.connect is not None or arguments.command == 'negotiate'):
+            print(json.dumps({'command': arguments.command, 'error': '--record and --replay work on ports opened here: not with --connect, nor with negotiate'}))
+            return EXIT_USAGE
+        try:
+            serial_factory, trace = open_trace(arguments.record, arguments.replay, arguments.replay_speed, description='cli.py ' + ' '.join(sys.argv[1:] if argv is None else argv))
+        except (OSError, ValueError) as error:
+            print(json.dumps({'command': arguments.command, 'error': str(error)}))
+            return EXIT_USAGE
+
+        if arguments.connect is None:
+            sessions = SerialSessions(serial_factory=serial_factory, profiles=profiles)
+        elif arguments.command == 'negotiate':
+            print(json.dumps({'command': 'negotiate', 'error': 'negotiate needs the ports to itself: stop the instrument server, and run it without --connect'}))
+            return EXIT_USAGE
+        else:
+            try:
+                sessions = RemoteSessions(server_address(arguments.connect), client_name='cli')
+            except ValueError as error:
+                print(json.dumps({'command': arguments.command, 'error': str(error)}))
+                return EXIT_USAGE
+        settings = {'timeout': arguments.timeout}
+        if arguments.baud is not None:
+            settings['baudrate'] = arguments.baud
+
+        try:
+            ports = FleetControl.parse_ports(arguments.port, FleetControl.load_groups())
+        except ValueError as error:
+            print(json.dumps({'command': arguments.command, 'error': str(error)}))
+            return EXIT_USAGE
+
+        try:
+            if arguments.command == 'set':
+                setpoints = {thing_to_change: value for thing_to_change, value in (('VOLT', arguments.volt), ('CURR', arguments.curr)) if value is not None}
+                if not setpoints:
+                    print(json.dumps({'command': 'set', 'error': 'Nothing to set: give --volt and/or --curr'}))
+                    return EXIT_USAGE
+                try:
+                    [float(value) for value in setpoints.values()]
+                except ValueError as error:
+                    print(json.dumps({'command': 'set', 'error': str(error)}))
+                    return EXIT_USAGE
+                result, exit_code = CommandLine.set(ports, setpoints, arguments.channel, arguments.verify, sessions, settings)
+
+            elif arguments.command == 'negotiate':
+                result, exit_code = CommandLine.negotiate(ports, profiles)
+
+            elif arguments.command == 'query':
+                result, exit_code = CommandLine.query(ports, [query.upper() for query in arguments.queries], arguments.channel, sessions, settings)
+
+            else:
+                if len(ports) != 1:
+                    print(json.dumps({'command': 'stream', 'error': 'stream takes exactly one port'}))
+                    return EXIT_USAGE
+                result, exit_code = CommandLine.stream(ports[0], arguments.channel, arguments.interval, arguments.count, arguments.duration, sessions, settings)
+
+        finally:
+            sessions.close_all()
+            if trace is not None:
+                trace.close()
+
+        print(json.dumps(result))
+        return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(CommandLine.main())
@@ -0,0 +1,200 @@
+'''
+Module to run actions at precise times on the monotonic clock.
+'''
+import collections
+import math
+import time
+
+
+class DeadlineScheduler():
+    '''
+    Class containing a monotonic-clock scheduler working from absolute deadlines.
+    Deadlines are offsets from one fixed start time, so lateness in one step never pushes back the steps after it.
+    '''
+
+    SPIN_MARGIN = 0.002  # Seconds before a deadline at which sleeping stops and busy-waiting takes over, for sub-millisecond accuracy
+
+    def __init__(self, cancelled=None):
+        '''
+        Create an idle scheduler. The clock starts with start().
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        cancelled (function object): Optional callable returning True when waiting should be abandoned
+
+        Returns
+        -------
+        None
+
+        '''
+        self.cancelled = cancelled or (lambda: False)
+        self.start_time = None
+
+
+    def start(self):
+        '''
+        Set time zero for every deadline.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        self.start_time = time.monotonic()
+
+
+    def elapsed(self):
+        '''
+        Seconds since start().
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        float
+
+        '''
+        return time.monotonic() - self.start_time
+
+
+    def wait_until(self, offset):
+        '''
+        Block until offset seconds after start(). Returns immediately if that time has already passed.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        offset (float): Deadline, in seconds after start()
+
+        Returns
+        -------
+        Timing error in seconds: positive when the deadline was missed, ~0 when it was hit. None if cancelled while waiting
+
+        '''
+        deadline = self.start_time + offset
+        while True:
+            if self.cancelled():
+                return None
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return -remaining
+
+            if remaining > self.SPIN_MARGIN:
+                # Sleep in short slices, so a cancel request is noticed quickly
+                time.sleep(min(remaining - self.SPIN_MARGIN, 0.05))
+
+
+
+class FixedRateScheduler(DeadlineScheduler):
+    '''
+    Class containing a scheduler that wakes once per period, for control loops, and keeps statistics on how well it kept time.
+    A tick that is missed entirely (the work took longer than a period) is skipped rather than run late, so the loop never bunches up to catch up.
+    '''
+
+    def __init__(self, period, cancelled=None, window=4096):
+        '''
+        Create an idle scheduler. The clock starts with start().
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        period (float): Seconds between ticks
+        cancelled (function object): Optional callable returning True when waiting should be abandoned
+        window (int): Number of recent ticks the timing statistics cover
+
+        Returns
+        -------
+        None
+
+        '''
+        DeadlineScheduler.__init__(self, cancelled)
+        self.period = period
+        self.tick = 0
+        self.overruns = 0  # Ticks skipped because the work before them ran past them
+        self.lateness = collections.deque(maxlen=window)  # Seconds each tick woke after its deadline
+        self.work_times = collections.deque(maxlen=window)  # Seconds between waking and asking for the next tick
+        self.woken = None
+
+
+    def start(self):
+        '''
+        Set time zero, which is also the first tick.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        DeadlineScheduler.start(self)
+        self.tick = 0
+        self.overruns = 0
+        self.lateness.clear()
+        self.work_times.clear()
+        self.woken = self.start_time
+
+
+    def wait_next(self):
+        '''
+        Block until the next tick, skipping any tick that has already been missed entirely.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        Lateness of this tick in seconds (~0 when on time). None if cancelled while waiting
+
+        '''
+        now = time.monotonic()
+        self.work_times.append(now - self.woken)
+
+        self.tick += 1
+        # Only a tick whose successor is also already due counts as missed. One that is merely late still runs, straight away
+        missed = math.floor((now - self.start_time) / self.period) - self.tick
+        if missed > 0:
+            self.overruns += missed
+            self.tick += missed
+
+        lateness = self.wait_until(self.tick * self.period)
+        self.woken = time.monotonic()
+        if lateness is not None:
+            self.lateness.append(lateness)
+        return lateness
+
+
+    def statistics(self):
+        '''
+        Loop timing summary, for display.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        Dictionary of {'period', 'ticks', 'overruns', 'lateness_p50', 'lateness_p99', 'lateness_max', 'work_p50', 'work_p99', 'work_max'}.
+        Times in seconds, None without samples
+
+        '''
+        def percentile(samples, fraction):
+            ordered = sorted(samples)
+            if not ordered:
+                return None
+            return ordered[min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1)]
+
+        return {'period': self.period, 'ticks': self.tick, 'overruns': self.overruns,
+                'lateness_p50': percentile(self.lateness, 0.50), 'lateness_p99': percentile(self.lateness, 0.99), 'lateness_max': max(self.lateness, default=None),
+                'work_p50': percentile(self.work_times, 0.50), 'work_p99': percentile(self.work_times, 0.99), 'work_max': max(self.work_times, default=None)}
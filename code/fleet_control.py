@@ -0,0 +1,190 @@
+'''
+Module to apply one setpoint to many power supplies at once.
+'''
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import serial
+from instrument_limits import InstrumentLimits
+from remote_control import RemoteControl
+from serial_sessions import serial_sessions
+
+
+# Optional file mapping group names to port lists. Ex.: {"bench_a": "3-7", "rack": ["bench_a", "12"]}
+GROUPS_FILE = 'fleet_groups.json'
+
+
+class FleetControl():
+    '''
+    Class containing functions to set + verify many instruments concurrently, each on its own port.
+    Wall time is that of the slowest instrument, not the sum of all of them.
+    '''
+
+    @staticmethod
+    def load_groups(path=GROUPS_FILE):
+        '''
+        Read named port groups from a JSON file.
+
+        Parameters
+        ----------
+        path (string): JSON file of {group name: port list string or list of port/group names}
+
+        Returns
+        -------
+        Dictionary of groups. Empty if the file does not exist
+
+        '''
+        if not Path(path).is_file():
+            return {}
+
+        with open(path, 'r', encoding='utf-8') as groups_file:
+            return json.load(groups_file)
+
+
+    @staticmethod
+    def parse_ports(text, groups=None):
+        '''
+        Expand a port list into port names.
+        Numbers become COM ports, "a-b" is an inclusive, ascending range, group names expand to their members, and anything else is used as-is (Ex.: "/dev/ttyUSB0").
+
+        Parameters
+        ----------
+        text (string or list): Ex.: "3-5, 8, bench_a"
+        groups (dictionary): Named groups, as returned by load_groups
+
+        Returns
+        -------
+        List of unique port names, in first-seen order. Ex.: ['COM3', 'COM4', 'COM5', 'COM8']
+
+        Raises
+        ------
+        ValueError if a group refers back to itself, or a range runs backwards. Ex.: "7-3"
+
+        '''
+        groups = groups or {}
+        ports = []
+
+        def expand(entry, seen_groups):
+            tokens = entry if isinstance(entry, list) else entry.split(',')
+            for token in tokens:
+                token = token.strip()
+                if token == '':
+                    continue
+
+                if token in groups:
+                    if token in seen_groups:
+                        raise ValueError(f'Port group "{token}" contains itself')
+                    expand(groups[token], seen_groups | {token})
+
+                elif token.isdigit():
+                    ports.append(f'COM{token}')
+
+                elif '-' in token and all(part.strip().isdigit() for part in token.split('-', 1)):
+                    first, last = (int(part) for part in token.split('-', 1))
+                    if first > last:
+                        raise ValueError(f'Port range "{token}" runs backwards. Ex.: "{last}-{first}"')
+                    ports.extend(f'COM{number}' for number in range(first, last + 1))
+
+                else:
+                    ports.append(token)
+
+        expand(text, frozenset())
+        return list(dict.fromkeys(ports))
+
+
+    @staticmethod
+    def apply(ports, thing_to_change, value, sessions=serial_sessions, max_workers=None, session_log=None, channel=None):
+        '''
+        Set + verify a value on every port concurrently. Headless: no GUI, no dialogs.
+
+        Parameters
+        ----------
+        ports (list): Port names. Ex.: ['COM3', 'COM4']
+        thing_to_change (string): "VOLT" or "CURR"
+        value (string): Value to set
+        sessions (SerialSessions): Pool of open serial port sessions. Defaults to the shared pool in serial_sessions.py
+        max_workers (int): Upper bound on simultaneous transactions. Defaults to one per port
+        session_log (SessionLog): Optional binary log receiving one record per instrument
+        channel (int): Output channel, 1, 2, or 3. None uses whichever channel is selected on each instrument
+
+        Returns
+        -------
+        List of dictionaries, one per port, in the order given:
+        {'port': string, 'passed': bool, 'value_found': string or None, 'latency': seconds, 'error': string or None, 'unchanged': bool}
+        unchanged is True when the setpoint was already in effect, so only the check query was sent
+
+        '''
+        if not ports:
+            return []
+
+        def set_one(com_port):
+            start_time = time.perf_counter()
+            result = {'port': com_port, 'passed': False, 'value_found': None, 'latency': 0.0, 'error': None, 'unchanged': False}
+            try:
+                skipped = []
+                value_found = RemoteControl.set_and_check(com_port, thing_to_change, value, sessions, session_log, channel, skipped).strip()
+                result['unchanged'] = any(command.startswith(thing_to_change) for command in skipped)
+                result['value_found'] = value_found
+                if value_found == '':
+                    result['error'] = 'No reply'
+                elif not InstrumentLimits.confirms(value_found, value):
+                    result['error'] = 'Confirmation failed'
+                else:
+                    result['passed'] = True
+
+            except (serial.serialutil.SerialException, OSError) as error:
+                result['error'] = f'Could not communicate: {error}'
+
+            except ValueError:
+                result['error'] = 'Unreadable reply'
+
+            result['latency'] = time.perf_counter() - start_time
+            return result
+
+        with ThreadPoolExecutor(max_workers=max_workers or len(ports)) as executor:
+            return list(executor.map(set_one, ports))
+
+
+    @staticmethod
+    def fleet_control(update_status_callback, ports, thing_to_change, value, sessions=serial_sessions, session_log=None, channel=None):
+        '''
+        GUI counterpart to apply(): runs it, then prints a per-instrument report.
+        Uses update_status_callback to update/refresh GUI.
+
+        Parameters
+        ----------
+        update_status_callback (function object): Defined in run.py, prints fed string to GUI status box + refreshes GUI
+        ports (list): Port names. Ex.: ['COM3', 'COM4']
+        thing_to_change (string): "VOLT" or "CURR"
+        value (string): Value to set
+        sessions (SerialSessions): Pool of open serial port sessions. Defaults to the shared pool in serial_sessions.py
+        session_log (SessionLog): Optional binary log receiving one record per instrument
+        channel (int): Output channel, 1, 2, or 3. None uses whichever channel is selected on each instrument
+
+        Returns
+        -------
+        A Boolean value of True is returned if any instrument failed.
+        Returns "None", otherwise.
+
+        '''
+        update_status_callback('<p style="font-size:11px; color:#DADADA;">' + f'[Deploying remote control algorithms to {len(ports)} instruments]' + '</p>')
+
+        start_time = time.perf_counter()
+        results = FleetControl.apply(ports, thing_to_change, value, sessions, session_log=session_log, channel=channel)
+        wall_time = time.perf_counter() - start_time
+
+        for result in results:
+            if result['passed']:
+                update_status_callback('{port}: PASS, read back {value_found} in {latency_ms:.1f} ms{note}', 'info', port=result['port'], value_found=result['value_found'], latency_ms=result['latency'] * 1000,
+                                       note=' (already set, check only)' if result['unchanged'] else '')
+            else:
+                update_status_callback('{port}: FAIL, {error} after {latency_ms:.1f} ms', 'error', port=result['port'], error=result['error'], latency_ms=result['latency'] * 1000)
+
+        passed = sum(result['passed'] for result in results)
+        slowest = max((result['latency'] for result in results), default=0.0)
+        update_status_callback('<p style="font-size:11px; color:#DADADA;">' + f'<br>{passed}/{len(results)} instruments passed. Wall time {wall_time * 1000:.1f} ms, slowest instrument {slowest * 1000:.1f} ms' + '</p>')
+
+        if passed != len(results):
+            return True
@@ -0,0 +1,109 @@
+'''
+Module containing the BK Precision 9141 setpoint limits.
+'''
+
+
+class InstrumentLimits():
+    '''
+    Class containing the instrument setpoint limits, and the check applied before anything is sent to the instrument.
+    '''
+
+    # BK Precision 9141:
+    # 60.600 > V > 0.000
+    # 4.040 > I > 0.015
+    # {thing_to_change: (minimum, maximum, limits text for messages)}
+    LIMITS = {
+        'VOLT': (0.0, 60.600, 'Set voltage value not within instrument limits: 60.600 > V > 0'),
+        'CURR': (0.015, 4.040, 'Set current value not within instrument limits: 4.040 > I > 0.015'),
+    }
+
+    # Half the instrument's 1 mV / 1 mA setpoint resolution. Read-backs closer than this to a setpoint confirm it
+    TOLERANCE = 0.0005
+
+    @staticmethod
+    def check(thing_to_change, value):
+        '''
+        Check a setpoint against the instrument limits.
+
+        Parameters
+        ----------
+        thing_to_change (string): "VOLT" or "CURR"
+        value (float or string): Setpoint
+
+        Returns
+        -------
+        None if the setpoint is within limits, otherwise a string describing the violated limit.
+
+        '''
+        if thing_to_change not in InstrumentLimits.LIMITS:
+            return f'Unknown function "{thing_to_change}". Expected one of: {", ".join(InstrumentLimits.LIMITS)}'
+
+        minimum, maximum, message = InstrumentLimits.LIMITS[thing_to_change]
+        if not maximum >= float(value) >= minimum:
+            return message
+
+        return None
+
+
+    @staticmethod
+    def confirms(value_found, value):
+        '''
+        Check whether a read-back confirms a setpoint, to within the instrument's resolution.
+
+        Parameters
+        ----------
+        value_found (float or string): Value read back from the instrument
+        value (float or string): Setpoint
+
+        Returns
+        -------
+        True if the read-back matches. False if it differs, or is not a number
+
+        '''
+        try:
+            return abs(float(value_found) - float(value)) < InstrumentLimits.TOLERANCE
+        except (TypeError, ValueError):
+            return False
+
+
+    @staticmethod
+    def clamp(thing_to_change, value):
+        '''
+        Limit a setpoint to the instrument range.
+
+        Parameters
+        ----------
+        thing_to_change (string): "VOLT" or "CURR"
+        value (float): Setpoint
+
+        Returns
+        -------
+        float within limits
+
+        '''
+        minimum, maximum, _ = InstrumentLimits.LIMITS[thing_to_change]
+        return min(max(float(value), minimum), maximum)
+
+
+    @staticmethod
+    def slew(thing_to_change, previous, value, seconds, rate):
+        '''
+        Limit a setpoint change to what rate allows in the given time, then to the instrument range.
+
+        Parameters
+        ----------
+        thing_to_change (string): "VOLT" or "CURR"
+        previous (float): Setpoint in effect. None skips the slew limit
+        value (float): Requested setpoint
+        seconds (float): Time since previous was set
+        rate (float): Fastest change allowed, in units per second. Ex.: regulation.py's slew rate
+
+        Returns
+        -------
+        float within limits
+
+        '''
+        if previous is not None:
+            step = rate * seconds
+            value = min(max(float(value), previous - step), previous + step)
+        return InstrumentLimits.clamp(thing_to_change, value)
@@ -0,0 +1,1114 @@
+'''
+Module to share serial ports between several applications, through a small TCP server that owns the serial sessions.
+
+Only one process can hold a COM port open. The server holds them all, and clients (the GUI, cli.py, scripts) send it requests over a local socket.
+Requests for one port are queued, and sent one at a time by that port's scheduler thread, so clients never collide on the link.
+The queue is fair: higher priority first, then round-robin between clients, so a busy script cannot starve the GUI.
+Identical read-only queries arriving within cache_ttl seconds of each other are answered from a read cache, and never reach the link.
+
+Protocol: one JSON object per line, each way.
+    Request:  {"id": 7, "method": "transaction", "params": {"port": "COM5", "transaction": {...}, "client": "gui", "priority": 0}}
+    Response: {"id": 7, "result": {...}, "error": null}
+    Error:    {"id": 7, "result": null, "error": {"type": "SerialException", "message": "..."}}
+
+Start the server:
+    python instrument_server.py --port 5025
+
+Then point the GUI at it with "python run.py --connect" (or REMOTE_CONTROL_SERVER=127.0.0.1:5025), and cli.py with --connect.
+'''
+import argparse
+import collections
+import itertools
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import serial
+from link_profiles import DEFAULT_PROFILE, LinkProfiles
+from scpi_transaction import ScpiTransaction
+from serial_sessions import DEFAULT_SETTINGS, SerialSessions
+
+
+# Local only by default: anything able to reach the socket can drive the supplies
+SERVER_ADDRESS = ('127.0.0.1', 5025)
+
+# Seconds an identical read-only query is answered from the read cache
+CACHE_TTL = 0.25
+
+# Seconds a client waits for a reply, including time queued behind other clients
+CLIENT_TIMEOUT = 30.0
+
+
+def server_address(text=None):
+    '''
+    Parse a "host:port", "host", or ":port" server address. Missing parts fall back to SERVER_ADDRESS.
+
+    Parameters
+    ----------
+    text (string): Address. None or empty gives SERVER_ADDRESS
+
+    Returns
+    -------
+    (host, port) tuple
+
+    Raises
+    ------
+    ValueError if the port is not a number
+
+    '''
+    if not text:
+        return SERVER_ADDRESS
+    host, _, port = text.rpartition(':') if ':' in text else (text, '', '')
+    return (host or SERVER_ADDRESS[0], int(port) if port else SERVER_ADDRESS[1])
+
+
+def requested_server(argv=None, environ=None):
+    '''
+    Server address the GUI was asked to connect to: "--connect [host:port]" on the command line, or the REMOTE_CONTROL_SERVER environment variable.
+
+    Parameters
+    ----------
+    argv (list): Command line. Defaults to sys.argv
+    environ (dictionary): Environment. Defaults to os.environ
+
+    Returns
+    -------
+    (host, port) tuple, or None to use the serial ports directly
+
+    '''
+    argv = sys.argv if argv is None else argv
+    environ = os.environ if environ is None else environ
+
+    if '--connect' in argv:
+        index = argv.index('--connect')
+        following = argv[index + 1] if index + 1 < len(argv) else ''
+        return server_address('' if following.startswith('-') else following)
+    if environ.get('REMOTE_CONTROL_SERVER'):
+        return server_address(environ['REMOTE_CONTROL_SERVER'])
+    return None
+
+
+class FairScheduler():
+    '''
+    Class containing one port's request queue: one FIFO per client, served highest priority first, and round-robin between clients of equal priority.
+    '''
+
+    def __init__(self):
+        '''
+        Create an empty queue.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        self.queues = {}  # {priority: OrderedDict of {client: deque of jobs}}. The first client in each OrderedDict is served next
+        self.condition = threading.Condition()
+
+
+    def put(self, client, priority, job):
+        '''
+        Queue a job behind the client's earlier jobs.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        client (string): Client name. Jobs of one client always run in order
+        priority (int): Higher runs first
+        job (object): Anything. Handed back by get()
+
+        Returns
+        -------
+        None
+
+        '''
+        with self.condition:
+            self.queues.setdefault(priority, collections.OrderedDict()).setdefault(client, collections.deque()).append(job)
+            self.condition.notify()
+
+
+    def get(self, timeout=None):
+        '''
+        Take the next job, waiting for one if the queue is empty.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        timeout (float): Longest wait, in seconds. None waits forever
+
+        Returns
+        -------
+        Job, or None if the wait timed out
+
+        '''
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.queues, timeout):
+                return None
+
+            priority = max(self.queues)
+            clients = self.queues[priority]
+            client, jobs = next(iter(clients.items()))
+            job = jobs.popleft()
+
+            # The client goes to the back of the line, or leaves it if it has nothing else queued
+            if jobs:
+                clients.move_to_end(client)
+            else:
+                del clients[client]
+            if not clients:
+                del self.queues[priority]
+            return job
+
+
+    def depth(self):
+        '''
+        Number of queued jobs.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        Integer
+
+        '''
+        with self.condition:
+            return sum(len(jobs) for clients in self.queues.values() for jobs in clients.values())
+
+
+class InstrumentServer():
+    '''
+    Class containing the serial session pool, one scheduler thread per port, the read cache, and the TCP listener in front of them.
+    '''
+
+    def __init__(self, sessions=None, address=SERVER_ADDRESS, cache_ttl=CACHE_TTL):
+        '''
+        Create the server. Nothing listens until start() or serve_forever() is called.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        sessions (SerialSessions): Pool the server owns. Defaults to one using the stored link profiles
+        address (tuple): (host, port) to listen on. Port 0 picks a free one
+        cache_ttl (float): Seconds identical read-only queries are answered from the read cache. 0 disables the cache
+
+        Returns
+        -------
+        None
+
+        '''
+        self.sessions = SerialSessions(profiles=LinkProfiles()) if sessions is None else sessions
+        self.address = address
+        self.cache_ttl = cache_ttl
+        self.schedulers = {}  # {com_port: FairScheduler}, each drained by its own thread
+        self.drains = {}  # {com_port: scheduler thread}
+        self.cache = {}  # {com_port: {request key: (time.monotonic(), result)}}
+        self.clients = {}  # {client: {'requests', 'cache_hits', 'sent', 'errors'}}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.listener = None
+        self.thread = None
+
+
+    def start(self):
+        '''
+        Start listening, on a background thread.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        (host, port) actually listened on
+
+        '''
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                peer = '{}:{}'.format(*self.client_address[:2])
+                for line in self.rfile:
+                    if not line.strip():
+                        continue
+                    self.wfile.write(json.dumps(server.respond(line, peer)).encode() + b'\n')
+
+        class Listener(socketserver.ThreadingTCPServer):
+            daemon_threads = True  # Client connections never keep the process alive
+            allow_reuse_address = True
+
+        self.listener = Listener(self.address, Handler)
+        self.address = self.listener.server_address[:2]
+        self.thread = threading.Thread(target=self.listener.serve_forever, name='instrument-server', daemon=True)
+        self.thread.start()
+        return self.address
+
+
+    def stop(self):
+        '''
+        Stop listening, stop the scheduler threads, and close every serial session.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        self.stop_event.set()
+        if self.listener is not None:
+            self.listener.shutdown()
+            self.listener.server_close()
+        self.sessions.close_all()
+
+
+    def respond(self, line, peer=''):
+        '''
+        Answer one request line.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        line (bytes): JSON request
+        peer (string): Client's "host:port", naming the client if the request does not
+
+        Returns
+        -------
+        Response dictionary of {'id', 'result', 'error'}
+
+        '''
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            params = request.get('params') or {}
+            method = request.get('method')
+
+            if method == 'transaction':
+                result = self.transaction(params['port'], params['transaction'], params.get('settings') or {}, params.get('retries', 1),
+                                          params.get('client') or peer, int(params.get('priority', 0)))
+            elif method == 'exchange':
+                result = self.exchange(params['port'], params['data'], int(params['replies']), params.get('settings') or {},
+                                       params.get('client') or peer, int(params.get('priority', 0)))
+            elif method == 'open':
+                self.__schedule(params['port'], params.get('client') or peer, int(params.get('priority', 0)),
+                                lambda: self.sessions.acquire(params['port'], **(params.get('settings') or {})))
+                result = None
+            elif method == 'link_settings':
+                result = self.sessions.link_settings(params['port'], **(params.get('settings') or {}))
+            elif method == 'channel_state':
+                state = self.sessions.channel_state(params['port'])
+                result = None if state is None else {str(key): value for key, value in state.items()}
+            elif method == 'link_statistics':
+                result = self.sessions.link_statistics(params['port'])
+            elif method == 'invalidate':
+                self.__forget(params['port'])
+                result = self.__schedule(params['port'], params.get('client') or peer, 0, lambda: self.sessions.invalidate(params['port']))
+            elif method == 'statistics':
+                result = self.statistics()
+            elif method == 'latency_metrics':
+                result = self.sessions.latency_metrics()
+            elif method == 'reset_latency_metrics':
+                result = self.sessions.reset_latency_metrics()
+            else:
+                raise ValueError(f'Unknown method "{method}"')
+
+            return {'id': request_id, 'result': result, 'error': None}
+
+        except (serial.serialutil.SerialException, OSError) as error:
+            return {'id': request_id, 'result': None, 'error': {'type': 'SerialException', 'message': str(error)}}
+        except (ValueError, KeyError, TypeError) as error:
+            return {'id': request_id, 'result': None, 'error': {'type': 'ValueError', 'message': f'Bad request: {error}'}}
+
+
+    def transaction(self, com_port, data, settings=None, retries=1, client='', priority=0):
+        '''
+        Run a ScpiTransaction sent as ScpiTransaction.to_dict().
+        One with no commands only reads, so its result is shared with identical requests for cache_ttl seconds. Anything else empties the port's read cache.
+        A read that does not start by selecting a channel reads whichever channel is selected, so it is only shared while that same channel is selected.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        data (dictionary): As returned by ScpiTransaction.to_dict()
+        settings (dictionary): Serial settings. Ex.: {'timeout': 3}
+        retries (int): Reconnect + retry attempts after a link failure
+        client (string): Client name, for fair queueing and statistics
+        priority (int): Higher is served first
+
+        Returns
+        -------
+        Dictionary of {'replies': [[label, reply string], ...], 'skipped': [commands left out as already in effect], 'cached': bool}
+
+        '''
+        settings = settings or {}
+        transaction = ScpiTransaction.from_dict(data)
+        read_only = not transaction.commands
+        # Ex.: "VOLT?" alone answers for CH1 or CH2, depending on the last INST:SEL. "INST:SEL CH2;:VOLT?" always answers for CH2
+        follows_selection = read_only and not (transaction.query_parts and transaction.query_parts[0][1][0] == 'select')
+
+        def cache_key():
+            if not read_only or self.cache_ttl <= 0:
+                return None
+            selected = None
+            if follows_selection:
+                selected = (self.sessions.channel_state(com_port) or {}).get('selected')
+                if selected is None:
+                    return None  # Selection unknown (Ex.: fresh connection): nothing can be shared safely
+            return json.dumps([data, settings, selected], sort_keys=True)
+
+        self.__count(client, 'requests')
+        key = cache_key()
+        if key is not None:
+            cached = self.__cached(com_port, key, client)
+            if cached is not None:
+                return cached
+
+        def run():
+            # The selection may have changed while this request was queued, and an identical one may have been answered
+            key = cache_key()
+            if key is not None:
+                cached = self.__cached(com_port, key, client)
+                if cached is not None:
+                    return cached
+            elif not read_only:
+                self.__forget(com_port)
+
+            replies = self.sessions.transaction(com_port, transaction.run, retries, **settings)
+            self.__count(client, 'sent')
+            result = {'replies': [[label, reply] for label, reply in replies.items()], 'skipped': transaction.skipped, 'cached': False}
+            if key is not None and '' not in replies.values():
+                with self.lock:
+                    self.cache.setdefault(com_port, {})[key] = (time.monotonic(), result)
+            return result
+
+        return self.__schedule(com_port, client, priority, run)
+
+
+    def exchange(self, com_port, text, replies, settings=None, client='', priority=0):
+        '''
+        Write raw SCPI text, then read a number of reply lines. For callers that drive the port directly (Ex.: telemetry.py).
+        Raw commands may change anything, so the read cache and the connection's channel state are forgotten unless every command in it is a query.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        text (string): SCPI lines, with terminators
+        replies (int): Reply lines to read. Reading stops early at the first timeout
+        settings (dictionary): Serial settings. Ex.: {'timeout': 3}
+        client (string): Client name, for fair queueing and statistics
+        priority (int): Higher is served first
+
+        Returns
+        -------
+        List of reply strings, without terminators
+
+        '''
+        settings = settings or {}
+        self.__count(client, 'requests')
+
+        def exchange(ser):
+            # Every ";"-joined part counts: "INST:SEL CH2;:VOLT?" changes the selection as much as "INST:SEL CH2" does
+            parts = [part for line in text.replace('\n', '\r').split('\r') for part in line.split(';') if part.strip()]
+            if any('?' not in part for part in parts):
+                if getattr(ser, 'channel_state', None) is not None:
+                    ser.channel_state.forget()
+                self.__forget(com_port)
+
+            ser.write(text.encode())
+            received = []
+            while len(received) < replies:
+                line = ser.readline()
+                if not line:  # Timed out
+                    break
+                received.append(line.decode(errors='replace').strip())
+            return received
+
+        def run():
+            received = self.sessions.transaction(com_port, exchange, 0, **settings)
+            self.__count(client, 'sent')
+            return received
+
+        return self.__schedule(com_port, client, priority, run)
+
+
+    def statistics(self):
+        '''
+        Request counts per client, and queue depth + cache size per port.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        Dictionary of {'clients': {client: {'requests', 'cache_hits', 'sent', 'errors'}}, 'ports': {com_port: {'queued', 'cached'}}}
+
+        '''
+        with self.lock:
+            clients = {client: dict(counts) for client, counts in self.clients.items()}
+            ports = {com_port: {'queued': scheduler.depth(), 'cached': len(self.cache.get(com_port, {}))} for com_port, scheduler in self.schedulers.items()}
+        return {'clients': clients, 'ports': ports}
+
+
+    def serve_forever(self):
+        '''
+        Listen until interrupted (Ctrl+C), then print the statistics and close the ports.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        host, port = self.start()
+        print(f'Serving instruments on {host}:{port}. Ctrl+C to stop', flush=True)
+        try:
+            while not self.stop_event.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            print(json.dumps(self.statistics()), flush=True)
+            self.stop()
+
+
+    def __schedule(self, com_port, client, priority, function):
+        '''
+        Queue function on the port's scheduler thread, and wait for its result.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        client (string): Client name
+        priority (int): Higher is served first
+        function (function object): Takes no arguments. Runs with the port to itself
+
+        Returns
+        -------
+        Return value of function
+
+        Raises
+        ------
+        Whatever function raised
+
+        '''
+        with self.lock:
+            scheduler = self.schedulers.get(com_port)
+            if scheduler is None:
+                scheduler = self.schedulers[com_port] = FairScheduler()
+            # Started on first use, and again if a job failed unexpectedly and ended it. Queued jobs wait for the new thread
+            if com_port not in self.drains or not self.drains[com_port].is_alive():
+                self.drains[com_port] = threading.Thread(target=self.__drain, args=(com_port, scheduler), name=f'instrument-server-{com_port}', daemon=True)
+                self.drains[com_port].start()
+
+        job = {'function': function, 'done': threading.Event(), 'result': None, 'error': None}
+        scheduler.put(client, priority, job)
+        job['done'].wait()
+
+        error = job['error']
+        if isinstance(error, BaseException):
+            self.__count(client, 'errors')
+            raise error
+        return job['result']
+
+
+    def __drain(self, com_port, scheduler):
+        '''
+        Scheduler thread of one port: run its jobs one at a time, and close its session when it sits idle.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        scheduler (FairScheduler): The port's queue
+
+        Returns
+        -------
+        None
+
+        '''
+        while not self.stop_event.is_set():
+            job = scheduler.get(timeout=1.0)
+            if job is None:
+                self.sessions.expire_idle()
+                continue
+
+            # Replaced by the outcome below. Left in place if the job raises anything else, which ends this thread with a traceback
+            job['error'] = serial.SerialException(f'Request on "{com_port}" failed unexpectedly')
+            try:
+                job['result'] = job['function']()
+                job['error'] = None
+            except (serial.serialutil.SerialException, OSError, ValueError) as error:
+                # Handed to the waiting client. ValueError: pyserial rejecting a setting, Ex.: an unsupported baud rate
+                job['error'] = error
+            finally:
+                if job['error'] is not None:
+                    # Whatever state the port was left in is unknown, so nothing cached for it is trusted
+                    self.__forget(com_port)
+                job['done'].set()
+
+
+    def __cached(self, com_port, key, client):
+        '''
+        Cached result of a read-only request, if it is still fresh.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        key (string): Request key
+        client (string): Client name, for statistics
+
+        Returns
+        -------
+        Result dictionary, or None
+
+        '''
+        with self.lock:
+            entry = self.cache.get(com_port, {}).get(key)
+            if entry is None or time.monotonic() - entry[0] > self.cache_ttl:
+                return None
+        self.__count(client, 'cache_hits')
+        return {**entry[1], 'cached': True}
+
+
+    def __forget(self, com_port):
+        '''
+        Empty a port's read cache. Ex.: after anything was written to it.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+
+        Returns
+        -------
+        None
+
+        '''
+        with self.lock:
+            self.cache.pop(com_port, None)
+
+
+    def __count(self, client, counter):
+        '''
+        Add one to a client's statistics counter.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        client (string): Client name
+        counter (string): "requests", "cache_hits", "sent", or "errors"
+
+        Returns
+        -------
+        None
+
+        '''
+        with self.lock:
+            counts = self.clients.setdefault(client, {'requests': 0, 'cache_hits': 0, 'sent': 0, 'errors': 0})
+            counts[counter] += 1
+
+
+class RemoteLink():
+    '''
+    Class standing in for an open serial object on the client side. Writes are sent to the server as one raw exchange,
+    expecting one reply line per line containing "?", and readline() returns those replies.
+    '''
+
+    def __init__(self, sessions, com_port, settings):
+        '''
+        Create a link to one port on the server.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        sessions (RemoteSessions): Client the requests go through
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        settings (dictionary): Serial settings
+
+        Returns
+        -------
+        None
+
+        '''
+        link_settings = sessions.link_settings(com_port, **settings)
+        self.sessions = sessions
+        self.com_port = com_port
+        self.settings = settings
+        self.terminator = link_settings.get('terminator', DEFAULT_PROFILE['terminator'])
+        self.reply_terminator = link_settings.get('reply_terminator', DEFAULT_PROFILE['reply_terminator'])
+        self.channel_state = None  # Kept by the server, on its own connection
+        self.replies = collections.deque()
+
+
+    def write(self, data):
+        '''
+        Send data, and collect the replies it produces.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        data (bytes): SCPI lines, with terminators
+
+        Returns
+        -------
+        Number of bytes written
+
+        '''
+        text = data.decode()
+        expected = sum('?' in line for line in text.replace('\n', '\r').split('\r'))
+        self.replies.extend(self.sessions.request('exchange', {'port': self.com_port, 'data': text, 'replies': expected, 'settings': self.settings}))
+        return len(data)
+
+
+    def readline(self, terminator=None):
+        '''
+        Next reply line, as serial.Serial.readline would return it.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        terminator (bytes): End-of-line marker the line is returned with. Defaults to the link's reply terminator. The server has already split the replies
+
+        Returns
+        -------
+        Bytes, including the terminator. Empty if no reply arrived in time
+
+        '''
+        if not self.replies:
+            return b''
+        return self.replies.popleft().encode() + (terminator or self.reply_terminator.encode())
+
+
+    def reset_input_buffer(self):
+        '''
+        Drop replies not read yet.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        self.replies.clear()
+
+
+class RemoteSessions():
+    '''
+    Class standing in for SerialSessions, forwarding everything to an InstrumentServer. Hand it to any caller that takes a session pool.
+    Each thread gets its own connection, so a slow request on one thread never holds up another.
+    '''
+
+    def __init__(self, address=SERVER_ADDRESS, client_name='', priority=0, timeout=CLIENT_TIMEOUT):
+        '''
+        Create the client. Connections are opened on first use.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        address (tuple): Server (host, port)
+        client_name (string): Shown in the server statistics, and used for fair queueing. Defaults to the connection address
+        priority (int): Queue priority of every request. Higher is served first
+        timeout (float): Seconds to wait for each reply
+
+        Returns
+        -------
+        None
+
+        '''
+        self.address = address
+        self.client_name = client_name
+        self.priority = priority
+        self.timeout = timeout
+        self.sessions = {}  # Always empty: the server holds the ports. Kept so callers that look for an open session find none
+        self.profiles = None
+        self.settings_cache = {}  # {(com_port, settings JSON): link settings}, so RemoteLink costs no extra round trip after the first
+        self.local = threading.local()
+        self.connections = []  # Every thread's socket, for cancel_reads and close_all
+        self.request_ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+
+    def request(self, method, params):
+        '''
+        Send one request, and wait for its response.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        method (string): Ex.: "transaction"
+        params (dictionary): Method parameters. client + priority are added
+
+        Returns
+        -------
+        Result of the request
+
+        Raises
+        ------
+        serial.serialutil.SerialException if the server cannot be reached, or the port failed on the server
+        ValueError if the server rejected the request
+
+        '''
+        request_id = next(self.request_ids)
+        line = json.dumps({'id': request_id, 'method': method, 'params': {'client': self.client_name, 'priority': self.priority, **params}}).encode() + b'\n'
+
+        try:
+            connection, reader = self.__connection()
+            connection.sendall(line)
+            response = reader.readline()
+        except OSError as error:
+            self.__disconnect()
+            raise serial.SerialException(f'Instrument server {self.address[0]}:{self.address[1]} unreachable: {error}') from error
+        if not response:
+            self.__disconnect()
+            raise serial.SerialException(f'Instrument server {self.address[0]}:{self.address[1]} closed the connection')
+
+        response = json.loads(response)
+        if response.get('id') != request_id:
+            self.__disconnect()
+            raise serial.SerialException('Instrument server reply out of order')
+        error = response.get('error')
+        if error is not None:
+            raise (ValueError if error.get('type') == 'ValueError' else serial.SerialException)(error.get('message', ''))
+        return response.get('result')
+
+
+    def acquire(self, com_port, **settings):
+        '''
+        Have the server open the port, as SerialSessions.acquire does.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        settings (keyword arguments): Serial settings
+
+        Returns
+        -------
+        None
+
+        '''
+        self.request('open', {'port': com_port, 'settings': settings})
+
+
+    def link_settings(self, com_port, **settings):
+        '''
+        Settings the server opens the port with, as SerialSessions.link_settings returns them.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        settings (keyword arguments): Caller's serial settings
+
+        Returns
+        -------
+        Dictionary of settings. DEFAULT_SETTINGS + DEFAULT_PROFILE terminators if the server cannot be reached
+
+        '''
+        key = (com_port, json.dumps(settings, sort_keys=True))
+        try:
+            if key not in self.settings_cache:
+                self.settings_cache[key] = self.request('link_settings', {'port': com_port, 'settings': settings})
+            return dict(self.settings_cache[key])
+        except serial.SerialException:
+            return {**DEFAULT_SETTINGS, 'terminator': DEFAULT_PROFILE['terminator'], 'reply_terminator': DEFAULT_PROFILE['reply_terminator'], **settings}
+
+
+    @contextmanager
+    def session(self, com_port, **settings):
+        '''
+        Context manager yielding a RemoteLink, as SerialSessions.session yields an open serial object.
+        Each write is queued separately on the server, so other clients may be served between two writes.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        settings (keyword arguments): Serial settings
+
+        Returns
+        -------
+        RemoteLink object (via yield)
+
+        '''
+        yield RemoteLink(self, com_port, settings)
+
+
+    def transaction(self, com_port, function, retries=1, **settings):
+        '''
+        Run function(ser) against the port, as SerialSessions.transaction does.
+        ScpiTransaction.run is sent whole, so the server can cache it and skip commands already in effect. Any other function runs against a RemoteLink.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        function (function object): Receives the open serial object, returns whatever the caller needs
+        retries (int): Number of reconnect + retry attempts after the first failure, on the server
+        settings (keyword arguments): Serial settings
+
+        Returns
+        -------
+        Return value of function
+
+        '''
+        transaction = getattr(function, '__self__', None)
+        if not isinstance(transaction, ScpiTransaction) or function.__name__ != 'run':
+            with self.session(com_port, **settings) as ser:
+                return function(ser)
+
+        result = self.request('transaction', {'port': com_port, 'transaction': transaction.to_dict(), 'settings': settings, 'retries': retries})
+        transaction.skipped = result['skipped']
+        return {ScpiTransaction.thaw(label): reply for label, reply in result['replies']}
+
+
+    def expire_idle(self):
+        '''
+        Nothing to do: the server closes its own idle sessions.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+
+
+    def link_statistics(self, com_port):
+        '''
+        Learned timing and retry counts for one port, from the server.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+
+        Returns
+        -------
+        Dictionary, as returned by LinkTiming.statistics. None if the port has never been used, or the server cannot be reached
+
+        '''
+        try:
+            return self.request('link_statistics', {'port': com_port})
+        except serial.SerialException:
+            return None
+
+
+    def channel_state(self, com_port):
+        '''
+        Channel selection + setpoints last confirmed on the server's connection to a port.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+
+        Returns
+        -------
+        Dictionary, as returned by ChannelState.snapshot. None if the port is not open, or the server cannot be reached
+
+        '''
+        try:
+            state = self.request('channel_state', {'port': com_port})
+        except serial.SerialException:
+            return None
+        # JSON keys are strings. Channels go back to ints
+        return None if state is None else {(int(key) if key.isdigit() else key): value for key, value in state.items()}
+
+
+    def statistics(self):
+        '''
+        Server statistics, as InstrumentServer.statistics returns them.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        Dictionary
+
+        '''
+        return self.request('statistics', {})
+
+
+    def latency_metrics(self):
+        '''
+        Latency histograms the server recorded for every port + command, as SerialSessions.latency_metrics returns them.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        Dictionary
+
+        Raises
+        ------
+        serial.serialutil.SerialException if the server cannot be reached
+
+        '''
+        return self.request('latency_metrics', {})
+
+
+    def reset_latency_metrics(self):
+        '''
+        Have the server forget every latency sample.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        self.request('reset_latency_metrics', {})
+
+
+    def cancel_reads(self):
+        '''
+        Abandon every request in progress, so a waiting caller returns immediately. The server still finishes them.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        with self.lock:
+            connections = list(self.connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+    def invalidate(self, com_port):
+        '''
+        Have the server close and forget its session for a port. Ex.: after the device was unplugged.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+
+        Returns
+        -------
+        None
+
+        '''
+        self.settings_cache = {key: value for key, value in self.settings_cache.items() if key[0] != com_port}
+        try:
+            self.request('invalidate', {'port': com_port})
+        except serial.SerialException:
+            pass
+
+
+    def close_all(self):
+        '''
+        Close every connection to the server. The server keeps its ports open for its other clients.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        with self.lock:
+            connections = list(self.connections)
+            self.connections.clear()
+        for connection in connections:
+            connection.close()
+
+
+    def __connection(self):
+        '''
+        This thread's connection to the server, opened on first use.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        (socket, binary reader) tuple
+
+        '''
+        connection = getattr(self.local, 'connection', None)
+        if connection is None or connection.fileno() == -1:
+            connection = socket.create_connection(self.address, timeout=self.timeout)
+            self.local.connection = connection
+            self.local.reader = connection.makefile('rb')
+            with self.lock:
+                self.connections.append(connection)
+        return connection, self.local.reader
+
+
+    def __disconnect(self):
+        '''
+        Drop this thread's connection, so the next request reconnects. Its reply, if one still comes, can no longer be matched to a request.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            return
+        self.local.connection = None
+        with self.lock:
+            if connection in self.connections:
+                self.connections.remove(connection)
+        connection.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='instrument_server.py', description='Share BK Precision 9141 serial ports between several applications.')
+    parser.add_argument('--host', default=SERVER_ADDRESS[0], help='Address to listen on. Anything but 127.0.0.1 exposes the supplies to the network')
+    parser.add_argument('--port', type=int, default=SERVER_ADDRESS[1], help='TCP port to listen on')
+    parser.add_argument('--cache-ttl', type=float, default=CACHE_TTL, help='Seconds identical read-only queries are answered from the read cache. 0 disables it')
+    arguments = parser.parse_args()
+
+    InstrumentServer(address=(arguments.host, arguments.port), cache_ttl=arguments.cache_ttl).serve_forever()
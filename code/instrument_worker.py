@@ -0,0 +1,268 @@
+'''
+Module to run instrument I/O on a background thread, away from the GUI thread.
+'''
+import queue
+import threading
+
+import serial
+from PyQt5.QtCore import QThread
+from PyQt5.QtCore import pyqtSignal
+from status_log import StatusLog
+
+
+class QueuedDialogs():
+    '''
+    Class standing in for PopupDialogs on the worker thread.
+    Qt widgets may only be created on the GUI thread, so dialog requests are forwarded there through a queued signal.
+    '''
+
+    def __init__(self, worker):
+        '''
+        Store the worker whose signal carries the dialog requests.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        worker (InstrumentWorker): Worker thread the requests originate from
+
+        Returns
+        -------
+        None
+
+        '''
+        self.worker = worker
+
+
+    def com_bad_communication(self, com_port):
+        '''
+        Forward a PopupDialogs.com_bad_communication request to the GUI thread.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+
+        Returns
+        -------
+        A Boolean value of True, matching PopupDialogs after the dialog box is exited.
+
+        '''
+        if not self.worker.is_cancelled():
+            self.worker.dialog_requested.emit('com_bad_communication', (com_port,))
+        return True
+
+
+    def failed_confirmation(self, thing_to_change, value_found, value):
+        '''
+        Forward a PopupDialogs.failed_confirmation request to the GUI thread.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        thing_to_change (string): "VOLT" or "CURR"
+        value_found (string): Returned string from VOLT? or CURR? command to instrument
+        value (string): Requested set value
+
+        Returns
+        -------
+        A Boolean value of True, matching PopupDialogs after the dialog box is exited.
+
+        '''
+        if not self.worker.is_cancelled():
+            self.worker.dialog_requested.emit('failed_confirmation', (thing_to_change, value_found, value))
+        return True
+
+
+class InstrumentWorker(QThread):
+    '''
+    Class containing a background thread that runs queued instrument jobs one after the other.
+    Dialog requests and results travel back to the GUI thread through queued signals. Status lines go to a StatusLog, if given, or the status signal.
+    '''
+
+    status = pyqtSignal(str)  # Status box text, same format as update_status_callback
+    busy_changed = pyqtSignal(bool)  # True while a job is in flight or waiting
+    job_finished = pyqtSignal(str, object)  # (job name, job return value)
+    dialog_requested = pyqtSignal(str, tuple)  # (PopupDialogs function name, arguments)
+
+    def __init__(self, serial_sessions, parent=None, status_log=None, report=None):
+        '''
+        Create the job queue. The thread itself starts with start().
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        serial_sessions (SerialSessions): Session pool whose blocking reads are interrupted on cancel()
+        parent (PyQt5.QtCore.QObject): Optional Qt parent
+        status_log (StatusLog): Optional thread-safe queue for status lines. Without it, each line is emitted through the status signal
+        report (function object): Optional report(update_status_callback, job name, result), run on this thread after each job, before job_finished
+
+        Returns
+        -------
+        None
+
+        '''
+        QThread.__init__(self, parent)
+        self.serial_sessions = serial_sessions
+        self.jobs = queue.Queue()
+        self.dialogs = QueuedDialogs(self)
+        self.report = report
+        self.update_status_callback = status_log if status_log is not None else lambda text, level=None, **fields: self.status.emit(StatusLog.render(text, level, fields))
+        self.cancel_event = threading.Event()
+        self.pending = 0
+        self.pending_lock = threading.Lock()
+        self.crashed = False  # True once a job raised an unexpected error, which ends the thread
+
+
+    def submit(self, name, function, *args):
+        '''
+        Queue a job. function is called on the worker thread as function(update_status_callback, dialogs, *args).
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        name (string): Job name, handed back with job_finished so the GUI knows what completed
+        function (function object): Blocking job to run
+        args: Additional positional arguments for function
+
+        Returns
+        -------
+        None
+
+        '''
+        with self.pending_lock:
+            self.pending += 1
+            if self.pending == 1:
+                self.busy_changed.emit(True)
+        self.jobs.put((name, function, args))
+
+        # An unexpected error in an earlier job ended the thread. Queued jobs, this one included, run on a new one
+        if self.crashed:
+            self.crashed = False
+            self.wait()  # Already on its way out
+            self.start()
+
+
+    def cancel(self):
+        '''
+        Drop every queued job and interrupt the one in flight, if it is blocked on a serial read.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        self.cancel_event.set()
+
+        # Discard jobs that have not started yet
+        while True:
+            try:
+                self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            self.__job_done()
+
+        self.serial_sessions.cancel_reads()
+
+
+    def is_cancelled(self):
+        '''
+        Let long-running jobs poll for a cancel request between instrument transactions.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        True if cancel() was called during the current job.
+
+        '''
+        return self.cancel_event.is_set()
+
+
+    def stop(self):
+        '''
+        Cancel outstanding work and end the thread. Blocks until the thread exits.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        self.cancel()
+        self.jobs.put(None)  # Sentinel
+        self.wait()
+
+
+    def run(self):
+        '''
+        Thread body. Overrides QThread.run.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+
+            name, function, args = job
+            self.cancel_event.clear()
+            result = True  # Failed, unless the job returns
+            handled = False
+            try:
+                result = function(self.update_status_callback, self.dialogs, *args)
+                handled = True
+
+            except (serial.serialutil.SerialException, OSError, ValueError) as error:  # Ex.: a port gone mid-job, or a bad profile file. The worker carries on
+                self.update_status_callback('<p style="font-size:11px; color:#D60000;">' + '<br>&lt;!&gt; ' + '<span style="color:#DADADA">' + f'{type(error).__name__}: {error}' + '</p>')
+                handled = True
+
+            finally:
+                if not handled:
+                    # A bug: the error ends the thread, and sys.excepthook prints it. The GUI is still told the job is over, and the next submit() starts a new thread
+                    self.crashed = True
+                    self.update_status_callback('<p style="font-size:11px; color:#D60000;">' + '<br>&lt;!&gt; ' + '<span style="color:#DADADA">' + f'"{name}" failed unexpectedly. Details were printed to the console.' + '</p>')
+
+                if self.is_cancelled():
+                    self.update_status_callback('<p style="font-size:11px; color:#D60000;">' + '<br>Cancelled.<br><br>' + '</p>')
+                    result = True
+
+                if self.report is not None:
+                    self.report(self.update_status_callback, name, result)
+
+                self.job_finished.emit(name, result)
+                self.__job_done()
+
+
+    def __job_done(self):
+        '''
+        Decrement the in-flight count, and signal the GUI once nothing is left.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        with self.pending_lock:
+            self.pending -= 1
+            if self.pending == 0:
+                self.busy_changed.emit(False)
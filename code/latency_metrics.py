@@ -0,0 +1,331 @@
+'''
+Module to keep latency histograms for every port and command, recorded by the serial layer (see serial_sessions.py).
+
+Each exchange is split into phases, so a slow bench can be traced to its cause:
+    open        Port open (serial factory call). Slow: USB-serial adapter or driver
+    write       write() call returning. Slow: USB-serial adapter, driver, or a full output buffer
+    first_byte  Last write to the first reply byte. Slow: the instrument itself (parsing, settling, measuring)
+    reply       First reply byte to the end of the line. Slow: baud rate, or flow control holding the line
+
+Histograms use fixed, logarithmically spaced buckets (16 per decade, 10 us to 100 s), so recording is a bisect + an increment,
+and percentiles are accurate to within one bucket (~15%).
+
+Export with:
+    LatencyMetrics.text(snapshot)        Table, for people
+    json.dumps(snapshot)                 Everything, for scripts
+    LatencyMetrics.prometheus(snapshot)  Prometheus text exposition format, for monitoring
+'''
+import bisect
+import json
+import math
+import threading
+
+
+# Upper bucket bounds, in seconds. Anything above the last one goes in an overflow bucket
+BUCKET_BOUNDS = tuple(10 ** (-5 + index / 16) for index in range(7 * 16 + 1))
+
+PHASES = ('open', 'write', 'first_byte', 'reply')
+
+# Distinct commands tracked per port. Further ones are counted under OTHER_COMMAND, so odd traffic cannot grow memory without bound
+MAXIMUM_COMMANDS = 64
+OTHER_COMMAND = '(other)'
+OPEN_COMMAND = '(open)'
+
+
+class LatencyHistogram():
+    '''
+    Class containing one fixed-bucket latency histogram, plus its count, sum, minimum, and maximum.
+    Not locked by itself: LatencyMetrics holds its lock around every use.
+    '''
+
+    def __init__(self):
+        '''
+        Create an empty histogram.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+
+    def record(self, seconds):
+        '''
+        Add one sample.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        seconds (float): Latency
+
+        Returns
+        -------
+        None
+
+        '''
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.minimum = seconds if self.minimum is None else min(self.minimum, seconds)
+        self.maximum = seconds if self.maximum is None else max(self.maximum, seconds)
+
+
+    def percentile(self, fraction):
+        '''
+        Latency below which the given fraction of samples fall, as the upper bound of the bucket it lands in.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        fraction (float): Ex.: 0.99
+
+        Returns
+        -------
+        Seconds, never above the largest sample. None without samples
+
+        '''
+        if not self.count:
+            return None
+        wanted = max(1, math.ceil(fraction * self.count))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= wanted:
+                return min(BUCKET_BOUNDS[index], self.maximum) if index < len(BUCKET_BOUNDS) else self.maximum
+        return self.maximum
+
+
+    def to_dict(self):
+        '''
+        JSON-ready summary, with the non-empty buckets.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        Dictionary of {'count', 'sum', 'min', 'max', 'p50', 'p90', 'p99', 'buckets': [[upper bound or None for overflow, count], ...]}. Times in seconds
+
+        '''
+        return {'count': self.count, 'sum': self.total, 'min': self.minimum, 'max': self.maximum,
+                'p50': self.percentile(0.50), 'p90': self.percentile(0.90), 'p99': self.percentile(0.99),
+                'buckets': [[BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else None, count] for index, count in enumerate(self.counts) if count]}
+
+
+class LatencyMetrics():
+    '''
+    Class containing the latency histograms of every port, command, and phase. Safe to record into from any thread.
+    '''
+
+    def __init__(self):
+        '''
+        Create an empty metrics store.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        self.histograms = {}  # {com_port: {command: {phase: LatencyHistogram}}}
+        self.lock = threading.Lock()
+
+
+    @staticmethod
+    def command_key(data):
+        '''
+        Name of the command(s) in a write, with arguments dropped so repeats of one command share a histogram.
+        Ex.: b"INST:SEL CH1\\rVOLT 12.5\\rVOLT?;:*OPC?\\r" -> "INST:SEL;VOLT;VOLT?;*OPC?"
+
+        Parameters
+        ----------
+        data (bytes): Bytes written
+
+        Returns
+        -------
+        String
+
+        '''
+        headers = []
+        for line in data.decode(errors='replace').replace('\n', '\r').split('\r'):
+            for part in line.split(';'):
+                header = part.strip().lstrip(':').split(' ', 1)[0]
+                if header:
+                    headers.append(header.upper())
+        return ';'.join(headers) or '(empty)'
+
+
+    def record(self, com_port, phase, command, seconds):
+        '''
+        Add one sample.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        phase (string): One of PHASES
+        command (string): As returned by command_key, or OPEN_COMMAND
+        seconds (float): Latency
+
+        Returns
+        -------
+        None
+
+        '''
+        with self.lock:
+            commands = self.histograms.setdefault(com_port, {})
+            if command not in commands and len(commands) >= MAXIMUM_COMMANDS:
+                command = OTHER_COMMAND
+            phases = commands.setdefault(command, {})
+            histogram = phases.get(phase)
+            if histogram is None:
+                histogram = phases[phase] = LatencyHistogram()
+            histogram.record(seconds)
+
+
+    def snapshot(self):
+        '''
+        JSON-ready copy of every histogram.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        Dictionary of {com_port: {command: {phase: LatencyHistogram.to_dict()}}}
+
+        '''
+        with self.lock:
+            return {com_port: {command: {phase: histogram.to_dict() for phase, histogram in phases.items()} for command, phases in commands.items()}
+                    for com_port, commands in self.histograms.items()}
+
+
+    def reset(self):
+        '''
+        Forget every sample. Ex.: to measure a bench again after swapping an adapter.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        with self.lock:
+            self.histograms.clear()
+
+
+    @staticmethod
+    def text(snapshot):
+        '''
+        Table of a snapshot: one row per port, command, and phase.
+
+        Parameters
+        ----------
+        snapshot (dictionary): As returned by snapshot()
+
+        Returns
+        -------
+        String
+
+        '''
+        if not snapshot:
+            return 'No latency samples yet'
+
+        def milliseconds(seconds):
+            return f'{seconds * 1000:10.2f}' if seconds is not None else f'{"-":>10}'
+
+        lines = [f'{"Port / command":<40}{"Phase":<12}{"Count":>8}{"p50 ms":>10}{"p90 ms":>10}{"p99 ms":>10}{"Max ms":>10}']
+        for com_port in sorted(snapshot):
+            lines.append(com_port)
+            for command in sorted(snapshot[com_port]):
+                for phase in PHASES:
+                    histogram = snapshot[com_port][command].get(phase)
+                    if histogram is None:
+                        continue
+                    lines.append(f'  {command[:37]:<38}{phase:<12}{histogram["count"]:>8}' +
+                                 ''.join(milliseconds(histogram[key]) for key in ('p50', 'p90', 'p99', 'max')))
+        return '\n'.join(lines)
+
+
+    @staticmethod
+    def prometheus(snapshot, name='remote_control_latency_seconds'):
+        '''
+        Prometheus text exposition format of a snapshot: one histogram per port, command, and phase, with cumulative buckets.
+
+        Parameters
+        ----------
+        snapshot (dictionary): As returned by snapshot()
+        name (string): Metric name
+
+        Returns
+        -------
+        String
+
+        '''
+        def label(value):
+            return json.dumps(str(value))  # Escapes quotes + backslashes as the format requires
+
+        lines = [f'# HELP {name} Serial latency by port, command, and phase (open, write, first_byte, reply)', f'# TYPE {name} histogram']
+        for com_port, commands in sorted(snapshot.items()):
+            for command, phases in sorted(commands.items()):
+                for phase, histogram in sorted(phases.items()):
+                    labels = f'port={label(com_port)},command={label(command)},phase={label(phase)}'
+                    cumulative = 0
+                    for bound, count in histogram['buckets']:
+                        cumulative += count
+                        if bound is not None:
+                            lines.append(f'{name}_bucket{{{labels},le="{bound:.6g}"}} {cumulative}')
+                    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram["count"]}')
+                    lines.append(f'{name}_sum{{{labels}}} {histogram["sum"]:.9g}')
+                    lines.append(f'{name}_count{{{labels}}} {histogram["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+    @staticmethod
+    def export(snapshot, path):
+        '''
+        Write a snapshot to a file, in the format its extension names: .json, .prom, or anything else for the text table.
+
+        Parameters
+        ----------
+        snapshot (dictionary): As returned by snapshot()
+        path (string): Output file
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        OSError if the file cannot be written
+
+        '''
+        if path.lower().endswith('.json'):
+            text = json.dumps(snapshot, indent=4)
+        elif path.lower().endswith('.prom'):
+            text = LatencyMetrics.prometheus(snapshot)
+        else:
+            text = LatencyMetrics.text(snapshot)
+        with open(path, 'w', encoding='utf-8') as metrics_file:
+            metrics_file.write(text)
+
+
+# Shared store for callers that do not manage their own
+latency_metrics = LatencyMetrics()
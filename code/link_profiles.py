@@ -0,0 +1,290 @@
+'''
+Module to keep per-instrument serial link settings (baud rate, terminators, flow control), and to find the fastest baud rate an instrument answers at.
+
+The BK Precision 9141's baud rate is chosen on its front panel, so the host cannot set it; it can only find it.
+negotiate() tries every rate from fastest to slowest, and keeps the first one that returns two clean *IDN? identifications.
+Profiles are stored in link_profiles.json, keyed by hardware ID, so a supply keeps its profile whichever COM port it is plugged into.
+
+Example link_profiles.json entry, any key of which may be left out to use DEFAULT_PROFILE:
+    {"USB VID:PID=2EC7:9200 SER=123456": {"baudrate": 115200, "terminator": "\\r", "reply_terminator": "\\n", "flow_control": "none"}}
+'''
+import json
+import threading
+import time
+from datetime import datetime
+
+import serial
+from port_discovery import PortDiscovery
+
+
+LINK_PROFILES_FILE = 'link_profiles.json'
+
+# Rates the BK Precision 9141 front panel offers, fastest first
+BAUD_RATES = (115200, 57600, 38400, 19200, 9600, 4800)
+
+# Factory settings of the BK Precision 9141
+DEFAULT_PROFILE = {'baudrate': 9600, 'terminator': '\r', 'reply_terminator': '\n', 'flow_control': 'none'}
+
+# Profile flow_control value: pyserial settings
+FLOW_CONTROL = {
+    'none': {'xonxoff': False, 'rtscts': False},
+    'xonxoff': {'xonxoff': True, 'rtscts': False},
+    'rtscts': {'xonxoff': False, 'rtscts': True},
+}
+
+
+class LinkProfiles():
+    '''
+    Class containing the stored link profiles, and the port name to hardware ID lookups needed to find them.
+    Hand one to SerialSessions, and every session is opened with its instrument's profile.
+    '''
+
+    def __init__(self, path=LINK_PROFILES_FILE):
+        '''
+        Create the profile store. The file is read on first use.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        path (string): JSON profile file. None keeps profiles in memory only
+
+        Returns
+        -------
+        None
+
+        '''
+        self.path = path
+        self.profiles = None  # {hardware ID or port name: profile dictionary}, loaded on first use
+        self.hwids = {}  # {port name: hardware ID}, looked up on first use of each port
+        self.lock = threading.Lock()
+
+
+    def key(self, com_port, hwid=None):
+        '''
+        Profile key for a port: its hardware ID, or the port name when the hardware ID is not unique (Ex.: "n/a" for built-in UARTs).
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        hwid (string): Hardware ID, if already known. Looked up otherwise
+
+        Returns
+        -------
+        String
+
+        '''
+        if hwid is None:
+            with self.lock:
+                hwid = self.hwids.get(com_port)
+            if hwid is None:
+                from serial.tools import list_ports  # Imported on first use, as it is slow to load on some platforms
+                found = {port.device: port.hwid for port in list_ports.comports()}
+                with self.lock:
+                    self.hwids.update(found)
+                hwid = found.get(com_port, '')
+
+        with self.lock:
+            self.hwids[com_port] = hwid
+        return hwid if hwid and hwid != 'n/a' else com_port
+
+
+    def forget_port(self, com_port):
+        '''
+        Forget which hardware ID a port name belongs to. Ex.: after the device was unplugged, as another device may take the name.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+
+        Returns
+        -------
+        None
+
+        '''
+        with self.lock:
+            self.hwids.pop(com_port, None)
+
+
+    def profile(self, com_port, hwid=None):
+        '''
+        Link profile for a port, with DEFAULT_PROFILE filling anything not stored.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        hwid (string): Hardware ID, if already known
+
+        Returns
+        -------
+        Dictionary of {'baudrate', 'terminator', 'reply_terminator', 'flow_control'}, plus whatever else was stored (Ex.: 'identity')
+
+        '''
+        key = self.key(com_port, hwid)
+        with self.lock:
+            if self.profiles is None:
+                self.profiles = self.__load()
+            return {**DEFAULT_PROFILE, **self.profiles.get(key, {})}
+
+
+    def settings(self, com_port, hwid=None):
+        '''
+        Session settings for a port, as SerialSessions.acquire takes them.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        hwid (string): Hardware ID, if already known
+
+        Returns
+        -------
+        Dictionary of {'baudrate', 'xonxoff', 'rtscts', 'terminator', 'reply_terminator'}
+
+        '''
+        profile = self.profile(com_port, hwid)
+        return {'baudrate': profile['baudrate'], **FLOW_CONTROL.get(profile['flow_control'], FLOW_CONTROL['none']),
+                'terminator': profile['terminator'], 'reply_terminator': profile['reply_terminator']}
+
+
+    def remember(self, com_port, hwid=None, **profile):
+        '''
+        Store profile values for a port's instrument, and save the file.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        hwid (string): Hardware ID, if already known
+        profile (keyword arguments): Profile values. Ex.: baudrate=115200
+
+        Returns
+        -------
+        None
+
+        '''
+        key = self.key(com_port, hwid)
+        with self.lock:
+            if self.profiles is None:
+                self.profiles = self.__load()
+            self.profiles[key] = {**self.profiles.get(key, {}), **profile}
+            if self.path:
+                try:
+                    with open(self.path, 'w', encoding='utf-8') as profile_file:
+                        json.dump(self.profiles, profile_file, indent=4)
+                except OSError:
+                    pass  # Read-only install folder: the profile lasts until the application closes
+
+
+    def negotiate(self, com_port, sessions=None, rates=BAUD_RATES, timeout=0.25, serial_factory=serial.Serial):
+        '''
+        Find the fastest baud rate the instrument on a port answers at, and remember it.
+        A rate passes with two identical, well-formed *IDN? replies in a row, so a garbled reply that happens to parse is not enough.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        sessions (SerialSessions): Optional session pool. Its session for the port is closed first, so the port is free and reopens at the new rate
+        rates (tuple): Baud rates to try, in order
+        timeout (float): Seconds to wait for each reply
+        serial_factory (function object): Opens the port. Defaults to serial.Serial
+
+        Returns
+        -------
+        Dictionary of {'baudrate': int or None if nothing answered, 'identity': *IDN? reply or None, 'attempts': [(baudrate, seconds, bool)]}
+
+        Raises
+        ------
+        serial.serialutil.SerialException or OSError if the port cannot be opened
+
+        '''
+        if sessions is not None:
+            sessions.invalidate(com_port)
+
+        profile = self.profile(com_port)
+        terminator = profile['terminator'].encode()
+        reply_terminator = profile['reply_terminator'].encode()
+        flow_control = FLOW_CONTROL.get(profile['flow_control'], FLOW_CONTROL['none'])
+
+        attempts = []
+        for baudrate in rates:
+            start_time = time.perf_counter()
+            with serial_factory(com_port, baudrate=baudrate, timeout=timeout, write_timeout=timeout, **flow_control) as ser:
+                # Anything left over from a previous rate is noise
+                ser.reset_input_buffer()
+                replies = []
+                for _ in range(2):
+                    ser.write(b'*IDN?' + terminator)
+                    replies.append(ser.read_until(reply_terminator).decode(errors='replace').strip())
+                    if PortDiscovery.parse_identity(replies[-1]) is None:
+                        break
+
+            passed = len(replies) == 2 and replies[0] == replies[1] and PortDiscovery.parse_identity(replies[0]) is not None
+            attempts.append((baudrate, time.perf_counter() - start_time, passed))
+            if passed:
+                self.remember(com_port, baudrate=baudrate, identity=replies[0], negotiated=datetime.now().isoformat(timespec='seconds'))
+                return {'baudrate': baudrate, 'identity': replies[0], 'attempts': attempts}
+
+        return {'baudrate': None, 'identity': None, 'attempts': attempts}
+
+
+    def link_negotiation(self, update_status_callback, com_port, sessions=None):
+        '''
+        GUI counterpart to negotiate(): runs it, then prints what was found.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        update_status_callback (function object): Defined in run.py, prints fed string to GUI status box + refreshes GUI
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        sessions (SerialSessions): Optional session pool, as for negotiate()
+
+        Returns
+        -------
+        A Boolean value of True is returned if no rate worked.
+        Returns "None", otherwise.
+
+        '''
+        update_status_callback('<p style="font-size:11px; color:#DADADA;">' + f'[Negotiating link speed on {com_port}: trying {", ".join(str(rate) for rate in BAUD_RATES)} baud]' + '</p>')
+
+        try:
+            result = self.negotiate(com_port, sessions)
+        except (serial.serialutil.SerialException, OSError) as error:
+            update_status_callback('Could not open {port}: {error}', 'error', port=com_port, error=str(error))
+            return True
+
+        for baudrate, seconds, passed in result['attempts']:
+            update_status_callback('{baudrate} baud: {outcome} in {probe_ms:.0f} ms', 'detail', baudrate=baudrate, outcome='answered' if passed else 'no clean reply', probe_ms=seconds * 1000)
+
+        if result['baudrate'] is None:
+            update_status_callback('{port}: no rate gave a clean *IDN? reply. Check the cable, and the RS-232/USB settings on the supply front panel', 'error', port=com_port)
+            return True
+
+        update_status_callback('{port}: {baudrate} baud, about {speedup:.0f}x the factory {default} baud. Remembered for this instrument', 'info',
+                               port=com_port, baudrate=result['baudrate'], speedup=result['baudrate'] / DEFAULT_PROFILE['baudrate'], default=DEFAULT_PROFILE['baudrate'])
+
+
+    def __load(self):
+        '''
+        Read the profile file. Call with the lock held.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        Dictionary of {key: profile dictionary}. Empty if the file is missing or unreadable
+
+        '''
+        if not self.path:
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as profile_file:
+                profiles = json.load(profile_file)
+            return profiles if isinstance(profiles, dict) else {}
+        except (OSError, ValueError):
+            return {}
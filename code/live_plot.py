@@ -0,0 +1,266 @@
+'''
+Module containing a live plot of streamed measurements.
+'''
+import time
+
+import numpy as np
+from PyQt5.QtCore import Qt
+from PyQt5.QtCore import QLineF
+from PyQt5.QtCore import QPointF
+from PyQt5.QtCore import QTimer
+from PyQt5 import QtWidgets
+from PyQt5 import QtGui
+
+
+class LivePlot(QtWidgets.QWidget):
+    '''
+    Class containing a plot widget that draws one channel of a DecimatedRingBuffer as a min/max envelope, one vertical line per pixel column.
+    Redraws are throttled to the display rate, and only happen when new samples arrived or the view changed.
+    Mouse wheel zooms the time axis, dragging pans it, and double-click returns to following the newest samples.
+    '''
+
+    REFRESH_INTERVAL = 33  # ms, ~30 redraws per second at most
+
+    def __init__(self, parent=None):
+        '''
+        Create the plot with no data attached.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        parent (PyQt5.QtWidgets.QWidget): Optional Qt parent
+
+        Returns
+        -------
+        None
+
+        '''
+        QtWidgets.QWidget.__init__(self, parent)
+        self.buffer = None
+        self.channel = 0
+        self.span = 60.0  # Seconds shown across the plot width
+        self.view_end = None  # time.time() seconds at the right edge. None follows the newest sample
+        self.drag_origin = None  # (mouse x, view_end) when a drag started
+        self.drawn_total = -1  # buffer.total at the last redraw
+        self.dirty = True
+
+        self.setMinimumSize(320, 200)
+        self.setToolTip('Mouse wheel: zoom\nDrag: pan\nDouble-click: follow newest samples')
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(self.REFRESH_INTERVAL)
+
+
+    def set_buffer(self, buffer):
+        '''
+        Attach the DecimatedRingBuffer to draw from.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        buffer (DecimatedRingBuffer): Telemetry store
+
+        Returns
+        -------
+        None
+
+        '''
+        self.buffer = buffer
+        self.dirty = True
+
+
+    def set_channel(self, channel):
+        '''
+        Choose which channel column to draw.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        channel (int): Channel column index. Ex.: 0 for voltage
+
+        Returns
+        -------
+        None
+
+        '''
+        self.channel = channel
+        self.dirty = True
+
+
+    def refresh(self):
+        '''
+        Schedule a repaint if anything changed since the last one. Connected to refresh_timer.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        if self.buffer is None or not self.isVisible():
+            return
+
+        if self.dirty or (self.view_end is None and self.buffer.total != self.drawn_total):
+            self.dirty = False
+            self.update()
+
+
+    def paintEvent(self, event):
+        '''
+        Draw the envelope of the visible time span. Overrides QtWidgets.QWidget.paintEvent.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        event (PyQt5.QtGui.QPaintEvent): Automatically passed in by Qt
+
+        Returns
+        -------
+        None
+
+        '''
+        painter = QtGui.QPainter(self)
+        painter.fillRect(self.rect(), QtGui.QColor(0, 0, 0))
+        painter.setFont(QtGui.QFont('Cascadia Mono', 8))
+
+        if self.buffer is None or self.buffer.total == 0:
+            painter.setPen(QtGui.QColor(107, 107, 107))
+            painter.drawText(self.rect(), Qt.AlignCenter, 'Start streaming to plot measurements')
+            return
+
+        self.drawn_total = self.buffer.total
+        end = self.view_end if self.view_end is not None else time.time()
+        start = end - self.span
+        width, height = self.width(), self.height()
+
+        centers, minimums, maximums = self.buffer.envelope(start, end, width, self.channel)
+        painter.setPen(QtGui.QColor(107, 107, 107))
+        painter.drawText(4, height - 4, f'{self.span:.4g} s' + ('' if self.view_end is None else '  (paused, double-click to follow)'))
+
+        if len(centers) == 0:
+            return
+
+        # Auto-scale to what is visible, with a little headroom
+        low, high = float(minimums.min()), float(maximums.max())
+        margin = (high - low) * 0.05 or max(abs(high) * 0.05, 1e-3)
+        low, high = low - margin, high + margin
+
+        # Screen coordinates, computed for every column at once
+        x = (centers - start) / self.span * (width - 1)
+        y_low = (high - minimums) / (high - low) * (height - 1)
+        y_high = (high - maximums) / (high - low) * (height - 1)
+
+        painter.setPen(QtGui.QColor(135, 183, 227))
+        painter.drawLines([QLineF(x_column, y_top, x_column, y_bottom + 0.5) for x_column, y_top, y_bottom in zip(x.tolist(), y_high.tolist(), y_low.tolist())])
+
+        # Connect neighbouring columns, so sparse data still reads as a trace
+        if len(x) > 1:
+            middle = (y_low + y_high) / 2
+            painter.drawPolyline(QtGui.QPolygonF([QPointF(x_column, y_column) for x_column, y_column in zip(x.tolist(), middle.tolist())]))
+
+        painter.setPen(QtGui.QColor(218, 218, 218))
+        painter.drawText(4, 12, f'{high:.4g}')
+        painter.drawText(4, height - 16, f'{low:.4g}')
+
+
+    def wheelEvent(self, event):
+        '''
+        Zoom the time axis around the mouse position. Overrides QtWidgets.QWidget.wheelEvent.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        event (PyQt5.QtGui.QWheelEvent): Automatically passed in by Qt
+
+        Returns
+        -------
+        None
+
+        '''
+        scale = 0.8 if event.angleDelta().y() > 0 else 1.25
+        end = self.view_end if self.view_end is not None else time.time()
+        anchor = end - self.span * (1 - event.pos().x() / max(self.width(), 1))
+
+        new_span = float(np.clip(self.span * scale, 0.05, 7 * 24 * 3600))
+        if self.view_end is not None:
+            self.view_end = anchor + (end - anchor) * new_span / self.span
+        self.span = new_span
+        self.dirty = True
+
+
+    def mousePressEvent(self, event):
+        '''
+        Start a pan. Overrides QtWidgets.QWidget.mousePressEvent.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        event (PyQt5.QtGui.QMouseEvent): Automatically passed in by Qt
+
+        Returns
+        -------
+        None
+
+        '''
+        self.drag_origin = (event.pos().x(), self.view_end if self.view_end is not None else time.time())
+
+
+    def mouseMoveEvent(self, event):
+        '''
+        Pan the time axis while dragging. Overrides QtWidgets.QWidget.mouseMoveEvent.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        event (PyQt5.QtGui.QMouseEvent): Automatically passed in by Qt
+
+        Returns
+        -------
+        None
+
+        '''
+        if self.drag_origin is None:
+            return
+
+        origin_x, origin_end = self.drag_origin
+        self.view_end = origin_end - (event.pos().x() - origin_x) / max(self.width(), 1) * self.span
+        self.dirty = True
+
+
+    def mouseReleaseEvent(self, event):
+        '''
+        End a pan. Overrides QtWidgets.QWidget.mouseReleaseEvent.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        event (PyQt5.QtGui.QMouseEvent): Automatically passed in by Qt
+
+        Returns
+        -------
+        None
+
+        '''
+        self.drag_origin = None
+
+
+    def mouseDoubleClickEvent(self, event):
+        '''
+        Return to following the newest samples. Overrides QtWidgets.QWidget.mouseDoubleClickEvent.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        event (PyQt5.QtGui.QMouseEvent): Automatically passed in by Qt
+
+        Returns
+        -------
+        None
+
+        '''
+        self.view_end = None
+        self.dirty = True
@@ -0,0 +1,257 @@
+'''
+Module to find BK Precision 9141 power supplies among the computer's serial ports, by asking every candidate port "*IDN?" at once.
+'''
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import serial
+from serial_sessions import serial_sessions
+
+
+# Identification results + learned USB IDs, kept between launches
+DISCOVERY_CACHE_FILE = 'port_discovery.json'
+
+# USB-serial bridges probed first, as "VID:PID" hex strings. Extended with every VID:PID a supply is later found behind
+KNOWN_USB_IDS = ('0403:6001', '0403:6015', '10C4:EA60', '067B:2303', '1A86:7523')
+
+# *IDN? model field of the supported instruments
+SUPPORTED_MODELS = ('9141',)
+
+
+class PortDiscovery():
+    '''
+    Class containing functions to probe serial ports concurrently and identify the supplies behind them.
+    Probes run in parallel, so discovery takes one probe timeout in total, however many ports there are.
+    '''
+
+    @staticmethod
+    def load_cache(path=DISCOVERY_CACHE_FILE):
+        '''
+        Read the discovery cache.
+
+        Parameters
+        ----------
+        path (string): JSON cache file
+
+        Returns
+        -------
+        Dictionary of {'usb_ids': list of "VID:PID" strings, 'ports': {hwid: identification dictionary}}. Empty lists/dictionaries if the file does not exist or is unreadable
+
+        '''
+        cache = {'usb_ids': [], 'ports': {}}
+        if Path(path).is_file():
+            try:
+                with open(path, 'r', encoding='utf-8') as cache_file:
+                    cache.update(json.load(cache_file))
+            except (OSError, ValueError):
+                pass  # A damaged cache only costs a re-probe
+        return cache
+
+
+    @staticmethod
+    def save_cache(cache, path=DISCOVERY_CACHE_FILE):
+        '''
+        Write the discovery cache.
+
+        Parameters
+        ----------
+        cache (dictionary): As returned by load_cache
+        path (string): JSON cache file
+
+        Returns
+        -------
+        None
+
+        '''
+        with open(path, 'w', encoding='utf-8') as cache_file:
+            json.dump(cache, cache_file, indent=4)
+
+
+    @staticmethod
+    def usb_id(port):
+        '''
+        "VID:PID" of a port, for the prefilter.
+
+        Parameters
+        ----------
+        port (serial.tools.list_ports_common.ListPortInfo): Port description
+
+        Returns
+        -------
+        String, Ex.: "10C4:EA60". None for ports that are not USB devices
+
+        '''
+        if port.vid is None:
+            return None
+        return f'{port.vid:04X}:{port.pid or 0:04X}'
+
+
+    @staticmethod
+    def parse_identity(reply):
+        '''
+        Split an *IDN? reply into its fields.
+
+        Parameters
+        ----------
+        reply (string): Ex.: "B&K Precision, 9141, 123A45678, 1.10-1.08"
+
+        Returns
+        -------
+        Dictionary of manufacturer, model, serial_number, firmware, and supported. None if the reply is not an identification
+
+        '''
+        fields = [field.strip() for field in reply.split(',')]
+        if len(fields) < 2 or fields[0] == '':
+            return None
+
+        fields += [''] * (4 - len(fields))
+        return {'manufacturer': fields[0], 'model': fields[1], 'serial_number': fields[2], 'firmware': fields[3],
+                'supported': fields[1] in SUPPORTED_MODELS}
+
+
+    @staticmethod
+    def probe(com_port, timeout=0.25, sessions=serial_sessions, serial_factory=serial.Serial):
+        '''
+        Ask one port "*IDN?". A port the session pool already holds open is asked through the pool, so it is not closed from under its user.
+
+        Parameters
+        ----------
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        timeout (float): Seconds to wait for a reply
+        sessions (SerialSessions): Pool of open serial port sessions. Defaults to the shared pool in serial_sessions.py
+        serial_factory (function object): Opens ports that are not in the pool. Defaults to serial.Serial
+
+        Returns
+        -------
+        Reply string. Empty if nothing answered in time
+
+        Raises
+        ------
+        serial.serialutil.SerialException or OSError if the port cannot be opened
+
+        '''
+        # The port's link profile applies here too, so a supply negotiated to a faster rate is still identified
+        settings = sessions.link_settings(com_port)
+        terminator = settings.get('terminator', '\r')
+
+        def ask(ser):
+            ser.write(f'*IDN?{terminator}'.encode())
+            return ser.readline().decode(errors='replace').strip()
+
+        session = sessions.sessions.get(com_port)
+        if session is not None:
+            return sessions.transaction(com_port, ask, **session.settings)
+
+        with serial_factory(com_port, **{key: value for key, value in settings.items() if key in ('baudrate', 'xonxoff', 'rtscts')}, timeout=timeout, write_timeout=timeout) as ser:
+            return ask(ser)
+
+
+    @staticmethod
+    def discover(sessions=serial_sessions, timeout=0.25, refresh=False, cache_path=DISCOVERY_CACHE_FILE, ports=None):
+        '''
+        Identify the supported supplies on this computer.
+        Ports whose hardware ID is cached as identified are not probed again, unless refresh is set.
+        Ports behind known USB-serial bridges, and ports that are not USB at all, are probed first; the rest only if that finds no supply.
+        Every VID:PID a supply is found behind is remembered, so it is probed first next time.
+
+        Parameters
+        ----------
+        sessions (SerialSessions): Pool of open serial port sessions. Defaults to the shared pool in serial_sessions.py
+        timeout (float): Seconds to wait for each probe reply. Probes run in parallel
+        refresh (bool): Ignore cached identifications and probe every candidate port
+        cache_path (string): JSON cache file. None disables the cache
+        ports (list): Port descriptions to consider. Defaults to list_ports.comports()
+
+        Returns
+        -------
+        List of dictionaries, one per supported supply, in port order:
+        {'device', 'hwid', 'manufacturer', 'model', 'serial_number', 'firmware', 'supported', 'cached', 'probe_time'}
+
+        '''
+        if ports is None:
+            from serial.tools import list_ports  # Imported on first use, as it is slow to load on some platforms
+            ports = list_ports.comports()
+        cache = PortDiscovery.load_cache(cache_path) if cache_path else {'usb_ids': [], 'ports': {}}
+        usb_ids = set(KNOWN_USB_IDS) | set(cache['usb_ids'])
+        identities = {}  # {device: identification dictionary}
+
+        # Cached identifications. Hardware IDs of "n/a" (Ex.: built-in UARTs) are not unique, so are never cached
+        candidates = []
+        for port in ports:
+            cached = cache['ports'].get(port.hwid) if port.hwid and port.hwid != 'n/a' else None
+            if cached is not None and not refresh:
+                identities[port.device] = {**cached, 'device': port.device, 'hwid': port.hwid, 'cached': True, 'probe_time': 0.0}
+            else:
+                candidates.append(port)
+
+        def probe_one(port):
+            start_time = time.perf_counter()
+            try:
+                reply = PortDiscovery.probe(port.device, timeout, sessions)
+            except (serial.serialutil.SerialException, OSError):
+                reply = ''  # Missing, or busy in another application
+            identity = PortDiscovery.parse_identity(reply)
+            if identity is not None:
+                identity.update({'device': port.device, 'hwid': port.hwid, 'cached': False, 'probe_time': time.perf_counter() - start_time})
+            return port, identity
+
+        def probe_all(group):
+            if not group:
+                return
+            with ThreadPoolExecutor(max_workers=len(group)) as executor:
+                for port, identity in executor.map(probe_one, group):
+                    if identity is None:
+                        continue
+                    identities[port.device] = identity
+                    if port.hwid and port.hwid != 'n/a':
+                        cache['ports'][port.hwid] = {key: identity[key] for key in ('manufacturer', 'model', 'serial_number', 'firmware', 'supported')}
+                    if identity['supported'] and PortDiscovery.usb_id(port) is not None and PortDiscovery.usb_id(port) not in usb_ids:
+                        usb_ids.add(PortDiscovery.usb_id(port))
+                        cache['usb_ids'].append(PortDiscovery.usb_id(port))
+
+        likely = [port for port in candidates if PortDiscovery.usb_id(port) is None or PortDiscovery.usb_id(port) in usb_ids]
+        probe_all(likely)
+        if not any(identity['supported'] for identity in identities.values()):
+            probe_all([port for port in candidates if port not in likely])
+
+        if cache_path and any(not identity['cached'] for identity in identities.values()):
+            PortDiscovery.save_cache(cache, cache_path)
+
+        order = [port.device for port in ports]
+        return sorted((identity for identity in identities.values() if identity['supported']), key=lambda identity: order.index(identity['device']))
+
+
+    @staticmethod
+    def port_discovery(update_status_callback, sessions=serial_sessions, refresh=False, ports=None):
+        '''
+        GUI counterpart to discover(): runs it, then prints the supplies found.
+        Uses update_status_callback to update/refresh GUI.
+
+        Parameters
+        ----------
+        update_status_callback (function object): Defined in run.py, prints fed string to GUI status box + refreshes GUI
+        sessions (SerialSessions): Pool of open serial port sessions. Defaults to the shared pool in serial_sessions.py
+        refresh (bool): Ignore cached identifications and probe every candidate port
+        ports (list): Port descriptions to consider, Ex.: from PortMonitor.ports(). Defaults to list_ports.comports()
+
+        Returns
+        -------
+        List of supplies, as returned by discover()
+
+        '''
+        update_status_callback('<p style="font-size:12px; color:#DADADA; font-weight: bold;">' + f'<br>Power Supply Discovery<br>{"-"*110}' + '</p>')
+
+        start_time = time.perf_counter()
+        supplies = PortDiscovery.discover(sessions, refresh=refresh, ports=ports)
+        wall_time = time.perf_counter() - start_time
+
+        for supply in supplies:
+            identified = 'from cache' if supply['cached'] else f'probed in {supply["probe_time"] * 1000:.0f} ms'
+            update_status_callback('<br>{device}<br>\002\002\002\002\002Model: {manufacturer} {model}<br>\002\002\002\002\002Serial number: {serial_number}<br>\002\002\002\002\002Firmware: {firmware}<br>\002\002\002\002\002Identified: {identified}', 'info',
+                                   device=supply['device'], manufacturer=supply['manufacturer'], model=supply['model'], serial_number=supply['serial_number'], firmware=supply['firmware'], identified=identified)
+        update_status_callback('<br>{count} supplies found in {wall_time_ms:.0f} ms', 'info', count=len(supplies), wall_time_ms=wall_time * 1000)
+        update_status_callback('<p style="font-size:12px; color:#DADADA; font-weight: bold;">' + f'<br>{"-"*110}<br><br>' + '</p>')
+
+        return supplies
@@ -0,0 +1,192 @@
+'''
+Module to keep an up-to-date index of the computer's serial ports, and report ports being attached or removed.
+'''
+import sys
+import threading
+
+from serial_sessions import serial_sessions
+
+
+class PortMonitor(threading.Thread):
+    '''
+    Class containing a background thread that keeps an in-memory index of serial ports.
+    Each pass re-enumerates the ports and compares against the index, so only changes are reported.
+    On Linux with the optional pyudev package, passes run when udev reports a tty change, instead of on a timer.
+    '''
+
+    def __init__(self, sessions=serial_sessions, interval=1.0):
+        '''
+        Create the monitor. The first enumeration happens on the monitor thread, so creating it costs nothing.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        sessions (SerialSessions): Pool whose sessions are invalidated when their port goes away. Defaults to the shared pool in serial_sessions.py
+        interval (float): Seconds between enumerations when polling
+
+        Returns
+        -------
+        None
+
+        '''
+        threading.Thread.__init__(self, daemon=True)
+        self.sessions = sessions
+        self.interval = interval
+        self.index = {}  # {device: ListPortInfo}
+        self.index_lock = threading.Lock()
+        self.ready = threading.Event()  # Set once the first enumeration is done
+        self.listeners = []
+        self.stop_event = threading.Event()
+        self.udev_monitor = None
+
+
+    @staticmethod
+    def __udev_monitor():
+        '''
+        Open a udev monitor for tty devices, if possible.
+
+        Parameters
+        ----------
+        N/A
+
+        Returns
+        -------
+        pyudev.Monitor object, or None when not on Linux or pyudev is not installed
+
+        '''
+        if not sys.platform.startswith('linux'):
+            return None
+        try:
+            import pyudev
+        except ImportError:
+            return None
+
+        monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+        monitor.filter_by(subsystem='tty')
+        monitor.start()
+        return monitor
+
+
+    def subscribe(self, callback):
+        '''
+        Call callback(event, port) on every change, from the monitor thread.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        callback (function object): event is "added" or "removed", port is a serial.tools.list_ports_common.ListPortInfo
+
+        Returns
+        -------
+        None
+
+        '''
+        self.listeners.append(callback)
+
+
+    def ports(self):
+        '''
+        Ports currently attached, from the index. Costs no enumeration, unless called before the monitor's first one has finished.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        List of serial.tools.list_ports_common.ListPortInfo objects, sorted by device name
+
+        '''
+        if not self.ready.is_set():
+            if self.is_alive():
+                self.ready.wait()
+            else:
+                self.refresh()  # Not started: enumerate here instead
+        with self.index_lock:
+            return sorted(self.index.values(), key=lambda port: port.device)
+
+
+    def refresh(self):
+        '''
+        Re-enumerate the ports and report every difference from the index.
+        A device name now belonging to different hardware counts as removed, then added.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        List of (event, port) tuples that were reported
+
+        '''
+        from serial.tools import list_ports  # Imported on first use, as it is slow to load on some platforms
+
+        current = {port.device: port for port in list_ports.comports()}
+
+        with self.index_lock:
+            removed = [port for device, port in self.index.items() if device not in current or current[device].hwid != port.hwid]
+            added = [port for device, port in current.items() if device not in self.index or self.index[device].hwid != port.hwid]
+            self.index = current
+            first = not self.ready.is_set()
+            self.ready.set()
+
+        # The first enumeration only fills the index: nothing was attached or removed
+        if first:
+            return []
+
+        events = [('removed', port) for port in removed] + [('added', port) for port in added]
+        for event, port in events:
+            if event == 'removed':
+                # Only the session on the port that went away is closed
+                self.sessions.invalidate(port.device)
+            for callback in self.listeners:
+                callback(event, port)
+        return events
+
+
+    def stop(self):
+        '''
+        Ask the monitor to finish, and wait for it.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        self.stop_event.set()
+        if self.is_alive():
+            self.join()
+
+
+    def run(self):
+        '''
+        Thread body: wait for a udev event or the polling interval, then refresh.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        self.refresh()
+        self.udev_monitor = self.__udev_monitor()
+
+        while not self.stop_event.is_set():
+            if self.udev_monitor is not None:
+                # Wake on the first tty event, then collect the rest of the burst (a plug-in produces several)
+                if self.udev_monitor.poll(timeout=self.interval) is None:
+                    continue
+                while self.udev_monitor.poll(timeout=0.1) is not None:
+                    pass
+            elif self.stop_event.wait(self.interval):
+                break
+
+            self.refresh()
@@ -0,0 +1,243 @@
+'''
+Module to hold a voltage or current at the device under test, by measuring the output every control period and trimming the setpoint.
+
+"VOLT?" only confirms what was programmed. Under load, the leads drop part of it before it reaches the device under test,
+and the drop changes with the load current. Regulation measures the output (MEAS:VOLT? + MEAS:CURR?) once per period,
+estimates what the device under test receives, and sets the output to make up for the difference.
+
+    Device under test voltage = measured voltage - measured current x lead resistance
+    Setpoint = target + measured current x lead resistance (feed-forward) + PI trim
+
+The feed-forward term follows a load step within one period. The PI trim removes whatever the lead resistance estimate gets wrong.
+
+Every trim is no faster than the slew rate, no further than the maximum trim from the requested value, and never outside InstrumentLimits.LIMITS.
+The slew rate and maximum trim depend on the device under test, not on the instrument. SLEW_RATE and MAXIMUM_TRIM are only defaults, set in the GUI per run.
+Each period costs one serial round-trip: the new setpoint and both measurements go out in one write.
+'''
+import serial
+from deadline_scheduler import FixedRateScheduler
+from instrument_limits import InstrumentLimits
+from scpi_transaction import ScpiTransaction
+from serial_sessions import serial_sessions
+
+
+# Default control period, in seconds. A 9600-baud round-trip takes ~30 ms, so ~3x that leaves room for jitter
+CONTROL_PERIOD = 0.1
+
+# Default band the regulated value counts as "in tolerance" within. {thing_to_change: units}
+TOLERANCE = {'VOLT': 0.010, 'CURR': 0.002}
+
+# Default fastest setpoint change while trimming. {thing_to_change: units per second}
+SLEW_RATE = {'VOLT': 10.0, 'CURR': 1.0}
+
+# Default furthest a trim may take the setpoint from the value asked for. {thing_to_change: units}
+MAXIMUM_TRIM = {'VOLT': 2.0, 'CURR': 0.2}
+
+# Seconds between progress lines in the status box
+REPORT_INTERVAL = 1.0
+
+UNITS = {'VOLT': 'V', 'CURR': 'A'}
+
+
+class Regulator():
+    '''
+    Class containing the controller of one regulated output: measurements in, next setpoint out.
+    Lead drop feed-forward answers load steps within a period. PI action removes the error left over.
+    '''
+
+    def __init__(self, thing_to_change, target, period=CONTROL_PERIOD, lead_resistance=0.0, proportional_gain=0.3, integral_gain=4.0, slew_rate=None, maximum_trim=None):
+        '''
+        Create a controller with no trim applied yet.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        thing_to_change (string): "VOLT" or "CURR"
+        target (float): Value wanted at the device under test
+        period (float): Seconds between updates
+        lead_resistance (float): Ohms of the wiring to the device under test, both leads together. Only used for "VOLT"
+        proportional_gain (float): Setpoint change per unit of error
+        integral_gain (float): Setpoint change per unit of error, per second
+        slew_rate (float): Fastest setpoint change, in units per second. Defaults to SLEW_RATE
+        maximum_trim (float): Furthest the setpoint may be trimmed from target. Defaults to MAXIMUM_TRIM
+
+        Returns
+        -------
+        None
+
+        '''
+        self.thing_to_change = thing_to_change
+        self.target = float(target)
+        self.period = period
+        self.lead_resistance = lead_resistance
+        self.proportional_gain = proportional_gain
+        self.integral_gain = integral_gain
+        self.slew_rate = SLEW_RATE[thing_to_change] if slew_rate is None else slew_rate
+        self.maximum_trim = MAXIMUM_TRIM[thing_to_change] if maximum_trim is None else maximum_trim
+        self.integral = 0.0  # Accumulated trim, in setpoint units
+        self.measured = None  # Last regulated value, None before anything was measured
+        self.setpoint = None  # Last setpoint returned, None before the first update
+        self.clamped = False  # True if the last setpoint was held back by a slew, trim, or instrument limit
+
+
+    def regulated_value(self, volts, amps):
+        '''
+        Value at the device under test, estimated from the output terminal measurements.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        volts (float): MEAS:VOLT? reply
+        amps (float): MEAS:CURR? reply
+
+        Returns
+        -------
+        float
+
+        '''
+        if self.thing_to_change == 'VOLT':
+            return volts - amps * self.lead_resistance
+        return amps
+
+
+    def update(self, volts=None, amps=None):
+        '''
+        Next setpoint, from the latest output measurements.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        volts (float): MEAS:VOLT? reply. None if nothing was measured, which repeats the last setpoint
+        amps (float): MEAS:CURR? reply
+
+        Returns
+        -------
+        Setpoint, rounded to the instrument's 1 mV / 1 mA resolution
+
+        '''
+        if volts is None or amps is None:
+            self.measured = None
+            if self.setpoint is None:
+                self.setpoint = self.target  # Sent as is, so the first trim is slew-limited from it
+            return self.setpoint
+
+        self.measured = self.regulated_value(volts, amps)
+        error = self.target - self.measured
+        feed_forward = amps * self.lead_resistance if self.thing_to_change == 'VOLT' else 0.0
+        integral = self.integral + self.integral_gain * error * self.period
+        requested = self.target + feed_forward + self.proportional_gain * error + integral
+
+        limited = min(max(requested, self.target - self.maximum_trim), self.target + self.maximum_trim)
+        limited = round(InstrumentLimits.slew(self.thing_to_change, self.setpoint, limited, self.period, self.slew_rate), 3)
+
+        # Anti-windup: while a limit holds the setpoint back, the error is not the controller's to integrate
+        self.clamped = abs(limited - requested) > 0.0005
+        if not self.clamped:
+            self.integral = integral
+
+        self.setpoint = limited
+        return limited
+
+
+    @staticmethod
+    def regulate(update_status_callback, com_port, thing_to_change, target, period=CONTROL_PERIOD, duration=None, sessions=serial_sessions,
+                 session_log=None, cancelled=None, channel=None, lead_resistance=0.0, tolerance=None, slew_rate=None, maximum_trim=None):
+        '''
+        Regulate one output until cancelled, or for a set duration, then report how well the target and the loop timing were held.
+        The last trimmed setpoint is left in place, as it is the one that holds the target.
+
+        Parameters
+        ----------
+        update_status_callback (function object): Prints fed string to GUI status box, or queues a structured record
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        thing_to_change (string): "VOLT" or "CURR"
+        target (float or string): Value wanted at the device under test. Must already be within instrument limits
+        period (float): Control period, in seconds
+        duration (float): Seconds to regulate for. None regulates until cancelled
+        sessions (SerialSessions): Pool of open serial port sessions. Defaults to the shared pool in serial_sessions.py
+        session_log (SessionLog): Optional binary log receiving the measurements of every period
+        cancelled (function object): Optional callable returning True when regulation should stop. Ex.: InstrumentWorker.is_cancelled
+        channel (int): Output channel, 1, 2, or 3. None uses whichever channel is selected on the instrument
+        lead_resistance (float): Ohms of the wiring to the device under test. Only used for "VOLT"
+        tolerance (float): Band around the target that counts as held. Defaults to TOLERANCE
+        slew_rate (float): Fastest setpoint change, in units per second. Defaults to SLEW_RATE
+        maximum_trim (float): Furthest the setpoint may be trimmed from target. Defaults to MAXIMUM_TRIM
+
+        Returns
+        -------
+        A Boolean value of True is returned if communication failed.
+        Returns "None", otherwise.
+
+        '''
+        target = float(target)
+        tolerance = TOLERANCE[thing_to_change] if tolerance is None else tolerance
+        unit = UNITS[thing_to_change]
+        prefix = f'CH{channel} ' if channel is not None else ''
+        regulator = Regulator(thing_to_change, target, period, lead_resistance, slew_rate=slew_rate, maximum_trim=maximum_trim)
+
+        update_status_callback('<p style="font-size:11px; color:#DADADA;">' + f'[Regulating {com_port} {prefix}{thing_to_change} at {target:g} {unit}, every {period * 1000:.0f} ms' +
+                               (f', {lead_resistance:g} Ω lead compensation' if thing_to_change == 'VOLT' and lead_resistance else '') +
+                               f', trims up to ±{regulator.maximum_trim:g} {unit} at {regulator.slew_rate:g} {unit}/s' + ']' + '</p>')
+
+        scheduler = FixedRateScheduler(period, cancelled)
+        volts, amps = None, None
+        samples, held, missed = 0, 0, 0
+        settled = False
+        worst = 0.0  # Largest error once the target was first reached, Ex.: during a load step
+        next_report = REPORT_INTERVAL
+        failed = None
+        scheduler.start()
+
+        while duration is None or scheduler.elapsed() < duration:
+            # One write: new setpoint (left out when unchanged, see channel_state.py), then both measurements
+            setpoint = regulator.update(volts, amps)
+            transaction = ScpiTransaction()
+            if channel is not None:
+                transaction.select(channel)
+            transaction.set(thing_to_change, f'{setpoint:.3f}')
+            transaction.query('MEAS:VOLT?').query('MEAS:CURR?')
+
+            try:
+                replies = transaction.execute(com_port, sessions, session_log)
+            except (serial.serialutil.SerialException, OSError) as error:
+                update_status_callback('{port} {prefix}regulation stopped: lost communication ({error})', 'error', port=com_port, prefix=prefix, error=str(error))
+                failed = True
+                break
+
+            try:
+                volts, amps = float(replies['MEAS:VOLT?']), float(replies['MEAS:CURR?'])
+            except ValueError:
+                # Measurement missing: hold the setpoint rather than act on nothing
+                missed += 1
+                volts, amps = None, None
+            else:
+                measured = regulator.regulated_value(volts, amps)
+                samples += 1
+                error = target - measured
+                if abs(error) <= tolerance:
+                    held += 1
+                    settled = True
+                if settled:
+                    worst = max(worst, abs(error))
+
+            if volts is not None and scheduler.elapsed() >= next_report:
+                next_report += REPORT_INTERVAL
+                update_status_callback('{port} {prefix}{thing}: {measured:.3f} {unit} at load, setpoint {setpoint:.3f} {unit}, error {error:+.3f} {unit}{clamped}', 'detail',
+                                       port=com_port, prefix=prefix, thing=thing_to_change, measured=measured, unit=unit, setpoint=setpoint, error=target - measured,
+                                       clamped=' (limited)' if regulator.clamped else '')
+
+            if scheduler.wait_next() is None:
+                break
+
+        timing = scheduler.statistics()
+        update_status_callback('{port} {prefix}regulation ended at setpoint {setpoint:.3f} {unit}: {held_percent:.1f}% of {samples} measurements within ±{tolerance:g} {unit}, '
+                               'worst error after settling {worst:.3f} {unit}, {missed} missed', 'error' if failed or not settled else 'info',
+                               port=com_port, prefix=prefix, setpoint=regulator.setpoint, unit=unit, held_percent=100.0 * held / samples if samples else 0.0,
+                               samples=samples, tolerance=tolerance, worst=worst, missed=missed)
+        if timing['lateness_p50'] is not None:
+            update_status_callback('Loop: {ticks} periods of {period_ms:.0f} ms, wake-up lateness p50 {late_p50:.2f} ms, p99 {late_p99:.2f} ms, '
+                                   'round-trip p50 {work_p50:.1f} ms, p99 {work_p99:.1f} ms, {overruns} overruns', 'detail',
+                                   ticks=timing['ticks'], period_ms=period * 1000, late_p50=timing['lateness_p50'] * 1000, late_p99=timing['lateness_p99'] * 1000,
+                                   work_p50=timing['work_p50'] * 1000, work_p99=timing['work_p99'] * 1000, overruns=timing['overruns'])
+
+        return failed
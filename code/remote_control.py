@@ -1,8 +1,12 @@
 '''
 Module to manipulate power supply function.
 '''
+import time
+
 import serial
-from popup_dialogs import PopupDialogs
+from instrument_limits import InstrumentLimits
+from serial_sessions import serial_sessions
+from scpi_transaction import ScpiTransaction
 
 
 class RemoteControl():
@@ -11,9 +15,64 @@ class RemoteControl():
     '''
 
     @staticmethod
-    def remote_control(update_status_callback, com_port, thing_to_change, value=''):
+    def set_and_check(com_port, thing_to_change, value, sessions=serial_sessions, session_log=None, channel=None, skipped=None):
+        '''
+        Send a set command followed by its check query, and return the instrument's reply.
+        No GUI involvement, so it may be called from any thread, or in parallel for different ports.
+        The channel selection and set command are left out when the connection's channel state shows they are already in effect. The check query is always sent.
+
+        Parameters
+        ----------
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        thing_to_change (string): "VOLT" or "CURR"
+        value (string): Value to set
+        sessions (SerialSessions): Pool of open serial port sessions. Defaults to the shared pool in serial_sessions.py
+        session_log (SessionLog): Optional binary log receiving one record per set + check
+        channel (int): Output channel, 1, 2, or 3. None uses whichever channel is selected on the instrument
+        skipped (list): Optional. Extended with the commands left out, because they were already in effect
+
+        Returns
+        -------
+        String returned by the VOLT? or CURR? check command. Empty if the instrument did not reply in time
+
+        Raises
+        ------
+        serial.serialutil.SerialException if the port cannot be opened, or the link fails twice
+
+        '''
+        # General commands from BK Precision 9141 programming manual
+        # timeout=3: return immediately when the requested number of bytes are available, otherwise wait three seconds and return all bytes that were received until then.
+        # Cannot use timeout=0 if want to use any ser.read...(), no return
+        # Do not use any ser.read...() immediately following a command that doesn't return (Ex.: 'VOLT #') - will wait until something returns (never), so waits until timeout to continue
+        # Set + check go out in a single write, and the reply is read back in a single read
+        # Channel selection rides in the same write
+        transaction = ScpiTransaction()
+        if channel is not None:
+            transaction.select(channel)
+        transaction.set(thing_to_change, value).query(f'{thing_to_change}?')
+
+        # Reconnects + retries once if the link drops mid-command
+        start_time = time.perf_counter()
+        # Baud rate, terminators + flow control come from the instrument's link profile, if the pool has profiles
+        value_found = sessions.transaction(com_port, transaction.run, timeout=3)[f'{thing_to_change}?']
+        if skipped is not None:
+            skipped.extend(transaction.skipped)
+
+        if session_log is not None:
+            try:
+                readback = float(value_found)
+            except ValueError:
+                readback = float('nan')
+            session_log.append(com_port, thing_to_change, float(value), readback, time.perf_counter() - start_time)
+
+        return value_found
+
+
+    @staticmethod
+    def remote_control(update_status_callback, com_port, thing_to_change, value='', sessions=serial_sessions, dialogs=None, session_log=None, channel=None):
         '''
         Commandeers specified serial port and sends commands to the connected instrument.
+        The port is held open by the session pool, so repeated commands only cost the wire round-trip.
 
         Parameters
         ----------
@@ -21,6 +80,10 @@ class RemoteControl():
         com_port (string): User input text from COM Port text field in GUI
         thing_to_change (string): String based on user selected Function option from GUI, variable value set in run.py
         value (string): User input text from Set Value text field in GUI
+        sessions (SerialSessions): Pool of open serial port sessions. Defaults to the shared pool in serial_sessions.py
+        dialogs (class or object): Provides the popup dialog functions. QueuedDialogs on a worker thread. Defaults to PopupDialogs, for the GUI thread
+        session_log (SessionLog): Optional binary log receiving one record per set + check
+        channel (int): Output channel, 1, 2, or 3, from the Channel selector in GUI. None uses whichever channel is selected on the instrument
 
         Returns
         -------
@@ -29,11 +92,15 @@ class RemoteControl():
         Returns "None", otherwise.
 
         '''
+        # PopupDialogs needs PyQt5, so it is only imported when no other dialogs are given. Headless use never loads Qt
+        if dialogs is None:
+            from popup_dialogs import PopupDialogs
+            dialogs = PopupDialogs
+
         # Catch communication exceptions before running
         try:
-            # Connect to the BK Precision 9141 power supply
-            with serial.Serial(com_port, 9600, timeout=0) as ser:  # closes the port after use
-                pass
+            # Connect to the BK Precision 9141 power supply. Reuses the already-open session if there is a healthy one
+            sessions.acquire(com_port, timeout=3)
 
         except serial.serialutil.SerialException:
 
@@ -41,42 +108,53 @@ class RemoteControl():
             update_status_callback('<p style="font-size:11px; color:#D60000;">' + '<br>&lt;!&gt; ' + '<span style="color:#DADADA">' + f'Could not open "{com_port}". Please check COM ports and try again.' + '</p>')
 
             # Inform the user of the problem via a popup dialog window to better grab their attention
-            error_dialog = PopupDialogs.com_bad_communication(com_port)
+            error_dialog = dialogs.com_bad_communication(com_port)
             return error_dialog
 
         update_status_callback('<p style="font-size:11px; color:#DADADA;">' + '[Deploying remote control algorithms]' + '</p>')
 
-        # Commandeer the serial port and send commands
-        # General commands from BK Precision 9141 programming manual
-        # timeout=3: return immediately when the requested number of bytes are available, otherwise wait three seconds and return all bytes that were received until then.
-        # Cannot use timeout=0 if want to use any ser.read...(), no return
-        # Do not use any ser.read...() immediately following a command that doesn't return (Ex.: 'VOLT #') - will wait until something returns (never), so waits until timeout to continue
-        with serial.Serial(com_port, 9600, timeout=3) as ser:
+        try:
+            # Commandeer the serial port and send commands
+            skipped = []
+            value_found = RemoteControl.set_and_check(com_port, thing_to_change, value, sessions, session_log, channel, skipped)
 
-            # Define the set command
-            change_command = f'{thing_to_change} {value}\r'
+        except (serial.serialutil.SerialException, OSError):
+            update_status_callback('<p style="font-size:11px; color:#D60000;">' + '<br>&lt;!&gt; ' + '<span style="color:#DADADA">' + f'Lost communication with "{com_port}". Please check COM ports and try again.' + '</p>')
+            error_dialog = dialogs.com_bad_communication(com_port)
+            return error_dialog
 
-            # Send the command
-            ser.write(change_command.encode())  # Encode to bytes
+        # A timed-out or cancelled read returns nothing at all
+        if value_found.strip() == '':
+            update_status_callback('<p style="font-size:11px; color:#D60000;">' + '<br>&lt;!&gt; ' + '<span style="color:#DADADA">' + f'No reply from "{com_port}". Please check instrument and try again.' + '</p>')
+            error_dialog = dialogs.com_bad_communication(com_port)
+            return error_dialog
 
-            # Define the check command
-            check_command = f'{thing_to_change}?\r'
+        # Perform a failsafe check, to within the instrument's 1 mV / 1 mA resolution. A reply that is not a number fails it
+        if InstrumentLimits.confirms(value_found, value):
+            quantity = 'Voltage' if thing_to_change == 'VOLT' else 'Current'
+            prefix = f'CH{channel} ' if channel is not None else ''
+            if any(command.startswith(thing_to_change) for command in skipped):
+                update_status_callback('<p style="font-size:11px; color:#DADADA;">' + f'<br><br>--> {prefix}{quantity} value already {value}. Confirmed by read-back, no set command sent' + '</p>')
 
-            # Send the command and read all bytes of the returned value
-            ser.write(check_command.encode())
-            value_found = ser.readline().decode()  # Decode from bytes
+            else:
+                update_status_callback('<p style="font-size:11px; color:#DADADA;">' + f'<br><br>--> {prefix}{quantity} value changed to {value}' + '</p>')
 
-            # Perform a failsafe check
-            if float(value_found) == float(value):
-                if thing_to_change == 'VOLT':
-                    update_status_callback('<p style="font-size:11px; color:#DADADA;">' + f'<br><br>--> Voltage value changed to {value}' + '</p>')
+            # Every setpoint confirmed on this connection so far
+            state = sessions.channel_state(com_port)
+            if state:
+                known = ' | '.join(f'CH{known_channel} ' + ', '.join(f'{setpoint:g} {"V" if known_thing == "VOLT" else "A"}' for known_thing, setpoint in sorted(state[known_channel].items(), reverse=True))
+                                   for known_channel in sorted(key for key in state if key != 'selected'))
+                if known:
+                    update_status_callback('<p style="font-size:11px; color:#6b6b6b;">' + f'Confirmed setpoints: {known}' + '</p>')
 
-                else:
-                    update_status_callback('<p style="font-size:11px; color:#DADADA;">' + f'<br><br>--> Current value changed to {value}' + '</p>')
+            # Learned link timing, so slow or flaky links are visible
+            link = sessions.link_statistics(com_port)
+            if link is not None and link['p50'] is not None:
+                update_status_callback('<p style="font-size:11px; color:#6b6b6b;">' + f'Link: round-trip p50 {link["p50"] * 1000:.1f} ms, p99 {link["p99"] * 1000:.1f} ms ({link["samples"]} samples), read timeout {link["timeout"] * 1000:.0f} ms, {link["retries"]} retries, {link["timeouts"]} timeouts' + '</p>')
 
-            else:  # Failsafe check failed
-                update_status_callback('<p style="font-size:11px; color:#D60000;">' + '<br>&lt;!&gt; ' + '<span style="color:#DADADA">' + f'Could not confirm set value! Please check instrument and try again.' + '</p>')
+        else:  # Failsafe check failed
+            update_status_callback('<p style="font-size:11px; color:#D60000;">' + '<br>&lt;!&gt; ' + '<span style="color:#DADADA">' + f'Could not confirm set value! Please check instrument and try again.' + '</p>')
 
-                # Inform the user of the problem via a popup dialog window to better grab their attention
-                error_dialog = PopupDialogs.failed_confirmation(thing_to_change, value_found, value)
-                return error_dialog
+            # Inform the user of the problem via a popup dialog window to better grab their attention
+            error_dialog = dialogs.failed_confirmation(thing_to_change, value_found, value)
+            return error_dialog
@@ -6,21 +6,51 @@
 '''
 Module containing class to handle the application's GUI and operation.
 '''
+import time
+
+# Launch time, taken before any other import, so startup timings include import time
+STARTUP_TIME = time.perf_counter()
+
 import sys
+import threading
 from datetime import datetime
-from pathlib import Path
 
+import serial
 from PyQt5.QtCore import Qt
 from PyQt5.QtCore import QRegExp
+from PyQt5.QtCore import QTimer
+from PyQt5.QtCore import pyqtSignal
 from PyQt5 import QtWidgets
 from PyQt5 import QtGui
 
-import base64
-import hashlib
-from cryptography.fernet import Fernet
-
+from build_integrity import BuildIntegrity
 from remote_control import RemoteControl
 from check_ports import CheckPorts
+from port_discovery import PortDiscovery
+from link_profiles import LinkProfiles, LINK_PROFILES_FILE
+from port_monitor import PortMonitor
+from fleet_control import FleetControl, GROUPS_FILE
+from status_log import StatusLog
+from instrument_limits import InstrumentLimits
+from sequence import Sequence
+from regulation import Regulator, CONTROL_PERIOD, MAXIMUM_TRIM, SLEW_RATE
+from setpoint_coalescer import SetpointCoalescer
+from serial_sessions import SerialSessions
+from instrument_server import RemoteSessions, requested_server
+from session_trace import TraceReplayer, requested_trace
+from instrument_worker import InstrumentWorker
+from popup_dialogs import PopupDialogs
+from startup_profiler import StartupProfiler
+from latency_metrics import LatencyMetrics
+
+# Phase-by-phase startup timing. Reported with --profile-startup, or REMOTE_CONTROL_PROFILE=1
+# NumPy-based modules (session_log, telemetry, live_plot) are imported after the window is shown, not here
+startup_profiler = StartupProfiler(STARTUP_TIME)
+startup_profiler.mark('imports')
+
+
+# Lines kept in the status box. Older lines are only in the status_logs files
+STATUS_BLOCKS = 5000
 
 
 # Class to manage the GUI
@@ -29,6 +59,12 @@ class ApplicationUi(QtWidgets.QDialog):
     Class containing functions to handle the application's GUI and operation.
     '''
 
+    # Emitted from the port monitor thread, delivered on the GUI thread. (event, serial.tools.list_ports_common.ListPortInfo)
+    port_changed = pyqtSignal(str, object)
+
+    # Emitted from the build check thread, delivered on the GUI thread. (version, details)
+    version_checked = pyqtSignal(str, object)
+
     def __init__(self):
         '''
         "Initialize" GUI window and run the functions that create the GUI.
@@ -44,6 +80,49 @@ class ApplicationUi(QtWidgets.QDialog):
         '''
         QtWidgets.QDialog.__init__(self)
 
+        # Serial port sessions stay open between "Go!" clicks, and are closed after sitting idle
+        # Each session opens with its instrument's link profile (baud rate, terminators, flow control). Filled in by "Link Speed"
+        self.link_profiles = LinkProfiles()
+        # With --connect [host:port], or REMOTE_CONTROL_SERVER=host:port, the ports are shared through instrument_server.py instead of held here
+        self.server_address = requested_server()
+        # With --record-trace PATH, every byte to and from the ports is recorded. With --replay-trace PATH, a recording answers instead of the instruments (see session_trace.py)
+        self.serial_factory, self.trace = None, None
+        trace_error = None
+        if self.server_address is None:
+            try:
+                self.serial_factory, self.trace = requested_trace()
+            except (OSError, ValueError) as error:
+                # Ex.: a replay speed that is not a number, or a trace file that is missing. The real ports are used, and the status box says why
+                self.serial_factory, trace_error = serial.Serial, error
+        if self.server_address is None:
+            self.serial_sessions = SerialSessions(idle_timeout=30.0, serial_factory=self.serial_factory, profiles=self.link_profiles)
+        else:
+            self.serial_sessions = RemoteSessions(self.server_address, client_name='gui', priority=1)
+
+        # Binary record of every command + measurement, kept across runs. Export with session_log.py
+        # Created by __finish_startup once the window is up, as it loads NumPy
+        self.session_log = None
+        self.startup_finished = False  # Set by __finish_startup
+
+        # Status messages from every thread are queued here, and shown in batches by status_timer. Everything is also kept in status_logs
+        self.status_log = StatusLog(maximum_pending=STATUS_BLOCKS)
+        if trace_error is not None:
+            self.update_status_callback('<p style="font-size:11px; color:#D60000;">' + '<br>&lt;!&gt; ' + '<span style="color:#DADADA">' + f'Trace not opened: {trace_error}. Using the serial ports directly.' + '</p>')
+
+        # All instrument I/O runs on this thread, so slow instruments never freeze the GUI
+        self.worker = InstrumentWorker(self.serial_sessions, self, self.status_log, self.report_job)
+        self.start_time = None
+
+        # Live mode setpoints: only the newest value per port + channel is sent, on the worker thread, then verified once it settles
+        self.live_setpoints = SetpointCoalescer(self.worker.submit, self.serial_sessions, cancelled=self.worker.is_cancelled)
+
+        # Keeps the port list current in the background, and closes sessions on ports that disappear
+        self.port_monitor = PortMonitor(self.serial_sessions)
+
+        # Measurement streaming. The telemetry store + plot widget are created on first use
+        self.telemetry = None
+        self.stream = None
+
         self.__create_components()
         self.__configure_components()
         self.__construct_gui()
@@ -73,36 +152,73 @@ class ApplicationUi(QtWidgets.QDialog):
         self.com_port_group_box_layout = QtWidgets.QGridLayout()
         self.com_port = QtWidgets.QLineEdit()
         self.check_ports_button = QtWidgets.QPushButton('Check Ports')
+        self.discover_button = QtWidgets.QPushButton('Discover')
+        self.link_speed_button = QtWidgets.QPushButton('Link Speed')
+        self.fleet_ports = QtWidgets.QLineEdit()
 
         # Function group-box + component objects
         self.function_group_box = QtWidgets.QGroupBox('Function')
         self.function_group_box_layout = QtWidgets.QGridLayout()
         self.radio_button_voltage = QtWidgets.QRadioButton('Voltage')
         self.radio_button_current = QtWidgets.QRadioButton('Current')
+        self.channel_select = QtWidgets.QComboBox()
 
         # Manual Voltage Values group-box + component objects
         self.set_value_group_box = QtWidgets.QGroupBox('Set Values')
         self.set_value_group_box_layout = QtWidgets.QGridLayout()
         self.set_value = QtWidgets.QLineEdit()
+        self.live_value = QtWidgets.QDoubleSpinBox()
+        self.live_mode = QtWidgets.QCheckBox('Live')
+        self.regulate_mode = QtWidgets.QCheckBox('Regulate')
+        self.lead_resistance = QtWidgets.QDoubleSpinBox()
+        self.control_period = QtWidgets.QDoubleSpinBox()
+        self.maximum_trim = QtWidgets.QDoubleSpinBox()
+        self.slew_rate = QtWidgets.QDoubleSpinBox()
 
         # Status group-box + component objects
         self.status_group_box = QtWidgets.QGroupBox('Status')
         self.status_group_box_layout = QtWidgets.QGridLayout()
         self.status = QtWidgets.QPlainTextEdit()
+        self.stream_status = QtWidgets.QLabel()
+
+        # Live Plot group-box + component objects
+        self.plot_group_box = QtWidgets.QGroupBox('Live Plot')
+        self.plot_group_box_layout = QtWidgets.QGridLayout()
+        self.plot_channel = QtWidgets.QComboBox()
+        self.plot = None  # LivePlot, created by toggle_stream
 
         # go_row component objects - not using a nested group box
         self.clear = QtWidgets.QPushButton('Clear')
         self.always_clear = QtWidgets.QCheckBox('Always clear on "Go!"')
+        self.stream_button = QtWidgets.QPushButton('Stream')
+        self.sequence_button = QtWidgets.QPushButton('Run Sequence...')
+        self.metrics_button = QtWidgets.QPushButton('Metrics')
+        self.metrics_dialog = None  # Created by show_metrics
         self.go_button = QtWidgets.QPushButton('Go!')
+        self.cancel_button = QtWidgets.QPushButton('Cancel')
+        self.busy_indicator = QtWidgets.QProgressBar()
 
-        # Create decrypted "version value" object for display in bottom right of GUI. Version numberis YYYYMMDD format
-        version_decrypted = self.__version_decryption()
-        self.version = QtWidgets.QLabel(f'Version {version_decrypted}')
+        # Decrypted "version value" display in bottom right of GUI. Version number is YYYYMMDD format
+        # Filled in by the background build check, which starts once the window is shown
+        self.version = QtWidgets.QLabel('Version ........')
 
         # Create additional functional objects
+        # Periodically release serial ports that have not been used for a while, so other applications can use them
+        self.session_expiry_timer = QTimer(self)
+
+        # Moves queued status messages into the status box, many at a time
+        self.status_timer = QTimer(self)
+
+        # Refreshes the streaming sample rate + statistics line
+        self.stream_timer = QTimer(self)
+
         # COM Port text entry validator
         self.com_validator = QtGui.QRegExpValidator(QRegExp(r'^[0-9]{1,2}$'))  # REGEX
 
+        # Fleet port list text entry validator
+        # REGEX: comma-separated port numbers, ranges, port names, and group names
+        self.fleet_validator = QtGui.QRegExpValidator(QRegExp(r'^[0-9A-Za-z_/\-, ]*$'))
+
         # Voltage Value text entry validator
         # BK Precision 9141:
         # 60.600 > V > 0.000
@@ -127,7 +243,12 @@ class ApplicationUi(QtWidgets.QDialog):
 
         '''
         # Main GUI window attributes
-        self.setWindowTitle('Remote Control')
+        if self.server_address is not None:
+            self.setWindowTitle('Remote Control (via instrument server {}:{})'.format(*self.server_address))
+        elif self.trace is not None:
+            self.setWindowTitle(f'Remote Control ({"replaying" if isinstance(self.trace, TraceReplayer) else "recording"} {self.trace.path})')
+        else:
+            self.setWindowTitle('Remote Control')
         self.setWindowFlags(Qt.WindowCloseButtonHint | Qt.WindowMaximizeButtonHint | Qt.WindowMinimizeButtonHint)
 
         # COM Port group-box + component objects attributes
@@ -143,6 +264,21 @@ class ApplicationUi(QtWidgets.QDialog):
         self.com_port.textChanged.emit(self.com_port.text())
 
         self.check_ports_button.clicked.connect(self.check_ports)
+        self.discover_button.setToolTip('Find BK Precision 9141 supplies on every port at once, and fill in the COM Port # of the first one found.\nShift+click to ignore remembered identifications and probe every port again.')
+        self.discover_button.clicked.connect(self.discover_supplies)
+        self.link_speed_button.setToolTip(f'Find the fastest baud rate the supply on the COM Port # above answers at, and remember it for that supply.\nThe rate itself is chosen on the supply front panel. Profiles are kept in {LINK_PROFILES_FILE}')
+        self.link_speed_button.clicked.connect(self.negotiate_link)
+        if self.server_address is not None:
+            # Both open the ports directly, which the instrument server holds. Run them on the server's machine, without --connect
+            for button in (self.discover_button, self.link_speed_button):
+                button.setEnabled(False)
+                button.setToolTip('Unavailable through the instrument server, which holds the ports.\nStop the server, and run Remote Control without --connect.')
+
+        self.fleet_ports.setFixedHeight(30)
+        self.fleet_ports.setFixedWidth(140)
+        self.fleet_ports.setPlaceholderText('Fleet | Hover for help')
+        self.fleet_ports.setValidator(self.fleet_validator)
+        self.fleet_ports.setToolTip(f'Optional. Apply "Go!" to many COM ports at once, instead of the single COM Port # above\n\nExamples:\n3-7, 12\nbench_a, 15\n\nGroup names are read from {GROUPS_FILE}')
 
         # Function group-box + component attributes
         self.function_group_box.setStyleSheet('QGroupBox { font-size: 11px; }')
@@ -150,6 +286,9 @@ class ApplicationUi(QtWidgets.QDialog):
         self.radio_button_voltage.setToolTip('Control the connected power supply voltage level.')
         self.radio_button_current.setFont(QtGui.QFont('Cascadia Mono', 10))
         self.radio_button_current.setToolTip('Control the connected power supply current level.')
+        self.channel_select.addItems(['CH1', 'CH2', 'CH3'])  # BK Precision 9141 outputs. Index + 1 is the channel number
+        self.channel_select.setFont(QtGui.QFont('Cascadia Mono', 10))
+        self.channel_select.setToolTip('Output channel to control.\nChannel selections and set values already confirmed on the open connection are not re-sent.')
 
         # Voltage Values group-box + component objects attributes
         self.set_value_group_box.setStyleSheet('QGroupBox { font-size: 11px; }')
@@ -160,6 +299,40 @@ class ApplicationUi(QtWidgets.QDialog):
         self.set_value.textChanged.connect(self.check_state)
         self.set_value.textChanged.emit(self.set_value.text())
         self.set_value.textChanged.emit(self.set_value.text())
+        self.live_value.setFixedHeight(30)
+        self.live_value.setDecimals(3)  # Instrument resolution
+        self.live_value.setKeyboardTracking(False)  # Typed values are sent on Enter, not per keystroke. Arrows + mouse wheel are sent straight away
+        self.live_value.setToolTip('Live set value. Every change is sent to the instrument as soon as the previous one is done.\nChanges made faster than the serial link replace each other, and only the final value is verified.')
+        self.live_value.valueChanged.connect(self.offer_live_setpoint)
+        self.live_value.setVisible(False)
+        self.live_mode.setToolTip('Follow the spin-box instead of "Go!". Uses the COM Port # (or fleet list), Function, and Channel above.')
+        self.live_mode.toggled.connect(self.toggle_live_mode)
+        self.radio_button_voltage.toggled.connect(self.update_live_range)
+        self.radio_button_voltage.toggled.connect(self.update_regulation_limits)
+        self.regulate_mode.setToolTip('"Go!" keeps measuring the output and trims the setpoint, so the Set Value holds at the device under test, until "Cancel".\n'
+                                      'Trims are limited in size and speed by the max trim and slew settings, and never leave the instrument limits. Uses the COM Port #, Function, and Channel above.')
+        self.regulate_mode.toggled.connect(self.toggle_regulate_mode)
+        self.lead_resistance.setRange(0.0, 5.0)
+        self.lead_resistance.setDecimals(3)
+        self.lead_resistance.setSingleStep(0.01)
+        self.lead_resistance.setSuffix(' Ω lead')
+        self.lead_resistance.setToolTip('Resistance of the wiring to the device under test, both leads together.\nVoltage regulation makes up for the drop across it at the measured current.')
+        self.lead_resistance.setVisible(False)
+        self.control_period.setRange(0.02, 5.0)
+        self.control_period.setDecimals(2)
+        self.control_period.setSingleStep(0.05)
+        self.control_period.setValue(CONTROL_PERIOD)
+        self.control_period.setSuffix(' s period')
+        self.control_period.setToolTip('Time between measurements. Shorter follows load changes faster, but must stay above the serial round-trip time.\n'
+                                       'Loop timing is reported when regulation stops.')
+        self.control_period.setVisible(False)
+        self.maximum_trim.setDecimals(3)  # Instrument resolution
+        self.maximum_trim.setToolTip('Furthest regulation may trim the setpoint away from the Set Value.\nKeep it within what the device under test tolerates if the measurements are wrong.')
+        self.maximum_trim.setVisible(False)
+        self.slew_rate.setDecimals(3)
+        self.slew_rate.setToolTip('Fastest regulation may change the setpoint, per second.\nKeep it within what the device under test tolerates.')
+        self.slew_rate.setVisible(False)
+        self.update_regulation_limits()
         self.set_value.setToolTip('Set Value text restricted to "0, 1, or 2 digits, optional decimal, 1, 2, or 3 digits"\n\nExamples:\nAny integer up to 5 digits in length, or some value of the following form:\n\n.#     | #.#     | ##.#\n.##   | #.##   | ##.##\n.### | #.### | ##.###')
 
         # Status group-box + component objects attributes
@@ -167,13 +340,58 @@ class ApplicationUi(QtWidgets.QDialog):
         self.status.setStyleSheet('QPlainTextEdit {background-color: rgb(0, 0, 0);}')
         self.status.setReadOnly(True)
         self.status.setPlaceholderText('Remote Control status log will print in this box')
+        self.status.setMaximumBlockCount(STATUS_BLOCKS)
+        self.stream_status.setFont(QtGui.QFont('Cascadia Mono', 9))
+        self.stream_status.setVisible(False)
+
+        # Live Plot group-box + component objects attributes
+        self.plot_group_box.setStyleSheet('QGroupBox { font-size: 11px; }')
+        self.plot_group_box.setVisible(False)  # Shown once streaming starts
+        self.plot_channel.addItems(['Voltage', 'Current', 'Power'])  # Column order of telemetry.CHANNELS
 
         # go_row component attributes
         # Make "Go!" the default button in focus. Enter key selects focused elements
         self.go_button.setDefault(True)
         self.go_button.clicked.connect(self.click_go)
         self.clear.clicked.connect(self.clear_status)
+        self.stream_button.setCheckable(True)
+        self.stream_button.setToolTip('Continuously measure output voltage, current, and power on the COM Port # above.')
+        self.stream_button.toggled.connect(self.toggle_stream)
+        self.sequence_button.setToolTip('Load a setpoint sequence profile (.json) and run it on the COM Port # above.\nSee sequence.py for the profile format.')
+        self.sequence_button.clicked.connect(self.run_sequence)
+        self.metrics_button.setToolTip('Latency histograms per port and command: port open, write, time to first reply byte, and reply transfer.\n'
+                                       'Slow open/write points at the USB-serial adapter, slow first byte at the instrument, slow reply at the baud rate.')
+        self.metrics_button.clicked.connect(self.show_metrics)
+        self.cancel_button.clicked.connect(self.worker.cancel)
+        self.cancel_button.clicked.connect(self.live_setpoints.clear)
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.setToolTip('Abandon the instrument command in progress, and any still waiting.')
+        self.busy_indicator.setRange(0, 0)  # Indeterminate "busy" animation
+        self.busy_indicator.setFixedWidth(120)
+        self.busy_indicator.setTextVisible(False)
+        self.busy_indicator.setVisible(False)
         self.version.setStyleSheet('QLabel { background-color : ; color : #6b6b6b; }')
+        self.version_checked.connect(self.show_version)
+        QTimer.singleShot(1000, self.__finish_startup)  # Normally started by the first paint. This covers a window that is never painted
+
+        # Additional functional objects attributes
+        self.session_expiry_timer.timeout.connect(self.serial_sessions.expire_idle)
+        self.session_expiry_timer.timeout.connect(self.status_log.flush)
+        self.session_expiry_timer.start(5000)  # ms
+        self.stream_timer.timeout.connect(self.update_stream_status)
+        self.status_timer.timeout.connect(self.flush_status)
+        self.status_timer.start(50)  # ms
+
+        # Worker signals cross from the worker thread to the GUI thread, so force queued delivery
+        self.worker.busy_changed.connect(self.set_busy, Qt.QueuedConnection)
+        self.worker.job_finished.connect(self.job_finished, Qt.QueuedConnection)
+        self.worker.dialog_requested.connect(self.show_dialog, Qt.QueuedConnection)
+        self.worker.start()
+
+        # Port monitor callbacks run on its own thread, so they are forwarded through a signal
+        self.port_changed.connect(self.report_port_change)
+        self.port_monitor.subscribe(self.port_changed.emit)
+        self.port_monitor.start()
 
 
     def __construct_gui(self):
@@ -199,6 +417,7 @@ class ApplicationUi(QtWidgets.QDialog):
         self.main_layout.addWidget(self.function_group_box, 0, 1, 1, 1)
         self.main_layout.addWidget(self.set_value_group_box, 0, 2, 1, 1)
         self.main_layout.addWidget(self.status_group_box, 1, 0, 1, 3)
+        self.main_layout.addWidget(self.plot_group_box, 1, 3, 1, 1)
 
         # Set layouts of main_layout group-boxes
         # Add components to main_layout group-box layouts
@@ -206,55 +425,95 @@ class ApplicationUi(QtWidgets.QDialog):
         self.com_port_group_box.setLayout(self.com_port_group_box_layout)
         self.com_port_group_box_layout.addWidget(self.com_port, 0, 0, 1, 1, alignment=Qt.AlignCenter)
         self.com_port_group_box_layout.addWidget(self.check_ports_button, 1, 0, 1, 1)
+        self.com_port_group_box_layout.addWidget(self.discover_button, 2, 0, 1, 1)
+        self.com_port_group_box_layout.addWidget(self.link_speed_button, 3, 0, 1, 1)
+        self.com_port_group_box_layout.addWidget(self.fleet_ports, 4, 0, 1, 1, alignment=Qt.AlignCenter)
 
         # [Function group-box]
         self.function_group_box.setLayout(self.function_group_box_layout)
         self.function_group_box_layout.addWidget(self.radio_button_voltage)
         self.function_group_box_layout.addWidget(self.radio_button_current)
+        self.function_group_box_layout.addWidget(self.channel_select)
 
         # [Voltage Values group-box]
         self.set_value_group_box.setLayout(self.set_value_group_box_layout)
         self.set_value_group_box_layout.addWidget(self.set_value)
+        self.set_value_group_box_layout.addWidget(self.live_value)
+        self.set_value_group_box_layout.addWidget(self.live_mode)
+        self.set_value_group_box_layout.addWidget(self.regulate_mode)
+        self.set_value_group_box_layout.addWidget(self.lead_resistance)
+        self.set_value_group_box_layout.addWidget(self.control_period)
+        self.set_value_group_box_layout.addWidget(self.maximum_trim)
+        self.set_value_group_box_layout.addWidget(self.slew_rate)
 
         # [Status group-box]
         self.status_group_box.setLayout(self.status_group_box_layout)
         self.status_group_box_layout.addWidget(self.status)
+        self.status_group_box_layout.addWidget(self.stream_status)
+
+        # [Live Plot group-box]
+        self.plot_group_box.setLayout(self.plot_group_box_layout)
+        self.plot_group_box_layout.addWidget(self.plot_channel, 0, 0, 1, 1)
 
         # Nesting go_row_layout into main_layout
-        self.main_layout.addLayout(self.go_row_layout, 2, 0, 1, 3)
+        self.main_layout.addLayout(self.go_row_layout, 2, 0, 1, 4)
 
         # Add components to go_row layout
         # (QHBoxLayout)
         # [GO! row has no group-box]
         self.go_row_layout.addWidget(self.clear)
         self.go_row_layout.addWidget(self.always_clear)
+        self.go_row_layout.addWidget(self.stream_button)
+        self.go_row_layout.addWidget(self.sequence_button)
+        self.go_row_layout.addWidget(self.metrics_button)
 
         # Wedge "Clear" and "Go!" apart, to the left and right edge. Order of code is significant, and determines the order of components
-        self.go_row_layout.insertStretch(2) # Adds a blank in "spot 3"
+        self.go_row_layout.insertStretch(5) # Adds a blank in "spot 6"
         self.go_row_layout.addWidget(self.version)
+        self.go_row_layout.addWidget(self.busy_indicator)
+        self.go_row_layout.addWidget(self.cancel_button)
         self.go_row_layout.addWidget(self.go_button)
 
 
     # SUPPLEMENTARY FUNCTIONS
-    def update_status_callback(self, text):
+    def update_status_callback(self, text, level=None, **fields):
         '''
-        Display text in status widget in GUI.
-        Updates/refreshes GUI.
+        Queue text for the status widget in GUI. It is shown by the next flush_status, within 50 ms.
+        Safe to call from any thread. Instrument jobs on the worker thread write to the same queue.
         Can be passed as a function argument to get to other modules, allowing other modules to update the GUI
         without needing to import this module (offloads non-GUI work from GUI module + avoids circular imports).
 
         Parameters
         ----------
         self: Represents the instance of the Class
-        text (string): Text to print in status text box
+        text (string): Ready-made HTML, or a message template when level is given. See status_log.py
+        level (string): None for HTML, otherwise "heading", "info", "detail", or "error"
+        fields (keyword arguments): Values for the message template
 
         Returns
         -------
         None
 
         '''
-        self.status.appendHtml(text)
-        QtWidgets.QApplication.processEvents()
+        self.status_log(text, level, **fields)
+
+
+    def flush_status(self):
+        '''
+        Move every queued status message into the status widget, with a single append. Connected to status_timer.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        text = self.status_log.drain()
+        if text:
+            self.status.appendHtml(text)
 
 
     def clear_status(self):
@@ -271,6 +530,7 @@ class ApplicationUi(QtWidgets.QDialog):
         None
 
         '''
+        self.status_log.drain()  # Messages not shown yet belong to what is being cleared
         self.status.clear()
         QtWidgets.QApplication.processEvents()
 
@@ -289,83 +549,429 @@ class ApplicationUi(QtWidgets.QDialog):
         None
 
         '''
-        CheckPorts.check_ports(self.update_status_callback)
+        ports = self.port_monitor.ports()
+        self.worker.submit('check_ports', lambda update_status_callback, dialogs: CheckPorts.check_ports(update_status_callback, ports))
 
 
-    def check_state(self):
+    def report_port_change(self, event, port):
         '''
-        Change color of QLineEdit border to reflect validator status.
+        Print a port being attached or removed. Connected to port_changed.
 
         Parameters
         ----------
         self: Represents the instance of the Class
+        event (string): "added" or "removed"
+        port (serial.tools.list_ports_common.ListPortInfo): Port description
 
         Returns
         -------
         None
 
         '''
-        sender = self.sender()
-        state = sender.validator().validate(sender.text(), 0)[0]
-
-        if state == QtGui.QValidator.Acceptable:
-            color = '#2bb359'  # A nice green
-        elif state == QtGui.QValidator.Intermediate:
-            color = '#87b7e3'  # A nice blue
+        if event == 'added':
+            self.update_status_callback('[{device} attached: {description}]', 'detail', device=port.device, description=port.description)
         else:
-            color = '#911e2e'  # A nice red
+            self.update_status_callback('[{device} removed]', 'detail', device=port.device)
 
-        # Perform the actual color change
-        sender.setStyleSheet('QLineEdit { border: 1px solid' + f'{color}' + '; border-radius: 2px; margin-top: 0px;}')
 
+    def discover_supplies(self):
+        '''
+        Probe every port for BK Precision 9141 supplies, and list them. The COM Port # of the first one found is filled in by job_finished.
+        Shift+click re-probes ports whose identification is remembered.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
 
-    @staticmethod
-    def __version_decryption():
         '''
-        Performs decryption of version number.
-        A version number is generated and encrypted into a data file when this app is built. Only an app from the same build as the mentioned data file can decrypt the version number.
-        This is done so it is immediately apparent if the runtime files are the correct ones for the GUI being run.
-        This is primarily relevant if end-users are overwriting old versions of individual files of the application on their system with files from new versions.
+        refresh = bool(QtWidgets.QApplication.keyboardModifiers() & Qt.ShiftModifier)
+        ports = self.port_monitor.ports()
+        self.worker.submit('discover', lambda update_status_callback, dialogs: PortDiscovery.port_discovery(update_status_callback, self.serial_sessions, refresh, ports))
+
 
-        Possible version values:
-        00000001: The application .exe file is not located. This would be because a standalone GUI was run via direct command (expected), or post-compile directory structure was lost
-        00000000: The application .exe file exists, but the encrypted version.dat file is missing, was not successfully decrypted, or there was an error reading it
-        YYYYMMDD: The application is running normally
+    def negotiate_link(self):
+        '''
+        Find and remember the fastest baud rate of the supply on the COM Port # in the GUI. Connected to the Link Speed button.
 
         Parameters
         ----------
-        N/A
+        self: Represents the instance of the Class
 
         Returns
         -------
-        String object containing appropriate version number
+        None
 
         '''
-        # If standalone GUI run via command
-        if not Path('RemoteControl.exe').is_file():
-            return '00000001'
+        if self.com_port.text() == '':
+            self.update_status_callback('<p style="font-size:11px; color:#DADADA;">' + 'No COM Port value specified!<br>' + '</p>')
+            return
+
+        com_port = 'COM' + self.com_port.text()
+        self.worker.submit('negotiate', lambda update_status_callback, dialogs: self.link_profiles.link_negotiation(update_status_callback, com_port, self.serial_sessions))
+
+
+    def set_busy(self, busy):
+        '''
+        Show whether instrument jobs are in flight. Connected to InstrumentWorker.busy_changed.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        busy (bool): True while any job is running or queued
+
+        Returns
+        -------
+        None
+
+        '''
+        self.busy_indicator.setVisible(busy)
+        self.cancel_button.setEnabled(busy)
+        self.go_button.setEnabled(not busy)
+        self.sequence_button.setEnabled(not busy)
+        self.check_ports_button.setEnabled(not busy)
+        self.discover_button.setEnabled(not busy and self.server_address is None)
+
+
+    def show_dialog(self, name, args):
+        '''
+        Show a popup dialog requested by the worker thread. Connected to InstrumentWorker.dialog_requested.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        name (string): PopupDialogs function name
+        args (tuple): Arguments for that function
+
+        Returns
+        -------
+        None
+
+        '''
+        getattr(PopupDialogs, name)(*args)
+
+
+    def job_finished(self, name, result):
+        '''
+        Act on the outcome of a finished instrument job. Connected to InstrumentWorker.job_finished.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        name (string): Job name given to InstrumentWorker.submit
+        result (object): Job return value
+
+        Returns
+        -------
+        None
+
+        '''
+        if name == 'discover':
+            # Only COM port numbers fit the COM Port # field
+            numbered = [supply['device'][3:] for supply in result or [] if supply['device'].upper().startswith('COM') and supply['device'][3:].isdigit()]
+            if numbered:
+                self.com_port.setText(numbered[0])
+
+
+    def report_job(self, update_status_callback, name, result):
+        '''
+        Print the outcome of a finished instrument job.
+        Runs on the worker thread straight after the job, so the outcome is queued right behind the job's own status lines.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        update_status_callback (function object): Status callback the job itself used
+        name (string): Job name given to InstrumentWorker.submit
+        result (object): Job return value. True means a failure occurred at a known potential failure point
+
+        Returns
+        -------
+        None
+
+        '''
+        # Regulation prints its own summary, and is normally ended with Cancel, which the worker reports as a failure
+        if name not in ('go', 'sequence'):
+            return
+
+        if result is True:
+            update_status_callback('<p style="font-size:11px; color:#D60000;">' + '<br>Error encountered. Resetting application.<br><br><br><br><br><br>' + '</p>')
+            return
+
+        update_status_callback('<p style="font-size:11px; color:#DADADA;">' + f'<br><br>+++++++++++++++++<br>+++ TASK COMPLETE +++<br>+++++++++++++++++<br><br>Time taken: {datetime.now() - self.start_time}<br><br><br><br><br><br>' + '</p>')
+
+
+    def closeEvent(self, event):
+        '''
+        Release all held serial ports when the GUI window is closed.
+        Overrides QtWidgets.QDialog.closeEvent.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        event (PyQt5.QtGui.QCloseEvent): Automatically passed in by Qt
+
+        Returns
+        -------
+        None
+
+        '''
+        self.session_expiry_timer.stop()
+        self.status_timer.stop()
+        self.stream_button.setChecked(False)
+        self.worker.stop()
+        self.port_monitor.stop()
+        self.serial_sessions.close_all()
+        if self.trace is not None:
+            self.trace.close()
+        if self.session_log is not None:
+            self.session_log.close()
+        self.status_log.close()
+        QtWidgets.QDialog.closeEvent(self, event)
+
+
+    def toggle_stream(self, checked):
+        '''
+        Start or stop streaming measurements from the COM Port # in the GUI. Connected to the Stream button.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        checked (bool): New Stream button state
+
+        Returns
+        -------
+        None
+
+        '''
+        if not checked:
+            self.stream_timer.stop()
+            if self.stream is not None:
+                self.stream.stop()
+                self.update_status_callback('<p style="font-size:11px; color:#DADADA;">' + f'Streaming stopped. {self.stream.samples} samples, {self.stream.dropped} dropped<br>' + '</p>')
+                self.stream = None
+            return
+
+        if self.com_port.text() == '':
+            self.update_status_callback('<p style="font-size:11px; color:#DADADA;">' + 'No COM Port value specified!<br>' + '</p>')
+            self.stream_button.setChecked(False)
+            return
+
+        # Streaming pulls in NumPy + the plot widget, so they are only loaded the first time it is used
+        from telemetry import DecimatedRingBuffer, TelemetryStream
+        if self.telemetry is None:
+            from live_plot import LivePlot
+            self.telemetry = DecimatedRingBuffer()
+            self.plot = LivePlot()
+            self.plot.set_buffer(self.telemetry)
+            self.plot.set_channel(self.plot_channel.currentIndex())
+            self.plot_channel.currentIndexChanged.connect(self.plot.set_channel)
+            self.plot_group_box_layout.addWidget(self.plot, 1, 0, 1, 1)
+
+        self.stream = TelemetryStream('COM' + self.com_port.text(), self.telemetry, self.serial_sessions, session_log=self.session_log)
+        self.stream.start()
+        self.stream_status.setText('Streaming...')
+        self.stream_status.setVisible(True)
+        self.plot_group_box.setVisible(True)
+        self.stream_timer.start(1000)  # ms
+
+
+    def update_stream_status(self):
+        '''
+        Show the streaming sample rate, dropped samples, and last-second statistics. Connected to stream_timer.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        if self.stream is None:
+            return
+
+        if not self.stream.is_alive():
+            self.update_status_callback('<p style="font-size:11px; color:#D60000;">' + '<br>&lt;!&gt; ' + '<span style="color:#DADADA">' + f'Streaming ended: {self.stream.error}' + '</p>')
+            self.stream_button.setChecked(False)
+            return
+
+        statistics = self.telemetry.statistics(window=1.0)
+        voltage, current = statistics['voltage'], statistics['current']
+        self.stream_status.setText(f'{self.stream.com_port}  {self.stream.sample_rate():6.1f} samples/s  {self.stream.dropped} dropped  |  '
+                                   f'V mean {voltage["mean"]:.3f} min {voltage["min"]:.3f} max {voltage["max"]:.3f} rms {voltage["rms"]:.3f}  |  '
+                                   f'I mean {current["mean"]:.3f} min {current["min"]:.3f} max {current["max"]:.3f} rms {current["rms"]:.3f}')
+
+
+    def run_sequence(self):
+        '''
+        Load a sequence profile, validate every setpoint against the instrument limits, then run it on the worker thread.
+        Connected to the Run Sequence button.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        if self.always_clear.isChecked():
+            self.clear_status()
+
+        if self.com_port.text() == '':
+            self.update_status_callback('<p style="font-size:11px; color:#DADADA;">' + 'No COM Port value specified!<br>' + '</p>')
+            return
+
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(self, 'Open Sequence Profile', '', 'Sequence profiles (*.json);;All files (*)')
+        if path == '':
+            return
 
-        # Grab encrypted version number from version.dat (try to)
         try:
-            with open ('version.dat', 'rb') as myfile:
-                version_encrypted = myfile.read()
+            schedule = Sequence.load(path)
+        except (OSError, ValueError, TypeError) as error:
+            self.update_status_callback('<p style="font-size:11px; color:#DADADA;">' + f'Could not load sequence profile: {error}<br>' + '</p>')
+            return
+
+        if not schedule:
+            self.update_status_callback('<p style="font-size:11px; color:#DADADA;">' + 'Sequence profile contains no setpoints!<br>' + '</p>')
+            return
+
+        # Nothing is sent unless every setpoint is within limits
+        problems = Sequence.validate(schedule)
+        if problems:
+            self.update_status_callback('<p style="font-size:11px; color:#DADADA;">' + 'Sequence not run. Setpoints outside instrument limits:<br>' + '<br>'.join(problems) + '<br>' + '</p>')
+            return
+
+        com_port = 'COM' + self.com_port.text()
+        channel = self.channel_select.currentIndex() + 1
+        self.start_time = datetime.now()
+        self.worker.submit('sequence', lambda update_status_callback, dialogs: Sequence.run_sequence(update_status_callback, com_port, schedule, self.serial_sessions, self.session_log,
+                                                                                                   self.worker.is_cancelled, channel))
+
+
+    def __finish_startup(self):
+        '''
+        Set up everything the window does not need in order to appear. Runs once, as the first event after the window is painted.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        if self.startup_finished:
+            return
+        self.startup_finished = True
+        self.shown_time = time.perf_counter()
+        startup_profiler.mark('event_loop')
+
+        from session_log import SessionLog
+        self.session_log = SessionLog()
+        self.session_expiry_timer.timeout.connect(self.session_log.flush)
+        self.live_setpoints.session_log = self.session_log
+        startup_profiler.mark('deferred_setup')
+
+        self.start_version_check()
+
+
+    def start_version_check(self):
+        '''
+        Verify the build version on a background thread, so the check never delays the window.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        threading.Thread(target=lambda: self.version_checked.emit(*BuildIntegrity.version()), daemon=True).start()
 
-            # Decryption. See make_version.py in scripts\helpers for fuller explanation comments
-            exe_remote_control = 'RemoteControl.exe'
 
-            # Generate 32-bit byte-type from CONTENTS of .exe file
-            key = hashlib.blake2s(open(exe_remote_control, 'rb').read(), digest_size=32).digest()
+    def show_version(self, version, details):
+        '''
+        Display the verified build version, and how long startup took. Connected to version_checked.
 
-            # Encodes to base64
-            key_64 = base64.urlsafe_b64encode(key)
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        version (string): As returned by BuildIntegrity.version
+        details (dictionary): As returned by BuildIntegrity.version
 
-            # Actual decryption, is being fed appropriately structured objects
-            version_decrypted = Fernet(key_64).decrypt(version_encrypted).decode()
-            return version_decrypted
+        Returns
+        -------
+        None
 
-        except:
-            # .exe exists, version.dat missing/not successfully decrypted/error reading
-            return '00000000'
+        '''
+        self.version.setText(f'Version {version}')
+        startup_profiler.mark('version_check')
+        self.update_status_callback('[Startup: window shown {shown_ms:.0f} ms after launch, build check {check_ms:.1f} ms ({how})]', 'detail',
+                                    shown_ms=(self.shown_time - STARTUP_TIME) * 1000, check_ms=details['seconds'] * 1000, how='cached' if details['cached'] else 'verified')
+
+        # Opt-in phase-by-phase report
+        if startup_profiler.report() is not None:
+            for phase, timing in startup_profiler.phases().items():
+                self.update_status_callback('[Startup phase {phase}: {phase_ms:.1f} ms, done {since_ms:.1f} ms after launch]', 'detail',
+                                            phase=phase, phase_ms=timing['seconds'] * 1000, since_ms=timing['since_launch'] * 1000)
+
+
+    def paintEvent(self, event):
+        '''
+        Note the first paint for the startup profile, and queue the deferred startup work behind it.
+        Overrides QtWidgets.QDialog.paintEvent.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        event (PyQt5.QtGui.QPaintEvent): Automatically passed in by Qt
+
+        Returns
+        -------
+        None
+
+        '''
+        QtWidgets.QDialog.paintEvent(self, event)
+        if not self.startup_finished:
+            startup_profiler.mark('first_paint')
+            QTimer.singleShot(0, self.__finish_startup)
+
+
+    def check_state(self):
+        '''
+        Change color of QLineEdit border to reflect validator status.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        sender = self.sender()
+        state = sender.validator().validate(sender.text(), 0)[0]
+
+        if state == QtGui.QValidator.Acceptable:
+            color = '#2bb359'  # A nice green
+        elif state == QtGui.QValidator.Intermediate:
+            color = '#87b7e3'  # A nice blue
+        else:
+            color = '#911e2e'  # A nice red
+
+        # Perform the actual color change
+        sender.setStyleSheet('QLineEdit { border: 1px solid' + f'{color}' + '; border-radius: 2px; margin-top: 0px;}')
 
 
     @staticmethod
@@ -423,6 +1029,235 @@ class ApplicationUi(QtWidgets.QDialog):
         return dark_palette
 
 
+    def toggle_live_mode(self, checked):
+        '''
+        Swap the Set Value text field for the live spin-box, and back. Connected to the Live checkbox.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        checked (bool): New Live checkbox state
+
+        Returns
+        -------
+        None
+
+        '''
+        self.update_live_range()
+        if checked:
+            self.regulate_mode.setChecked(False)
+
+            # Start from the typed value, without sending it
+            try:
+                self.live_value.blockSignals(True)
+                self.live_value.setValue(float(self.set_value.text()))
+            except ValueError:
+                pass
+            finally:
+                self.live_value.blockSignals(False)
+
+        self.set_value.setVisible(not checked)
+        self.live_value.setVisible(checked)
+        self.go_button.setEnabled(not checked)
+
+
+    def toggle_regulate_mode(self, checked):
+        '''
+        Show the regulation settings, and make "Go!" start regulation instead of a single set. Connected to the Regulate checkbox.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        checked (bool): New Regulate checkbox state
+
+        Returns
+        -------
+        None
+
+        '''
+        if checked:
+            self.live_mode.setChecked(False)
+        self.lead_resistance.setVisible(checked)
+        self.control_period.setVisible(checked)
+        self.maximum_trim.setVisible(checked)
+        self.slew_rate.setVisible(checked)
+
+
+    def update_live_range(self):
+        '''
+        Limit the live spin-box to the instrument range of the selected Function.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        thing_to_change = 'CURR' if self.radio_button_current.isChecked() else 'VOLT'
+        minimum, maximum, _ = InstrumentLimits.LIMITS[thing_to_change]
+        self.live_value.blockSignals(True)  # A range change may move the value, which must not be sent by itself
+        self.live_value.setRange(minimum, maximum)
+        self.live_value.setSingleStep(0.1 if thing_to_change == 'VOLT' else 0.01)
+        self.live_value.setSuffix(' V' if thing_to_change == 'VOLT' else ' A')
+        self.live_value.blockSignals(False)
+
+
+    def update_regulation_limits(self):
+        '''
+        Put the regulation trim + slew spin-boxes in the units of the selected Function, at that Function's defaults.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        thing_to_change = 'CURR' if self.radio_button_current.isChecked() else 'VOLT'
+        unit = 'V' if thing_to_change == 'VOLT' else 'A'
+        minimum, maximum, _ = InstrumentLimits.LIMITS[thing_to_change]
+        # Neither can usefully exceed the whole instrument range
+        self.maximum_trim.setRange(0.0, maximum - minimum)
+        self.maximum_trim.setSingleStep(0.1 if thing_to_change == 'VOLT' else 0.01)
+        self.maximum_trim.setSuffix(f' {unit} max trim')
+        self.maximum_trim.setValue(MAXIMUM_TRIM[thing_to_change])
+        self.slew_rate.setRange(0.001, maximum - minimum)
+        self.slew_rate.setSingleStep(1.0 if thing_to_change == 'VOLT' else 0.1)
+        self.slew_rate.setSuffix(f' {unit}/s slew')
+        self.slew_rate.setValue(SLEW_RATE[thing_to_change])
+
+
+    def offer_live_setpoint(self, value):
+        '''
+        Queue a live spin-box value for every target port. Connected to the live spin-box valueChanged signal.
+        Replaces any value for the same port + channel that has not been sent yet, so fast changes never pile up.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        value (float): New spin-box value
+
+        Returns
+        -------
+        None
+
+        '''
+        if self.radio_button_voltage.isChecked():
+            thing_to_change = 'VOLT'
+        elif self.radio_button_current.isChecked():
+            thing_to_change = 'CURR'
+        else:
+            self.update_status_callback('<p style="font-size:11px; color:#DADADA;">' + 'No Function selection made!<br>' + '</p>')
+            return
+
+        if self.fleet_ports.text().strip() != '':
+            try:
+                ports = FleetControl.parse_ports(self.fleet_ports.text(), FleetControl.load_groups())
+            except ValueError as error:
+                self.update_status_callback('<p style="font-size:11px; color:#DADADA;">' + f'{error}!<br>' + '</p>')
+                return
+        elif self.com_port.text() != '':
+            ports = ['COM' + self.com_port.text()]
+        else:
+            self.update_status_callback('<p style="font-size:11px; color:#DADADA;">' + 'No COM Port value specified!<br>' + '</p>')
+            return
+
+        value = f'{value:.3f}'
+        limit_error = InstrumentLimits.check(thing_to_change, value)
+        if limit_error is not None:
+            self.update_status_callback('<p style="font-size:11px; color:#DADADA;">' + f'{limit_error}<br>' + '</p>')
+            return
+
+        channel = self.channel_select.currentIndex() + 1
+        for com_port in ports:
+            self.live_setpoints.offer(com_port, channel, thing_to_change, value)
+
+
+    def show_metrics(self):
+        '''
+        Open the latency metrics window, which refreshes itself every second while shown. Connected to the Metrics button.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        if self.metrics_dialog is None:
+            dialog = QtWidgets.QDialog(self)
+            dialog.setWindowTitle('Latency Metrics')
+            dialog.resize(900, 500)
+            layout = QtWidgets.QGridLayout(dialog)
+
+            table = QtWidgets.QPlainTextEdit()
+            table.setReadOnly(True)
+            table.setLineWrapMode(QtWidgets.QPlainTextEdit.NoWrap)
+            table.setFont(QtGui.QFont('Cascadia Mono', 9))
+            refresh_button = QtWidgets.QPushButton('Refresh')
+            reset_button = QtWidgets.QPushButton('Reset')
+            export_button = QtWidgets.QPushButton('Export...')
+            refresh_timer = QTimer(dialog)
+
+            def refresh():
+                try:
+                    snapshot = self.serial_sessions.latency_metrics()
+                except (serial.serialutil.SerialException, ValueError) as error:  # Instrument server unreachable, or rejected the request
+                    table.setPlainText(f'Metrics not available: {error}')
+                    return None
+                # Keep the scroll position, as the table is rewritten every second
+                scroll = table.verticalScrollBar().value()
+                table.setPlainText(LatencyMetrics.text(snapshot))
+                table.verticalScrollBar().setValue(scroll)
+                return snapshot
+
+            def reset():
+                try:
+                    self.serial_sessions.reset_latency_metrics()
+                except (serial.serialutil.SerialException, ValueError):
+                    pass  # refresh() shows why
+                refresh()
+
+            def export():
+                snapshot = refresh()
+                if snapshot is None:
+                    return
+                path, _ = QtWidgets.QFileDialog.getSaveFileName(dialog, 'Export Latency Metrics', 'latency_metrics.json',
+                                                                'JSON (*.json);;Prometheus text format (*.prom);;Text table (*.txt)')
+                if path == '':
+                    return
+                try:
+                    LatencyMetrics.export(snapshot, path)
+                except OSError as error:
+                    table.appendPlainText(f'\nCould not export: {error}')
+
+            refresh_button.clicked.connect(refresh)
+            reset_button.clicked.connect(reset)
+            export_button.clicked.connect(export)
+            refresh_timer.timeout.connect(refresh)
+            dialog.finished.connect(refresh_timer.stop)
+            dialog.refresh = refresh
+            dialog.refresh_timer = refresh_timer
+
+            layout.addWidget(table, 0, 0, 1, 4)
+            layout.addWidget(refresh_button, 1, 0, 1, 1)
+            layout.addWidget(reset_button, 1, 1, 1, 1)
+            layout.addWidget(export_button, 1, 3, 1, 1)
+            self.metrics_dialog = dialog
+
+        self.metrics_dialog.refresh()
+        self.metrics_dialog.refresh_timer.start(1000)  # ms
+        self.metrics_dialog.show()
+        self.metrics_dialog.raise_()
+
+
     def click_go(self):
         '''
         Make clicking the 'Go!' button execute the primary functionality.
@@ -433,9 +1268,7 @@ class ApplicationUi(QtWidgets.QDialog):
 
         Returns
         -------
-        A Boolean value of True is returned if failure occurs at a known potential failure point.
-        The Boolean value of True is generated by a simple "return", or when an associated popup error dialog is exited.
-        Returns "None", otherwise.
+        None. The instrument work is handed to the worker thread, and its outcome is reported by job_finished.
 
         '''
         # Check for user-defined GUI settings
@@ -443,7 +1276,20 @@ class ApplicationUi(QtWidgets.QDialog):
         if self.always_clear.isChecked():
             self.clear_status()
 
-        if self.com_port.text() == '':
+        # A fleet port list takes precedence over the single COM Port #
+        fleet = self.fleet_ports.text().strip() != ''
+        if fleet:
+            try:
+                ports = FleetControl.parse_ports(self.fleet_ports.text(), FleetControl.load_groups())
+            except ValueError as error:
+                self.update_status_callback('<p style="font-size:11px; color:#DADADA;">' + f'{error}!<br>' + '</p>')
+                return
+
+            if not ports:
+                self.update_status_callback('<p style="font-size:11px; color:#DADADA;">' + 'No fleet COM Ports specified!<br>' + '</p>')
+                return
+
+        elif self.com_port.text() == '':
             self.update_status_callback('<p style="font-size:11px; color:#DADADA;">' + 'No COM Port value specified!<br>' + '</p>')
             return
 
@@ -469,27 +1315,35 @@ class ApplicationUi(QtWidgets.QDialog):
             return
 
         # Instrument limits
-        if thing_to_change == 'VOLT' and  not 60.600 >= float(self.set_value.text()) >= 0:
-            self.update_status_callback('<p style="font-size:11px; color:#DADADA;">' + 'Set voltage value not within instrument limits: 60.600 > V > 0<br>' + '</p>')
-            return
-
-        if thing_to_change == 'CURR' and  not 4.040 >= float(self.set_value.text()) >= 0.015:
-            self.update_status_callback('<p style="font-size:11px; color:#DADADA;">' + 'Set current value not within instrument limits: 4.040 > I > 0.015<br>' + '</p>')
+        limit_error = InstrumentLimits.check(thing_to_change, self.set_value.text())
+        if limit_error is not None:
+            self.update_status_callback('<p style="font-size:11px; color:#DADADA;">' + f'{limit_error}<br>' + '</p>')
             return
 
         value = self.set_value.text()
+        channel = self.channel_select.currentIndex() + 1
 
         # Proceed with operations
         self.update_status_callback('<p style="font-size:11px; color:#DADADA;">' + '+++++++++++++++++++++++++++++<br>+++ JACKING INTO CENTRAL COMMAND +++<br>+++++++++++++++++++++++++++++<br><br>' + '</p>')
-        start_time = datetime.now()
+        self.start_time = datetime.now()
 
         # Feeds required methods/components through as parameters to avoid importing the entry module, which also avoids circular import hurdles
-        remote_control = RemoteControl.remote_control(self.update_status_callback, com_port, thing_to_change, value)
-        if remote_control is True:
-            self.update_status_callback('<p style="font-size:11px; color:#D60000;">' + '<br>Error encountered. Resetting application.<br><br><br><br><br><br>' + '</p>')
-            return
-
-        self.update_status_callback('<p style="font-size:11px; color:#DADADA;">' + f'<br><br>+++++++++++++++++<br>+++ TASK COMPLETE +++<br>+++++++++++++++++<br><br>Time taken: {datetime.now() - start_time}<br><br><br><br><br><br>' + '</p>')
+        # The session pool keeps the port open, so repeated clicks skip the port open/close cycle
+        # Runs on the worker thread. The worker supplies its own status callback + dialogs, which are forwarded back here through queued signals
+        if self.regulate_mode.isChecked():
+            if fleet:
+                self.update_status_callback('<p style="font-size:11px; color:#DADADA;">' + 'Regulation runs on one COM Port # at a time. Clear the fleet list to regulate.<br>' + '</p>')
+                return
+            period = self.control_period.value()
+            lead_resistance = self.lead_resistance.value()
+            maximum_trim, slew_rate = self.maximum_trim.value(), self.slew_rate.value()
+            self.worker.submit('regulate', lambda update_status_callback, dialogs: Regulator.regulate(update_status_callback, com_port, thing_to_change, value, period, None, self.serial_sessions,
+                                                                                                     self.session_log, self.worker.is_cancelled, channel, lead_resistance,
+                                                                                                     slew_rate=slew_rate, maximum_trim=maximum_trim))
+        elif fleet:
+            self.worker.submit('go', lambda update_status_callback, dialogs: FleetControl.fleet_control(update_status_callback, ports, thing_to_change, value, self.serial_sessions, self.session_log, channel))
+        else:
+            self.worker.submit('go', lambda update_status_callback, dialogs: RemoteControl.remote_control(update_status_callback, com_port, thing_to_change, value, self.serial_sessions, dialogs, self.session_log, channel))
 
 
 # Initialize the GUI
@@ -501,6 +1355,7 @@ if __name__ == '__main__':
 
     # Setting icon here applies to all windows (as opposed to setting within each window's code)
     application.setWindowIcon(QtGui.QIcon('remote_control.ico'))
+    startup_profiler.mark('qapplication')
 
     # Override built-in exception handler and print function
     # Connect custom ApplicationUi.exception_catcher function to built-in exception handler
@@ -509,7 +1364,9 @@ if __name__ == '__main__':
     # Show the application's GUI
     view = ApplicationUi()
     view.resize(1151, 635)
+    startup_profiler.mark('widgets')
     view.show()
+    startup_profiler.mark('shown')
 
     # Execute the application's main loop
     sys.exit(application.exec())
@@ -0,0 +1,480 @@
+'''
+Module to batch several SCPI commands into one write, verified by one combined query.
+
+Example: configure all three BK Precision 9141 outputs in roughly one serial round-trip
+    transaction = ScpiTransaction()
+    for channel, (volts, amps) in {1: (12.0, 1.0), 2: (5.0, 0.5), 3: (3.3, 0.2)}.items():
+        transaction.apply(channel, volts, amps)
+        transaction.query_channel(channel, 'VOLT?', 'CURR?')
+    replies = transaction.execute('COM5')
+
+Run through a SerialSessions pool, commands that would change nothing on the current connection are left out (see channel_state.py).
+Configuring the same bench twice sends nothing the second time, apart from the verifying queries.
+'''
+import time
+
+from instrument_limits import InstrumentLimits
+from serial_sessions import serial_sessions
+
+
+class ScpiTransaction():
+    '''
+    Class containing a queue of SCPI commands and queries, sent together in one write.
+    All queries are joined into one compound query line (Ex.: "INST:SEL CH1;:VOLT?;:CURR?"), so every reply comes back in one read.
+    If nothing is queried, "*OPC?" is appended, so completion is still confirmed with a single reply.
+    INST:SEL, VOLT, CURR, and APPL are tracked against the connection's ChannelState, and skipped when already in effect.
+    '''
+
+    def __init__(self):
+        '''
+        Create an empty transaction.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        self.commands = []  # (command, effect) pairs without a reply, sent first. effect is None for untracked commands
+        self.query_parts = []  # (piece of the compound query line, effect) pairs
+        self.labels = []  # One label per expected reply, in reply order
+        self.skipped = []  # Commands left out of the last run, because they were already in effect
+
+
+    def write(self, command, effect=None):
+        '''
+        Queue a command that produces no reply. Ex.: "OUTP ON"
+        An untracked command (no effect) may change anything, so the channel state is forgotten rather than used when it is sent.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        command (string): SCPI command, without terminator
+        effect (tuple): What the command changes, for the channel state. Set by select/set/apply
+
+        Returns
+        -------
+        This ScpiTransaction, so calls can be chained
+
+        '''
+        self.commands.append((command, effect))
+        return self
+
+
+    def select(self, channel):
+        '''
+        Queue an output channel selection. Following VOLT/CURR commands apply to that channel.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        channel (int): 1, 2, or 3
+
+        Returns
+        -------
+        This ScpiTransaction, so calls can be chained
+
+        '''
+        return self.write(f'INST:SEL CH{channel}', ('select', channel))
+
+
+    def set(self, thing_to_change, value):
+        '''
+        Queue a VOLT/CURR setpoint for the currently selected channel.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        thing_to_change (string): "VOLT" or "CURR"
+        value (float or string): Setpoint
+
+        Returns
+        -------
+        This ScpiTransaction, so calls can be chained
+
+        '''
+        return self.write(f'{thing_to_change} {value}', ('set', thing_to_change, value))
+
+
+    def apply(self, channel, volts, amps):
+        '''
+        Queue voltage + current setpoints for one channel in a single APPL command.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        channel (int): 1, 2, or 3
+        volts (float): Voltage setpoint
+        amps (float): Current setpoint
+
+        Returns
+        -------
+        This ScpiTransaction, so calls can be chained
+
+        '''
+        return self.write(f'APPL CH{channel},{volts},{amps}', ('apply', channel, volts, amps))
+
+
+    def query(self, command, label=None):
+        '''
+        Add a query to the compound query line. Ex.: "VOLT?"
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        command (string): SCPI query, without terminator
+        label (hashable): Key for the reply in execute()'s result. Defaults to the query itself
+
+        Returns
+        -------
+        This ScpiTransaction, so calls can be chained
+
+        '''
+        label = command if label is None else label
+        self.query_parts.append((command, ('query', command, label)))
+        self.labels.append(label)
+        return self
+
+
+    def query_channel(self, channel, *commands):
+        '''
+        Add queries for one channel to the compound query line, preceded by its channel selection.
+        Replies are labelled (channel, query). Ex.: (2, 'VOLT?')
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        channel (int): 1, 2, or 3
+        commands (strings): SCPI queries, without terminators
+
+        Returns
+        -------
+        This ScpiTransaction, so calls can be chained
+
+        '''
+        self.query_parts.append((f'INST:SEL CH{channel}', ('select', channel)))
+        for command in commands:
+            self.query(command, (channel, command))
+        return self
+
+
+    def to_dict(self):
+        '''
+        JSON-ready copy of the queued commands, queries, and labels. Ex.: to send the transaction to instrument_server.py.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        Dictionary of {'commands', 'query_parts', 'labels'}
+
+        '''
+        return {'commands': [list(entry) for entry in self.commands], 'query_parts': [list(entry) for entry in self.query_parts], 'labels': list(self.labels)}
+
+
+    @staticmethod
+    def from_dict(data):
+        '''
+        Rebuild a transaction from to_dict() output, after a JSON round-trip.
+
+        Parameters
+        ----------
+        data (dictionary): As returned by to_dict, with tuples turned into lists by JSON
+
+        Returns
+        -------
+        ScpiTransaction object
+
+        '''
+        transaction = ScpiTransaction()
+        transaction.commands = [(command, ScpiTransaction.thaw(effect)) for command, effect in data.get('commands', [])]
+        transaction.query_parts = [(part, ScpiTransaction.thaw(effect)) for part, effect in data.get('query_parts', [])]
+        transaction.labels = [ScpiTransaction.thaw(label) for label in data.get('labels', [])]
+        return transaction
+
+
+    @staticmethod
+    def thaw(value):
+        '''
+        Turn JSON lists back into the tuples they were, at every depth, so labels can be dictionary keys again.
+
+        Parameters
+        ----------
+        value (object): Value decoded from JSON
+
+        Returns
+        -------
+        Same value, with every list replaced by a tuple
+
+        '''
+        if isinstance(value, list):
+            return tuple(ScpiTransaction.thaw(item) for item in value)
+        return value
+
+
+    def encode(self, state=None, terminator='\r'):
+        '''
+        Build the bytes for the single write: each command on its own line, then the compound query line.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        state (ChannelState): What is already in effect. Commands that would change nothing are left out. None sends everything
+        terminator (string): Ends each line. Set by the instrument's link profile
+
+        Returns
+        -------
+        (bytes to write, list of reply labels). Both empty if nothing needs sending
+
+        '''
+        data, labels, _ = self.__plan(state, terminator)
+        return data, labels
+
+
+    def __plan(self, state, terminator='\r'):
+        '''
+        Decide which queued commands to send, and what the channel state will be once the instrument has answered.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        state (ChannelState): What is already in effect. None sends everything
+        terminator (string): Ends each line
+
+        Returns
+        -------
+        (bytes to write, list of reply labels, plan dictionary of
+        {'selected': channel selected afterwards, 'confirmed': [(channel, thing_to_change, value)], 'readbacks': [(channel, thing_to_change, label)],
+         'assumed': {(channel, thing_to_change): value skipped as already set}, 'skipped': [command]})
+
+        '''
+        plan = {'selected': None if state is None else state.selected, 'confirmed': [], 'readbacks': [], 'assumed': {}, 'skipped': []}
+
+        def needed(command, effect):
+            kind = effect[0] if effect is not None else None
+            if kind == 'select':
+                if state is not None and plan['selected'] == effect[1]:
+                    plan['skipped'].append(command)
+                    return False
+                plan['selected'] = effect[1]
+
+            elif kind == 'set':
+                _, thing_to_change, value = effect
+                if state is not None and state.matches(plan['selected'], thing_to_change, value):
+                    plan['skipped'].append(command)
+                    plan['assumed'][(plan['selected'], thing_to_change)] = float(value)
+                    return False
+                plan['confirmed'].append((plan['selected'], thing_to_change, value))
+
+            elif kind == 'apply':
+                _, channel, volts, amps = effect
+                if state is not None and state.matches(channel, 'VOLT', volts) and state.matches(channel, 'CURR', amps):
+                    plan['skipped'].append(command)
+                    plan['assumed'].update({(channel, 'VOLT'): float(volts), (channel, 'CURR'): float(amps)})
+                    return False
+                plan['confirmed'] += [(channel, 'VOLT', volts), (channel, 'CURR', amps)]
+
+            elif kind == 'query':
+                # VOLT?/CURR? replies are the instrument's own word on a setpoint, so they become the confirmed state
+                if effect[1] in ('VOLT?', 'CURR?'):
+                    plan['readbacks'].append((plan['selected'], effect[1][:-1], effect[2]))
+
+            else:
+                plan['selected'] = None  # Untracked command
+            return True
+
+        commands = [command for command, effect in self.commands if needed(command, effect)]
+        query_parts = [part for part, effect in self.query_parts if needed(part, effect)]
+
+        # Every command already in effect, and nothing asked: nothing to send
+        if not commands and not self.labels:
+            return b'', [], plan
+
+        labels = self.labels or ['*OPC?']
+        if not self.labels:
+            query_parts.append('*OPC?')
+
+        # ";:" resets the command tree between commands, so each one is parsed from the root
+        lines = commands + [';:'.join(query_parts)]
+        return ''.join(f'{line}{terminator}' for line in lines).encode(), labels, plan
+
+
+    def run(self, ser, retries=2):
+        '''
+        Perform the transaction on an already open serial object.
+        Replies may arrive ";"-joined on one line, or one per line; both are accepted.
+        An incomplete reply re-sends the whole transaction, up to retries times. Set commands are idempotent, so re-sending is safe.
+        If ser carries a channel_state (AdaptiveLink does), commands already in effect are skipped, and the state is updated once every reply is in.
+        An incomplete reply forgets the state, as it is unknown which commands took effect. A read-back that contradicts a skipped setpoint
+        (Ex.: changed on the front panel) forgets it too, and re-sends everything.
+        Nothing is re-sent once ser reports it has stopped (AdaptiveLink.stopped: the read was cancelled, or the transaction's deadline passed).
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        ser (serial.Serial or AdaptiveLink): Open port, with a read timeout set
+        retries (int): Number of re-sends after an incomplete reply
+
+        Returns
+        -------
+        Dictionary of {label: reply string}. Labels whose reply never arrived map to ''.
+        {'*OPC?': '1'} if every command was already in effect, and nothing was sent
+
+        '''
+        state = getattr(ser, 'channel_state', None)
+        terminator = getattr(ser, 'terminator', '\r')  # From the link profile, on an AdaptiveLink
+        stopped = getattr(ser, 'stopped', None)
+
+        # An untracked command may change anything, so the state is neither used nor kept
+        if state is not None and any(effect is None for _, effect in self.commands):
+            state.forget()
+            state = None
+        use_state = state
+        replies, labels = [], []
+
+        for attempt in range(retries + 1):
+            data, labels, plan = self.__plan(use_state, terminator)
+            self.skipped = plan['skipped']
+            if not data:
+                return {'*OPC?': '1'}
+
+            if attempt and stopped is not None and stopped():
+                break
+
+            if attempt:
+                # Anything that arrives late belongs to the abandoned attempt. A re-send after a stale state is not a link problem
+                ser.reset_input_buffer()
+                if hasattr(ser, 'timing') and len(replies) < len(labels):
+                    ser.timing.record_retry()
+
+            ser.write(data)
+            replies = []
+            while len(replies) < len(labels):
+                line = ser.readline().decode().strip()
+                if line == '':  # Timed out
+                    break
+                replies.extend(part.strip() for part in line.split(';'))
+
+            if len(replies) < len(labels):
+                if state is not None:
+                    state.forget()
+                continue
+
+            if use_state is not None and attempt < retries and ScpiTransaction.__contradicted(plan, dict(zip(labels, replies))):
+                state.forget()
+                use_state = None
+                continue
+            break
+
+        replies += [''] * (len(labels) - len(replies))
+        replies = dict(zip(labels, replies))
+
+        if state is not None and '' not in replies.values():
+            state.selected = plan['selected']
+            for channel, thing_to_change, value in plan['confirmed']:
+                state.confirm(channel, thing_to_change, value)
+            for channel, thing_to_change, label in plan['readbacks']:
+                state.confirm(channel, thing_to_change, replies[label])
+
+        return replies
+
+
+    @staticmethod
+    def __contradicted(plan, replies):
+        '''
+        Check whether any read-back differs from a setpoint that was skipped as already in effect.
+
+        Parameters
+        ----------
+        plan (dictionary): As built by __plan
+        replies (dictionary): {label: reply string}
+
+        Returns
+        -------
+        True if the channel state was stale
+
+        '''
+        for channel, thing_to_change, label in plan['readbacks']:
+            assumed = plan['assumed'].get((channel, thing_to_change))
+            if assumed is None:
+                continue
+            try:
+                if float(replies[label]) != assumed:
+                    return True
+            except ValueError:
+                return True
+        return False
+
+
+    def execute(self, com_port, sessions=serial_sessions, session_log=None, **settings):
+        '''
+        Perform the transaction through the session pool.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        sessions (SerialSessions): Pool of open serial port sessions. Defaults to the shared pool in serial_sessions.py
+        session_log (SessionLog): Optional binary log receiving one record per reply
+        settings (keyword arguments): Serial settings. Anything not given falls back to serial_sessions.DEFAULT_SETTINGS
+
+        Returns
+        -------
+        Dictionary of {label: reply string}
+
+        Raises
+        ------
+        serial.serialutil.SerialException if the port cannot be opened, or the link fails twice
+
+        '''
+        start_time = time.perf_counter()
+        replies = sessions.transaction(com_port, self.run, **settings)
+
+        if session_log is not None:
+            latency = time.perf_counter() - start_time
+            for label, reply in replies.items():
+                try:
+                    readback = float(reply)
+                except ValueError:
+                    readback = float('nan')
+                session_log.append(com_port, str(label if not isinstance(label, tuple) else f'CH{label[0]}:{label[1]}'), readback=readback, latency=latency)
+
+        return replies
+
+
+    @staticmethod
+    def configure_channels(com_port, setpoints, sessions=serial_sessions, session_log=None):
+        '''
+        Set voltage + current on several channels, and verify all of them, in one transaction.
+
+        Parameters
+        ----------
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        setpoints (dictionary): {channel: (volts, amps)}. Ex.: {1: (12.0, 1.0), 3: (3.3, 0.2)}
+        sessions (SerialSessions): Pool of open serial port sessions. Defaults to the shared pool in serial_sessions.py
+        session_log (SessionLog): Optional binary log receiving one record per reply
+
+        Returns
+        -------
+        Dictionary of {channel: {'volts': read-back string, 'amps': read-back string, 'passed': bool}}
+
+        '''
+        transaction = ScpiTransaction()
+        for channel, (volts, amps) in setpoints.items():
+            transaction.apply(channel, volts, amps)
+        for channel in setpoints:
+            transaction.query_channel(channel, 'VOLT?', 'CURR?')
+
+        replies = transaction.execute(com_port, sessions, session_log)
+
+        results = {}
+        for channel, (volts, amps) in setpoints.items():
+            volts_found, amps_found = replies[(channel, 'VOLT?')], replies[(channel, 'CURR?')]
+            passed = InstrumentLimits.confirms(volts_found, volts) and InstrumentLimits.confirms(amps_found, amps)
+            results[channel] = {'volts': volts_found, 'amps': amps_found, 'passed': passed}
+        return results
@@ -0,0 +1,219 @@
+'''
+Module to run timed setpoint sequences (steps, ramps, dwell times, repeats) loaded from a profile file.
+
+Profile format (JSON):
+{
+    "function": "VOLT",                                 Default function for every step: "VOLT" or "CURR"
+    "repeat": 2,                                        Run the whole step list this many times
+    "steps": [
+        {"set": 5.0, "dwell": 1.0},                     Set 5 V, then hold for 1 s
+        {"ramp": [0.0, 12.0], "points": 25, "dwell": 0.2},  25 evenly spaced setpoints, 0.2 s apart
+        {"ramp": [12.0, 0.0], "increment": 0.5, "dwell": 0.1},  Ramp in 0.5 V increments
+        {"function": "CURR", "set": 1.0, "dwell": 0.5},  Override the function for one step
+        {"repeat": 3, "steps": [...]}                   Nested group of steps, repeated
+    ]
+}
+'''
+import json
+
+import serial
+from deadline_scheduler import DeadlineScheduler
+from instrument_limits import InstrumentLimits
+from remote_control import RemoteControl
+from serial_sessions import serial_sessions
+
+
+class Sequence():
+    '''
+    Class containing functions to load, validate, and run setpoint sequences against the deadline scheduler.
+    '''
+
+    @staticmethod
+    def load(path):
+        '''
+        Read a profile file and expand it into a schedule.
+
+        Parameters
+        ----------
+        path (string): JSON profile file
+
+        Returns
+        -------
+        Schedule: list of (offset seconds, thing_to_change, value string, label) tuples, in time order
+
+        Raises
+        ------
+        ValueError if the profile is malformed
+
+        '''
+        with open(path, 'r', encoding='utf-8') as profile_file:
+            try:
+                profile = json.load(profile_file)
+            except json.JSONDecodeError as error:
+                raise ValueError(f'Profile is not valid JSON: {error}') from error
+
+        return Sequence.build_schedule(profile)
+
+
+    @staticmethod
+    def build_schedule(profile):
+        '''
+        Expand a profile into absolute setpoint times: repeats are unrolled, and ramps become individual setpoints.
+
+        Parameters
+        ----------
+        profile (dictionary): Profile, as described in this module's docstring
+
+        Returns
+        -------
+        Schedule: list of (offset seconds, thing_to_change, value string, label) tuples, in time order
+
+        Raises
+        ------
+        ValueError if the profile is malformed
+
+        '''
+        schedule = []
+        offset = 0.0
+
+        def number(value, kind, label):
+            # float()/int() raise ValueError or TypeError (Ex.: on a list). Either way, the profile is at fault
+            try:
+                return kind(value)
+            except (TypeError, ValueError) as error:
+                raise ValueError(f'{label}: {value!r} is not a number') from error
+
+        def expand(group, function, path):
+            nonlocal offset
+            if not isinstance(group.get('steps'), list):
+                raise ValueError(f'{path or "Profile"}: "steps" list missing')
+
+            where = f'Step {path[:-1]}' if path else 'Profile'
+            repeat = number(group.get('repeat', 1), int, f'{where} repeat')
+            if repeat < 1:
+                raise ValueError(f'{where}: "repeat" must be 1 or more')
+
+            for repetition in range(repeat):
+                for index, step in enumerate(group['steps'], 1):
+                    label = f'{path}{index}' + (f' (repeat {repetition + 1})' if repetition else '')
+                    if not isinstance(step, dict):
+                        raise ValueError(f'Step {label}: must be an object, Ex.: {{"set": 5.0, "dwell": 1.0}}')
+                    step_function = str(step.get('function', function)).upper()
+                    dwell = number(step.get('dwell', 0.0), float, f'Step {label} dwell')
+                    if dwell < 0:
+                        raise ValueError(f'Step {label}: negative dwell')
+
+                    if 'steps' in step:
+                        expand(step, step_function, f'{path}{index}.')
+
+                    elif 'set' in step:
+                        schedule.append((offset, step_function, f'{number(step["set"], float, f"Step {label} set"):.3f}', f'Step {label}'))
+                        offset += dwell
+
+                    elif 'ramp' in step:
+                        if not isinstance(step['ramp'], list) or len(step['ramp']) != 2:
+                            raise ValueError(f'Step {label}: "ramp" must be [first, last]')
+                        first, last = (number(value, float, f'Step {label} ramp') for value in step['ramp'])
+                        if 'points' in step:
+                            points = number(step['points'], int, f'Step {label} points')
+                            if points < 1:
+                                raise ValueError(f'Step {label}: "points" must be 1 or more')
+                        elif 'increment' in step and number(step['increment'], float, f'Step {label} increment') > 0:
+                            points = int(round(abs(last - first) / float(step['increment']))) + 1
+                        else:
+                            raise ValueError(f'Step {label}: ramp needs "points", or a positive "increment"')
+
+                        for point in range(points):
+                            value = first if points == 1 else first + (last - first) * point / (points - 1)
+                            schedule.append((offset, step_function, f'{value:.3f}', f'Step {label} ramp {point + 1}/{points}'))
+                            offset += dwell
+
+                    else:
+                        raise ValueError(f'Step {label}: needs "set", "ramp", or "steps"')
+
+        if not isinstance(profile, dict):
+            raise ValueError('Profile must be a JSON object with a "steps" list')
+        expand(profile, str(profile.get('function', 'VOLT')).upper(), '')
+        return schedule
+
+
+    @staticmethod
+    def validate(schedule):
+        '''
+        Check every setpoint of a schedule against the instrument limits, before anything is sent.
+
+        Parameters
+        ----------
+        schedule (list): As returned by build_schedule
+
+        Returns
+        -------
+        List of problem descriptions. Empty if the whole schedule is within limits
+
+        '''
+        problems = []
+        for _, thing_to_change, value, label in schedule:
+            limit_error = InstrumentLimits.check(thing_to_change, value)
+            if limit_error is not None:
+                problems.append(f'{label}: {value}. {limit_error}')
+        return problems
+
+
+    @staticmethod
+    def run_sequence(update_status_callback, com_port, schedule, sessions=serial_sessions, session_log=None, cancelled=None, channel=None):
+        '''
+        Send each setpoint at its scheduled time, verify it, and report how far from its deadline it was sent.
+        Uses update_status_callback to update/refresh GUI.
+
+        Parameters
+        ----------
+        update_status_callback (function object): Defined in run.py, prints fed string to GUI status box + refreshes GUI
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        schedule (list): As returned by build_schedule. Must already have passed validate()
+        sessions (SerialSessions): Pool of open serial port sessions. Defaults to the shared pool in serial_sessions.py
+        session_log (SessionLog): Optional binary log receiving one record per setpoint
+        cancelled (function object): Optional callable returning True when the sequence should stop
+        channel (int): Output channel, 1, 2, or 3. None uses whichever channel is selected on the instrument
+
+        Returns
+        -------
+        A Boolean value of True is returned if any setpoint failed, or the sequence was cancelled.
+        Returns "None", otherwise.
+
+        '''
+        target = com_port + (f' CH{channel}' if channel is not None else '')
+        update_status_callback('<p style="font-size:11px; color:#DADADA;">' + f'[Running sequence on {target}: {len(schedule)} setpoints over {schedule[-1][0] if schedule else 0:.3f} s]' + '</p>')
+
+        scheduler = DeadlineScheduler(cancelled)
+        timing_errors = []
+        failures = 0
+        scheduler.start()
+
+        for offset, thing_to_change, value, label in schedule:
+            if scheduler.wait_until(offset) is None:
+                return True
+
+            # Timing error measured at the moment the command goes out
+            timing_error = scheduler.elapsed() - offset
+            timing_errors.append(timing_error)
+
+            try:
+                # The channel selection is only re-sent when the connection's channel state shows it changed (see channel_state.py)
+                value_found = RemoteControl.set_and_check(com_port, thing_to_change, value, sessions, session_log, channel).strip()
+            except (serial.serialutil.SerialException, OSError) as error:
+                update_status_callback('<p style="font-size:11px; color:#D60000;">' + '<br>&lt;!&gt; ' + '<span style="color:#DADADA">' + f'{label}: lost communication with "{com_port}" ({error}). Sequence stopped.' + '</p>')
+                return True
+
+            if InstrumentLimits.confirms(value_found, value):
+                update_status_callback('{label}: {thing} {value} at {offset:.3f} s, timing error {timing_error_ms:+.2f} ms', 'info', label=label, thing=thing_to_change, value=value, offset=offset, timing_error_ms=timing_error * 1000)
+            else:
+                failures += 1
+                update_status_callback('{label}: {thing} {value} not confirmed (read back "{value_found}"), timing error {timing_error_ms:+.2f} ms', 'error', label=label, thing=thing_to_change, value=value, value_found=value_found, timing_error_ms=timing_error * 1000)
+
+        if timing_errors:
+            worst = max(timing_errors, key=abs)
+            mean = sum(abs(error) for error in timing_errors) / len(timing_errors)
+            update_status_callback('<p style="font-size:11px; color:#DADADA;">' + f'<br>Sequence finished: {len(schedule) - failures}/{len(schedule)} setpoints confirmed. Timing error mean {mean * 1000:.2f} ms, worst {worst * 1000:+.2f} ms' + '</p>')
+
+        if failures:
+            return True
@@ -0,0 +1,846 @@
+'''
+Module to keep serial port sessions open between commands.
+'''
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import serial
+from channel_state import ChannelState
+from latency_metrics import LatencyMetrics, OPEN_COMMAND
+# Renamed, as SerialSessions has a latency_metrics() method of its own
+from latency_metrics import latency_metrics as shared_latency_metrics
+
+
+# Serial settings used when a caller does not specify their own. Matches the BK Precision 9141 defaults
+DEFAULT_SETTINGS = {'baudrate': 9600, 'timeout': 3}
+
+# Settings used by AdaptiveLink rather than the serial port itself. Both are str, Ex.: {'terminator': '\r', 'reply_terminator': '\n'}
+LINK_SETTINGS = {'terminator': '\r', 'reply_terminator': '\n'}
+
+# Largest multiple of the learned timeout that consecutive timeouts back off to. Reset at the start of every transaction
+MAXIMUM_BACKOFF = 8
+
+
+class LinkTiming():
+    '''
+    Class containing a port's observed round-trip times, and the read timeout learned from them.
+    Until enough round-trips are observed the timeout stays at the conservative ceiling. After that it follows the slow tail of the distribution,
+    so a dead link is detected in tens of milliseconds instead of seconds. Consecutive timeouts within a transaction back the timeout off, up to MAXIMUM_BACKOFF times.
+    '''
+
+    def __init__(self, floor=0.02, ceiling=3.0, margin=3.0, window=64, minimum_samples=8):
+        '''
+        Create timing with no observations.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        floor (float): Shortest timeout ever used, in seconds
+        ceiling (float): Longest timeout ever used, and the timeout until enough samples exist, in seconds
+        margin (float): Timeout as a multiple of the 99th percentile round-trip time
+        window (int): Number of most recent round-trips considered
+        minimum_samples (int): Round-trips required before the timeout is learned
+
+        Returns
+        -------
+        None
+
+        '''
+        self.floor = floor
+        self.ceiling = ceiling
+        self.margin = margin
+        self.minimum_samples = minimum_samples
+        self.samples = deque(maxlen=window)
+        self.backoff = 1
+        self.timeouts = 0
+        self.retries = 0
+        self.lock = threading.Lock()
+
+
+    def record(self, round_trip):
+        '''
+        Add an observed round-trip time.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        round_trip (float): Seconds from write to complete reply
+
+        Returns
+        -------
+        None
+
+        '''
+        with self.lock:
+            self.samples.append(round_trip)
+            self.backoff = 1
+
+
+    def record_timeout(self):
+        '''
+        Note a read that timed out, doubling the next timeout (up to MAXIMUM_BACKOFF times the learned one, and the ceiling).
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        with self.lock:
+            self.timeouts += 1
+            self.backoff = min(self.backoff * 2, MAXIMUM_BACKOFF)
+
+
+    def reset_backoff(self):
+        '''
+        Return to the learned timeout. Called as each transaction begins, so one dead command never slows down the ones after it.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        with self.lock:
+            self.backoff = 1
+
+
+    def record_retry(self):
+        '''
+        Note a transaction that was re-sent after an incomplete reply.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        with self.lock:
+            self.retries += 1
+
+
+    def percentile(self, fraction):
+        '''
+        Round-trip time below which the given fraction of recent samples fall.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        fraction (float): Ex.: 0.99
+
+        Returns
+        -------
+        Seconds, or None without samples
+
+        '''
+        with self.lock:
+            ordered = sorted(self.samples)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1)]
+
+
+    def timeout(self):
+        '''
+        Read timeout to use now, rounded up to whole 10 ms so the port is rarely reconfigured.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        Seconds
+
+        '''
+        if len(self.samples) < self.minimum_samples:
+            return self.ceiling
+
+        learned = max(self.floor, self.percentile(0.99) * self.margin) * self.backoff
+        return min(self.ceiling, math.ceil(learned * 100) / 100)
+
+
+    def statistics(self):
+        '''
+        Summary of the learned timing, for display.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        Dictionary of {'samples', 'p50', 'p99', 'timeout', 'timeouts', 'retries'}. Times in seconds, None without samples
+
+        '''
+        return {'samples': len(self.samples), 'p50': self.percentile(0.50), 'p99': self.percentile(0.99),
+                'timeout': self.timeout(), 'timeouts': self.timeouts, 'retries': self.retries}
+
+
+class AdaptiveLink():
+    '''
+    Class wrapping an open serial object with a buffered, terminator-aware line reader whose timeout comes from LinkTiming.
+    Round-trip times are measured from the last write to the first complete reply line.
+    With a LatencyMetrics store, each write is also timed by phase: write call, time to first reply byte, and first byte to end of line.
+    Also carries the instrument's channel state for this connection only, so a reconnect never trusts what was known before it.
+    cancel_read() ends the read in progress, and every read after it, until the next begin(), so a cancelled transaction unwinds without waiting out any timeout.
+    begin() may also set an overall deadline, which no read waits past, however many times the transaction re-sends.
+    Anything not handled here (Ex.: in_waiting, close) passes straight through to the serial object.
+    '''
+
+    def __init__(self, ser, timing, terminator=LINK_SETTINGS['terminator'], reply_terminator=LINK_SETTINGS['reply_terminator'], metrics=None, com_port=''):
+        '''
+        Wrap a serial object.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        ser (serial.Serial): Open port
+        timing (LinkTiming): Timing shared by every session on this port
+        terminator (string): Ends every command line written by ScpiTransaction + TelemetryStream
+        reply_terminator (string): Ends every reply line read by readline()
+        metrics (LatencyMetrics): Optional store receiving write, first_byte, and reply times
+        com_port (string): Name of the serial port, for the metrics. Ex.: "COM5"
+
+        Returns
+        -------
+        None
+
+        '''
+        self.ser = ser
+        self.timing = timing
+        self.terminator = terminator
+        self.reply_terminator = reply_terminator.encode()
+        self.buffer = bytearray()  # Bytes received after the last returned terminator
+        self.sent_at = None  # When the last write went out, until its first reply line arrives
+        self.metrics = metrics
+        self.com_port = com_port
+        self.command = None  # LatencyMetrics.command_key of the last write, until its first reply line arrives
+        self.written_at = None  # When the last write call returned
+        self.first_byte_at = None  # When the first reply byte after it arrived
+        self.channel_state = ChannelState()  # Selected channel + confirmed setpoints. Used by ScpiTransaction to skip redundant commands
+        self.cancelled = threading.Event()  # Set by cancel_read(), cleared by begin()
+        self.deadline = None  # time.perf_counter() by which the current transaction must be over. None for no limit but the learned timeout
+
+
+    def __getattr__(self, name):
+        return getattr(self.ser, name)
+
+
+    def begin(self, deadline=None):
+        '''
+        Start a new use of the link: forget any earlier cancel_read() and timeout backoff, and set the overall deadline.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        deadline (float): time.perf_counter() by which every reply must be in. None for no overall limit
+
+        Returns
+        -------
+        None
+
+        '''
+        self.cancelled.clear()
+        self.deadline = deadline
+        self.timing.reset_backoff()
+
+
+    def cancel_read(self):
+        '''
+        Interrupt a blocking read, and make every read until the next begin() return nothing straight away.
+        Safe to call from any thread.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        self.cancelled.set()
+        if hasattr(self.ser, 'cancel_read'):
+            self.ser.cancel_read()
+
+
+    def stopped(self):
+        '''
+        Check whether waiting for more replies is pointless. Ex.: ScpiTransaction.run checks it before re-sending.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        True if the read was cancelled, or the overall deadline has passed
+
+        '''
+        return self.cancelled.is_set() or (self.deadline is not None and time.perf_counter() >= self.deadline)
+
+
+    def write(self, data):
+        '''
+        Send bytes, and start the round-trip clock.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        data (bytes): Bytes to send
+
+        Returns
+        -------
+        Number of bytes written
+
+        '''
+        self.sent_at = time.perf_counter()
+        written = self.ser.write(data)
+
+        if self.metrics is not None:
+            self.written_at = time.perf_counter()
+            self.first_byte_at = None
+            self.command = LatencyMetrics.command_key(data)
+            self.metrics.record(self.com_port, 'write', self.command, self.written_at - self.sent_at)
+        return written
+
+
+    def reset_input_buffer(self):
+        '''
+        Drop unread bytes, both buffered here and in the driver.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        self.buffer.clear()
+        self.ser.reset_input_buffer()
+
+
+    def readline(self, terminator=None):
+        '''
+        Return one reply line, reading whatever is available in as few driver calls as possible.
+        Bytes after the terminator stay buffered for the next call.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        terminator (bytes): End-of-line marker. Defaults to the link's reply terminator
+
+        Returns
+        -------
+        bytes object, terminator included. Empty on timeout
+
+        '''
+        terminator = terminator or self.reply_terminator
+        timeout = self.timing.timeout()
+        deadline = time.perf_counter() + timeout
+        if self.deadline is not None and self.deadline < deadline:
+            # The transaction's overall deadline comes first. Rounded up like the learned timeout, so the port is rarely reconfigured
+            deadline = self.deadline
+            timeout = max(0.01, math.ceil((deadline - time.perf_counter()) * 100) / 100)
+        if self.ser.timeout != timeout:
+            self.ser.timeout = timeout
+
+        while True:
+            index = self.buffer.find(terminator)
+            if index >= 0:
+                line = bytes(self.buffer[:index + len(terminator)])
+                del self.buffer[:index + len(terminator)]
+                if self.sent_at is not None:
+                    self.timing.record(time.perf_counter() - self.sent_at)
+                    self.sent_at = None
+                if self.first_byte_at is not None:
+                    self.metrics.record(self.com_port, 'reply', self.command, time.perf_counter() - self.first_byte_at)
+                    self.written_at = self.first_byte_at = None
+                return line
+
+            if self.cancelled.is_set():
+                # Not a timeout: the link says nothing about the instrument, so the timing is left alone
+                self.buffer.clear()
+                self.sent_at = self.written_at = self.first_byte_at = None
+                return b''
+
+            if time.perf_counter() >= deadline:
+                self.timing.record_timeout()
+                self.buffer.clear()  # A partial line is of no use
+                self.written_at = self.first_byte_at = None
+                return b''
+
+            # Block for the first byte (bounded by the port timeout), then take everything else already waiting
+            chunk = self.ser.read(self.ser.in_waiting or 1)
+            if chunk:
+                self.buffer += chunk
+                if self.written_at is not None and self.first_byte_at is None:
+                    self.first_byte_at = time.perf_counter()
+                    self.metrics.record(self.com_port, 'first_byte', self.command, self.first_byte_at - self.written_at)
+
+
+class SerialSession():
+    '''
+    Class containing a single open serial port, and the bookkeeping required to safely reuse it.
+    '''
+
+    def __init__(self, com_port, settings, serial_factory, timing, metrics=None):
+        '''
+        Store session parameters. The port itself is opened by SerialSessions, not here.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        settings (dictionary): Keyword arguments handed to the serial factory, plus any LINK_SETTINGS. Ex.: {'baudrate': 9600, 'timeout': 3}
+        serial_factory (function object): Callable returning an open serial.Serial-like object
+        timing (LinkTiming): Learned timing for this port. Outlives the session, so reconnecting does not forget it
+        metrics (LatencyMetrics): Optional store receiving port open times, and the link's command times
+
+        Returns
+        -------
+        None
+
+        '''
+        self.com_port = com_port
+        self.settings = dict(settings)
+        self.serial_factory = serial_factory
+        self.lock = threading.RLock()  # One transaction at a time per port, across all threads
+        self.timing = timing
+        self.metrics = metrics
+        self.ser = None
+        self.link = None  # AdaptiveLink around ser
+        self.last_used = 0.0
+        self.open_count = 0
+
+
+    def open(self):
+        '''
+        Open the serial port.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        start_time = time.perf_counter()
+        self.ser = self.serial_factory(self.com_port, **{key: value for key, value in self.settings.items() if key not in LINK_SETTINGS})
+        if self.metrics is not None:
+            self.metrics.record(self.com_port, 'open', OPEN_COMMAND, time.perf_counter() - start_time)
+        self.link = AdaptiveLink(self.ser, self.timing, **{key: self.settings.get(key, default) for key, default in LINK_SETTINGS.items()}, metrics=self.metrics, com_port=self.com_port)
+        self.open_count += 1
+        self.last_used = time.monotonic()
+
+
+    def close(self):
+        '''
+        Close the serial port, ignoring errors from a port that has already disappeared.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        if self.ser is not None:
+            try:
+                self.ser.close()
+            except (serial.SerialException, OSError):
+                pass
+        self.ser = None
+        self.link = None
+
+
+    def is_healthy(self):
+        '''
+        Check that the serial port is still open and that the driver still answers.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        True if the session can be reused, False if it must be reopened.
+
+        '''
+        if self.ser is None or not self.ser.is_open:
+            return False
+
+        # Asking the driver for the input queue length is cheap, and raises if the device was unplugged
+        try:
+            self.ser.in_waiting
+        except (serial.SerialException, OSError):
+            return False
+
+        return True
+
+
+class SerialSessions():
+    '''
+    Class containing a pool of open serial port sessions, keyed by COM port and serial settings.
+    Replaces opening + closing the port around every command, which costs far more than the command itself with some USB-serial drivers.
+    '''
+
+    def __init__(self, idle_timeout=30.0, serial_factory=serial.Serial, profiles=None, metrics=shared_latency_metrics):
+        '''
+        Create an empty session pool.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        idle_timeout (float): Seconds a session may sit unused before it is closed, releasing the port for other applications
+        serial_factory (function object): Callable returning an open serial.Serial-like object. Swappable for simulated/recorded transports
+        profiles (LinkProfiles): Optional per-instrument link settings (baud rate, terminators, flow control), applied under the caller's settings
+        metrics (LatencyMetrics): Store receiving per-port + per-command latencies. Defaults to the shared store in latency_metrics.py. None records nothing
+
+        Returns
+        -------
+        None
+
+        '''
+        self.idle_timeout = idle_timeout
+        self.serial_factory = serial_factory
+        self.profiles = profiles
+        self.metrics = metrics
+        self.sessions = {}  # {com_port: SerialSession}
+        self.timings = {}  # {com_port: LinkTiming}
+        self.pool_lock = threading.Lock()
+
+
+    def acquire(self, com_port, **settings):
+        '''
+        Return an open, healthy session for the given port and settings, opening or reopening the port if required.
+        A port can only be held open once, so a session for the same port with different settings is closed first.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        settings (keyword arguments): Serial settings. Anything not given falls back to the port's link profile, then DEFAULT_SETTINGS
+
+        Returns
+        -------
+        SerialSession object
+
+        Raises
+        ------
+        serial.serialutil.SerialException if the port cannot be opened
+
+        '''
+        settings = self.link_settings(com_port, **settings)
+        self.expire_idle()
+
+        stale, claimed = None, False
+        with self.pool_lock:
+            session = self.sessions.get(com_port)
+            if session is None or session.settings != settings:
+                stale = session
+                timing = self.timings.setdefault(com_port, LinkTiming(ceiling=settings.get('timeout') or DEFAULT_SETTINGS['timeout']))
+                session = SerialSession(com_port, settings, self.serial_factory, timing, self.metrics)
+                self.sessions[com_port] = session
+                # Nobody else can hold the new session yet. Taking it now keeps other users of this port waiting until the stale one is closed
+                claimed = session.lock.acquire()
+
+        if not claimed:
+            session.lock.acquire()
+        try:
+            if stale is not None:
+                # Outside the pool lock: this may wait out a transaction on the stale session, which must not hold up other ports
+                with stale.lock:
+                    stale.close()
+
+            if not session.is_healthy():
+                session.close()
+                try:
+                    session.open()
+                except (serial.SerialException, OSError) as error:
+                    # Do not keep a session around for a port that does not exist
+                    with self.pool_lock:
+                        if self.sessions.get(com_port) is session:
+                            del self.sessions[com_port]
+                    raise serial.SerialException(str(error)) from error
+        finally:
+            session.lock.release()
+
+        return session
+
+
+    def link_settings(self, com_port, **settings):
+        '''
+        Settings a session on the port is opened with: DEFAULT_SETTINGS, overridden by the port's link profile, overridden by settings.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        settings (keyword arguments): Caller's serial settings. Ex.: timeout=3
+
+        Returns
+        -------
+        Dictionary of settings
+
+        '''
+        profile = self.profiles.settings(com_port) if self.profiles is not None else {}
+        return {**DEFAULT_SETTINGS, **profile, **settings}
+
+
+    @contextmanager
+    def session(self, com_port, **settings):
+        '''
+        Context manager yielding an open serial object with the session locked for the caller's exclusive use.
+        The object is the session's AdaptiveLink, so readline() uses the port's learned timeout.
+        Any serial error raised inside the block closes the session, so the next use reconnects.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        settings (keyword arguments): Serial settings. Anything not given falls back to DEFAULT_SETTINGS
+
+        Returns
+        -------
+        AdaptiveLink object wrapping a serial.Serial object (via yield)
+
+        '''
+        session = self.acquire(com_port, **settings)
+        with session.lock:
+            # Another thread may have hit an error and closed the port between acquire() and here
+            if not session.is_healthy():
+                session.close()
+                session.open()
+
+            session.link.begin()
+            try:
+                yield session.link
+            except (serial.SerialException, OSError):
+                session.close()
+                raise
+            finally:
+                session.last_used = time.monotonic()
+
+
+    def transaction(self, com_port, function, retries=1, **settings):
+        '''
+        Run function(ser) against an open port, reconnecting and retrying if the link fails mid-transaction.
+        The whole transaction, re-sends and reconnects included, shares one deadline: the timeout setting (3 s by default).
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        function (function object): Receives the open serial object, returns whatever the caller needs
+        retries (int): Number of reconnect + retry attempts after the first failure
+        settings (keyword arguments): Serial settings. Anything not given falls back to DEFAULT_SETTINGS
+
+        Returns
+        -------
+        Return value of function
+
+        '''
+        timeout = settings.get('timeout', DEFAULT_SETTINGS['timeout'])
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        for attempt in range(retries + 1):
+            try:
+                with self.session(com_port, **settings) as ser:
+                    ser.begin(deadline)
+                    # Drop stale bytes, such as a late reply to a previously timed-out query
+                    ser.reset_input_buffer()
+                    return function(ser)
+
+            except (serial.SerialException, OSError):
+                if attempt == retries or (deadline is not None and time.perf_counter() >= deadline):
+                    raise
+
+
+    def expire_idle(self):
+        '''
+        Close sessions that have not been used for longer than idle_timeout.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        now = time.monotonic()
+        with self.pool_lock:
+            for com_port, session in list(self.sessions.items()):
+                # Skip sessions currently in use
+                if not session.lock.acquire(blocking=False):
+                    continue
+                try:
+                    if now - session.last_used > self.idle_timeout:
+                        session.close()
+                        del self.sessions[com_port]
+                finally:
+                    session.lock.release()
+
+
+    def link_statistics(self, com_port):
+        '''
+        Learned timing and retry counts for one port.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+
+        Returns
+        -------
+        Dictionary, as returned by LinkTiming.statistics. None if the port has never been used
+
+        '''
+        timing = self.timings.get(com_port)
+        return None if timing is None else timing.statistics()
+
+
+    def channel_state(self, com_port):
+        '''
+        Channel selection + setpoints last confirmed on a port's current connection.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+
+        Returns
+        -------
+        Dictionary, as returned by ChannelState.snapshot. None if the port is not open
+
+        '''
+        with self.pool_lock:
+            session = self.sessions.get(com_port)
+        link = None if session is None else session.link
+        return None if link is None else link.channel_state.snapshot()
+
+
+    def latency_metrics(self):
+        '''
+        Latency histograms of every port + command, as LatencyMetrics.snapshot returns them.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        Dictionary. Empty if metrics are off
+
+        '''
+        return {} if self.metrics is None else self.metrics.snapshot()
+
+
+    def reset_latency_metrics(self):
+        '''
+        Forget every latency sample.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        if self.metrics is not None:
+            self.metrics.reset()
+
+
+    def cancel_reads(self):
+        '''
+        Interrupt any blocking read in progress on any session, so a waiting caller returns immediately.
+        Deliberately does not take the session locks, since they are held by the blocked reader.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        with self.pool_lock:
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            link = session.link
+            if link is not None:
+                try:
+                    link.cancel_read()
+                except (serial.SerialException, OSError):
+                    pass
+
+
+    def invalidate(self, com_port):
+        '''
+        Close and forget the session for a single port. Ex.: after the device was unplugged.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+
+        Returns
+        -------
+        None
+
+        '''
+        with self.pool_lock:
+            session = self.sessions.pop(com_port, None)
+        if self.profiles is not None:
+            self.profiles.forget_port(com_port)
+        if session is not None:
+            with session.lock:
+                session.close()
+
+
+    def close_all(self):
+        '''
+        Close every session in the pool. Called when the application exits.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        with self.pool_lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+        for session in sessions:
+            with session.lock:
+                session.close()
+
+
+# Shared pool for callers that do not manage their own
+serial_sessions = SerialSessions()
@@ -0,0 +1,382 @@
+'''
+Module to record commands and measurements to a compact, append-only binary log.
+
+Export a recorded range after the run with:
+    python session_log.py <log directory> <output .csv or .parquet> [start time] [end time]
+'''
+import csv
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+
+# One fixed-width record per command or measurement (72 bytes)
+RECORD_DTYPE = np.dtype([
+    ('timestamp', '<f8'),  # time.time() seconds
+    ('port', 'S16'),  # Ex.: b'COM5'
+    ('command', 'S24'),  # Ex.: b'VOLT', b'MEAS:VOLT?'
+    ('setpoint', '<f8'),  # NaN for queries
+    ('readback', '<f8'),  # NaN if there was no (readable) reply
+    ('latency', '<f8'),  # Seconds from sending the command to receiving the reply
+])
+
+# Chunk file header: magic + number of records written
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('count', '<u8')])
+MAGIC = b'RCLOG001'
+
+
+class SessionLog():
+    '''
+    Class containing an append-only log of fixed-width binary records, written through memory-mapped chunk files.
+    A full chunk is closed and the next one started, so months of history stay a set of same-sized files that load instantly.
+    A new run carries on filling the last chunk, if it has room. A chunk is written by one process at a time, claimed by its ".lock" file,
+    so a second copy of the application writes to a chunk of its own instead of over the first one's records.
+    Chunks are named by number (Ex.: 00000012.rclog). Other files in the folder are ignored.
+    '''
+
+    def __init__(self, directory='session_logs', chunk_records=65536):
+        '''
+        Open the log directory. The first chunk file is created on the first append.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        directory (string): Folder holding the chunk files
+        chunk_records (int): Records per chunk file. 65536 records is 4.5 MB
+
+        Returns
+        -------
+        None
+
+        '''
+        self.directory = Path(directory)
+        self.chunk_records = chunk_records
+        self.header = None
+        self.records = None
+        self.claim = None  # Lock file of the chunk being written, while mapped
+        self.lock = threading.Lock()
+
+
+    def append(self, port, command, setpoint=np.nan, readback=np.nan, latency=np.nan, timestamp=None):
+        '''
+        Write one record. Thread-safe.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        port (string): Ex.: "COM5"
+        command (string): Ex.: "VOLT"
+        setpoint (float): Value set. NaN for queries
+        readback (float): Value read back or measured. NaN if none
+        latency (float): Seconds from sending the command to receiving the reply
+        timestamp (float): time.time() seconds. Defaults to now. May be older than earlier records (Ex.: replayed data)
+
+        Returns
+        -------
+        None
+
+        '''
+        with self.lock:
+            if self.records is None or self.header['count'][0] == self.chunk_records:
+                self.__roll_over()
+
+            index = int(self.header['count'][0])
+            self.records[index] = (time.time() if timestamp is None else timestamp, port.encode()[:16], command.encode()[:24], setpoint, readback, latency)
+            self.header['count'][0] = index + 1  # Count last, so a reader never sees a half-written record
+
+
+    def flush(self):
+        '''
+        Push written records to disk.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        with self.lock:
+            if self.records is not None:
+                self.records.flush()
+                self.header.flush()
+
+
+    def close(self):
+        '''
+        Flush and unmap the current chunk.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        self.flush()
+        with self.lock:
+            self.records = None
+            self.header = None
+            self.__release()
+
+
+    def __roll_over(self):
+        '''
+        Finish the current chunk and map the next one: on the first append, the last chunk on disk if it has room and no other writer, otherwise a new one.
+        Call with the lock held.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        reopen = self.records is None
+        if self.records is not None:
+            self.records.flush()
+            self.header.flush()
+            self.records = None
+            self.header = None
+            self.__release()
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        existing = SessionLog.chunks(self.directory)
+        chunk_size = HEADER_DTYPE.itemsize + self.chunk_records * RECORD_DTYPE.itemsize
+
+        if reopen and existing and existing[-1].stat().st_size == chunk_size and self.__claim(existing[-1]):
+            header = np.memmap(existing[-1], dtype=HEADER_DTYPE, mode='r+', shape=(1,))
+            if header['magic'][0] == MAGIC and header['count'][0] < self.chunk_records:
+                self.header = header
+                self.records = np.memmap(existing[-1], dtype=RECORD_DTYPE, mode='r+', offset=HEADER_DTYPE.itemsize, shape=(self.chunk_records,))
+                return
+            del header
+            self.__release()
+
+        number = int(existing[-1].stem) + 1 if existing else 0
+        while True:
+            path = self.directory / f'{number:08d}.rclog'
+            # Claim first, then create exclusively: two writers never end up with the same chunk, and an existing chunk is never truncated
+            if self.__claim(path):
+                try:
+                    with open(path, 'xb') as chunk_file:
+                        chunk_file.truncate(chunk_size)
+                    break
+                except FileExistsError:
+                    self.__release()
+            number += 1
+
+        self.header = np.memmap(path, dtype=HEADER_DTYPE, mode='r+', shape=(1,))
+        self.header['magic'][0] = MAGIC
+        self.header['count'][0] = 0
+        self.records = np.memmap(path, dtype=RECORD_DTYPE, mode='r+', offset=HEADER_DTYPE.itemsize, shape=(self.chunk_records,))
+
+
+    def __claim(self, path):
+        '''
+        Take a chunk for this log to write, by creating its lock file holding this process ID. Call with the lock held.
+        A lock file left behind by a crashed writer (its process ID no longer running) is taken over.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        path (pathlib.Path): Chunk file
+
+        Returns
+        -------
+        True if the chunk is now this log's, False if another writer has it
+
+        '''
+        claim = path.with_name(path.name + '.lock')
+        for attempt in range(2):
+            try:
+                with open(claim, 'x', encoding='utf-8') as claim_file:
+                    claim_file.write(str(os.getpid()))
+                self.claim = claim
+                return True
+
+            except FileExistsError:
+                try:
+                    owner = int(claim.read_text(encoding='utf-8'))
+                except (OSError, ValueError):
+                    return False  # Being written right now, or not ours to judge
+                if attempt or SessionLog.running(owner):
+                    return False
+                try:
+                    claim.unlink()
+                except OSError:
+                    return False
+        return False
+
+
+    def __release(self):
+        '''
+        Give up the chunk claimed by __claim, if any. Call with the lock held.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        if self.claim is not None:
+            try:
+                self.claim.unlink()
+            except OSError:
+                pass
+            self.claim = None
+
+
+    @staticmethod
+    def running(pid):
+        '''
+        Check whether a process is still running. Ex.: the writer named in a chunk's lock file.
+
+        Parameters
+        ----------
+        pid (int): Process ID
+
+        Returns
+        -------
+        True if the process exists (or may exist, when that cannot be told), False if it has ended
+
+        '''
+        if os.name == 'nt':
+            import ctypes  # Windows only: os.kill would terminate the process instead of probing it
+
+            kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+            handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+            if not handle:
+                return ctypes.get_last_error() == 5  # ERROR_ACCESS_DENIED: running, as another user
+            exit_code = ctypes.c_ulong()
+            try:
+                kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+            finally:
+                kernel32.CloseHandle(handle)
+            return exit_code.value == 259  # STILL_ACTIVE
+
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True  # Running, as another user
+        return True
+
+
+    @staticmethod
+    def chunks(directory):
+        '''
+        Chunk files in a log directory, oldest first.
+
+        Parameters
+        ----------
+        directory (string or pathlib.Path): Folder holding the chunk files
+
+        Returns
+        -------
+        List of pathlib.Path objects. Files not named by a chunk number are left out
+
+        '''
+        return sorted(path for path in Path(directory).glob('*.rclog') if path.stem.isdigit())
+
+
+    @staticmethod
+    def load(directory='session_logs', start=None, end=None):
+        '''
+        Read records back, optionally limited to a time range.
+        Records are filtered one by one, not by binary search, as append() takes caller-supplied timestamps that need not increase.
+
+        Parameters
+        ----------
+        directory (string): Folder holding the chunk files
+        start (float): time.time() seconds. Defaults to the beginning of the log
+        end (float): time.time() seconds, exclusive. Defaults to the end of the log
+
+        Returns
+        -------
+        NumPy structured array of RECORD_DTYPE, in time order
+
+        '''
+        start = -np.inf if start is None else start
+        end = np.inf if end is None else end
+        pieces = []
+
+        for path in SessionLog.chunks(directory):
+            header = np.memmap(path, dtype=HEADER_DTYPE, mode='r', shape=(1,))
+            if header['magic'][0] != MAGIC:
+                continue
+
+            count = int(header['count'][0])
+            if count == 0:
+                continue
+
+            records = np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=HEADER_DTYPE.itemsize, shape=(count,))
+            times = records['timestamp']
+            selected = (times >= start) & (times < end)
+            if selected.any():
+                pieces.append(np.array(records[selected]))
+
+        if not pieces:
+            return np.zeros(0, dtype=RECORD_DTYPE)
+        records = np.concatenate(pieces)
+        # Chunks written side by side by two processes overlap in time, and caller-supplied timestamps may arrive out of order
+        return records[np.argsort(records['timestamp'], kind='stable')]
+
+
+    @staticmethod
+    def export(records, path):
+        '''
+        Write records to a CSV or Parquet file, chosen by the file extension. Parquet requires the optional pyarrow package.
+
+        Parameters
+        ----------
+        records (NumPy structured array): As returned by load()
+        path (string): Output file. Ex.: "run.csv", "run.parquet"
+
+        Returns
+        -------
+        None
+
+        '''
+        columns = {name: records[name] for name in RECORD_DTYPE.names}
+        columns['port'] = np.char.decode(columns['port'])
+        columns['command'] = np.char.decode(columns['command'])
+
+        if Path(path).suffix.lower() == '.parquet':
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError as error:
+                raise ImportError('Parquet export requires pyarrow: python -m pip install pyarrow') from error
+
+            pyarrow.parquet.write_table(pyarrow.table(columns), path)
+            return
+
+        with open(path, 'w', newline='', encoding='utf-8') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(RECORD_DTYPE.names)
+            writer.writerows(zip(*(columns[name].tolist() for name in RECORD_DTYPE.names)))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(2)
+
+    loaded = SessionLog.load(sys.argv[1], *(float(argument) for argument in sys.argv[3:5]))
+    SessionLog.export(loaded, sys.argv[2])
+    print(f'{len(loaded)} records written to {sys.argv[2]}')
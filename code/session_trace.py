@@ -0,0 +1,833 @@
+'''
+Module to record the exact byte exchange with the instruments into a compact trace file, and to play it back later without hardware.
+
+Both ends plug into SerialSessions as its serial_factory, so everything above the port (AdaptiveLink, ScpiTransaction, RemoteControl, the GUI) runs unchanged:
+    recorder = TraceRecorder('bench.rctrace')
+    sessions = SerialSessions(serial_factory=recorder.serial_factory())   Real ports, every open/write/read/close recorded
+
+    replayer = TraceReplayer('bench.rctrace', speed=1.0)                 speed=1.0: original timing. 0: as fast as possible
+    sessions = SerialSessions(serial_factory=replayer.serial_factory)   No ports needed: replies come from the trace
+
+The GUI takes --record-trace PATH or --replay-trace PATH [--replay-speed X] (see requested_trace), cli.py takes --record / --replay, and
+"python session_trace.py info|replay PATH" summarizes a trace, or re-sends its writes through the driver path to time it and check every reply.
+
+File format: MAGIC, then one event after another, each an EVENT header followed by its payload:
+    kind (uint8)  port (uint8)  microseconds since the previous event (uint32)  payload length (uint16)
+Kinds are META (JSON details), OPEN (JSON port name + settings), WRITE + READ (raw bytes), and CLOSE. A command and its reply cost ~30 bytes of overhead.
+Every event is flushed as it is written, so a trace from a session that crashed is complete up to the crash.
+'''
+import argparse
+import json
+import os
+import struct
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import serial
+
+
+MAGIC = b'RCTRACE1'
+EVENT = struct.Struct('<BBIH')
+
+META, OPEN, WRITE, READ, CLOSE = range(5)
+KIND_NAMES = ('meta', 'open', 'write', 'read', 'close')
+
+MAXIMUM_PAYLOAD = 0xFFFF  # Longer writes/reads are split over several events
+MAXIMUM_PORTS = 256
+
+
+def open_trace(record=None, replay=None, speed=1.0, description=''):
+    '''
+    Open a trace to record into, or to replay, and the serial factory SerialSessions needs for it.
+
+    Parameters
+    ----------
+    record (string): Trace file to record the real ports into
+    replay (string): Trace file to replay instead of opening ports. Takes precedence over record
+    speed (float): Replay speed. See TraceReplayer
+    description (string): Kept in a recorded trace. Ex.: the command line
+
+    Returns
+    -------
+    (serial factory, TraceRecorder or TraceReplayer) tuple, or (serial.Serial, None) with neither file given
+
+    Raises
+    ------
+    OSError if the file cannot be opened, ValueError if a replayed file is not a trace
+
+    '''
+    if replay:
+        replayer = TraceReplayer(replay, speed=speed)
+        return replayer.serial_factory, replayer
+    if record:
+        recorder = TraceRecorder(record, description=description)
+        return recorder.serial_factory(), recorder
+    return serial.Serial, None
+
+
+def requested_trace(argv=None, environ=None):
+    '''
+    Trace the GUI was asked to record or replay: "--record-trace PATH" or "--replay-trace PATH [--replay-speed X]" on the command line,
+    or the REMOTE_CONTROL_RECORD / REMOTE_CONTROL_REPLAY (+ REMOTE_CONTROL_REPLAY_SPEED) environment variables.
+
+    Parameters
+    ----------
+    argv (list): Command line. Defaults to sys.argv
+    environ (dictionary): Environment. Defaults to os.environ
+
+    Returns
+    -------
+    As open_trace
+
+    Raises
+    ------
+    As open_trace, plus ValueError for a replay speed that is not a number
+
+    '''
+    argv = sys.argv if argv is None else argv
+    environ = os.environ if environ is None else environ
+
+    def option(name, variable):
+        index = argv.index(name) if name in argv else -1
+        return argv[index + 1] if 0 <= index < len(argv) - 1 else environ.get(variable)
+
+    speed = option('--replay-speed', 'REMOTE_CONTROL_REPLAY_SPEED')
+    return open_trace(option('--record-trace', 'REMOTE_CONTROL_RECORD'), option('--replay-trace', 'REMOTE_CONTROL_REPLAY'),
+                      float(speed) if speed else 1.0, description=' '.join(argv))
+
+
+class TraceRecorder():
+    '''
+    Class containing an open trace file, shared by every port recorded into it. Safe to record into from any thread.
+    '''
+
+    def __init__(self, path, description=''):
+        '''
+        Create the trace file, and write its META event.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        path (string): Trace file. Overwritten if it exists
+        description (string): Free text kept in the META event. Ex.: the bench it was recorded on
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        OSError if the file cannot be created
+
+        '''
+        self.path = path
+        self.trace_file = open(path, 'wb')
+        self.trace_file.write(MAGIC)
+        self.ports = {}  # {port name: port index in events}
+        self.last_time = time.perf_counter()
+        self.events = 0
+        self.lock = threading.Lock()
+        self.record(META, 0, json.dumps({'created': datetime.now().isoformat(timespec='seconds'), 'description': description}).encode())
+
+
+    def serial_factory(self, factory=serial.Serial):
+        '''
+        Serial factory for SerialSessions, opening real ports through factory and recording them.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        factory (function object): Opens the real port. Defaults to serial.Serial
+
+        Returns
+        -------
+        Function taking (port, **settings), returning a RecordingSerial object
+
+        '''
+        def open_recorded(port, **settings):
+            ser = factory(port, **settings)
+            with self.lock:
+                if port not in self.ports:
+                    if len(self.ports) >= MAXIMUM_PORTS:
+                        ser.close()
+                        raise serial.SerialException(f'Trace already holds {MAXIMUM_PORTS} ports')
+                    self.ports[port] = len(self.ports)
+            index = self.ports[port]
+            self.record(OPEN, index, json.dumps({'port': port, 'settings': settings}).encode())
+            return RecordingSerial(ser, self, index)
+
+        return open_recorded
+
+
+    def record(self, kind, port_index, payload=b''):
+        '''
+        Append one event, split over several if the payload is too long for one.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        kind (int): META, OPEN, WRITE, READ, or CLOSE
+        port_index (int): Port the event belongs to
+        payload (bytes): Event data
+
+        Returns
+        -------
+        None
+
+        '''
+        with self.lock:
+            if self.trace_file is None:
+                return
+            now = time.perf_counter()
+            microseconds = min(int((now - self.last_time) * 1e6), 0xFFFFFFFF)
+            self.last_time = now
+            for start in range(0, max(len(payload), 1), MAXIMUM_PAYLOAD):
+                chunk = payload[start:start + MAXIMUM_PAYLOAD]
+                self.trace_file.write(EVENT.pack(kind, port_index, microseconds, len(chunk)) + chunk)
+                microseconds = 0
+                self.events += 1
+            self.trace_file.flush()
+
+
+    def close(self):
+        '''
+        Close the trace file. Ports still open stop being recorded.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        with self.lock:
+            if self.trace_file is not None:
+                self.trace_file.close()
+                self.trace_file = None
+
+
+class RecordingSerial():
+    '''
+    Class wrapping an open serial object, recording every write, read, and close into a TraceRecorder.
+    Anything not handled here (Ex.: in_waiting, timeout) passes straight through to the serial object.
+    '''
+
+    def __init__(self, ser, recorder, port_index):
+        '''
+        Wrap a serial object.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        ser (serial.Serial): Open port
+        recorder (TraceRecorder): Trace receiving the events
+        port_index (int): Index of the port in the trace
+
+        Returns
+        -------
+        None
+
+        '''
+        object.__setattr__(self, 'ser', ser)
+        object.__setattr__(self, 'recorder', recorder)
+        object.__setattr__(self, 'port_index', port_index)
+
+
+    def __getattr__(self, name):
+        return getattr(self.ser, name)
+
+
+    def __setattr__(self, name, value):
+        # Ex.: AdaptiveLink setting the read timeout
+        setattr(self.ser, name, value)
+
+
+    def write(self, data):
+        '''
+        Send bytes, and record them once sent.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        data (bytes): Bytes to send
+
+        Returns
+        -------
+        Number of bytes written
+
+        '''
+        written = self.ser.write(data)
+        self.recorder.record(WRITE, self.port_index, bytes(data))
+        return written
+
+
+    def read(self, size=1):
+        '''
+        Read bytes, and record them, including an empty read on timeout.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        size (int): Most bytes to return
+
+        Returns
+        -------
+        bytes object
+
+        '''
+        data = self.ser.read(size)
+        self.recorder.record(READ, self.port_index, data)
+        return data
+
+
+    def read_until(self, expected=b'\n', size=None):
+        '''
+        Read up to and including expected, and record it.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        expected (bytes): End marker
+        size (int): Most bytes to return. None for no limit
+
+        Returns
+        -------
+        bytes object
+
+        '''
+        data = self.ser.read_until(expected, size)
+        self.recorder.record(READ, self.port_index, data)
+        return data
+
+
+    def close(self):
+        '''
+        Close the port, and record it.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        try:
+            self.ser.close()
+        finally:
+            self.recorder.record(CLOSE, self.port_index)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc, trace):
+        self.close()
+
+
+class TraceReplayer():
+    '''
+    Class containing a loaded trace, split into exchanges (one write + the reads after it) per port, and the replay position on each port.
+    '''
+
+    def __init__(self, path, speed=1.0, strict=True):
+        '''
+        Load a trace.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        path (string): Trace file
+        speed (float): Replay speed. 1.0 serves each reply with its original delay after the write, 2.0 twice as fast. 0 serves every reply straight away
+        strict (bool): Fail a write that differs from the recorded one. If False, the recorded reply is served anyway
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        OSError if the file cannot be read, ValueError if it is not a trace
+
+        '''
+        self.path = path
+        self.speed = speed
+        self.strict = strict
+        self.meta, self.exchanges, self.events = TraceReplayer.load(path)
+        self.positions = {port: 0 for port in self.exchanges}  # {port name: index of the next exchange}
+        self.mismatches = 0
+        self.lock = threading.Lock()
+
+
+    @staticmethod
+    def read_events(path):
+        '''
+        Read every event of a trace file.
+
+        Parameters
+        ----------
+        path (string): Trace file
+
+        Returns
+        -------
+        List of (seconds since the trace started, kind, port name, payload bytes) tuples
+
+        Raises
+        ------
+        OSError if the file cannot be read, ValueError if it is not a trace
+
+        '''
+        with open(path, 'rb') as trace_file:
+            data = trace_file.read()
+        if not data.startswith(MAGIC):
+            raise ValueError(f'{path} is not a session trace')
+
+        events = []
+        names = {}  # {port index: port name}, from the OPEN events
+        offset = len(MAGIC)
+        seconds = 0.0
+        while offset + EVENT.size <= len(data):
+            kind, port_index, microseconds, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            payload = data[offset:offset + length]
+            offset += length
+            if len(payload) < length:
+                break  # Cut short by a crash mid-write. Everything before it is still good
+
+            seconds += microseconds / 1e6
+            if kind == OPEN:
+                names[port_index] = json.loads(payload)['port']
+            events.append((seconds, kind, names.get(port_index, ''), payload))
+        return events
+
+
+    @staticmethod
+    def load(path):
+        '''
+        Read a trace, and split it into exchanges per port.
+
+        Parameters
+        ----------
+        path (string): Trace file
+
+        Returns
+        -------
+        (META details dictionary, {port name: [(written bytes, [(seconds after the write, read bytes), ...]), ...]}, number of events) tuple
+
+        '''
+        events = TraceReplayer.read_events(path)
+        meta = {}
+        exchanges = {}
+        current = {}  # {port name: (write time, exchange)} still collecting reads
+        for seconds, kind, port, payload in events:
+            if kind == META:
+                meta = json.loads(payload)
+            elif kind == WRITE:
+                exchange = (payload, [])
+                exchanges.setdefault(port, []).append(exchange)
+                current[port] = (seconds, exchange)
+            elif kind == READ and payload and port in current:
+                write_time, exchange = current[port]
+                exchange[1].append((seconds - write_time, payload))
+            elif kind in (OPEN, CLOSE):
+                exchanges.setdefault(port, [])
+                current.pop(port, None)  # Nothing read after a reopen belongs to the write before it
+        return meta, exchanges, len(events)
+
+
+    def serial_factory(self, port, **settings):
+        '''
+        Serial factory for SerialSessions, opening a replayed port.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        port (string): Port name, as recorded. Ex.: "COM5"
+        settings (keyword arguments): Serial settings. Only timeout is used
+
+        Returns
+        -------
+        ReplaySerial object
+
+        Raises
+        ------
+        serial.SerialException if the port is not in the trace
+
+        '''
+        if port not in self.exchanges:
+            raise serial.SerialException(f'{port} is not in the replayed trace {self.path}')
+        return ReplaySerial(self, port, settings.get('timeout'))
+
+
+    def next_exchange(self, port, data):
+        '''
+        Take the port's next recorded exchange, checking that the write matches the recorded one.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        port (string): Port name
+        data (bytes): Bytes being written
+
+        Returns
+        -------
+        List of (seconds after the write, read bytes) tuples. Empty once the trace has run out, as if the instrument stopped answering
+
+        Raises
+        ------
+        serial.SerialException if strict and the write differs from the recorded one
+
+        '''
+        with self.lock:
+            position = self.positions[port]
+            if position >= len(self.exchanges[port]):
+                return []
+            recorded, reads = self.exchanges[port][position]
+            if data != recorded:
+                self.mismatches += 1
+                if self.strict:
+                    raise serial.SerialException(f'Replay of {port} diverged at write {position + 1}: recorded {recorded!r}, got {bytes(data)!r}')
+            self.positions[port] = position + 1
+            return reads
+
+
+    def statistics(self):
+        '''
+        Replay progress.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        Dictionary of {'ports': {port name: {'replayed', 'recorded'}}, 'mismatches'}
+
+        '''
+        with self.lock:
+            return {'ports': {port: {'replayed': self.positions[port], 'recorded': len(exchanges)} for port, exchanges in self.exchanges.items()},
+                    'mismatches': self.mismatches}
+
+
+    def close(self):
+        '''
+        Nothing to release: the trace is held in memory. Matches TraceRecorder.close.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+
+
+class ReplaySerial():
+    '''
+    Class standing in for an open serial.Serial object, serving the replies recorded after each write.
+    Replies become readable at their recorded delay after the write, scaled by the replay speed, so reads block as they did on the bench.
+    '''
+
+    def __init__(self, replayer, port, timeout=None):
+        '''
+        Open a replayed port.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        replayer (TraceReplayer): Trace being replayed
+        port (string): Port name
+        timeout (float): Read timeout in seconds. None blocks until the next reply is due
+
+        Returns
+        -------
+        None
+
+        '''
+        self.replayer = replayer
+        self.port = port
+        self.timeout = timeout
+        self.is_open = True
+        self.buffer = bytearray()  # Bytes already due, not read yet
+        self.pending = deque()  # (time.perf_counter() when due, bytes) still to arrive
+        self.cancelled = threading.Event()
+
+
+    @property
+    def in_waiting(self):
+        '''
+        Number of bytes ready to read.
+        '''
+        if not self.is_open:
+            raise serial.SerialException(f'{self.port} is closed')
+        self.__collect()
+        return len(self.buffer)
+
+
+    def write(self, data):
+        '''
+        Take the next recorded exchange, and schedule its replies.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        data (bytes): Bytes to send
+
+        Returns
+        -------
+        Number of bytes written
+
+        '''
+        if not self.is_open:
+            raise serial.SerialException(f'{self.port} is closed')
+        written_at = time.perf_counter()
+        scale = 1.0 / self.replayer.speed if self.replayer.speed else 0.0
+        for delay, chunk in self.replayer.next_exchange(self.port, bytes(data)):
+            self.pending.append((written_at + delay * scale, chunk))
+        return len(data)
+
+
+    def read(self, size=1):
+        '''
+        Return up to size bytes, waiting up to the timeout for the next reply to become due.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        size (int): Most bytes to return
+
+        Returns
+        -------
+        bytes object. Empty on timeout
+
+        '''
+        self.cancelled.clear()
+        deadline = None if self.timeout is None else time.perf_counter() + self.timeout
+        self.__collect()
+        while not self.buffer and not self.cancelled.is_set():
+            due = self.pending[0][0] if self.pending else None
+            wake = due if deadline is None else (deadline if due is None else min(due, deadline))
+            if wake is None:
+                break  # Nothing will ever arrive, and no timeout to wait out
+            remaining = wake - time.perf_counter()
+            if remaining > 0:
+                # Short slices, so cancel_read is noticed quickly
+                self.cancelled.wait(min(remaining, 0.05))
+            self.__collect()
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+
+    def read_until(self, expected=b'\n', size=None):
+        '''
+        Read up to and including expected, or until a read times out.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        expected (bytes): End marker
+        size (int): Most bytes to return. None for no limit
+
+        Returns
+        -------
+        bytes object
+
+        '''
+        line = bytearray()
+        while not line.endswith(expected) and (size is None or len(line) < size):
+            chunk = self.read(1)
+            if not chunk:
+                break
+            line += chunk
+        return bytes(line)
+
+
+    def reset_input_buffer(self):
+        '''
+        Drop replies already due. Replies still on their way arrive later, as they would on a real link.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        self.__collect()
+        self.buffer.clear()
+
+
+    def reset_output_buffer(self):
+        '''
+        Nothing to drop: writes are never held back.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+
+
+    def cancel_read(self):
+        '''
+        Interrupt a blocking read.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        self.cancelled.set()
+
+
+    def close(self):
+        '''
+        Close the replayed port.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        self.is_open = False
+        self.cancelled.set()
+
+
+    def __collect(self):
+        '''
+        Move replies that are due into the read buffer.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        now = time.perf_counter()
+        while self.pending and self.pending[0][0] <= now:
+            self.buffer += self.pending.popleft()[1]
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc, trace):
+        self.close()
+
+
+class TraceTools():
+    '''
+    Class containing the command-line trace tools: a summary of a trace, and a driver-path replay that times it and checks every reply.
+    '''
+
+    @staticmethod
+    def info(path):
+        '''
+        Summarize a trace.
+
+        Parameters
+        ----------
+        path (string): Trace file
+
+        Returns
+        -------
+        JSON-ready dictionary of {'meta', 'events', 'seconds', 'ports': {port name: {'writes', 'bytes_written', 'bytes_read'}}}
+
+        '''
+        events = TraceReplayer.read_events(path)
+        meta = next((json.loads(payload) for _, kind, _, payload in events if kind == META), {})
+        ports = {}
+        for _, kind, port, payload in events:
+            if kind in (WRITE, READ):
+                counts = ports.setdefault(port, {'writes': 0, 'bytes_written': 0, 'bytes_read': 0})
+                counts['writes'] += kind == WRITE
+                counts['bytes_written' if kind == WRITE else 'bytes_read'] += len(payload)
+        return {'meta': meta, 'events': len(events), 'seconds': round(events[-1][0], 6) if events else 0.0, 'ports': ports}
+
+
+    @staticmethod
+    def replay(path, speed=0.0):
+        '''
+        Re-send every recorded write through SerialSessions + AdaptiveLink against the replay transport, reading the replies as the application would.
+        Times the driver path against the recorded traffic, and checks that every reply line comes back as recorded.
+
+        Parameters
+        ----------
+        path (string): Trace file
+        speed (float): Replay speed. 0 for as fast as possible, 1.0 for the original timing
+
+        Returns
+        -------
+        JSON-ready dictionary of {'exchanges', 'seconds', 'exchanges_per_second', 'recorded_seconds', 'mismatched_replies'}
+
+        '''
+        from serial_sessions import SerialSessions  # Only needed here, so the transports stay importable on their own
+
+        replayer = TraceReplayer(path, speed=speed)
+        sessions = SerialSessions(serial_factory=replayer.serial_factory, metrics=None)
+        exchanges, mismatched = 0, 0
+        start_time = time.perf_counter()
+        try:
+            for port, recorded in replayer.exchanges.items():
+                for data, reads in recorded:
+                    expected = [line for line in b''.join(chunk for _, chunk in reads).split(b'\n') if line]
+
+                    # Bound now, so the function never sees a later exchange's data
+                    def exchange(ser, data=data, expected=expected):
+                        ser.write(data)
+                        return [ser.readline().rstrip(b'\n') for _ in expected]
+
+                    # No retries: a retry would send the write again, and take the next recorded exchange
+                    replies = sessions.transaction(port, exchange, retries=0)
+                    mismatched += replies != expected
+                    exchanges += 1
+        finally:
+            sessions.close_all()
+
+        seconds = time.perf_counter() - start_time
+        events = TraceReplayer.read_events(path)
+        return {'exchanges': exchanges, 'seconds': round(seconds, 6), 'exchanges_per_second': round(exchanges / seconds, 2) if seconds else None,
+                'recorded_seconds': round(events[-1][0], 6) if events else 0.0, 'mismatched_replies': mismatched}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='session_trace.py', description='Inspect and replay instrument session traces.')
+    parser.add_argument('action', choices=('info', 'replay'), help='info: summarize. replay: re-send every write through the driver path, timing it and checking the replies')
+    parser.add_argument('path', help='Trace file, recorded with --record-trace (GUI) or --record (cli.py)')
+    parser.add_argument('--speed', type=float, default=0.0, help='replay only. 0 for as fast as possible, 1.0 for the original timing')
+    arguments = parser.parse_args()
+
+    result = TraceTools.info(arguments.path) if arguments.action == 'info' else TraceTools.replay(arguments.path, arguments.speed)
+    print(json.dumps(result, indent=4))
+    sys.exit(1 if result.get('mismatched_replies') else 0)
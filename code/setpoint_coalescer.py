@@ -0,0 +1,186 @@
+'''
+Module to follow rapidly changing setpoints (Ex.: a spin-box being scrolled) without queueing a full set + verify cycle per change.
+
+Only the newest pending setpoint per port + channel + function is kept. It is sent as soon as the transaction before it finishes,
+and only the final value is verified by read-back, once the operator stops changing it.
+'''
+import threading
+
+import serial
+from instrument_limits import InstrumentLimits
+from remote_control import RemoteControl
+from scpi_transaction import ScpiTransaction
+from serial_sessions import serial_sessions
+
+
+class SetpointCoalescer():
+    '''
+    Class containing a latest-value-wins queue of setpoints, drained by a single job on the instrument worker thread.
+    A value replaced before it was sent costs nothing on the serial link.
+    '''
+
+    def __init__(self, submit, sessions=serial_sessions, session_log=None, cancelled=None):
+        '''
+        Create an empty queue.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        submit (function object): Queues a job, as InstrumentWorker.submit(name, function)
+        sessions (SerialSessions): Pool of open serial port sessions. Defaults to the shared pool in serial_sessions.py
+        session_log (SessionLog): Optional binary log receiving one record per verified setpoint
+        cancelled (function object): Optional callable returning True when draining should stop. Ex.: InstrumentWorker.is_cancelled
+
+        Returns
+        -------
+        None
+
+        '''
+        self.submit = submit
+        self.sessions = sessions
+        self.session_log = session_log
+        self.cancelled = cancelled
+        self.pending = {}  # {(com_port, channel, thing_to_change): value string}, in arrival order
+        self.counts = {}  # {(com_port, channel, thing_to_change): {'requested': int, 'replaced': int, 'sent': int}} since the last verification
+        self.scheduled = False  # True while a drain job is queued or running
+        self.generation = 0  # Counts clear() calls. A drain started before the latest one leaves the queue to the drain after it
+        self.lock = threading.Lock()
+
+
+    def offer(self, com_port, channel, thing_to_change, value):
+        '''
+        Make value the next setpoint for its port + channel + function, replacing any that has not been sent yet. Safe to call from any thread.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        channel (int): Output channel, 1, 2, or 3. None uses whichever channel is selected on the instrument
+        thing_to_change (string): "VOLT" or "CURR"
+        value (string): Setpoint, already checked against the instrument limits
+
+        Returns
+        -------
+        None
+
+        '''
+        key = (com_port, channel, thing_to_change)
+        with self.lock:
+            counts = self.counts.setdefault(key, {'requested': 0, 'replaced': 0, 'sent': 0})
+            counts['requested'] += 1
+            if key in self.pending:
+                counts['replaced'] += 1
+            self.pending[key] = value
+
+            if self.scheduled:
+                return  # The running drain picks it up
+            self.scheduled = True
+
+        self.submit('live', self.drain)
+
+
+    def clear(self):
+        '''
+        Drop every setpoint not sent yet. Ex.: on cancel, which also discards a drain job that has not started.
+        A drain still running stops at its next step. Setpoints offered from here on are sent by a new drain job.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        with self.lock:
+            self.pending.clear()
+            self.counts.clear()
+            self.scheduled = False
+            self.generation += 1
+
+
+    def drain(self, update_status_callback, _dialogs=None):
+        '''
+        Send pending setpoints until none are left, then verify the final value of each by read-back.
+        Runs as a job on the instrument worker thread: function(update_status_callback, dialogs).
+        No dialogs are raised, as a popup per scroll step would bury the operator. Failures are printed instead.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        update_status_callback (function object): Prints fed string to GUI status box, or queues a structured record
+        _dialogs (class or object): Unused. Accepted so the drain can be submitted like any other job
+
+        Returns
+        -------
+        A Boolean value of True is returned if any setpoint failed.
+        Returns "None", otherwise.
+
+        '''
+        sent = {}  # {key: last value sent}, verified once nothing newer is pending
+        failed = False
+        with self.lock:
+            generation = self.generation
+
+        while True:
+            with self.lock:
+                if self.generation != generation:
+                    # Cleared while running. Anything offered since belongs to the drain job that offer() queued after the clear
+                    return True if failed else None
+
+                if self.cancelled is not None and self.cancelled():
+                    # Cancelled without clear(): drop the queue as clear() would
+                    self.pending.clear()
+                    self.counts.clear()
+                    self.scheduled = False
+                    self.generation += 1
+                    return True if failed else None
+
+                setpoint = None  # (key, value) to send next
+                if self.pending:
+                    key = next(iter(self.pending))
+                    setpoint = key, self.pending.pop(key)
+                    self.counts[key]['sent'] += 1
+                elif not sent:
+                    self.scheduled = False
+                    return True if failed else None
+
+            if setpoint is not None:
+                # Completion is confirmed with *OPC?, so the next setpoint never queues up behind this one in the instrument
+                key, value = setpoint
+                com_port, channel, thing_to_change = key
+                transaction = ScpiTransaction()
+                if channel is not None:
+                    transaction.select(channel)
+                transaction.set(thing_to_change, value)
+                try:
+                    transaction.execute(com_port, self.sessions, timeout=3)
+                except (serial.serialutil.SerialException, OSError):
+                    pass  # Reported by the verification, which reconnects
+                sent[key] = value
+                continue
+
+            # Nothing newer pending: verify what was last sent. The set itself is skipped when the connection already confirmed it
+            for (com_port, channel, thing_to_change), value in sent.items():
+                with self.lock:
+                    if (com_port, channel, thing_to_change) in self.pending:
+                        continue  # Replaced meanwhile. The newer value is sent, then verified, on the next pass
+                    counts = self.counts.pop((com_port, channel, thing_to_change), {'requested': 0, 'replaced': 0, 'sent': 0})
+                prefix = f'CH{channel} ' if channel is not None else ''
+
+                try:
+                    value_found = RemoteControl.set_and_check(com_port, thing_to_change, value, self.sessions, self.session_log, channel).strip()
+                except (serial.serialutil.SerialException, OSError) as error:
+                    update_status_callback('{port} {prefix}{thing} {value}: could not communicate ({error})', 'error', port=com_port, prefix=prefix, thing=thing_to_change, value=value, error=str(error))
+                    failed = True
+                    continue
+
+                # Within the instrument's 1 mV / 1 mA resolution. A reply that is not a number fails
+                if InstrumentLimits.confirms(value_found, value):
+                    update_status_callback('{port} {prefix}{thing} {value} confirmed. {sent} sent for {requested} changes, {replaced} replaced before sending', 'info',
+                                           port=com_port, prefix=prefix, thing=thing_to_change, value=value, **counts)
+                else:
+                    update_status_callback('{port} {prefix}{thing} {value} not confirmed (read back "{value_found}")', 'error', port=com_port, prefix=prefix, thing=thing_to_change, value=value, value_found=value_found)
+                    failed = True
+            sent.clear()
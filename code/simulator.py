@@ -0,0 +1,554 @@
+'''
+Module containing a simulated BK Precision 9141, served on pseudo-terminals (POSIX only), for offline testing and benchmarking.
+RemoteControl, CheckPorts, and everything else in this application talk to a simulated instrument exactly as to a real one: through its device path.
+
+Run standalone to serve instruments until Ctrl+C:
+    python simulator.py [number of instruments] [latency ms] [jitter ms] [drop rate] [wrong read-back rate]
+'''
+import heapq
+import os
+import random
+import selectors
+import sys
+import threading
+import time
+
+
+# Long-form SCPI keywords, reduced to the short forms used below
+LONG_FORMS = (('MEASURE', 'MEAS'), ('VOLTAGE', 'VOLT'), ('CURRENT', 'CURR'), ('POWER', 'POW'), ('INSTRUMENT', 'INST'),
+              ('SELECT', 'SEL'), ('APPLY', 'APPL'), ('OUTPUT', 'OUTP'), ('SYSTEM', 'SYST'), ('ERROR', 'ERR'), ('SCALAR:', ''),
+              ('SCAL:', ''), ('SOURCE:', ''), ('SOUR:', ''), ('LEVEL:', ''), ('LEV:', ''), ('IMMEDIATE:', ''), ('IMM:', ''))
+
+
+class SimulatedBK9141():
+    '''
+    Class containing the state and command handling of one simulated three-channel BK Precision 9141.
+    Each channel drives a resistive load, so measurements follow constant-voltage / constant-current behaviour.
+    '''
+
+    def __init__(self, serial_number, latency=0.0, jitter=0.0, drop_rate=0.0, wrong_readback_rate=0.0, load_resistance=10.0, noise=0.0, baudrate=None, lead_resistance=0.0):
+        '''
+        Create an instrument with all channels at 0 V, 0.015 A limit, and output on.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        serial_number (string): Reported by *IDN?
+        latency (float): Seconds before each reply is sent
+        jitter (float): Up to this many extra seconds, chosen at random per reply
+        drop_rate (float): Fraction of replies never sent, 0 to 1
+        wrong_readback_rate (float): Fraction of VOLT?/CURR? replies that report a wrong setpoint, 0 to 1
+        load_resistance (float): Ohms of the simulated load on every channel
+        noise (float): Standard deviation of Gaussian noise added to measurements
+        baudrate (int): Link speed set on the simulated front panel. Bytes sent at any other rate are lost, and every byte costs wire time.
+                        None accepts any rate, with no wire time
+        lead_resistance (float): Ohms of the wiring between each output and its load. Measurements are taken at the output terminals, ahead of the lead drop
+
+        Returns
+        -------
+        None
+
+        '''
+        self.serial_number = serial_number
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.wrong_readback_rate = wrong_readback_rate
+        self.load_resistance = load_resistance
+        self.lead_resistance = lead_resistance
+        self.noise = noise
+        self.baudrate = baudrate
+        self.channels = {channel: {'VOLT': 0.0, 'CURR': 0.015, 'OUTP': True} for channel in (1, 2, 3)}
+        self.selected = 1
+        self.errors = []
+        self.commands_received = 0
+        self.random = random.Random(serial_number)
+
+
+    def reply_delay(self):
+        '''
+        Time to wait before sending a reply, including jitter.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        Seconds
+
+        '''
+        return self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+
+
+    def wire_time(self, byte_count):
+        '''
+        Time to move bytes over the simulated serial line: 10 bits per byte (start + 8 data + stop).
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        byte_count (int): Number of bytes
+
+        Returns
+        -------
+        Seconds. 0 without a simulated baud rate
+
+        '''
+        return byte_count * 10 / self.baudrate if self.baudrate else 0.0
+
+
+    def handle_line(self, line):
+        '''
+        Execute one received line, which may hold several ";"-separated commands.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        line (string): Received line, without terminator
+
+        Returns
+        -------
+        Reply line without terminator (query replies joined by ";"), or None if nothing is to be sent
+
+        '''
+        replies = []
+        for command in line.split(';'):
+            command = command.strip().lstrip(':')
+            if command == '':
+                continue
+
+            self.commands_received += 1
+            reply = self.handle_command(command)
+            if reply is not None:
+                replies.append(reply)
+
+        if not replies or (self.drop_rate and self.random.random() < self.drop_rate):
+            return None
+        return ';'.join(replies)
+
+
+    def handle_command(self, command):
+        '''
+        Execute a single SCPI command.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        command (string): Ex.: "VOLT 12.0", "MEAS:CURR?"
+
+        Returns
+        -------
+        Reply string for queries, None otherwise
+
+        '''
+        header, _, argument = command.partition(' ')
+        header = header.upper()
+        for long_form, short_form in LONG_FORMS:
+            header = header.replace(long_form, short_form)
+        argument = argument.strip()
+        state = self.channels[self.selected]
+
+        if header == '*IDN?':
+            return f'B&K Precision, 9141, {self.serial_number}, 1.00-SIM'
+        if header == '*OPC?':
+            return '1'
+        if header in ('*RST', '*CLS'):
+            if header == '*RST':
+                # The front-panel baud rate survives a reset, as on the real supply, and so does the wiring
+                self.__init__(self.serial_number, self.latency, self.jitter, self.drop_rate, self.wrong_readback_rate, self.load_resistance, self.noise,
+                              baudrate=self.baudrate, lead_resistance=self.lead_resistance)
+            self.errors.clear()
+            return None
+        if header == 'SYST:ERR?':
+            return self.errors.pop(0) if self.errors else '0,"No error"'
+
+        if header in ('INST:SEL', 'INST', 'INST:NSEL'):
+            channel = argument.upper().replace('CH', '').replace('OUTPUT', '')
+            if channel in ('1', '2', '3'):
+                self.selected = int(channel)
+            else:
+                self.errors.append('-224,"Illegal parameter value"')
+            return None
+        if header in ('INST:SEL?', 'INST?'):
+            return f'CH{self.selected}'
+        if header == 'INST:NSEL?':
+            return str(self.selected)
+
+        if header in ('VOLT', 'CURR'):
+            try:
+                state[header] = float(argument)
+            except ValueError:
+                self.errors.append('-104,"Data type error"')
+            return None
+        if header in ('VOLT?', 'CURR?'):
+            value = state[header[:-1]]
+            if self.wrong_readback_rate and self.random.random() < self.wrong_readback_rate:
+                value += 0.5
+            return f'{value:.3f}'
+
+        if header == 'APPL':
+            try:
+                channel, volts, amps = (part.strip() for part in argument.split(','))
+                self.channels[int(channel.upper().replace('CH', ''))].update({'VOLT': float(volts), 'CURR': float(amps)})
+            except (ValueError, KeyError):
+                self.errors.append('-224,"Illegal parameter value"')
+            return None
+        if header == 'APPL?':
+            channel = self.channels.get(int(argument.upper().replace('CH', '') or self.selected), state)
+            return f'{channel["VOLT"]:.3f},{channel["CURR"]:.3f}'
+
+        if header == 'OUTP':
+            state['OUTP'] = argument.upper() in ('1', 'ON')
+            return None
+        if header == 'OUTP?':
+            return '1' if state['OUTP'] else '0'
+
+        if header in ('MEAS:VOLT?', 'MEAS:CURR?', 'MEAS:POW?'):
+            volts, amps = self.output(state)
+            value = {'MEAS:VOLT?': volts, 'MEAS:CURR?': amps, 'MEAS:POW?': volts * amps}[header]
+            if self.noise:
+                value += self.random.gauss(0.0, self.noise)
+            return f'{value:.4f}'
+
+        self.errors.append('-113,"Undefined header"')
+        return None
+
+
+    def output(self, state):
+        '''
+        Output voltage + current of a channel at its terminals, into the leads + resistive load.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        state (dictionary): Channel state
+
+        Returns
+        -------
+        (volts, amps) tuple
+
+        '''
+        if not state['OUTP']:
+            return 0.0, 0.0
+
+        resistance = self.load_resistance + self.lead_resistance
+        amps = state['VOLT'] / resistance
+        if amps <= state['CURR']:
+            return state['VOLT'], amps  # Constant voltage
+
+        return state['CURR'] * resistance, state['CURR']  # Constant current
+
+
+    def load_voltage(self, channel):
+        '''
+        Voltage across a channel's load, after the lead drop. What a meter at the device under test would read.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        channel (int): 1, 2, or 3
+
+        Returns
+        -------
+        Volts
+
+        '''
+        _, amps = self.output(self.channels[channel])
+        return amps * self.load_resistance
+
+
+class SimulatorBank():
+    '''
+    Class containing any number of simulated instruments, each on its own pseudo-terminal, all served by one background thread.
+    '''
+
+    def __init__(self):
+        '''
+        Start the serving thread, with no instruments yet.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        self.selector = selectors.DefaultSelector()
+        self.instruments = {}  # {device path: (SimulatedBK9141, master fd, slave fd)}
+        self.pending = []  # Heap of (due time, sequence number, master fd, reply bytes)
+        self.last_due = {}  # {master fd: due time of the latest scheduled reply}, keeps replies in order
+        self.sequence = 0
+        self.lock = threading.Lock()
+        self.running = True
+
+        # Writing to this pipe wakes the serving thread, Ex.: to pick up a new instrument
+        self.wake_read, self.wake_write = os.pipe()
+        self.selector.register(self.wake_read, selectors.EVENT_READ, None)
+
+        self.thread = threading.Thread(target=self.__serve, daemon=True)
+        self.thread.start()
+
+
+    def add(self, serial_number=None, **faults):
+        '''
+        Create a simulated instrument on a new pseudo-terminal.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        serial_number (string): Reported by *IDN?. Defaults to SIM000001, SIM000002, ...
+        faults (keyword arguments): Passed to SimulatedBK9141. Ex.: latency=0.005, drop_rate=0.1
+
+        Returns
+        -------
+        Device path to open, Ex.: "/dev/pts/7"
+
+        '''
+        import pty
+        import tty
+
+        master, slave = pty.openpty()
+        tty.setraw(slave)  # No echo, no line-ending translation
+        os.set_blocking(master, False)
+
+        with self.lock:
+            serial_number = serial_number or f'SIM{len(self.instruments) + 1:06d}'
+            instrument = SimulatedBK9141(serial_number, **faults)
+            path = os.ttyname(slave)
+            self.instruments[path] = (instrument, master, slave)
+            self.selector.register(master, selectors.EVENT_READ, [instrument, bytearray(), slave, 0])
+        os.write(self.wake_write, b'x')
+        return path
+
+
+    def instrument(self, path):
+        '''
+        Look up the simulated instrument behind a device path, Ex.: to inspect its state or change its faults.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        path (string): Device path returned by add()
+
+        Returns
+        -------
+        SimulatedBK9141 object
+
+        '''
+        return self.instruments[path][0]
+
+
+    def list_ports(self):
+        '''
+        Port descriptions of the simulated instruments, in the form serial.tools.list_ports.comports() returns.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        List of serial.tools.list_ports_common.ListPortInfo objects
+
+        '''
+        from serial.tools.list_ports_common import ListPortInfo
+
+        ports = []
+        for path, (instrument, _, _) in self.instruments.items():
+            port = ListPortInfo(path, skip_link_detection=True)
+            port.description = 'Simulated BK Precision 9141'
+            port.hwid = f'SIM::{instrument.serial_number}'
+            port.serial_number = instrument.serial_number
+            port.manufacturer = 'B&K Precision (simulated)'
+            port.product = '9141'
+            ports.append(port)
+        return ports
+
+
+    def install_port_listing(self):
+        '''
+        Make serial.tools.list_ports.comports() also report the simulated instruments, so port listing code (Ex.: CheckPorts) finds them unchanged.
+        Pseudo-terminals are otherwise invisible to comports(). Undone by close().
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        from serial.tools import list_ports
+
+        if getattr(self, 'original_comports', None) is not None:
+            return
+
+        self.original_comports = list_ports.comports
+        list_ports.comports = lambda *args, **kwargs: self.original_comports(*args, **kwargs) + self.list_ports()
+
+
+    def close(self):
+        '''
+        Stop serving and close every pseudo-terminal.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        if getattr(self, 'original_comports', None) is not None:
+            from serial.tools import list_ports
+            list_ports.comports = self.original_comports
+            self.original_comports = None
+
+        self.running = False
+        os.write(self.wake_write, b'x')
+        self.thread.join()
+
+        for _, master, slave in self.instruments.values():
+            os.close(master)
+            os.close(slave)
+        self.instruments.clear()
+        os.close(self.wake_read)
+        os.close(self.wake_write)
+        self.selector.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc, trace):
+        self.close()
+
+
+    def __serve(self):
+        '''
+        Thread body: read commands from every instrument, and send replies once their delay has passed.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        while self.running:
+            with self.lock:
+                timeout = max(0.0, self.pending[0][0] - time.monotonic()) if self.pending else None
+
+            for key, _ in self.selector.select(timeout):
+                if key.data is None:
+                    os.read(self.wake_read, 4096)
+                    continue
+
+                instrument, buffer, slave, _ = key.data
+                try:
+                    received = os.read(key.fd, 4096)
+                except BlockingIOError:
+                    continue
+                except OSError:  # Pseudo-terminal closed
+                    self.selector.unregister(key.fd)
+                    continue
+
+                # Sent at the wrong baud rate: the instrument only sees noise
+                if instrument.baudrate and SimulatorBank.host_baudrate(slave) != instrument.baudrate:
+                    continue
+                buffer += received
+                key.data[3] += len(received)  # Command bytes on the wire, charged to the next reply
+
+                # Commands end with "\r" (this application) or "\n" (other SCPI clients)
+                while True:
+                    ends = [index for index in (buffer.find(b'\r'), buffer.find(b'\n')) if index >= 0]
+                    if not ends:
+                        break
+                    line = bytes(buffer[:min(ends)])
+                    del buffer[:min(ends) + 1]
+
+                    reply = instrument.handle_line(line.decode(errors='replace'))
+                    if reply is not None:
+                        reply = f'{reply}\n'.encode()
+                        self.__schedule(key.fd, instrument.reply_delay(), reply, instrument.wire_time(key.data[3] + len(reply)))
+                        key.data[3] = 0
+
+            # Send every reply that is due
+            now = time.monotonic()
+            with self.lock:
+                while self.pending and self.pending[0][0] <= now:
+                    _, _, master, reply = heapq.heappop(self.pending)
+                    try:
+                        os.write(master, reply)
+                    except OSError:
+                        pass
+
+
+    @staticmethod
+    def host_baudrate(slave):
+        '''
+        Baud rate the host application opened a pseudo-terminal at. Both ends of a pseudo-terminal share one set of terminal settings.
+
+        Parameters
+        ----------
+        slave (int): Pseudo-terminal slave file descriptor
+
+        Returns
+        -------
+        Baud rate, or None if it is not a standard rate
+
+        '''
+        import termios
+
+        speed = termios.tcgetattr(slave)[5]  # Output speed, as a termios.B* constant
+        return next((rate for rate in (300, 1200, 2400, 4800, 9600, 19200, 38400, 57600, 115200, 230400) if getattr(termios, f'B{rate}', None) == speed), None)
+
+
+    def __schedule(self, master, delay, reply, wire_time=0.0):
+        '''
+        Queue a reply for sending after delay seconds, never ahead of an earlier reply from the same instrument.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        master (int): Pseudo-terminal master file descriptor
+        delay (float): Seconds
+        reply (bytes): Reply, terminator included
+        wire_time (float): Seconds the command + reply bytes occupy the serial line. Queues behind earlier replies, like the real line
+
+        Returns
+        -------
+        None
+
+        '''
+        with self.lock:
+            due = max(time.monotonic() + delay, self.last_due.get(master, 0.0)) + wire_time
+            self.last_due[master] = due
+            self.sequence += 1
+            heapq.heappush(self.pending, (due, self.sequence, master, reply))
+
+
+if __name__ == '__main__':
+    arguments = [float(argument) for argument in sys.argv[1:6]]
+    count = int(arguments[0]) if arguments else 1
+    latency, jitter = (arguments[1:3] + [0.0, 0.0])[:2]
+    drop_rate, wrong_readback_rate = (arguments[3:5] + [0.0, 0.0])[:2]
+
+    bank = SimulatorBank()
+    for _ in range(count):
+        print(bank.add(latency=latency / 1000, jitter=jitter / 1000, drop_rate=drop_rate, wrong_readback_rate=wrong_readback_rate))
+
+    print('Serving simulated BK Precision 9141 instruments. Ctrl+C to stop.')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        bank.close()
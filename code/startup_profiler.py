@@ -0,0 +1,102 @@
+'''
+Module to time the application's startup, phase by phase.
+
+Opt in with the --profile-startup argument, or the REMOTE_CONTROL_PROFILE=1 environment variable.
+The report is printed to the console and written to startup_profile.json.
+'''
+import json
+import os
+import sys
+import time
+
+
+class StartupProfiler():
+    '''
+    Class containing named timestamps taken during startup. Taking them always costs next to nothing; only the report is opt-in.
+    '''
+
+    def __init__(self, start_time=None):
+        '''
+        Start timing.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        start_time (float): time.perf_counter() at launch. Defaults to now
+
+        Returns
+        -------
+        None
+
+        '''
+        self.start_time = time.perf_counter() if start_time is None else start_time
+        self.marks = []  # (phase name, time.perf_counter())
+        self.enabled = '--profile-startup' in sys.argv or os.environ.get('REMOTE_CONTROL_PROFILE', '') not in ('', '0')
+
+
+    def mark(self, phase):
+        '''
+        Record the end of a startup phase. Only the first mark of each phase counts.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        phase (string): Ex.: "imports"
+
+        Returns
+        -------
+        None
+
+        '''
+        if all(name != phase for name, _ in self.marks):
+            self.marks.append((phase, time.perf_counter()))
+
+
+    def phases(self):
+        '''
+        Duration of every phase, from the end of the one before it.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        Dictionary of {phase: {'seconds': phase duration, 'since_launch': seconds from launch to the end of the phase}}, in mark order
+
+        '''
+        phases = {}
+        previous = self.start_time
+        for phase, timestamp in self.marks:
+            phases[phase] = {'seconds': timestamp - previous, 'since_launch': timestamp - self.start_time}
+            previous = timestamp
+        return phases
+
+
+    def report(self, path='startup_profile.json'):
+        '''
+        Print the phase table, and write it to a JSON file. Does nothing unless profiling was opted into.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        path (string): JSON output file. None skips writing it
+
+        Returns
+        -------
+        Report text, or None if profiling is not enabled
+
+        '''
+        if not self.enabled:
+            return None
+
+        phases = self.phases()
+        lines = ['Startup profile', f'{"Phase":<20}{"Phase ms":>12}{"Since launch ms":>18}']
+        lines += [f'{phase:<20}{timing["seconds"] * 1000:>12.1f}{timing["since_launch"] * 1000:>18.1f}' for phase, timing in phases.items()]
+        text = '\n'.join(lines)
+        print(text)
+
+        if path:
+            with open(path, 'w', encoding='utf-8') as profile_file:
+                json.dump(phases, profile_file, indent=4)
+        return text
@@ -0,0 +1,217 @@
+'''
+Module to collect status messages from any thread, and hand them to the GUI in batches.
+
+Two ways to emit, through any update_status_callback:
+    update_status_callback('<p style="...">Ready-made HTML</p>')                  Formatted as-is
+    update_status_callback('{port}: PASS in {latency:.1f} ms', 'info', port='COM5', latency=12.3)   Structured record
+Structured records are only turned into HTML if they reach the screen. Every record is also written to a plain-text file.
+'''
+import html
+import json
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+
+
+# HTML wrapper per record level. {} receives the formatted message
+LEVEL_TEMPLATES = {
+    'heading': '<p style="font-size:12px; color:#DADADA; font-weight: bold;">{}</p>',
+    'info': '<p style="font-size:11px; color:#DADADA;">{}</p>',
+    'detail': '<p style="font-size:11px; color:#6b6b6b;">{}</p>',
+    'error': '<p style="font-size:11px; color:#D60000;">&lt;!&gt; <span style="color:#DADADA">{}</span></p>',
+}
+
+TAG_PATTERN = re.compile(r'<br\s*/?>|<[^>]+>|\002')  # Markup removed for the plain-text file
+
+
+class StatusLog():
+    '''
+    Class containing a thread-safe queue of status records, drained by the GUI on a timer, plus a plain-text file of every record.
+    The queue is bounded: if the GUI falls behind, the oldest records are dropped from the screen only, never from the file.
+    '''
+
+    def __init__(self, directory='status_logs', maximum_pending=5000, maximum_file_bytes=10_000_000):
+        '''
+        Create an empty log. The file is created on the first record.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        directory (string): Folder for the plain-text files. None disables them
+        maximum_pending (int): Records held for the screen between drains. Match the status box block limit
+        maximum_file_bytes (int): Size at which a new file is started
+
+        Returns
+        -------
+        None
+
+        '''
+        self.directory = None if directory is None else Path(directory)
+        self.maximum_file_bytes = maximum_file_bytes
+        self.pending = deque(maxlen=maximum_pending)  # (message, level, fields)
+        self.dropped = 0  # Records pushed out of pending before they were drained
+        self.file = None
+        self.lock = threading.Lock()
+
+
+    def __call__(self, message, level=None, **fields):
+        '''
+        Emit one record. Thread-safe, and cheap: no HTML is built here.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        message (string): Ready-made HTML when level is None. Otherwise a str.format template, filled from fields
+        level (string): None, or a LEVEL_TEMPLATES key
+        fields (keyword arguments): Values for the message template, also written to the file
+
+        Returns
+        -------
+        None
+
+        '''
+        plain = StatusLog.plain_text(message, level, fields)
+        with self.lock:
+            if len(self.pending) == self.pending.maxlen:
+                self.dropped += 1
+            self.pending.append((message, level, fields))
+
+            if self.directory is not None and plain:
+                self.__write(f'{datetime.now().isoformat(timespec="milliseconds")} {(level or "html"):7} {plain}' + (f' {json.dumps(fields, default=str)}' if fields else '') + '\n')
+
+
+    @staticmethod
+    def render(message, level=None, fields=None):
+        '''
+        Turn one record into status box HTML.
+
+        Parameters
+        ----------
+        message (string): As given to __call__
+        level (string): As given to __call__
+        fields (dictionary): As given to __call__
+
+        Returns
+        -------
+        HTML string
+
+        '''
+        if level is None:
+            return message
+
+        if fields:
+            message = message.format(**{key: html.escape(value) if isinstance(value, str) else value for key, value in fields.items()})
+        return LEVEL_TEMPLATES.get(level, LEVEL_TEMPLATES['info']).format(message)
+
+
+    @staticmethod
+    def plain_text(message, level=None, fields=None):
+        '''
+        Turn one record into a single line of text, without markup.
+
+        Parameters
+        ----------
+        message (string): As given to __call__
+        level (string): As given to __call__
+        fields (dictionary): As given to __call__
+
+        Returns
+        -------
+        String
+
+        '''
+        text = html.unescape(TAG_PATTERN.sub(' ', message))
+        if level is not None and fields:
+            text = text.format(**fields)  # After removing markup, so markup-like field values survive
+        return ' '.join(text.split())
+
+
+    def drain(self):
+        '''
+        Take every pending record, as one block of HTML for a single appendHtml call. Call from the GUI thread.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        HTML string. Empty if nothing was pending
+
+        '''
+        with self.lock:
+            records = list(self.pending)
+            self.pending.clear()
+            dropped, self.dropped = self.dropped, 0
+
+        if not records:
+            return ''
+
+        parts = [StatusLog.render(*record) for record in records]
+        if dropped:
+            location = f', see {self.file.name}' if self.file is not None else ''
+            parts.insert(0, StatusLog.render('[{dropped} earlier lines not shown{location}]', 'detail', {'dropped': dropped, 'location': location}))
+        return ''.join(parts)
+
+
+    def flush(self):
+        '''
+        Push written records to disk.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+
+
+    def close(self):
+        '''
+        Close the current file.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+    def __write(self, line):
+        '''
+        Append a line to the current file, starting a new file when it is full. Call with the lock held.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        line (string): Text line, newline included
+
+        Returns
+        -------
+        None
+
+        '''
+        if self.file is None or self.file.tell() >= self.maximum_file_bytes:
+            if self.file is not None:
+                self.file.close()
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self.file = open(self.directory / f'status_{time.strftime("%Y%m%d_%H%M%S")}.log', 'a', encoding='utf-8')
+
+        self.file.write(line)
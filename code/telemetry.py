@@ -0,0 +1,470 @@
+'''
+Module to stream measurements from the power supply into a bounded, in-memory telemetry store.
+'''
+import threading
+import time
+
+import numpy as np
+import serial
+from serial_sessions import serial_sessions
+
+
+# Measurement queries, in column order of the telemetry store
+MEASUREMENTS = ('MEAS:VOLT?', 'MEAS:CURR?', 'MEAS:POW?')
+CHANNELS = ('voltage', 'current', 'power')
+
+
+class RingBuffer():
+    '''
+    Class containing a preallocated, fixed-capacity store of timestamped samples backed by NumPy arrays.
+    The oldest samples are overwritten once full, so memory use never grows during long soak tests.
+    '''
+
+    def __init__(self, capacity=500000, channels=CHANNELS):
+        '''
+        Allocate the sample arrays up front.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        capacity (int): Number of samples kept. 500000 samples of 3 channels is 16 MB
+        channels (tuple): Channel names, one column each
+
+        Returns
+        -------
+        None
+
+        '''
+        self.capacity = capacity
+        self.channels = channels
+        self.times = np.zeros(capacity, dtype=np.float64)  # time.time() seconds
+        self.values = np.zeros((capacity, len(channels)), dtype=np.float64)
+        self.total = 0  # Samples ever appended, including overwritten ones
+        self.lock = threading.Lock()
+
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+
+    def append(self, timestamp, values):
+        '''
+        Store one sample, overwriting the oldest once the buffer is full.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        timestamp (float): time.time() seconds
+        values (sequence): One value per channel
+
+        Returns
+        -------
+        None
+
+        '''
+        with self.lock:
+            index = self.total % self.capacity
+            self.times[index] = timestamp
+            self.values[index] = values
+            self.total += 1
+
+
+    def latest(self, count=None):
+        '''
+        Copy the newest samples out, in chronological order.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        count (int): Number of samples wanted. Defaults to everything held
+
+        Returns
+        -------
+        (times, values) tuple of NumPy arrays, shapes (n,) and (n, channels)
+
+        '''
+        with self.lock:
+            held = min(self.total, self.capacity)
+            count = held if count is None else min(count, held)
+            end = self.total % self.capacity
+            start = end - count
+
+            if start >= 0:
+                return self.times[start:end].copy(), self.values[start:end].copy()
+
+            # Wrapped around the end of the arrays: stitch the two pieces together
+            return (np.concatenate((self.times[start:], self.times[:end])),
+                    np.concatenate((self.values[start:], self.values[:end])))
+
+
+    def since(self, timestamp):
+        '''
+        Copy out every held sample taken at or after timestamp, in chronological order.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        timestamp (float): time.time() seconds
+
+        Returns
+        -------
+        (times, values) tuple of NumPy arrays
+
+        '''
+        return self.between(timestamp, np.inf)
+
+
+    def between(self, start, end):
+        '''
+        Copy out every held sample taken from start up to (not including) end, in chronological order.
+        Only the requested range is copied, found by binary search.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        start (float): time.time() seconds
+        end (float): time.time() seconds
+
+        Returns
+        -------
+        (times, values) tuple of NumPy arrays
+
+        '''
+        with self.lock:
+            ranges = [(first + np.searchsorted(self.times[first:last], start, side='left'),
+                       first + np.searchsorted(self.times[first:last], end, side='left'))
+                      for first, last in self.__segments()]
+            return (np.concatenate([self.times[low:high] for low, high in ranges]),
+                    np.concatenate([self.values[low:high] for low, high in ranges]))
+
+
+    def count_between(self, start, end):
+        '''
+        Count held samples taken from start up to (not including) end, without copying them.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        start (float): time.time() seconds
+        end (float): time.time() seconds
+
+        Returns
+        -------
+        int
+
+        '''
+        with self.lock:
+            return sum(int(np.searchsorted(self.times[first:last], end, side='left') - np.searchsorted(self.times[first:last], start, side='left'))
+                       for first, last in self.__segments())
+
+
+    def oldest(self):
+        '''
+        Timestamp of the oldest held sample.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        float, or inf if the buffer is empty
+
+        '''
+        with self.lock:
+            if self.total == 0:
+                return np.inf
+            return float(self.times[0 if self.total <= self.capacity else self.total % self.capacity])
+
+
+    def __segments(self):
+        '''
+        Index ranges of the held samples, oldest first. One range before the buffer wraps, two after. Call with the lock held.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        List of (first, last) index tuples. Each range is in chronological order on its own
+
+        '''
+        if self.total <= self.capacity:
+            return [(0, self.total)]
+
+        end = self.total % self.capacity
+        return [(end, self.capacity), (0, end)]
+
+
+    def statistics(self, window=None):
+        '''
+        Rolling statistics per channel, computed in vectorized form.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        window (float): Only use samples from the last window seconds. Defaults to everything held
+
+        Returns
+        -------
+        Dictionary of {channel: {'min', 'max', 'mean', 'rms'}}, plus 'count'. Channel values are NaN when no samples exist
+
+        '''
+        if window is None:
+            _, values = self.latest()
+        else:
+            _, values = self.since(time.time() - window)
+
+        if len(values) == 0:
+            empty = {'min': np.nan, 'max': np.nan, 'mean': np.nan, 'rms': np.nan}
+            return {'count': 0, **{channel: dict(empty) for channel in self.channels}}
+
+        minimums = values.min(axis=0)
+        maximums = values.max(axis=0)
+        means = values.mean(axis=0)
+        rms = np.sqrt(np.mean(np.square(values), axis=0))
+
+        statistics = {'count': len(values)}
+        for column, channel in enumerate(self.channels):
+            statistics[channel] = {'min': minimums[column], 'max': maximums[column], 'mean': means[column], 'rms': rms[column]}
+        return statistics
+
+
+class DecimatedRingBuffer(RingBuffer):
+    '''
+    Class containing a RingBuffer plus a pyramid of min/max summaries, each level factor times coarser than the one below.
+    A plot of any time span reads from the coarsest level that still resolves one screen column, so redrawing a 24-hour capture costs the same as redrawing a 1-minute one.
+    Coarse levels hold far more history than the raw samples do, so long captures stay viewable after the raw samples are overwritten.
+    '''
+
+    def __init__(self, capacity=500000, channels=CHANNELS, factor=8, levels=6, level_capacity=16384):
+        '''
+        Allocate the raw sample arrays and every summary level up front.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        capacity (int): Number of raw samples kept
+        channels (tuple): Channel names, one column each
+        factor (int): Entries of one level summarized by a single entry of the level above
+        levels (int): Number of summary levels
+        level_capacity (int): Entries kept per summary level. Level n covers level_capacity * factor**n raw samples
+
+        Returns
+        -------
+        None
+
+        '''
+        RingBuffer.__init__(self, capacity, channels)
+        self.factor = factor
+
+        # Summary level columns: every channel's minimum, then every channel's maximum
+        summary_channels = tuple(f'{channel}_min' for channel in channels) + tuple(f'{channel}_max' for channel in channels)
+        self.levels = [RingBuffer(level_capacity, summary_channels) for _ in range(levels)]
+
+        # Partially filled summary entry per level: [start time, count, minimums, maximums]
+        self.pending = [[0.0, 0, None, None] for _ in range(levels)]
+
+
+    def append(self, timestamp, values):
+        '''
+        Store one sample, then fold it into the summary levels. Amortized cost is constant per sample.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        timestamp (float): time.time() seconds
+        values (sequence): One value per channel
+
+        Returns
+        -------
+        None
+
+        '''
+        RingBuffer.append(self, timestamp, values)
+
+        values = np.asarray(values, dtype=np.float64)
+        minimums, maximums = values, values
+        for level, pending in zip(self.levels, self.pending):
+            if pending[1] == 0:
+                pending[:] = [timestamp, 1, minimums, maximums]
+            else:
+                pending[1] += 1
+                pending[2] = np.minimum(pending[2], minimums)
+                pending[3] = np.maximum(pending[3], maximums)
+
+            if pending[1] < self.factor:
+                return
+
+            # Entry complete: store it, and carry its summary up a level
+            timestamp, minimums, maximums = pending[0], pending[2], pending[3]
+            level.append(timestamp, np.concatenate((minimums, maximums)))
+            pending[1] = 0
+
+
+    def envelope(self, start, end, columns, channel=0):
+        '''
+        Minimum and maximum of one channel within each of columns equal time slices of [start, end).
+        Reads from the coarsest level that still gives at least ~2 entries per column, so cost depends on columns, not on the time span.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        start (float): time.time() seconds
+        end (float): time.time() seconds
+        columns (int): Number of time slices. Ex.: the plot width in pixels
+        channel (int): Channel column index
+
+        Returns
+        -------
+        (times, minimums, maximums) tuple of NumPy arrays, one entry per non-empty slice. times are slice centers
+
+        '''
+        # Finest level that both covers the start of the span (or of the capture, if that is later) and is not needlessly detailed
+        stores = [self] + self.levels
+        first_sample = max(start, min(store.oldest() for store in stores))
+        chosen = len(stores) - 1
+        for index, store in enumerate(stores):
+            if store.oldest() <= first_sample and store.count_between(start, end) <= 4 * columns:
+                chosen = index
+                break
+
+        store = stores[chosen]
+        times, values = store.between(start, end)
+        if chosen == 0:
+            minimums = maximums = values[:, channel]
+        else:
+            minimums, maximums = values[:, channel], values[:, len(self.channels) + channel]
+
+        if len(times) == 0:
+            return times, minimums, maximums
+
+        # Bin by time, reducing each non-empty bin in one vectorized pass
+        edges = np.linspace(start, end, columns + 1)
+        bounds = np.searchsorted(times, edges)
+        non_empty = np.diff(bounds) > 0
+        firsts = bounds[:-1][non_empty]
+        centers = (edges[:-1][non_empty] + edges[1:][non_empty]) / 2
+        return centers, np.minimum.reduceat(minimums, firsts), np.maximum.reduceat(maximums, firsts)
+
+
+class TelemetryStream(threading.Thread):
+    '''
+    Class containing a background thread that polls MEAS:VOLT?, MEAS:CURR? and MEAS:POW? as fast as the link allows.
+    All three queries go out in one write, and their replies are read back together, so each sample costs one round-trip.
+    The port is shared through the session pool, so "Go!" commands interleave with streaming instead of colliding with it.
+    '''
+
+    def __init__(self, com_port, buffer, sessions=serial_sessions, interval=0.0, session_log=None):
+        '''
+        Configure the stream. The thread itself starts with start().
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+        com_port (string): Name of the serial port. Ex.: "COM5"
+        buffer (RingBuffer): Where samples are stored
+        sessions (SerialSessions): Pool of open serial port sessions. Defaults to the shared pool in serial_sessions.py
+        interval (float): Minimum seconds between samples. 0 polls as fast as possible
+        session_log (SessionLog): Optional binary log receiving one record per measurement
+
+        Returns
+        -------
+        None
+
+        '''
+        threading.Thread.__init__(self, daemon=True)
+        self.com_port = com_port
+        self.buffer = buffer
+        self.sessions = sessions
+        self.interval = interval
+        self.session_log = session_log
+        self.stop_event = threading.Event()
+        self.samples = 0
+        self.dropped = 0
+        self.error = None  # Set to the exception that ended the stream, if any
+        self.rate_mark = (time.monotonic(), 0)  # (time, samples) at the last sample_rate() call
+
+
+    def stop(self):
+        '''
+        Ask the thread to finish after its current sample, and wait for it.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        self.stop_event.set()
+        self.join()
+
+
+    def sample_rate(self):
+        '''
+        Samples per second since the previous call.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        float
+
+        '''
+        now, samples = time.monotonic(), self.samples
+        then, samples_then = self.rate_mark
+        self.rate_mark = (now, samples)
+        return (samples - samples_then) / (now - then) if now > then else 0.0
+
+
+    def run(self):
+        '''
+        Thread body. Overrides threading.Thread.run.
+
+        Parameters
+        ----------
+        self: Represents the instance of the Class
+
+        Returns
+        -------
+        None
+
+        '''
+        while not self.stop_event.is_set():
+            started = time.monotonic()
+            try:
+                with self.sessions.session(self.com_port) as ser:
+                    # Terminator from the instrument's link profile
+                    command = ''.join(f'{query}{ser.terminator}' for query in MEASUREMENTS).encode()
+                    sent = time.perf_counter()
+                    ser.write(command)
+                    replies = [ser.readline() for _ in MEASUREMENTS]
+                    timestamp = time.time()
+                    latency = time.perf_counter() - sent
+
+                    try:
+                        values = [float(reply.decode()) for reply in replies]
+                    except ValueError:
+                        # Missing/partial reply: count it, and drop anything late so the next sample starts clean
+                        self.dropped += 1
+                        ser.reset_input_buffer()
+                        continue
+
+            except (serial.serialutil.SerialException, OSError) as error:
+                self.error = error
+                return
+
+            self.buffer.append(timestamp, values)
+            if self.session_log is not None:
+                for query, value in zip(MEASUREMENTS, values):
+                    self.session_log.append(self.com_port, query, readback=value, latency=latency)
+            self.samples += 1
+
+            if self.interval:
+                self.stop_event.wait(max(0.0, self.interval - (time.monotonic() - started)))
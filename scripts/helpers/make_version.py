@@ -11,7 +11,12 @@ exe_remote_control = 'bin\\bin\\RemoteControl\\RemoteControl.exe'
 
 # Generates key from CONTENTS of .exe file, and not just the path itself
 # Base64-encoded 32-bit byte-type key is required for Fernet.encrypt - blake2s allows 32-bit specification with byte-type digest
-key = hashlib.blake2s(open(exe_remote_control, 'rb').read(), digest_size=32).digest()
+# Hashed 1 MB at a time, so memory use does not grow with the .exe size. Same digest as hashing the whole file at once. code\build_integrity.py hashes the same way at runtime
+digest = hashlib.blake2s(digest_size=32)
+with open(exe_remote_control, 'rb') as exe_file:
+    for chunk in iter(lambda: exe_file.read(1024 * 1024), b''):
+        digest.update(chunk)
+key = digest.digest()
 
 # Fernet documentation says .encrypt returns "URL-safe base64-encoded" byte-type object inherently. This line was needed anyway
 # Encodes byte-type objects to base64
@@ -0,0 +1,25 @@
+'''
+Shared test setup: makes the flat modules in code/ importable, and provides simulated instruments.
+
+Run from the project root with:
+    python -m pytest
+'''
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'code'))
+
+
+@pytest.fixture
+def bank():
+    '''
+    Pty-backed simulator bank (see simulator.py), closed after the test. POSIX only.
+    '''
+    if os.name != 'posix':
+        pytest.skip('The simulator needs pseudo-terminals (POSIX only)')
+
+    from simulator import SimulatorBank
+    with SimulatorBank() as simulator_bank:
+        yield simulator_bank
@@ -0,0 +1,107 @@
+'''
+Tests for async_driver.py, against simulated instruments: verified setpoints, channel selection, link profile terminators, and sharing one port between driver objects.
+'''
+import asyncio
+
+import pytest
+import serial
+
+from async_driver import AsyncBK9141, AsyncSerialTransport, ConfirmationError
+from link_profiles import LinkProfiles
+
+
+def recording_factory(opened, writes):
+    '''
+    Serial factory that counts opened ports and records every write.
+    '''
+    def open_port(*args, **kwargs):
+        ser = serial.Serial(*args, **kwargs)
+        opened.append(ser)
+        write = ser.write
+        ser.write = lambda data: writes.append(data) or write(data)
+        return ser
+    return open_port
+
+
+def test_set_voltage_is_verified_within_resolution(bank):
+    port = bank.add()
+
+    async def main():
+        async with AsyncBK9141(port) as supply:
+            return await supply.set_voltage(1.0004), await supply.set_current(0.5), await supply.identify()
+
+    volts, amps, identity = asyncio.run(main())
+
+    assert (volts, amps) == (1.0, 0.5)  # 1.0004 reads back as 1.000: confirmed, not a mismatch
+    assert identity.startswith('B&K Precision, 9141')
+
+
+def test_wrong_read_back_raises(bank):
+    port = bank.add(wrong_readback_rate=1.0)
+
+    async def main():
+        async with AsyncBK9141(port) as supply:
+            await supply.set_voltage(5.0)
+
+    with pytest.raises(ConfirmationError):
+        asyncio.run(main())
+
+
+def test_silent_instrument_times_out(bank):
+    port = bank.add(drop_rate=1.0)
+
+    async def main():
+        async with AsyncBK9141(port, timeout=0.2) as supply:
+            await supply.measure_voltage()
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(main())
+
+
+def test_drivers_for_different_channels_share_a_port(bank):
+    port = bank.add()
+    opened, writes = [], []
+    factory = recording_factory(opened, writes)
+
+    async def main():
+        async with AsyncBK9141(port, channel=1, transport=AsyncSerialTransport(port, serial_factory=factory)) as first, \
+                AsyncBK9141(port, channel=2, transport=AsyncSerialTransport(port, serial_factory=factory)) as second:
+            await asyncio.gather(first.set_voltage(5.0), second.set_voltage(7.0))
+            await first.set_current(1.0)
+            await first.set_current(0.5)
+
+    asyncio.run(main())
+
+    instrument = bank.instrument(port)
+    assert len(opened) == 1
+    assert not opened[0].is_open  # Closed with the last driver object
+    assert (instrument.channels[1]['VOLT'], instrument.channels[2]['VOLT']) == (5.0, 7.0)
+    assert instrument.channels[1]['CURR'] == 0.5
+    assert writes[-1] == b'CURR 0.5\rCURR?\r'  # Channel 1 was already selected
+
+
+def test_port_is_reusable_from_another_event_loop(bank):
+    port = bank.add()
+    supply = AsyncBK9141(port)
+
+    async def main(volts):
+        async with supply:
+            return await supply.set_voltage(volts)
+
+    assert asyncio.run(main(3.0)) == 3.0
+    assert asyncio.run(main(4.0)) == 4.0
+
+
+def test_terminators_come_from_the_link_profile(bank):
+    port = bank.add()
+    profiles = LinkProfiles(path=None)
+    profiles.remember(port, hwid='', terminator='\n')
+    opened, writes = [], []
+
+    async def main():
+        transport = AsyncSerialTransport(port, serial_factory=recording_factory(opened, writes))
+        async with AsyncBK9141(port, transport=transport, profiles=profiles) as supply:
+            return await supply.query('VOLT?')
+
+    assert asyncio.run(main()) == '0.000'
+    assert writes == [b'VOLT?\n']
@@ -0,0 +1,56 @@
+'''
+Tests for build_integrity.py: a version.dat from the same build decrypts and is cached, anything else reads as 00000000 and is not.
+'''
+import base64
+
+from cryptography.fernet import Fernet
+
+from build_integrity import BuildIntegrity
+
+
+def build(tmp_path, version=b'20261017'):
+    '''
+    Write an application .exe, and a version.dat encrypted with its key as make_version.py does. Returns the three paths version() takes.
+    '''
+    exe_path, version_path, cache_path = tmp_path / 'RemoteControl.exe', tmp_path / 'version.dat', tmp_path / 'integrity_cache.json'
+    exe_path.write_bytes(b'MZ' + bytes(range(256)) * 64)
+    key_64 = base64.urlsafe_b64encode(BuildIntegrity.file_key(exe_path))
+    version_path.write_bytes(Fernet(key_64).encrypt(version))
+    return str(exe_path), str(version_path), str(cache_path)
+
+
+def test_same_build_decrypts_then_reads_from_the_cache(tmp_path):
+    paths = build(tmp_path)
+
+    assert BuildIntegrity.version(*paths)[0] == '20261017'
+    version, details = BuildIntegrity.version(*paths)
+    assert version == '20261017'
+    assert details['cached']
+
+
+def test_version_from_another_build_is_rejected_and_not_cached(tmp_path):
+    exe_path, version_path, cache_path = build(tmp_path)
+    with open(exe_path, 'ab') as exe_file:
+        exe_file.write(b'rebuilt')
+
+    assert BuildIntegrity.version(exe_path, version_path, cache_path)[0] == '00000000'
+    assert not (tmp_path / 'integrity_cache.json').exists()
+
+
+def test_garbled_version_file_is_rejected(tmp_path):
+    exe_path, version_path, cache_path = build(tmp_path)
+    with open(version_path, 'wb') as version_file:
+        version_file.write(b'not a token')
+
+    assert BuildIntegrity.version(exe_path, version_path, cache_path)[0] == '00000000'
+
+
+def test_version_that_is_not_text_is_rejected(tmp_path):
+    assert BuildIntegrity.version(*build(tmp_path, b'\xff\xfe'))[0] == '00000000'
+
+
+def test_missing_files(tmp_path):
+    exe_path, version_path, cache_path = build(tmp_path)
+
+    assert BuildIntegrity.version(str(tmp_path / 'missing.exe'), version_path, cache_path)[0] == '00000001'
+    assert BuildIntegrity.version(exe_path, str(tmp_path / 'missing.dat'), cache_path)[0] == '00000000'
@@ -0,0 +1,95 @@
+'''
+Tests for channel_state.py, and the commands ScpiTransaction leaves out because of it.
+'''
+from channel_state import ChannelState
+from scpi_transaction import ScpiTransaction
+from test_scpi_transaction import ScriptedLink
+
+
+def test_unknown_is_never_a_match():
+    state = ChannelState()
+
+    assert not state.matches(1, 'VOLT', 12)
+    assert not state.matches(None, 'VOLT', 12)
+
+
+def test_confirmed_setpoints_match_by_value():
+    state = ChannelState()
+    state.confirm(1, 'VOLT', '12.000')
+
+    assert state.matches(1, 'VOLT', 12)
+    assert state.matches(1, 'VOLT', '12.0')
+    assert not state.matches(1, 'VOLT', 12.5)
+    assert not state.matches(2, 'VOLT', 12)
+    assert not state.matches(1, 'CURR', 12)
+
+
+def test_a_reply_that_is_not_a_number_forgets_the_setpoint():
+    state = ChannelState()
+    state.confirm(1, 'VOLT', 12)
+    state.confirm(1, 'VOLT', 'garbled')
+
+    assert not state.matches(1, 'VOLT', 12)
+
+
+def test_repeated_setpoint_sends_only_the_check_query():
+    state = ChannelState()
+    first = ScriptedLink([b'12.000\n'], state)
+    ScpiTransaction().select(1).set('VOLT', 12).query('VOLT?').run(first)
+
+    second = ScriptedLink([b'12.000\n'], state)
+    transaction = ScpiTransaction().select(1).set('VOLT', 12).query('VOLT?')
+    replies = transaction.run(second)
+
+    assert first.writes == [b'INST:SEL CH1\rVOLT 12\rVOLT?\r']
+    assert second.writes == [b'VOLT?\r']
+    assert transaction.skipped == ['INST:SEL CH1', 'VOLT 12']
+    assert replies == {'VOLT?': '12.000'}
+
+
+def test_fully_confirmed_transaction_without_queries_sends_nothing():
+    state = ChannelState()
+    ScpiTransaction().apply(2, 5.0, 0.5).run(ScriptedLink([b'1\n'], state))
+
+    link = ScriptedLink([], state)
+    replies = ScpiTransaction().apply(2, 5.0, 0.5).run(link)
+
+    assert link.writes == []
+    assert replies == {'*OPC?': '1'}
+
+
+def test_contradicting_read_back_resends_everything():
+    state = ChannelState()
+    ScpiTransaction().select(1).set('VOLT', 12).query('VOLT?').run(ScriptedLink([b'12.000\n'], state))
+
+    # Changed on the front panel since: the skipped set is contradicted by the read-back
+    link = ScriptedLink([b'9.000\n', b'12.000\n'], state)
+    replies = ScpiTransaction().select(1).set('VOLT', 12).query('VOLT?').run(link)
+
+    assert link.writes == [b'VOLT?\r', b'INST:SEL CH1\rVOLT 12\rVOLT?\r']
+    assert replies == {'VOLT?': '12.000'}
+    assert state.matches(1, 'VOLT', 12)
+
+
+def test_untracked_command_forgets_the_state():
+    state = ChannelState()
+    state.selected = 1
+    state.confirm(1, 'VOLT', 12)
+
+    link = ScriptedLink([b'1\n'], state)
+    ScpiTransaction().write('*RST').select(1).set('VOLT', 12).run(link)
+
+    assert link.writes == [b'*RST\rINST:SEL CH1\rVOLT 12\r*OPC?\r']
+    assert state.selected is None
+    assert not state.matches(1, 'VOLT', 12)
+
+
+def test_incomplete_reply_forgets_the_state():
+    state = ChannelState()
+    state.selected = 1
+    state.confirm(1, 'VOLT', 12)
+
+    ScpiTransaction().select(2).set('VOLT', 5).query('VOLT?').run(ScriptedLink([], state), retries=0)
+
+    assert state.selected is None
+    assert state.setpoints == {}
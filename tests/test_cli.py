@@ -0,0 +1,115 @@
+'''
+Tests for cli.py: exit codes, the JSON printed for results and errors, and that the command line never loads PyQt5.
+'''
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import cli
+from cli import CommandLine
+
+
+@pytest.fixture
+def run(tmp_path, monkeypatch, capsys):
+    '''
+    Run CommandLine.main() in an empty working directory (no link profiles, no fleet groups), and return (exit code, printed JSON).
+    '''
+    monkeypatch.chdir(tmp_path)
+
+    def run_main(*argv):
+        exit_code = CommandLine.main(list(argv))
+        return exit_code, json.loads(capsys.readouterr().out)
+    return run_main
+
+
+def test_verified_set_exits_ok(bank, run):
+    port = bank.add()
+
+    exit_code, result = run('set', '--port', port, '--channel', '2', '--volt', '12.0004', '--curr', '1', '--verify')
+
+    assert exit_code == cli.EXIT_OK
+    assert result['results'][0]['passed']
+    assert result['results'][0]['VOLT'] == {'set': 12.0004, 'read_back': 12.0, 'passed': True}
+    assert bank.instrument(port).channels[2]['VOLT'] == pytest.approx(12.0004)
+
+
+def test_set_outside_limits_sends_nothing(bank, run):
+    port = bank.add()
+
+    exit_code, result = run('set', '--port', port, '--volt', '75')
+
+    assert exit_code == cli.EXIT_LIMITS
+    assert result == {'command': 'set', 'error': 'Set voltage value not within instrument limits: 60.600 > V > 0'}
+    assert bank.instrument(port).channels[1]['VOLT'] == 0
+
+
+def test_failed_read_back_exits_with_the_verify_code(bank, run):
+    port = bank.add(wrong_readback_rate=1.0)
+
+    exit_code, result = run('set', '--port', port, '--volt', '5', '--verify')
+
+    assert exit_code == cli.EXIT_VERIFY
+    assert result['results'][0]['error'] == 'Confirmation failed'
+    assert result['results'][0]['VOLT']['read_back'] == 5.5
+
+
+def test_silent_instrument_exits_with_the_no_reply_code(bank, run):
+    port = bank.add(drop_rate=1.0)
+
+    exit_code, result = run('query', '--port', port, '--timeout', '0.2', 'VOLT?')
+
+    assert exit_code == cli.EXIT_NO_REPLY
+    assert result['results'][0]['error'] == 'No reply'
+    assert result['results'][0]['replies'] == {'VOLT?': ''}
+
+
+def test_port_that_cannot_be_opened_exits_with_the_communication_code(run, tmp_path):
+    exit_code, result = run('query', '--port', str(tmp_path / 'missing'), 'VOLT?')
+
+    assert exit_code == cli.EXIT_COMMUNICATION
+    assert result['results'][0]['error'].startswith('Could not communicate')
+
+
+@pytest.mark.parametrize('argv, error', [
+    (('set', '--port', '5'), 'Nothing to set: give --volt and/or --curr'),
+    (('set', '--port', '5', '--volt', 'twelve'), "could not convert string to float: 'twelve'"),
+    (('stream', '--port', '3-4'), 'stream takes exactly one port'),
+    (('negotiate', '--port', '5', '--connect'), 'negotiate needs the ports to itself: stop the instrument server, and run it without --connect'),
+])
+def test_usage_errors_print_json_and_exit_with_the_usage_code(run, argv, error):
+    exit_code, result = run(*argv)
+
+    assert exit_code == cli.EXIT_USAGE
+    assert result == {'command': argv[0], 'error': error}
+
+
+def test_missing_replay_trace_is_a_usage_error(run, tmp_path):
+    exit_code, result = run('query', '--port', '5', '--replay', str(tmp_path / 'missing.trace'))
+
+    assert exit_code == cli.EXIT_USAGE
+    assert result['command'] == 'query'
+
+
+def test_bad_arguments_exit_with_argparse_usage_code(run):
+    with pytest.raises(SystemExit) as exit_info:
+        run('set', '--volt', '5')
+
+    assert exit_info.value.code == cli.EXIT_USAGE
+
+
+def test_never_loads_pyqt5(bank, tmp_path):
+    port = bank.add()
+    code_directory = os.path.dirname(cli.__file__)
+    script = ('import json, sys\n'
+              'from cli import CommandLine\n'
+              f'exit_code = CommandLine.main(["set", "--port", {port!r}, "--volt", "3.3", "--verify"])\n'
+              'print(json.dumps({"exit_code": exit_code, "qt": sorted(name for name in sys.modules if name.split(".")[0] == "PyQt5")}))\n')
+
+    completed = subprocess.run([sys.executable, '-c', script], cwd=tmp_path, env={**os.environ, 'PYTHONPATH': code_directory},
+                               capture_output=True, text=True, timeout=30, check=False)
+
+    last_line = json.loads(completed.stdout.strip().splitlines()[-1])
+    assert last_line == {'exit_code': cli.EXIT_OK, 'qt': []}
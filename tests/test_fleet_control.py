@@ -0,0 +1,51 @@
+'''
+Tests for fleet_control.py: port list expansion, and set + verify fanned out across simulated instruments.
+'''
+import time
+
+import pytest
+
+from fleet_control import FleetControl
+from serial_sessions import SerialSessions
+
+
+def test_numbers_and_ranges_become_com_ports():
+    assert FleetControl.parse_ports('3-5, 8, /dev/ttyUSB0') == ['COM3', 'COM4', 'COM5', 'COM8', '/dev/ttyUSB0']
+
+
+def test_reversed_range_is_rejected():
+    with pytest.raises(ValueError, match='7-3'):
+        FleetControl.parse_ports('7-3')
+
+
+def test_groups_expand_to_their_members_without_duplicates():
+    groups = {'bench_a': '3-4', 'rack': ['bench_a', '4', '9']}
+
+    assert FleetControl.parse_ports('rack, 3, bench_a', groups) == ['COM3', 'COM4', 'COM9']
+
+
+def test_group_containing_itself_is_rejected():
+    groups = {'rack': ['bench_a'], 'bench_a': 'rack, 3'}
+
+    with pytest.raises(ValueError, match='contains itself'):
+        FleetControl.parse_ports('rack', groups)
+
+
+def test_apply_sets_and_verifies_every_instrument(bank):
+    ports = [bank.add(latency=0.2) for _ in range(3)]
+    wrong = bank.add(wrong_readback_rate=1.0)
+    sessions = SerialSessions(metrics=None)
+    try:
+        started = time.perf_counter()
+        results = FleetControl.apply(ports + [wrong], 'VOLT', '5.0', sessions, channel=2)
+        wall_time = time.perf_counter() - started
+        again = FleetControl.apply(ports, 'VOLT', '5.0', sessions, channel=2)
+    finally:
+        sessions.close_all()
+
+    assert [result['port'] for result in results] == ports + [wrong]
+    assert [result['passed'] for result in results] == [True, True, True, False]
+    assert results[3]['error'] == 'Confirmation failed'
+    assert all(bank.instrument(port).channels[2]['VOLT'] == 5.0 for port in ports)
+    assert wall_time < 0.5  # Concurrent: three 0.2 s instruments one after another would take over 0.6 s
+    assert [result['unchanged'] for result in again] == [True, True, True]  # Already set: only the check query is sent
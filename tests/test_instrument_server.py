@@ -0,0 +1,214 @@
+'''
+Tests for instrument_server.py: fair queueing, the read cache, the per-port scheduler threads, and RemoteSessions talking to a live server.
+'''
+import threading
+import time
+
+import pytest
+import serial
+
+from instrument_server import FairScheduler, InstrumentServer, RemoteLink, RemoteSessions
+from scpi_transaction import ScpiTransaction
+from serial_sessions import SerialSessions
+
+
+@pytest.fixture
+def start_server():
+    '''
+    Start an InstrumentServer on a free local port. Returns a function taking the cache TTL, and giving (server, client factory).
+    '''
+    servers, clients = [], []
+
+    def start(cache_ttl=0.25):
+        server = InstrumentServer(SerialSessions(metrics=None), ('127.0.0.1', 0), cache_ttl)
+        servers.append(server)
+        address = server.start()
+
+        def client(name, priority=0, timeout=5.0):
+            sessions = RemoteSessions(address, client_name=name, priority=priority, timeout=timeout)
+            clients.append(sessions)
+            return sessions
+        return server, client
+
+    yield start
+    for sessions in clients:
+        sessions.close_all()
+    for server in servers:
+        server.stop()
+
+
+def test_higher_priority_first_then_round_robin_between_clients():
+    scheduler = FairScheduler()
+    for job in ('script 1', 'script 2', 'script 3'):
+        scheduler.put('script', 0, job)
+    scheduler.put('logger', 0, 'logger 1')
+    scheduler.put('gui', 1, 'gui 1')
+
+    assert scheduler.depth() == 5
+    assert [scheduler.get(0) for _ in range(5)] == ['gui 1', 'script 1', 'logger 1', 'script 2', 'script 3']
+    assert scheduler.get(0) is None
+
+
+def test_transaction_round_trip_through_the_server(bank, start_server):
+    port = bank.add()
+    _, client = start_server()
+    gui, script = client('gui'), client('script')
+
+    transaction = ScpiTransaction().select(2).set('VOLT', 12).query('VOLT?')
+    assert gui.transaction(port, transaction.run) == {'VOLT?': '12.000'}
+    assert transaction.skipped == []
+
+    # The other client sees the setpoint, with channel-labelled replies turned back into tuples
+    replies = script.transaction(port, ScpiTransaction().query_channel(2, 'VOLT?').query_channel(1, 'VOLT?').run)
+    assert replies == {(2, 'VOLT?'): '12.000', (1, 'VOLT?'): '0.000'}
+
+    # The setpoint is already in effect on the server's connection, so it is left out. The read above selected CH1, so the selection is not
+    again = ScpiTransaction().select(2).set('VOLT', 12).query('VOLT?')
+    assert script.transaction(port, again.run) == {'VOLT?': '12.000'}
+    assert again.skipped == ['VOLT 12']
+    assert bank.instrument(port).channels[2]['VOLT'] == 12
+
+
+def test_jobs_run_by_priority_then_round_robin(bank, start_server, monkeypatch):
+    port = bank.add()
+    server, client = start_server(cache_ttl=0)
+    entered, gate = threading.Event(), threading.Event()
+    order = []
+    run_transaction = server.sessions.transaction
+
+    def gated_transaction(com_port, function, retries=1, **settings):
+        entered.set()
+        gate.wait(5.0)
+        order.append(function.__self__.labels[0])
+        return run_transaction(com_port, function, retries, **settings)
+    monkeypatch.setattr(server.sessions, 'transaction', gated_transaction)
+
+    def query(sessions, command):
+        sessions.transaction(port, ScpiTransaction().query(command).run)
+
+    # The first request holds the port. The rest queue up behind it
+    threads = [threading.Thread(target=query, args=(client('first'), '*IDN?'))]
+    threads[0].start()
+    assert entered.wait(5.0)
+    script, gui = client('script'), client('gui', priority=1)
+    for queued, (sessions, command) in enumerate(((script, 'VOLT?'), (script, 'CURR?'), (gui, 'MEAS:VOLT?')), 1):
+        threads.append(threading.Thread(target=query, args=(sessions, command)))
+        threads[-1].start()
+        while server.schedulers[port].depth() < queued:  # Queued in this order
+            time.sleep(0.01)
+    gate.set()
+    for thread in threads:
+        thread.join(5.0)
+
+    assert order == ['*IDN?', 'MEAS:VOLT?', 'VOLT?', 'CURR?']
+
+
+def test_read_cache_is_per_selected_channel_and_expires(bank, start_server):
+    port = bank.add()
+    server, _ = start_server(cache_ttl=0.3)
+    read = ScpiTransaction().query('VOLT?').to_dict()
+
+    # The selection is unknown on a fresh connection, so a read that follows it is never shared
+    assert not server.transaction(port, read)['cached']
+    assert not server.transaction(port, read)['cached']
+
+    server.transaction(port, ScpiTransaction().select(1).set('VOLT', 1).to_dict())
+    assert not server.transaction(port, read, client='gui')['cached']
+    assert server.transaction(port, read, client='gui')['cached']
+
+    # Selecting another channel, even by a read, makes the same "VOLT?" a different request
+    server.transaction(port, ScpiTransaction().query_channel(2, 'VOLT?').to_dict())
+    second = server.transaction(port, read)
+    assert not second['cached']
+    assert second['replies'] == [['VOLT?', '0.000']]
+
+    time.sleep(0.35)
+    assert not server.transaction(port, read)['cached']
+    assert server.statistics()['clients']['gui'] == {'requests': 2, 'cache_hits': 1, 'sent': 1, 'errors': 0}
+
+
+def test_a_write_empties_the_read_cache(bank, start_server):
+    port = bank.add()
+    server, _ = start_server(cache_ttl=5.0)
+    read = ScpiTransaction().query_channel(1, 'VOLT?').to_dict()
+
+    server.transaction(port, read)
+    assert server.transaction(port, read)['cached']
+
+    server.transaction(port, ScpiTransaction().select(1).set('VOLT', 2).to_dict())
+    after = server.transaction(port, read)
+    assert not after['cached']
+    assert after['replies'] == [[(1, 'VOLT?'), '2.000']]  # Labels stay tuples until the result is sent as JSON
+
+
+def test_each_port_has_its_own_scheduler_thread(bank, start_server):
+    ports = [bank.add(), bank.add()]
+    server, _ = start_server()
+
+    for port in ports:
+        server.transaction(port, ScpiTransaction().query('*IDN?').to_dict())
+
+    names = {thread.name for thread in threading.enumerate()}
+    assert {f'instrument-server-{port}' for port in ports} <= names
+    assert set(server.schedulers) == set(ports)
+
+
+def test_port_failure_reaches_the_client_and_the_port_keeps_serving(bank, start_server, tmp_path):
+    port = bank.add()
+    _, client = start_server()
+    gui = client('gui')
+
+    with pytest.raises(serial.SerialException):
+        gui.transaction(str(tmp_path / 'missing'), ScpiTransaction().query('VOLT?').run)
+    assert gui.statistics()['clients']['gui']['errors'] == 1
+
+    assert gui.transaction(port, ScpiTransaction().query('*IDN?').run)['*IDN?'].startswith('B&K')
+
+
+@pytest.mark.filterwarnings('ignore::pytest.PytestUnhandledThreadExceptionWarning')  # The traceback that ends the thread
+def test_unexpected_job_error_restarts_the_scheduler_thread(bank, start_server, monkeypatch):
+    port = bank.add()
+    server, _ = start_server()
+    read = ScpiTransaction().query('*IDN?').to_dict()
+    server.transaction(port, read)
+    first_thread = server.drains[port]
+
+    def broken(com_port, function, retries=1, **settings):
+        raise RuntimeError('bug')
+    monkeypatch.setattr(server.sessions, 'transaction', broken)
+    with pytest.raises(serial.SerialException, match='failed unexpectedly'):
+        server.transaction(port, ScpiTransaction().select(1).to_dict())
+    monkeypatch.undo()
+
+    first_thread.join(2.0)
+    assert not first_thread.is_alive()
+    assert server.transaction(port, read)['replies'][0][1].startswith('B&K')
+    assert server.drains[port] is not first_thread
+
+
+def test_cancel_reads_returns_a_waiting_client_straight_away(bank, start_server):
+    port = bank.add(drop_rate=1.0)
+    _, client = start_server()
+    gui = client('gui')
+
+    threading.Timer(0.2, gui.cancel_reads).start()
+    started = time.perf_counter()
+    with pytest.raises(serial.SerialException):
+        gui.transaction(port, ScpiTransaction().query('VOLT?').run, timeout=1)
+    assert time.perf_counter() - started < 1.0
+
+    # The next request reconnects, and waits for the abandoned one to finish on the server
+    bank.instrument(port).drop_rate = 0.0
+    assert gui.transaction(port, ScpiTransaction().query('*IDN?').run)['*IDN?'].startswith('B&K')
+
+
+def test_remote_link_readline_ends_lines_with_the_terminator_asked_for(bank, start_server):
+    port = bank.add()
+    _, client = start_server()
+
+    link = RemoteLink(client('script'), port, {})
+    link.write(b'VOLT?\rCURR?\r')
+
+    assert link.readline() == b'0.000\n'
+    assert link.readline(b'\r\n') == b'0.015\r\n'
+    assert link.readline() == b''
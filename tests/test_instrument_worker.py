@@ -0,0 +1,74 @@
+'''
+Tests for instrument_worker.py: which job errors the worker reports and carries on from, and how it recovers from any other.
+'''
+import sys
+import threading
+
+import pytest
+import serial
+
+from instrument_worker import InstrumentWorker
+
+
+class NoSessions():
+    '''
+    Stands in for SerialSessions: nothing to cancel.
+    '''
+
+    def cancel_reads(self):
+        pass
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    '''
+    Started InstrumentWorker whose status lines and job results are collected in .lines and .results. Stopped after the test.
+    '''
+    lines, results = [], []
+    finished = threading.Semaphore(0)
+
+    def report(update_status_callback, name, result):
+        results.append((name, result))
+        finished.release()
+
+    # As run.py does. Without a hook of its own, PyQt5 aborts the process on an error ending QThread.run
+    monkeypatch.setattr(sys, 'excepthook', lambda exception, description, trace: lines.append(f'excepthook: {description}'))
+    instrument_worker = InstrumentWorker(NoSessions(), status_log=lambda text, level=None, **fields: lines.append(text), report=report)
+    instrument_worker.lines, instrument_worker.results, instrument_worker.finished = lines, results, finished
+    instrument_worker.start()
+    yield instrument_worker
+    instrument_worker.stop()
+
+
+def run_job(worker, name, function):
+    '''
+    Submit one job, and wait until its result has been reported.
+    '''
+    worker.submit(name, function)
+    assert worker.finished.acquire(timeout=5.0)
+
+
+def test_communication_errors_are_reported_and_the_worker_carries_on(worker):
+    def lost_port(update_status_callback, dialogs):
+        raise serial.SerialException('port gone')
+
+    run_job(worker, 'go', lost_port)
+    run_job(worker, 'go', lambda update_status_callback, dialogs: None)
+
+    assert worker.results == [('go', True), ('go', None)]
+    assert 'SerialException: port gone' in worker.lines[0]
+    assert worker.isRunning()
+
+
+def test_unexpected_error_ends_the_thread_and_the_next_job_starts_a_new_one(worker):
+    def bug(update_status_callback, dialogs):
+        raise RuntimeError('bug')
+
+    run_job(worker, 'go', bug)
+    assert worker.results == [('go', True)]  # The GUI still hears the job is over
+    assert worker.wait(5000)
+    assert 'excepthook: bug' in worker.lines
+    assert any('"go" failed unexpectedly' in line for line in worker.lines)
+
+    run_job(worker, 'stream', lambda update_status_callback, dialogs: None)
+    assert worker.results[-1] == ('stream', None)
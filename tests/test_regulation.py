@@ -0,0 +1,97 @@
+'''
+Tests for regulation.py: the Regulator's answer to a load step across lead resistance, and its trim and slew limits.
+'''
+import pytest
+
+from regulation import MAXIMUM_TRIM, SLEW_RATE, Regulator
+from serial_sessions import SerialSessions
+
+
+def settle(regulator, load_amps, lead_resistance, periods):
+    '''
+    Close the loop around an ideal supply: the output terminals sit at the setpoint, and the device under test gets that minus the lead drop.
+    Returns the setpoint of every period.
+    '''
+    setpoints = [regulator.update()]
+    for _ in range(periods):
+        setpoints.append(regulator.update(setpoints[-1], load_amps))
+    return setpoints
+
+
+def test_defaults_come_from_the_function():
+    regulator = Regulator('CURR', 1.0)
+
+    assert regulator.slew_rate == SLEW_RATE['CURR']
+    assert regulator.maximum_trim == MAXIMUM_TRIM['CURR']
+
+
+def test_first_setpoint_is_the_target_until_something_is_measured():
+    regulator = Regulator('VOLT', 12.0)
+
+    assert regulator.update() == 12.0
+    assert regulator.update(None, None) == 12.0
+    assert regulator.measured is None
+
+
+def test_load_step_is_made_up_for_across_the_lead_resistance():
+    regulator = Regulator('VOLT', 12.0, period=0.1, lead_resistance=0.5, slew_rate=100.0)
+    setpoints = settle(regulator, 0.0, 0.5, 5)
+    assert setpoints[-1] == 12.0  # No load, no lead drop
+
+    # 2 A load step: 1 V drops across the leads. The feed-forward answers it in the very next period
+    step = regulator.update(setpoints[-1], 2.0)
+    assert step >= 13.0
+
+    setpoints = settle(regulator, 2.0, 0.5, 60)
+    assert setpoints[-1] == pytest.approx(13.0, abs=0.002)
+    assert regulator.regulated_value(setpoints[-1], 2.0) == pytest.approx(12.0, abs=0.002)
+    assert not regulator.clamped
+
+
+def test_trim_is_clamped_and_does_not_wind_up():
+    regulator = Regulator('VOLT', 12.0, period=0.1, slew_rate=100.0, maximum_trim=0.5)
+
+    # The device under test reads far too low (Ex.: a shorted sense): the setpoint may only go 0.5 V above the target
+    for _ in range(20):
+        setpoint = regulator.update(5.0, 0.0)
+        assert setpoint == 12.5
+        assert regulator.clamped
+    assert regulator.integral == 0.0
+
+    # Once the reading recovers, no accumulated trim pushes the setpoint past the target
+    assert regulator.update(12.0, 0.0) == 12.0
+
+
+def test_setpoint_changes_no_faster_than_the_slew_rate():
+    regulator = Regulator('CURR', 1.0, period=0.1, slew_rate=0.5, maximum_trim=1.0)
+    setpoints = [regulator.update()]
+    for _ in range(5):
+        setpoints.append(regulator.update(12.0, 0.2))  # Far below target: the PI asks for a big jump every period
+
+    steps = [later - earlier for earlier, later in zip(setpoints, setpoints[1:])]
+    assert steps == pytest.approx([0.05] * 5)
+    assert regulator.clamped
+
+
+def test_trim_never_leaves_the_instrument_range():
+    regulator = Regulator('VOLT', 60.0, period=0.1, slew_rate=100.0)
+
+    assert regulator.update(59.0, 0.0) == 60.6
+
+
+def test_regulate_holds_the_load_voltage_on_the_simulator(bank):
+    port = bank.add(load_resistance=4.0, lead_resistance=1.0)
+    instrument = bank.instrument(port)
+    instrument.channels[1]['CURR'] = 4.0  # Constant voltage throughout
+    sessions = SerialSessions(metrics=None)
+    records = []
+    try:
+        failed = Regulator.regulate(lambda *message, **fields: records.append((message, fields)), port, 'VOLT', 5.0, period=0.05, duration=1.5,
+                                    sessions=sessions, channel=1, lead_resistance=1.0)
+    finally:
+        sessions.close_all()
+
+    assert failed is None
+    assert instrument.load_voltage(1) == pytest.approx(5.0, abs=0.01)
+    assert instrument.channels[1]['VOLT'] == pytest.approx(6.25, abs=0.01)  # 1.25 A through 4 + 1 Ω
+    assert 'trims up to ±2 V at 10 V/s' in records[0][0][0]
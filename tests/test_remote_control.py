@@ -0,0 +1,69 @@
+'''
+Tests for remote_control.py: the failsafe check that compares the read-back with the set value.
+'''
+from remote_control import RemoteControl
+from test_scpi_transaction import ScriptedLink, ScriptedSessions
+
+
+class RecordingDialogs():
+    '''
+    Stands in for PopupDialogs: records which dialog would have been shown.
+    '''
+
+    def __init__(self):
+        self.shown = []
+
+    def com_bad_communication(self, com_port):
+        self.shown.append(('com_bad_communication', com_port))
+        return True
+
+    def failed_confirmation(self, thing_to_change, value_found, value):
+        self.shown.append(('failed_confirmation', value_found))
+        return True
+
+
+class PooledSessions(ScriptedSessions):
+    '''
+    ScriptedSessions with the rest of the SerialSessions calls remote_control() makes.
+    '''
+
+    def acquire(self, com_port, **settings):
+        return self
+
+    def channel_state(self, com_port):
+        return {}
+
+    def link_statistics(self, com_port):
+        return None
+
+
+def remote_control(reply, value):
+    '''
+    Run remote_control() against a scripted instrument giving one reply line, and return (result, dialogs shown, status messages).
+    '''
+    dialogs = RecordingDialogs()
+    messages = []
+    result = RemoteControl.remote_control(messages.append, 'COM5', 'VOLT', value, PooledSessions(ScriptedLink([reply])), dialogs)
+    return result, dialogs.shown, messages
+
+
+def test_read_back_within_the_resolution_confirms_the_set_value():
+    result, shown, messages = remote_control(b'12.000\n', '12.0004')
+
+    assert result is None
+    assert shown == []
+    assert 'Voltage value changed to 12.0004' in messages[-1]
+
+
+def test_read_back_a_full_step_away_fails_the_check():
+    result, shown, _ = remote_control(b'12.001\n', '12')
+
+    assert result is True
+    assert shown == [('failed_confirmation', '12.001')]
+
+
+def test_unparsable_reply_fails_the_check():
+    result, shown, _ = remote_control(b'-113, "Undefined header"\n', '12')
+
+    assert result is True
+    assert shown == [('failed_confirmation', '-113, "Undefined header"')]
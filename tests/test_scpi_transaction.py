@@ -0,0 +1,138 @@
+'''
+Tests for scpi_transaction.py: what goes out in the single write, how replies are split back to their labels, and when the transaction is re-sent.
+'''
+import json
+
+from channel_state import ChannelState
+from scpi_transaction import ScpiTransaction
+
+
+class ScriptedLink():
+    '''
+    Stands in for an open port (or an AdaptiveLink, given a channel_state): records every write, and answers each readline from a script of reply lines. b'' is a timeout.
+    '''
+
+    def __init__(self, replies, channel_state=None):
+        self.replies = list(replies)
+        self.writes = []
+        self.resets = 0
+        self.cancelled = False
+        if channel_state is not None:
+            self.channel_state = channel_state
+
+    def write(self, data):
+        self.writes.append(data)
+        return len(data)
+
+    def readline(self):
+        return self.replies.pop(0) if self.replies else b''
+
+    def reset_input_buffer(self):
+        self.resets += 1
+
+    def stopped(self):
+        return self.cancelled
+
+
+class ScriptedSessions():
+    '''
+    Stands in for SerialSessions: runs every transaction against one ScriptedLink.
+    '''
+
+    def __init__(self, link):
+        self.link = link
+
+    def transaction(self, com_port, function, **settings):
+        return function(self.link)
+
+
+def test_commands_then_one_compound_query_line():
+    transaction = ScpiTransaction().select(2).set('VOLT', '12.5').query('VOLT?').query('CURR?')
+
+    data, labels = transaction.encode()
+
+    assert data == b'INST:SEL CH2\rVOLT 12.5\rVOLT?;:CURR?\r'
+    assert labels == ['VOLT?', 'CURR?']
+
+
+def test_opc_confirms_a_transaction_without_queries():
+    data, labels = ScpiTransaction().apply(1, 5.0, 0.5).encode()
+
+    assert data == b'APPL CH1,5.0,0.5\r*OPC?\r'
+    assert labels == ['*OPC?']
+
+
+def test_query_channel_labels_replies_by_channel():
+    transaction = ScpiTransaction().query_channel(1, 'VOLT?').query_channel(3, 'VOLT?', 'CURR?')
+    link = ScriptedLink([b'1.000;3.300;0.200\n'])
+
+    replies = transaction.run(link)
+
+    assert link.writes == [b'INST:SEL CH1;:VOLT?;:INST:SEL CH3;:VOLT?;:CURR?\r']
+    assert replies == {(1, 'VOLT?'): '1.000', (3, 'VOLT?'): '3.300', (3, 'CURR?'): '0.200'}
+
+
+def test_replies_one_per_line_are_accepted():
+    link = ScriptedLink([b'12.000\n', b'1.000\n'])
+
+    replies = ScpiTransaction().query('VOLT?').query('CURR?').run(link)
+
+    assert replies == {'VOLT?': '12.000', 'CURR?': '1.000'}
+
+
+def test_incomplete_reply_resends_the_whole_transaction():
+    link = ScriptedLink([b'12.000\n', b'', b'12.000;1.000\n'])
+
+    replies = ScpiTransaction().set('VOLT', 12).query('VOLT?').query('CURR?').run(link)
+
+    assert replies == {'VOLT?': '12.000', 'CURR?': '1.000'}
+    assert len(link.writes) == 2
+    assert link.writes[0] == link.writes[1]
+    assert link.resets == 1  # Late bytes of the abandoned attempt are dropped before the re-send
+
+
+def test_missing_replies_map_to_empty_strings_after_the_last_retry():
+    link = ScriptedLink([])
+
+    replies = ScpiTransaction().query('VOLT?').query('CURR?').run(link, retries=2)
+
+    assert replies == {'VOLT?': '', 'CURR?': ''}
+    assert len(link.writes) == 3
+
+
+def test_stopped_link_is_not_retried():
+    link = ScriptedLink([])
+    link.cancelled = True
+
+    replies = ScpiTransaction().query('VOLT?').run(link, retries=2)
+
+    assert replies == {'VOLT?': ''}
+    assert len(link.writes) == 1
+
+
+def test_configure_channels_verifies_every_channel_in_one_write():
+    link = ScriptedLink([b'12.000;1.000;3.300;0.100\n'])
+
+    results = ScpiTransaction.configure_channels('COM5', {1: (12.0, 1.0), 3: (3.3, 0.2)}, ScriptedSessions(link))
+
+    assert link.writes == [b'APPL CH1,12.0,1.0\rAPPL CH3,3.3,0.2\rINST:SEL CH1;:VOLT?;:CURR?;:INST:SEL CH3;:VOLT?;:CURR?\r']
+    assert results[1] == {'volts': '12.000', 'amps': '1.000', 'passed': True}
+    assert results[3] == {'volts': '3.300', 'amps': '0.100', 'passed': False}
+
+
+def test_configure_channels_allows_for_the_resolution_and_fails_garbled_replies():
+    link = ScriptedLink([b'12.000;1.000;garbled;0.200\n'])
+
+    results = ScpiTransaction.configure_channels('COM5', {1: (12.0004, 0.9996), 3: (3.3, 0.2)}, ScriptedSessions(link))
+
+    assert results[1]['passed']
+    assert not results[3]['passed']
+
+
+def test_to_dict_survives_a_json_round_trip():
+    transaction = ScpiTransaction().select(1).set('CURR', 0.5).query_channel(2, 'VOLT?')
+
+    rebuilt = ScpiTransaction.from_dict(json.loads(json.dumps(transaction.to_dict())))
+
+    assert rebuilt.encode(ChannelState()) == transaction.encode(ChannelState())
+    assert rebuilt.labels == [(2, 'VOLT?')]
@@ -0,0 +1,124 @@
+'''
+Tests for sequence.py and deadline_scheduler.py: profile expansion and validation, and setpoints sent on time against a simulated instrument.
+'''
+import time
+
+import pytest
+
+from deadline_scheduler import DeadlineScheduler, FixedRateScheduler
+from sequence import Sequence
+from serial_sessions import SerialSessions
+
+
+def test_steps_follow_each_other_by_their_dwell():
+    schedule = Sequence.build_schedule({'steps': [{'set': 5, 'dwell': 1.0}, {'function': 'curr', 'set': 0.5, 'dwell': 0.5}, {'set': 6}]})
+
+    assert schedule == [(0.0, 'VOLT', '5.000', 'Step 1'), (1.0, 'CURR', '0.500', 'Step 2'), (1.5, 'VOLT', '6.000', 'Step 3')]
+
+
+def test_ramps_expand_to_evenly_spaced_setpoints():
+    by_points = Sequence.build_schedule({'steps': [{'ramp': [0, 12], 'points': 4, 'dwell': 0.2}]})
+    by_increment = Sequence.build_schedule({'steps': [{'ramp': [2, 0], 'increment': 0.5, 'dwell': 0.1}]})
+
+    assert [(offset, value) for offset, _, value, _ in by_points] == [(0.0, '0.000'), (0.2, '4.000'), (0.4, '8.000'), (pytest.approx(0.6), '12.000')]
+    assert by_points[-1][3] == 'Step 1 ramp 4/4'
+    assert [value for _, _, value, _ in by_increment] == ['2.000', '1.500', '1.000', '0.500', '0.000']
+
+
+def test_repeats_unroll_nested_groups():
+    schedule = Sequence.build_schedule({'repeat': 2, 'steps': [{'set': 1, 'dwell': 1}, {'repeat': 2, 'steps': [{'set': 2, 'dwell': 0.5}]}]})
+
+    assert [offset for offset, _, _, _ in schedule] == [0.0, 1.0, 1.5, 2.0, 3.0, 3.5]
+    assert [label for _, _, _, label in schedule] == ['Step 1', 'Step 2.1', 'Step 2.1 (repeat 2)',
+                                                      'Step 1 (repeat 2)', 'Step 2.1', 'Step 2.1 (repeat 2)']
+
+
+@pytest.mark.parametrize('profile', [
+    [],
+    {'steps': 'set 5'},
+    {'steps': [5]},
+    {'steps': [{'dwell': 1}]},
+    {'steps': [{'set': 'five'}]},
+    {'steps': [{'set': 5, 'dwell': -1}]},
+    {'steps': [{'ramp': [0, 1, 2], 'points': 3}]},
+    {'steps': [{'ramp': [0, 1]}]},
+    {'steps': [{'ramp': [0, 1], 'points': 0}]},
+    {'steps': [{'ramp': [0, 1], 'points': -3}]},
+    {'steps': [{'ramp': [0, 1], 'increment': 0}]},
+    {'repeat': 0, 'steps': [{'set': 5}]},
+    {'steps': [{'repeat': -1, 'steps': [{'set': 5}]}]},
+])
+def test_malformed_profiles_raise_value_error(profile):
+    with pytest.raises(ValueError):
+        Sequence.build_schedule(profile)
+
+
+def test_validate_reports_setpoints_outside_the_instrument_limits():
+    schedule = Sequence.build_schedule({'steps': [{'set': 5}, {'set': 70}, {'function': 'CURR', 'set': 0.001}]})
+
+    problems = Sequence.validate(schedule)
+
+    assert len(problems) == 2
+    assert problems[0].startswith('Step 2: 70.000.')
+    assert problems[1].startswith('Step 3: 0.001.')
+
+
+def test_deadlines_are_absolute_offsets_from_the_start():
+    scheduler = DeadlineScheduler()
+    scheduler.start()
+
+    time.sleep(0.05)  # Late for the first deadline
+    late = scheduler.wait_until(0.02)
+    on_time = scheduler.wait_until(0.1)
+
+    assert late == pytest.approx(0.03, abs=0.02)
+    assert on_time < 0.005
+    assert scheduler.elapsed() == pytest.approx(0.1, abs=0.005)
+
+
+def test_cancelled_wait_returns_none():
+    scheduler = DeadlineScheduler(cancelled=lambda: True)
+    scheduler.start()
+
+    assert scheduler.wait_until(10.0) is None
+
+
+def test_fixed_rate_skips_missed_ticks():
+    scheduler = FixedRateScheduler(0.02)
+    scheduler.start()
+
+    time.sleep(0.07)  # Work overran ticks 1 and 2, and tick 3 is late
+    scheduler.wait_next()
+
+    assert scheduler.statistics()['overruns'] == 2
+    assert scheduler.tick == 3  # The late tick still runs, straight away, rather than waiting for tick 4
+
+
+def test_run_sequence_reports_timing_errors(bank):
+    port = bank.add()
+    records = []
+    schedule = Sequence.build_schedule({'steps': [{'ramp': [1, 3], 'points': 3, 'dwell': 0.05}]})
+    sessions = SerialSessions(metrics=None)
+    try:
+        failed = Sequence.run_sequence(lambda template, *level, **fields: records.append((template, fields)), port, schedule, sessions, channel=3)
+    finally:
+        sessions.close_all()
+
+    confirmed = [fields for template, fields in records if 'timing error' in template]
+    assert failed is None
+    assert [fields['value'] for fields in confirmed] == ['1.000', '2.000', '3.000']
+    assert all(abs(fields['timing_error_ms']) < 50 for fields in confirmed)
+    assert 'Sequence finished: 3/3 setpoints confirmed. Timing error mean' in records[-1][0]
+    assert bank.instrument(port).channels[3]['VOLT'] == 3.0
+
+
+def test_cancelled_sequence_stops_before_sending(bank):
+    port = bank.add()
+    sessions = SerialSessions(metrics=None)
+    try:
+        failed = Sequence.run_sequence(lambda *args, **fields: None, port, [(0.0, 'VOLT', '5.000', 'Step 1')], sessions, cancelled=lambda: True)
+    finally:
+        sessions.close_all()
+
+    assert failed is True
+    assert bank.instrument(port).channels[1]['VOLT'] == 0.0
@@ -0,0 +1,254 @@
+'''
+Tests for serial_sessions.py: the learned timeout and its backoff, the buffered line reader, and cancelling a read that is waiting on a silent instrument.
+'''
+import threading
+import time
+
+import pytest
+
+from scpi_transaction import ScpiTransaction
+from serial_sessions import MAXIMUM_BACKOFF, AdaptiveLink, LinkTiming, SerialSessions
+
+
+class QuietSerial():
+    '''
+    Stands in for serial.Serial: read() returns queued bytes, or blocks for up to timeout like a silent port. cancel_read() ends the wait.
+    '''
+
+    def __init__(self, incoming=b''):
+        self.incoming = bytearray(incoming)
+        self.timeout = None
+        self.reads = 0
+        self.interrupt = threading.Event()
+        self.is_open = True
+
+    @property
+    def in_waiting(self):
+        return len(self.incoming)
+
+    def read(self, size=1):
+        self.reads += 1
+        if not self.incoming:
+            self.interrupt.wait(self.timeout)
+            self.interrupt.clear()
+        chunk = bytes(self.incoming[:size])
+        del self.incoming[:size]
+        return chunk
+
+    def write(self, data):
+        return len(data)
+
+    def reset_input_buffer(self):
+        self.incoming.clear()
+
+    def cancel_read(self):
+        self.interrupt.set()
+
+    def close(self):
+        self.is_open = False
+
+
+def learned(round_trip=0.01, **settings):
+    '''
+    LinkTiming that has seen enough identical round-trips to use a learned timeout.
+    '''
+    timing = LinkTiming(**settings)
+    for _ in range(timing.minimum_samples):
+        timing.record(round_trip)
+    return timing
+
+
+def test_timeout_is_the_ceiling_until_enough_samples():
+    timing = LinkTiming(ceiling=3.0, minimum_samples=8)
+    for _ in range(7):
+        timing.record(0.01)
+
+    assert timing.timeout() == 3.0
+
+    timing.record(0.01)
+    assert timing.timeout() == pytest.approx(0.03)
+
+
+def test_timeout_never_drops_below_the_floor():
+    assert learned(0.001, floor=0.02).timeout() == pytest.approx(0.02)
+
+
+def test_timeouts_double_up_to_the_maximum_backoff():
+    timing = learned(0.01)
+    timeouts = []
+    for _ in range(6):
+        timing.record_timeout()
+        timeouts.append(timing.timeout())
+
+    assert timeouts[:3] == pytest.approx([0.06, 0.12, 0.24])
+    assert timeouts[3:] == pytest.approx([0.03 * MAXIMUM_BACKOFF] * 3)
+    assert timing.timeouts == 6
+
+
+def test_backoff_is_capped_by_the_ceiling():
+    timing = learned(0.5, ceiling=3.0)
+    for _ in range(3):
+        timing.record_timeout()
+
+    assert timing.timeout() == 3.0
+
+
+def test_a_reply_or_a_new_transaction_resets_the_backoff():
+    timing = learned(0.01)
+    timing.record_timeout()
+    timing.record(0.01)
+    assert timing.timeout() == pytest.approx(0.03)
+
+    timing.record_timeout()
+    AdaptiveLink(QuietSerial(), timing).begin()
+    assert timing.timeout() == pytest.approx(0.03)
+
+
+def test_readline_keeps_bytes_after_the_terminator():
+    ser = QuietSerial(b'12.000\n1.0')
+    link = AdaptiveLink(ser, learned())
+
+    assert link.readline() == b'12.000\n'
+    assert ser.reads == 1  # Everything waiting was taken in one call
+
+    ser.incoming += b'00\n'
+    assert link.readline() == b'1.000\n'
+
+
+def test_readline_times_out_with_the_learned_timeout():
+    timing = learned(0.01)
+    link = AdaptiveLink(QuietSerial(b'12.0'), timing)
+
+    started = time.perf_counter()
+    assert link.readline() == b''
+    assert time.perf_counter() - started < 0.5
+    assert timing.timeouts == 1
+    assert link.buffer == bytearray()  # The partial line is dropped
+
+
+def test_round_trips_are_timed_from_the_write():
+    timing = LinkTiming()
+    ser = QuietSerial()
+    link = AdaptiveLink(ser, timing)
+
+    link.write(b'VOLT?\r')
+    ser.incoming += b'12.000\n'
+    link.readline()
+
+    assert len(timing.samples) == 1
+    assert 0 <= timing.samples[0] < 0.5
+
+
+def test_changing_settings_on_a_busy_port_does_not_hold_up_other_ports():
+    opened = {}
+
+    def open_port(com_port, **settings):
+        ser = QuietSerial()
+        opened.setdefault(com_port, []).append(ser)
+        return ser
+
+    sessions = SerialSessions(serial_factory=open_port, metrics=None)
+    busy = sessions.acquire('COM1')
+
+    busy.lock.acquire()  # A transaction in progress on COM1
+    try:
+        changer = threading.Thread(target=sessions.acquire, args=('COM1',), kwargs={'baudrate': 115200})
+        changer.start()
+        time.sleep(0.1)
+
+        other = threading.Thread(target=sessions.acquire, args=('COM2',))
+        other.start()
+        other.join(1.0)
+        assert not other.is_alive()
+        assert changer.is_alive()  # Still waiting for the transaction on COM1 to end
+        assert opened['COM1'][0].is_open
+    finally:
+        busy.lock.release()
+
+    changer.join(1.0)
+    assert not changer.is_alive()
+    assert [ser.is_open for ser in opened['COM1']] == [False, True]  # The stale session is closed, and only the new one holds the port
+    assert sessions.sessions['COM1'].settings['baudrate'] == 115200
+
+
+def test_cancel_interrupts_a_pending_read():
+    timing = LinkTiming(ceiling=5.0)
+    link = AdaptiveLink(QuietSerial(), timing)
+    link.begin()
+
+    threading.Timer(0.1, link.cancel_read).start()
+    started = time.perf_counter()
+    assert link.readline() == b''
+    assert time.perf_counter() - started < 1.0
+    assert timing.timeouts == 0  # Cancelling says nothing about the link
+    assert link.stopped()
+
+    # Every read returns straight away until the next transaction begins
+    started = time.perf_counter()
+    assert link.readline() == b''
+    assert time.perf_counter() - started < 0.1
+
+    link.ser.incoming += b'12.000\n'
+    link.begin()
+    assert not link.stopped()
+    assert link.readline() == b'12.000\n'
+
+
+def test_deadline_bounds_the_read_timeout():
+    link = AdaptiveLink(QuietSerial(), LinkTiming(ceiling=5.0))
+    link.begin(time.perf_counter() + 0.2)
+
+    started = time.perf_counter()
+    assert link.readline() == b''
+    assert time.perf_counter() - started < 1.0
+    assert link.ser.timeout <= 0.21
+    assert link.stopped()
+
+
+def test_cancel_reads_interrupts_a_transaction_on_a_silent_instrument(bank):
+    port = bank.add(drop_rate=1.0)
+    sessions = SerialSessions(metrics=None)
+    try:
+        threading.Timer(0.3, sessions.cancel_reads).start()
+        started = time.perf_counter()
+        replies = ScpiTransaction().set('VOLT', 1).query('VOLT?').execute(port, sessions)
+        elapsed = time.perf_counter() - started
+    finally:
+        sessions.close_all()
+
+    assert replies == {'VOLT?': ''}
+    assert elapsed < 1.5  # Not the 3 s timeout, nor a re-send after it
+
+
+def test_transaction_deadline_covers_every_resend(bank):
+    port = bank.add(drop_rate=1.0)
+    sessions = SerialSessions(metrics=None)
+    try:
+        started = time.perf_counter()
+        replies = ScpiTransaction().query('VOLT?').execute(port, sessions, timeout=0.5)
+        elapsed = time.perf_counter() - started
+    finally:
+        sessions.close_all()
+
+    assert replies == {'VOLT?': ''}
+    assert elapsed < 1.2  # Two re-sends would each wait out the 0.5 s ceiling without the shared deadline
+
+
+def test_dead_link_commands_do_not_slow_down_one_after_another(bank):
+    port = bank.add()
+    sessions = SerialSessions(metrics=None)
+    try:
+        for _ in range(20):
+            assert ScpiTransaction().query('VOLT?').execute(port, sessions)['VOLT?'] != ''
+
+        bank.instrument(port).drop_rate = 1.0
+        durations = []
+        for _ in range(4):
+            started = time.perf_counter()
+            ScpiTransaction().query('VOLT?').execute(port, sessions)
+            durations.append(time.perf_counter() - started)
+    finally:
+        sessions.close_all()
+
+    assert max(durations) < 1.0
+    assert durations[-1] < durations[0] * 2 + 0.05
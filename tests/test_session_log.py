@@ -0,0 +1,111 @@
+'''
+Tests for session_log.py: chunk roll-over and reopening, one writer per chunk, and reading a time range back.
+'''
+import subprocess
+import sys
+
+import numpy as np
+
+from session_log import SessionLog
+
+
+def fill(log, timestamps):
+    for timestamp in timestamps:
+        log.append('COM5', 'VOLT', setpoint=timestamp, readback=timestamp, latency=0.01, timestamp=timestamp)
+
+
+def chunk_names(directory):
+    return [path.name for path in SessionLog.chunks(directory)]
+
+
+def test_full_chunks_roll_over_to_the_next_number(tmp_path):
+    log = SessionLog(tmp_path, chunk_records=4)
+    fill(log, range(10))
+    log.close()
+
+    assert chunk_names(tmp_path) == ['00000000.rclog', '00000001.rclog', '00000002.rclog']
+    assert list(SessionLog.load(tmp_path)['timestamp']) == list(range(10))
+    assert not list(tmp_path.glob('*.lock'))  # Closing gives the chunk up
+
+
+def test_a_new_run_continues_the_last_chunk(tmp_path):
+    for first in (0, 3):
+        log = SessionLog(tmp_path, chunk_records=8)
+        fill(log, range(first, first + 3))
+        log.close()
+
+    assert chunk_names(tmp_path) == ['00000000.rclog']
+    assert list(SessionLog.load(tmp_path)['timestamp']) == list(range(6))
+
+
+def test_two_writers_never_share_a_chunk(tmp_path):
+    first, second = SessionLog(tmp_path, chunk_records=8), SessionLog(tmp_path, chunk_records=8)
+    fill(first, [0, 2, 4])
+    fill(second, [1, 3, 5])
+    first.close()
+    second.close()
+
+    assert chunk_names(tmp_path) == ['00000000.rclog', '00000001.rclog']
+    assert list(SessionLog.load(tmp_path)['timestamp']) == list(range(6))
+
+
+def test_a_crashed_writers_chunk_is_taken_over(tmp_path):
+    log = SessionLog(tmp_path, chunk_records=8)
+    fill(log, range(3))
+    log.flush()
+    crashed = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True, text=True, check=True)
+    (tmp_path / '00000000.rclog.lock').write_text(crashed.stdout.strip(), encoding='utf-8')
+    log.records = log.header = log.claim = None  # Gone without closing, as in a crash
+
+    log = SessionLog(tmp_path, chunk_records=8)
+    fill(log, range(3, 5))
+    log.close()
+
+    assert chunk_names(tmp_path) == ['00000000.rclog']
+    assert list(SessionLog.load(tmp_path)['timestamp']) == list(range(5))
+
+
+def test_a_running_writers_chunk_is_left_alone(tmp_path):
+    first = SessionLog(tmp_path, chunk_records=8)
+    fill(first, [0])
+    first.flush()
+
+    second = SessionLog(tmp_path, chunk_records=8)
+    fill(second, [1])
+    second.close()
+    first.close()
+
+    assert chunk_names(tmp_path) == ['00000000.rclog', '00000001.rclog']
+
+
+def test_other_rclog_files_are_ignored(tmp_path):
+    (tmp_path / 'notes.rclog').write_bytes(b'not a chunk')
+    log = SessionLog(tmp_path, chunk_records=4)
+    fill(log, range(2))
+    log.close()
+
+    assert chunk_names(tmp_path) == ['00000000.rclog']
+    assert len(SessionLog.load(tmp_path)) == 2
+
+
+def test_load_filters_a_time_range_across_chunks(tmp_path):
+    log = SessionLog(tmp_path, chunk_records=4)
+    fill(log, range(10))
+    log.close()
+
+    records = SessionLog.load(tmp_path, start=3, end=7)
+
+    assert list(records['timestamp']) == [3, 4, 5, 6]
+    assert records['port'][0] == b'COM5'
+    assert len(SessionLog.load(tmp_path, start=20)) == 0
+
+
+def test_load_accepts_out_of_order_timestamps(tmp_path):
+    log = SessionLog(tmp_path, chunk_records=8)
+    fill(log, [5, 1, 7, 3, 2])
+    log.close()
+
+    records = SessionLog.load(tmp_path, start=2, end=6)
+
+    assert list(records['timestamp']) == [2, 3, 5]
+    assert np.all(records['setpoint'] == records['timestamp'])
@@ -0,0 +1,64 @@
+'''
+Tests for session_trace.py: a session recorded against the simulator replays with the same replies, and how bad trace options are reported.
+'''
+import serial
+import pytest
+
+from scpi_transaction import ScpiTransaction
+from serial_sessions import SerialSessions
+from session_trace import TraceTools, open_trace, requested_trace
+
+
+def session(port, sessions):
+    '''
+    A short bench session: set + verify on two channels, then measure. Returns every transaction's replies.
+    '''
+    transactions = [ScpiTransaction().select(1).set('VOLT', 5).query('VOLT?'),
+                    ScpiTransaction().apply(2, 3.3, 0.5),
+                    ScpiTransaction().query_channel(2, 'VOLT?', 'CURR?'),
+                    ScpiTransaction().query('*IDN?')]
+    return [transaction.execute(port, sessions) for transaction in transactions]
+
+
+def test_recorded_session_replays_with_the_same_replies(bank, tmp_path):
+    port = bank.add()
+    path = str(tmp_path / 'bench.trace')
+
+    serial_factory, recorder = open_trace(record=path, description='test bench')
+    sessions = SerialSessions(serial_factory=serial_factory, metrics=None)
+    try:
+        recorded = session(port, sessions)
+    finally:
+        sessions.close_all()
+        recorder.close()
+
+    info = TraceTools.info(path)
+    assert info['meta']['description'] == 'test bench'
+    assert info['ports'][port]['writes'] == 4
+
+    # The replayed instrument answers the same session the same way, with no instrument there
+    serial_factory, replayer = open_trace(replay=path, speed=0.0)
+    sessions = SerialSessions(serial_factory=serial_factory, metrics=None)
+    try:
+        assert session(port, sessions) == recorded
+    finally:
+        sessions.close_all()
+        replayer.close()
+
+    replayed = TraceTools.replay(path)
+    assert replayed['exchanges'] == 4
+    assert replayed['mismatched_replies'] == 0
+
+
+def test_no_trace_options_use_the_serial_ports():
+    assert requested_trace(['run.py'], {}) == (serial.Serial, None)
+
+
+def test_bad_replay_speed_is_a_value_error(tmp_path):
+    with pytest.raises(ValueError):
+        requested_trace(['run.py', '--replay-trace', str(tmp_path / 'bench.trace')], {'REMOTE_CONTROL_REPLAY_SPEED': 'fast'})
+
+
+def test_missing_replay_trace_is_an_os_error(tmp_path):
+    with pytest.raises(OSError):
+        requested_trace(['run.py', '--replay-trace', str(tmp_path / 'missing.trace'), '--replay-speed', '0'], {})
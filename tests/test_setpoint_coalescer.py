@@ -0,0 +1,119 @@
+'''
+Tests for setpoint_coalescer.py: replaced setpoints are never sent, only the final value is verified, and a cancel keeps what is offered after it.
+'''
+import threading
+
+import pytest
+
+from serial_sessions import SerialSessions
+from setpoint_coalescer import SetpointCoalescer
+
+
+class HookedSessions(SerialSessions):
+    '''
+    SerialSessions that counts transactions, and can run a hook (Ex.: the operator pressing cancel) once the first one has gone out.
+    '''
+
+    def __init__(self, hook=None):
+        super().__init__(metrics=None)
+        self.hook = hook
+        self.transactions = 0
+
+    def transaction(self, com_port, function, retries=1, **settings):
+        result = super().transaction(com_port, function, retries, **settings)
+        self.transactions += 1
+        if self.hook is not None:
+            hook, self.hook = self.hook, None
+            hook()
+        return result
+
+
+@pytest.fixture
+def coalescer():
+    '''
+    SetpointCoalescer whose drain jobs are queued in .jobs instead of going to a worker thread, and cancelled as the worker would.
+    '''
+    jobs = []
+    cancel = threading.Event()
+    sessions = HookedSessions()
+    setpoints = SetpointCoalescer(lambda name, function: jobs.append(function), sessions, cancelled=cancel.is_set)
+    setpoints.jobs, setpoints.cancel = jobs, cancel
+    try:
+        yield setpoints
+    finally:
+        sessions.close_all()
+
+
+def run_jobs(setpoints):
+    '''
+    Run the queued drain jobs in order, as the worker thread would, and return the status records they printed.
+    '''
+    records = []
+    while setpoints.jobs:
+        setpoints.cancel.clear()  # The worker clears its cancel flag as each job starts
+        setpoints.jobs.pop(0)(lambda template, level, **fields: records.append((level, template.format(**fields))))
+    return records
+
+
+def test_only_the_newest_setpoint_is_sent_and_verified(bank, coalescer):
+    port = bank.add()
+    for value in ('1', '2', '3.3'):
+        coalescer.offer(port, 2, 'VOLT', value)
+
+    records = run_jobs(coalescer)
+
+    assert bank.instrument(port).channels[2]['VOLT'] == 3.3
+    assert coalescer.sessions.transactions == 2  # One set, one verification
+    assert records == [('info', f'{port} CH2 VOLT 3.3 confirmed. 1 sent for 3 changes, 2 replaced before sending')]
+    assert not coalescer.scheduled
+
+
+def test_read_back_within_the_resolution_is_confirmed(bank, coalescer):
+    port = bank.add()
+    coalescer.offer(port, 1, 'VOLT', '5.0004')
+
+    records = run_jobs(coalescer)
+
+    assert records[0][0] == 'info'
+
+
+def test_wrong_read_back_is_reported(bank, coalescer):
+    port = bank.add(wrong_readback_rate=1.0)
+    coalescer.offer(port, 1, 'CURR', '1')
+
+    assert run_jobs(coalescer) == [('error', f'{port} CH1 CURR 1 not confirmed (read back "1.500")')]
+
+
+def test_setpoint_offered_after_a_cancel_is_still_sent(bank, coalescer):
+    port = bank.add()
+
+    def cancel_then_offer():
+        # As the cancel button does: the worker is cancelled, then the queue cleared. The operator then keeps scrolling
+        coalescer.cancel.set()
+        coalescer.clear()
+        coalescer.offer(port, 1, 'VOLT', '7')
+
+    coalescer.sessions.hook = cancel_then_offer
+    coalescer.offer(port, 1, 'VOLT', '4')
+    coalescer.offer(port, 3, 'VOLT', '5')
+
+    records = run_jobs(coalescer)
+
+    instrument = bank.instrument(port)
+    assert instrument.channels[1]['VOLT'] == 7
+    assert instrument.channels[3]['VOLT'] == 0  # Queued before the cancel: dropped
+    assert records == [('info', f'{port} CH1 VOLT 7 confirmed. 1 sent for 1 changes, 0 replaced before sending')]
+    assert not coalescer.scheduled
+
+
+def test_cancel_without_clear_drops_the_queue(bank, coalescer):
+    port = bank.add()
+    coalescer.sessions.hook = coalescer.cancel.set
+    coalescer.offer(port, 1, 'VOLT', '4')
+    coalescer.offer(port, 3, 'VOLT', '5')
+
+    assert coalescer.jobs.pop(0)(lambda template, level, **fields: None) is None
+
+    assert bank.instrument(port).channels[3]['VOLT'] == 0
+    assert coalescer.pending == {}
+    assert not coalescer.scheduled
@@ -0,0 +1,130 @@
+'''
+Tests for telemetry.py: RingBuffer wrap-around and statistics, and the min/max pyramid of DecimatedRingBuffer.
+'''
+import numpy as np
+
+from telemetry import DecimatedRingBuffer, RingBuffer
+
+
+def sawtooth(count):
+    '''
+    Samples at t = 0, 1, 2, ... whose values are not monotonic, so every min/max group has a different answer.
+    '''
+    times = np.arange(count, dtype=np.float64)
+    values = (times * 7) % 13
+    return times, values
+
+
+def test_ring_buffer_keeps_the_newest_samples_in_order():
+    buffer = RingBuffer(4, ('voltage',))
+    for timestamp in range(6):
+        buffer.append(float(timestamp), [timestamp * 10])
+
+    times, values = buffer.latest()
+    assert len(buffer) == 4
+    assert list(times) == [2, 3, 4, 5]
+    assert list(values[:, 0]) == [20, 30, 40, 50]
+    assert list(buffer.latest(2)[0]) == [4, 5]
+    assert buffer.oldest() == 2
+
+
+def test_ring_buffer_ranges_span_the_wrap_around():
+    buffer = RingBuffer(4, ('voltage',))
+    for timestamp in range(6):
+        buffer.append(float(timestamp), [timestamp])
+
+    times, _ = buffer.between(3, 5)
+    assert list(times) == [3, 4]
+    assert buffer.count_between(0, 100) == 4
+    assert buffer.count_between(4, 100) == 2
+
+
+def test_since_spans_the_wrap_around():
+    buffer = RingBuffer(4, ('voltage',))
+    for timestamp in range(6):
+        buffer.append(float(timestamp), [timestamp])
+
+    assert list(buffer.since(3)[0]) == [3, 4, 5]
+    assert list(buffer.since(0)[0]) == [2, 3, 4, 5]
+    assert list(buffer.since(10)[0]) == []
+
+
+def test_statistics_per_channel():
+    buffer = RingBuffer(8, ('voltage', 'current'))
+    for timestamp, (volts, amps) in enumerate([(3, 1), (4, -1), (5, 1)]):
+        buffer.append(float(timestamp), [volts, amps])
+
+    statistics = buffer.statistics()
+    assert statistics['count'] == 3
+    assert statistics['voltage']['min'] == 3
+    assert statistics['voltage']['max'] == 5
+    assert statistics['voltage']['mean'] == 4
+    assert statistics['current']['rms'] == 1
+    assert np.isnan(RingBuffer(8, ('voltage',)).statistics()['voltage']['mean'])
+
+
+def test_each_level_holds_the_min_and_max_of_factor_entries_below():
+    buffer = DecimatedRingBuffer(capacity=16, channels=('voltage',), factor=4, levels=2, level_capacity=64)
+    times, values = sawtooth(64)
+    for timestamp, value in zip(times, values):
+        buffer.append(timestamp, [value])
+
+    for level, size in enumerate((4, 16)):
+        level_times, summaries = buffer.levels[level].latest()
+        groups = values.reshape(-1, size)
+        assert list(level_times) == list(times[::size])
+        assert list(summaries[:, 0]) == list(groups.min(axis=1))
+        assert list(summaries[:, 1]) == list(groups.max(axis=1))
+
+
+def test_partial_groups_are_not_summarized_yet():
+    buffer = DecimatedRingBuffer(capacity=16, channels=('voltage',), factor=4, levels=2, level_capacity=64)
+    times, values = sawtooth(7)
+    for timestamp, value in zip(times, values):
+        buffer.append(timestamp, [value])
+
+    assert len(buffer.levels[0]) == 1
+    assert len(buffer.levels[1]) == 0
+    assert buffer.pending[0][1] == 3
+
+
+def test_envelope_matches_the_raw_min_and_max_per_column():
+    buffer = DecimatedRingBuffer(capacity=1024, channels=('voltage', 'current'), factor=4, levels=3, level_capacity=1024)
+    times, values = sawtooth(1024)
+    for timestamp, value in zip(times, values):
+        buffer.append(timestamp, [value, -value])
+
+    centers, minimums, maximums = buffer.envelope(0, 1024, 8, channel=1)
+
+    columns = (-values).reshape(8, -1)
+    assert list(centers) == list(np.arange(8) * 128 + 64)
+    assert list(minimums) == list(columns.min(axis=1))
+    assert list(maximums) == list(columns.max(axis=1))
+
+
+def test_envelope_reads_coarse_levels_once_raw_samples_are_overwritten():
+    buffer = DecimatedRingBuffer(capacity=16, channels=('voltage',), factor=4, levels=2, level_capacity=64)
+    times, values = sawtooth(256)
+    for timestamp, value in zip(times, values):
+        buffer.append(timestamp, [value])
+
+    assert buffer.oldest() == 240  # Only the last 16 raw samples are left
+    centers, minimums, maximums = buffer.envelope(0, 256, 4)
+
+    columns = values.reshape(4, -1)
+    assert len(centers) == 4
+    assert list(minimums) == list(columns.min(axis=1))
+    assert list(maximums) == list(columns.max(axis=1))
+
+
+def test_envelope_of_recent_samples_uses_the_raw_values():
+    buffer = DecimatedRingBuffer(capacity=64, channels=('voltage',), factor=4, levels=2, level_capacity=64)
+    times, values = sawtooth(64)
+    for timestamp, value in zip(times, values):
+        buffer.append(timestamp, [value])
+
+    centers, minimums, maximums = buffer.envelope(32, 48, 16)
+
+    assert list(centers) == list(times[32:48] + 0.5)
+    assert list(minimums) == list(values[32:48])
+    assert list(maximums) == list(values[32:48])